@@ -8,6 +8,8 @@ Rutas:
 - GET /admin/metrics              → Vista HTML
 - GET /admin/metrics.json         → JSON para sistemas de monitoreo
 - GET /admin/metrics/prometheus   → Formato Prometheus
+- GET /admin/metrics/pdf          → Cache y cola de render de PDFs
+- GET /admin/metrics/geocoding    → Latencia por proveedor y cache de búsquedas
 
 Acceso: solo super admins (is_super_admin=True).
 """
@@ -120,6 +122,24 @@ def metrics_refresh():
     return jsonify(metrics)
 
 
+@admin_metrics_bp.route('/pdf')
+@login_required
+def metrics_pdf():
+    """Cache y cola de render de PDFs (hits, tiempo de render, jobs en cola)."""
+    _require_super_admin()
+    from services.pdf_concurrency import pdf_metricas
+    return jsonify(pdf_metricas())
+
+
+@admin_metrics_bp.route('/geocoding')
+@login_required
+def metrics_geocoding():
+    """Histograma de latencia por proveedor de geocoding y hits del cache de search()."""
+    _require_super_admin()
+    from services.geocoding_service import geocode_metricas
+    return jsonify(geocode_metricas())
+
+
 @admin_metrics_bp.route('/prometheus')
 @login_required
 def metrics_prometheus():
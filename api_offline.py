@@ -1,20 +1,99 @@
 """
 API endpoints para modo offline
 Permite sincronización de datos para operarios sin conexión
+
+Los GET de datos (mis-obras, mis-tareas, tareas-obra, inventario-basico)
+aceptan `?since=<cursor>` para traer solo cambios y `eliminados`, responden
+con ETag fuerte (304 si el cliente ya tiene esa versión) y van en gzip si el
+cliente lo acepta. Ver services/offline_sync.py.
 """
 
-from flask import Blueprint, jsonify, request, current_app
+import gzip
+import hashlib
+import json
+import os
+
+from flask import Blueprint, jsonify, request, current_app, make_response
 from flask_login import login_required, current_user
 from models import db
 from models.core import Usuario, Organizacion
-from models.projects import Obra, TareaEtapa, TareaAvance, EtapaObra, TareaResponsables
+from models.projects import Obra, TareaEtapa, EtapaObra, TareaResponsables
+from services.offline_sync import (aplicar_lote, conteos_sync, cursor_respuesta, desde_cursor,
+                                   leer_cursor, tombstones)
 
 api_offline_bp = Blueprint('api_offline', __name__, url_prefix='/api/offline')
 
+# Debajo de esto comprimir no vale la pena
+OFFLINE_GZIP_MIN_BYTES = int(os.getenv('OFFLINE_GZIP_MIN_BYTES', '1024'))
+
+
+def _alcance_cursor():
+    """Usuario y org del cursor: uno de otra sesión en el mismo dispositivo no sirve."""
+    return f'{current_user.id}.{get_current_org_id() or 0}'
+
+
+def _cursor_desde_request():
+    """(cursor, desde, error_response) a partir de `?since=`.
+
+    `desde` es None para pull completo (sin since, cursor vencido o ajeno).
+    """
+    try:
+        cursor = leer_cursor(request.args.get('since'), alcance=_alcance_cursor())
+    except ValueError:
+        return None, None, (jsonify({'ok': False, 'error': 'Parámetro since inválido'}), 400)
+    return cursor, desde_cursor(cursor), None
+
+
+def _cursor_respuesta(cursor_cliente, desde, *momentos):
+    """Cursor nuevo: lo más reciente devuelto, o el del cliente si no hubo cambios."""
+    return cursor_respuesta(cursor_cliente if desde is not None else None, *momentos,
+                            alcance=_alcance_cursor())
+
+
+def _etags_cliente():
+    valores = request.headers.get('If-None-Match', '')
+    etags = set()
+    for valor in valores.split(','):
+        valor = valor.strip()
+        if valor.startswith('W/'):
+            valor = valor[2:]
+        etags.add(valor.strip('"').removesuffix('-gz'))
+    return etags
+
+
+def _responder_sync(payload):
+    """JSON con ETag fuerte (hash del cuerpo), 304 si el cliente ya lo tiene y
+    gzip si lo acepta. El cursor viaja también en X-Sync-Cursor."""
+    cuerpo = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    version = hashlib.sha256(cuerpo).hexdigest()[:32]
+    comprimir = (len(cuerpo) >= OFFLINE_GZIP_MIN_BYTES
+                 and 'gzip' in request.headers.get('Accept-Encoding', '').lower())
+    etag = f'"{version}-gz"' if comprimir else f'"{version}"'
+
+    if version in _etags_cliente():
+        response = make_response('', 304)
+    else:
+        response = make_response(gzip.compress(cuerpo, mtime=0) if comprimir else cuerpo)
+        response.mimetype = 'application/json'
+        if comprimir:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if payload.get('cursor'):
+        response.headers['X-Sync-Cursor'] = payload['cursor']
+    return response
+
 
 def get_current_org_id():
     """Obtener ID de organización actual del usuario."""
     from flask import session
+    from services.memberships import identidad_actual
+
+    # La org ya resuelta para el request (membresía activa)
+    identidad = identidad_actual()
+    if identidad is not None and identidad.org_id:
+        return identidad.org_id
 
     # Intentar obtener de session primero
     org_id = session.get('current_org_id')
@@ -35,9 +114,13 @@ def mis_obras():
     """
     Obtener obras del usuario para modo offline.
     Retorna obras con información básica para cache local.
+    Con ?since=<cursor> solo las que cambiaron desde ese cursor.
     """
     try:
         org_id = get_current_org_id()
+        cursor_cliente, desde, error = _cursor_desde_request()
+        if error:
+            return error
 
         # Si no hay org_id y no es super admin, retornar lista vacía
         if not org_id and not (hasattr(current_user, 'is_super_admin') and current_user.is_super_admin):
@@ -54,24 +137,27 @@ def mis_obras():
             if hasattr(current_user, 'is_super_admin') and current_user.is_super_admin:
                 # Super admin ve todas las obras activas (no soft-deleted)
                 # 2026-05-08: Obra no tiene columna 'activo'; usa deleted_at IS NULL.
-                if org_id:
-                    obras = Obra.query.filter(
-                        Obra.organizacion_id == org_id,
-                        Obra.deleted_at.is_(None),
-                    ).all()
-                else:
-                    obras = Obra.query.filter(Obra.deleted_at.is_(None)).limit(100).all()
+                query = Obra.query.filter(Obra.organizacion_id == org_id) if org_id else Obra.query
             elif current_user.role in ('admin', 'pm'):
-                obras = Obra.query.filter(
-                    Obra.organizacion_id == org_id,
-                    Obra.deleted_at.is_(None),
-                ).all()
+                query = Obra.query.filter(Obra.organizacion_id == org_id)
             else:
                 # Operarios ven obras donde tienen tareas asignadas
-                obras = db.session.query(Obra).join(EtapaObra).join(TareaEtapa).join(TareaResponsables).filter(
+                query = db.session.query(Obra).join(EtapaObra).join(TareaEtapa).join(TareaResponsables).filter(
                     TareaResponsables.user_id == current_user.id,
-                    Obra.deleted_at.is_(None),
-                ).distinct().all()
+                ).distinct()
+
+            if desde is None:
+                query = query.filter(Obra.deleted_at.is_(None))
+            elif current_user.role in ('admin', 'pm') or getattr(current_user, 'is_super_admin', False):
+                # Incluye las dadas de baja desde el cursor: van a `eliminados`
+                query = query.filter(Obra.updated_at >= desde)
+            else:
+                # Una asignación nueva también trae la obra
+                query = query.filter(db.or_(Obra.updated_at >= desde,
+                                            TareaResponsables.created_at >= desde))
+            if not org_id:
+                query = query.limit(100)
+            todas = query.all()
         except Exception as query_error:
             current_app.logger.error(f"Error en query de obras: {query_error}")
             return jsonify({
@@ -81,6 +167,10 @@ def mis_obras():
                 'error': 'Error consultando obras'
             })
 
+        obras = [o for o in todas if o.deleted_at is None]
+        eliminados = {o.id: o.deleted_at for o in todas if o.deleted_at is not None}
+        eliminados.update(tombstones(org_id, 'obra', desde))
+
         obras_data = []
         for obra in obras:
             try:
@@ -128,10 +218,15 @@ def mis_obras():
                 current_app.logger.error(f"Error procesando obra {obra.id}: {obra_error}")
                 continue
 
-        return jsonify({
+        cursor = _cursor_respuesta(cursor_cliente, desde,
+                                   *(o.updated_at for o in todas), *eliminados.values())
+        return _responder_sync({
             'ok': True,
             'obras': obras_data,
-            'total': len(obras_data)
+            'total': len(obras_data),
+            'eliminados': sorted(eliminados),
+            'cursor': cursor,
+            'incremental': desde is not None,
         })
 
     except Exception as e:
@@ -150,14 +245,26 @@ def mis_obras():
 def mis_tareas():
     """
     Obtener tareas asignadas al usuario para modo offline.
+    Con ?since=<cursor> solo las que cambiaron desde ese cursor, en cualquier
+    estado (así el cliente se entera de las que se completaron).
     """
     try:
+        cursor_cliente, desde, error = _cursor_desde_request()
+        if error:
+            return error
+
         # Obtener tareas del usuario a través de TareaResponsables
         try:
-            tareas = db.session.query(TareaEtapa).join(TareaResponsables).filter(
+            query = db.session.query(TareaEtapa, TareaResponsables.created_at).join(TareaResponsables).filter(
                 TareaResponsables.user_id == current_user.id,
-                TareaEtapa.estado.in_(['pendiente', 'en_curso'])
-            ).all()
+            )
+            if desde is None:
+                query = query.filter(TareaEtapa.estado.in_(['pendiente', 'en_curso']))
+            else:
+                query = query.filter(db.or_(TareaEtapa.updated_at >= desde,
+                                            TareaResponsables.created_at >= desde))
+            filas = query.all()
+            tareas = [tarea for tarea, _ in filas]
         except Exception as query_error:
             current_app.logger.error(f"Error en query de tareas: {query_error}")
             return jsonify({
@@ -167,6 +274,9 @@ def mis_tareas():
                 'error': 'Error consultando tareas'
             })
 
+        # Tareas borradas o que le sacaron al usuario
+        eliminados = dict(tombstones(get_current_org_id(), 'tarea', desde, usuario_id=current_user.id))
+
         tareas_data = []
         for tarea in tareas:
             try:
@@ -220,10 +330,16 @@ def mis_tareas():
                 current_app.logger.error(f"Error procesando tarea {tarea.id}: {tarea_error}")
                 continue
 
-        return jsonify({
+        cursor = _cursor_respuesta(cursor_cliente, desde,
+                                   *(t.updated_at for t in tareas), *(asignada for _, asignada in filas),
+                                   *eliminados.values())
+        return _responder_sync({
             'ok': True,
             'tareas': tareas_data,
-            'total': len(tareas_data)
+            'total': len(tareas_data),
+            'eliminados': sorted(set(eliminados) - {t.id for t in tareas}),
+            'cursor': cursor,
+            'incremental': desde is not None,
         })
 
     except Exception as e:
@@ -242,8 +358,14 @@ def mis_tareas():
 def tareas_por_obra(obra_id):
     """
     Obtener todas las tareas de una obra específica.
+    Con ?since=<cursor> solo las que cambiaron, más las borradas de la org
+    en `eliminados`.
     """
     try:
+        cursor_cliente, desde, error = _cursor_desde_request()
+        if error:
+            return error
+
         obra = Obra.query.get(obra_id)
         if not obra:
             return jsonify({'ok': False, 'error': 'Obra no encontrada'}), 404
@@ -251,9 +373,13 @@ def tareas_por_obra(obra_id):
             return jsonify({'ok': False, 'error': 'Acceso denegado'}), 403
 
         # Obtener tareas a través de las etapas de la obra
-        tareas = db.session.query(TareaEtapa).join(EtapaObra).filter(
+        query = db.session.query(TareaEtapa).join(EtapaObra).filter(
             EtapaObra.obra_id == obra_id
-        ).all()
+        )
+        if desde is not None:
+            query = query.filter(TareaEtapa.updated_at >= desde)
+        tareas = query.all()
+        eliminados = dict(tombstones(obra.organizacion_id, 'tarea', desde))
 
         tareas_data = []
         for tarea in tareas:
@@ -281,11 +407,16 @@ def tareas_por_obra(obra_id):
                 'cantidad_planificada': float(tarea.cantidad_planificada) if tarea.cantidad_planificada else None
             })
 
-        return jsonify({
+        cursor = _cursor_respuesta(cursor_cliente, desde,
+                                   *(t.updated_at for t in tareas), *eliminados.values())
+        return _responder_sync({
             'ok': True,
             'tareas': tareas_data,
             'obra_id': obra_id,
-            'total': len(tareas_data)
+            'total': len(tareas_data),
+            'eliminados': sorted(eliminados),
+            'cursor': cursor,
+            'incremental': desde is not None,
         })
 
     except Exception as e:
@@ -298,51 +429,28 @@ def tareas_por_obra(obra_id):
 def crear_avance():
     """
     Crear un avance de tarea (funciona para sincronización offline).
+    Pasa por el mismo motor que sync-batch: reenviar el mismo offline_id
+    devuelve el avance ya creado.
     """
     try:
         data = request.get_json() or {}
 
-        tarea_id = data.get('tarea_id')
-        if not tarea_id:
+        if not data.get('tarea_id'):
             return jsonify({'ok': False, 'error': 'tarea_id es requerido'}), 400
 
-        org_id = get_current_org_id()
-        tarea = TareaEtapa.query.join(EtapaObra).join(Obra).filter(
-            TareaEtapa.id == tarea_id,
-            Obra.organizacion_id == org_id
-        ).first()
-        if not tarea:
-            return jsonify({'ok': False, 'error': 'Tarea no encontrada'}), 404
-        if tarea.etapa.obra.organizacion_id != get_current_org_id():
-            return jsonify({'ok': False, 'error': 'Acceso denegado'}), 403
-
-        # Crear avance
-        avance = TareaAvance(
-            tarea_id=tarea_id,
-            usuario_id=current_user.id,
-            descripcion=data.get('descripcion', ''),
-            cantidad_ingresada=data.get('cantidad_ingresada', 0),
-            unidad_ingresada=data.get('unidad', tarea.unidad),
-            status='pendiente'
-        )
-
-        db.session.add(avance)
-
-        # Actualizar porcentaje de la tarea si se proporciona
-        if data.get('porcentaje'):
-            tarea.porcentaje_avance = data.get('porcentaje')
-            if float(data.get('porcentaje')) >= 100:
-                tarea.estado = 'completada'
-            elif float(data.get('porcentaje')) > 0:
-                tarea.estado = 'en_curso'
-
-        db.session.commit()
+        results, _ = aplicar_lote([{'type': 'CREATE_AVANCE', 'data': data}],
+                                  get_current_org_id(), current_user.id)
+        resultado = results[0]
+        if not resultado['success']:
+            status = 404 if resultado.get('error') == 'Tarea no encontrada' else 400
+            return jsonify({'ok': False, 'error': resultado.get('error')}), status
 
         return jsonify({
             'ok': True,
-            'avance_id': avance.id,
+            'avance_id': resultado.get('server_id'),
             'message': 'Avance registrado correctamente',
-            'offline_id': data.get('offline_id')
+            'offline_id': data.get('offline_id'),
+            'duplicado': bool(resultado.get('duplicado')),
         })
 
     except Exception as e:
@@ -395,17 +503,27 @@ def actualizar_tarea(tarea_id):
 def inventario_basico():
     """
     Obtener lista básica de inventario para búsqueda offline.
+    Con ?since=<cursor> solo los items que cambiaron, incluidos los
+    desactivados (activo=False) para que el cliente los saque.
     """
     try:
         from models.inventory import ItemInventario
 
+        cursor_cliente, desde, error = _cursor_desde_request()
+        if error:
+            return error
+
         org_id = get_current_org_id()
         limit = request.args.get('limit', 1000, type=int)
 
-        items = ItemInventario.query.filter_by(
-            organizacion_id=org_id,
-            activo=True
-        ).limit(limit).all()
+        query = ItemInventario.query.filter_by(organizacion_id=org_id)
+        if desde is None:
+            query = query.filter_by(activo=True)
+        else:
+            query = query.filter(ItemInventario.updated_at >= desde)
+        items = query.limit(limit).all()
+
+        eliminados = dict(tombstones(org_id, 'item', desde))
 
         items_data = []
         for item in items:
@@ -414,13 +532,19 @@ def inventario_basico():
                 'codigo': item.codigo,
                 'nombre': item.nombre,
                 'unidad': item.unidad,
-                'categoria_id': item.categoria_id
+                'categoria_id': item.categoria_id,
+                'activo': bool(item.activo),
             })
 
-        return jsonify({
+        cursor = _cursor_respuesta(cursor_cliente, desde,
+                                   *(i.updated_at for i in items), *eliminados.values())
+        return _responder_sync({
             'ok': True,
             'items': items_data,
-            'total': len(items_data)
+            'total': len(items_data),
+            'eliminados': sorted(eliminados),
+            'cursor': cursor,
+            'incremental': desde is not None,
         })
 
     except Exception as e:
@@ -436,25 +560,11 @@ def sync_status():
     """
     try:
         org_id = get_current_org_id()
-        from models.inventory import ItemInventario
         from datetime import datetime
 
-        # Contar tareas del usuario
-        tareas_count = db.session.query(TareaEtapa).join(TareaResponsables).filter(
-            TareaResponsables.user_id == current_user.id,
-            TareaEtapa.estado.in_(['pendiente', 'en_curso'])
-        ).count()
-
-        stats = {
-            # 2026-05-08: Obra no tiene 'activo'; soft-delete por deleted_at.
-            'obras': Obra.query.filter(
-                Obra.organizacion_id == org_id,
-                Obra.deleted_at.is_(None),
-            ).count(),
-            'tareas_pendientes': tareas_count,
-            'inventario': ItemInventario.query.filter_by(organizacion_id=org_id, activo=True).count(),
-            'server_time': datetime.utcnow().isoformat()
-        }
+        # Conteos cacheados unos segundos: el cliente consulta esto seguido
+        stats = dict(conteos_sync(org_id, current_user.id))
+        stats['server_time'] = datetime.utcnow().isoformat()
 
         return jsonify({
             'ok': True,
@@ -473,86 +583,25 @@ def sync_status():
 def sync_batch():
     """
     Sincronizar múltiples operaciones en un solo request.
+
+    Idempotente por offline_id: reenviar el mismo lote no duplica avances
+    (ver services/offline_sync.py). Cada operación se aplica por separado,
+    así que una que falla no invalida las demás.
     """
     try:
         data = request.get_json() or {}
         operations = data.get('operations', [])
 
-        results = []
-
         org_id = get_current_org_id()
-
-        for op in operations:
-            op_type = op.get('type')
-            op_data = op.get('data', {})
-
-            try:
-                if op_type == 'CREATE_AVANCE':
-                    tarea = TareaEtapa.query.join(EtapaObra).join(Obra).filter(
-                        TareaEtapa.id == op_data.get('tarea_id'),
-                        Obra.organizacion_id == org_id
-                    ).first()
-                    if tarea:
-                        avance = TareaAvance(
-                            tarea_id=op_data.get('tarea_id'),
-                            usuario_id=current_user.id,
-                            descripcion=op_data.get('descripcion', ''),
-                            cantidad_ingresada=op_data.get('cantidad_ingresada', 0),
-                            status='pendiente'
-                        )
-                        db.session.add(avance)
-
-                        if op_data.get('porcentaje'):
-                            tarea.porcentaje_avance = op_data.get('porcentaje')
-
-                        results.append({
-                            'offline_id': op_data.get('offline_id'),
-                            'success': True,
-                            'server_id': avance.id
-                        })
-                    else:
-                        results.append({
-                            'offline_id': op_data.get('offline_id'),
-                            'success': False,
-                            'error': 'Tarea no encontrada'
-                        })
-
-                elif op_type == 'UPDATE_TAREA':
-                    tarea = TareaEtapa.query.join(EtapaObra).join(Obra).filter(
-                        TareaEtapa.id == op_data.get('id'),
-                        Obra.organizacion_id == org_id
-                    ).first()
-                    if tarea:
-                        if 'estado' in op_data:
-                            tarea.estado = op_data['estado']
-                        if 'porcentaje_avance' in op_data:
-                            tarea.porcentaje_avance = op_data['porcentaje_avance']
-
-                        results.append({
-                            'offline_id': op_data.get('offline_id'),
-                            'success': True
-                        })
-                    else:
-                        results.append({
-                            'offline_id': op_data.get('offline_id'),
-                            'success': False,
-                            'error': 'Tarea no encontrada'
-                        })
-
-            except Exception as op_error:
-                results.append({
-                    'offline_id': op_data.get('offline_id'),
-                    'success': False,
-                    'error': str(op_error)
-                })
-
-        db.session.commit()
+        results, timing = aplicar_lote(operations, org_id, current_user.id)
 
         return jsonify({
             'ok': True,
             'results': results,
             'synced': len([r for r in results if r.get('success')]),
-            'failed': len([r for r in results if not r.get('success')])
+            'failed': len([r for r in results if not r.get('success')]),
+            'duplicados': len([r for r in results if r.get('duplicado')]),
+            'timing_ms': timing,
         })
 
     except Exception as e:
@@ -30,8 +30,8 @@ from werkzeug.routing import BuildError
 from services.memberships import (
     initialize_membership_session,
     load_membership_into_context,
-    get_current_membership,
     get_current_org_id,
+    identidad_actual,
 )
 
 from extensions import db, login_manager, csrf
@@ -293,6 +293,82 @@ setup_request_timing(app)
 from middleware.security_headers import setup_security_headers
 setup_security_headers(app)
 
+# Hooks que invalidan el snapshot de alertas del dashboard
+# (movimientos de stock, fichadas, estado de OCs)
+try:
+    from services.alertas_snapshot import registrar_hooks_alertas
+    registrar_hooks_alertas()
+except Exception as _alertas_e:
+    app.logger.warning(f'[ALERTAS] No se pudieron registrar hooks de snapshot: {_alertas_e}')
+
+# Hooks que invalidan el indice invertido del matcher de inventario
+try:
+    from services.inventory_matcher import registrar_hooks_indice
+    registrar_hooks_indice()
+except Exception as _indice_e:
+    app.logger.warning(f'[INVENTARIO] No se pudieron registrar hooks del indice: {_indice_e}')
+
+# Hooks que invalidan el indice fuzzy de provider_price_list (estimar precios)
+try:
+    from services.precio_recurso_service import registrar_hooks_precios
+    registrar_hooks_precios()
+except Exception as _precios_e:
+    app.logger.warning(f'[PRECIOS] No se pudieron registrar hooks del indice: {_precios_e}')
+
+# Hooks que invalidan el mapa de precios compartido de la calculadora IA
+try:
+    from calculadora_ia import registrar_hooks_cache_precios
+    registrar_hooks_cache_precios()
+except Exception as _calc_e:
+    app.logger.warning(f'[CALCULADORA] No se pudieron registrar hooks del cache de precios: {_calc_e}')
+
+# Hooks que invalidan el cache de membresía por usuario + conteo de búsquedas
+# de membresía por request
+try:
+    from services.memberships import (
+        registrar_hooks_membresias,
+        registrar_instrumentacion_membresias,
+    )
+    registrar_hooks_membresias()
+    registrar_instrumentacion_membresias(app)
+except Exception as _memb_e:
+    app.logger.warning(f'[MEMBRESIAS] No se pudieron registrar hooks del cache de membresías: {_memb_e}')
+
+# Tombstones de borrados para los pulls incrementales de /api/offline
+try:
+    from services.offline_sync import registrar_hooks_tombstones
+    registrar_hooks_tombstones()
+except Exception as _tomb_e:
+    app.logger.warning(f'[OFFLINE] No se pudieron registrar hooks de tombstones: {_tomb_e}')
+
+# Contador de no leídas y eventos push de notificaciones
+try:
+    from services.notificaciones_push import registrar_hooks_notificaciones
+    registrar_hooks_notificaciones()
+except Exception as _notif_e:
+    app.logger.warning(f'[NOTIF] No se pudieron registrar hooks de notificaciones: {_notif_e}')
+
+# Texto de búsqueda de productos del marketplace + índice en memoria (SQLite)
+try:
+    from services.busqueda_productos import registrar_hooks_busqueda_productos
+    registrar_hooks_busqueda_productos()
+except Exception as _busq_e:
+    app.logger.warning(f'[MARKETPLACE] No se pudieron registrar hooks de búsqueda: {_busq_e}')
+
+# Saldo de caja por obra (caja_saldos_obra) al confirmar / anular movimientos
+try:
+    from services.caja_saldos import registrar_hooks_saldos_caja
+    registrar_hooks_saldos_caja()
+except Exception as _caja_e:
+    app.logger.warning(f'[CAJA] No se pudieron registrar hooks de saldos de caja: {_caja_e}')
+
+# Asistencia diaria (fichadas_asistencia_diaria) al registrar / modificar fichadas
+try:
+    from services.asistencia_diaria import registrar_hooks_asistencia
+    registrar_hooks_asistencia()
+except Exception as _asis_e:
+    app.logger.warning(f'[FICHADAS] No se pudieron registrar hooks de asistencia diaria: {_asis_e}')
+
 # Setup Row Level Security middleware (Fase A — sin policies aún)
 # Setea SET app.current_org_id en cada checkout de conexión PostgreSQL.
 # Activable con RLS_ENABLED=true en .env.
@@ -481,6 +557,80 @@ def cac_refresh_current():
 
 app.cli.add_command(cac_cli)
 
+inventario_cli = AppGroup('inventario')
+
+@inventario_cli.command('costos-iniciales')
+@click.option('--company-id', type=int, default=None, help='Solo esta organización')
+def inventario_costos_iniciales(company_id: Optional[int]):
+    """Carga el costo promedio de los stocks que todavía no tienen."""
+    with app.app_context():
+        from services.inventory_service import InventoryService
+
+        actualizados = InventoryService().seed_average_costs(company_id=company_id)
+        click.echo(f"[OK] Costo promedio inicial cargado en {actualizados} registros de stock")
+
+@inventario_cli.command('reconciliar-stock')
+@click.option('--company-id', type=int, default=None, help='Solo esta organización')
+@click.option('--fix', is_flag=True, help='Corregir las diferencias encontradas')
+def inventario_reconciliar_stock(company_id: Optional[int], fix: bool):
+    """Recalcula los totales de stock de los items y reporta diferencias."""
+    with app.app_context():
+        from services.inventory_service import InventoryService
+
+        diferencias = InventoryService().reconcile_stock_totals(company_id=company_id, fix=fix)
+        for d in diferencias:
+            click.echo(
+                "[DRIFT] {sku} (item {item_id}): stock {stock_total} -> {stock_real}, "
+                "reservado {stock_reservado} -> {reservado_real}".format(**d)
+            )
+        if not diferencias:
+            click.echo('[OK] Totales de stock consistentes')
+        elif fix:
+            click.echo(f"[OK] {len(diferencias)} items corregidos")
+        else:
+            click.echo(f"[WARN] {len(diferencias)} items con diferencias (usar --fix para corregir)")
+
+app.cli.add_command(inventario_cli)
+
+caja_cli = AppGroup('caja')
+
+@caja_cli.command('reconciliar-saldos')
+@click.option('--company-id', type=int, default=None, help='Solo esta organización')
+@click.option('--fix', is_flag=True, help='Corregir las diferencias encontradas')
+def caja_reconciliar_saldos(company_id: Optional[int], fix: bool):
+    """Recalcula los saldos de caja por obra desde los movimientos y reporta diferencias."""
+    with app.app_context():
+        from services.caja_saldos import reconciliar_saldos
+
+        diferencias = reconciliar_saldos(org_id=company_id, fix=fix)
+        for d in diferencias:
+            click.echo(
+                "[DRIFT] obra {obra_id}: transferido {transferido} -> {transferido_real}, "
+                "gastado {gastado} -> {gastado_real}".format(**d)
+            )
+        if not diferencias:
+            click.echo('[OK] Saldos de caja consistentes')
+        elif fix:
+            click.echo(f"[OK] {len(diferencias)} obras corregidas")
+        else:
+            click.echo(f"[WARN] {len(diferencias)} obras con diferencias (usar --fix para corregir)")
+
+app.cli.add_command(caja_cli)
+
+fichadas_cli = AppGroup('fichadas')
+
+@fichadas_cli.command('reconstruir-asistencia')
+@click.option('--obra-id', type=int, default=None, help='Solo esta obra')
+def fichadas_reconstruir_asistencia(obra_id: Optional[int]):
+    """Rearma la asistencia diaria (fichadas_asistencia_diaria) desde las fichadas."""
+    with app.app_context():
+        from services.asistencia_diaria import reconstruir_asistencia
+
+        dias = reconstruir_asistencia(obra_id=obra_id)
+        click.echo(f'[OK] Asistencia diaria reconstruida: {dias} días')
+
+app.cli.add_command(fichadas_cli)
+
 # ---------------- Login handlers ----------------
 @login_manager.user_loader
 def load_user(user_id):
@@ -713,9 +863,9 @@ def utility_processor():
         if not current_user.is_authenticated:
             return False
 
-        membership = get_current_membership()
-        if membership and membership.status == 'active':
-            return (membership.role or '').lower() == (rol or '').lower()
+        identidad = identidad_actual()
+        if identidad is not None:
+            return identidad.tiene_rol(rol)
 
         org_id = session.get('current_org_id')
         if not org_id:
@@ -740,8 +890,8 @@ def utility_processor():
             return False
         return (registro.role or '').lower() == (rol or '').lower()
 
-    membership = get_current_membership()
-    current_org = membership.organizacion if membership else getattr(current_user, 'organizacion', None)
+    identidad = identidad_actual()
+    current_org = identidad.organizacion if identidad else getattr(current_user, 'organizacion', None)
 
     def formatPrecio(valor):
         """Formatea precio: sin decimales si es entero, con 2 si tiene centavos."""
@@ -778,7 +928,8 @@ def utility_processor():
         tiene_rol=tiene_rol_helper,
         formatPrecio=formatPrecio,
         mostrar_calculadora_ia_header=app.config.get("SHOW_IA_CALCULATOR_BUTTON", False),
-        current_membership=membership,
+        # Los templates solo leen .role: la identidad alcanza sin cargar el ORM
+        current_membership=g.get('current_membership') or identidad,
         current_organization=current_org,
         current_org_id=get_current_org_id,
         org_branding=org_branding,
@@ -1135,6 +1286,14 @@ try:
 except ImportError as e:
     print(f"[WARN] Caja blueprint not available: {e}")
 
+# Estado de los jobs de PDF (render asincronico en Celery)
+try:
+    from blueprint_pdf import pdf_bp
+    app.register_blueprint(pdf_bp)
+    print("[OK] PDF jobs blueprint registered successfully")
+except ImportError as e:
+    print(f"[WARN] PDF jobs blueprint not available: {e}")
+
 # Documentos de Obra (Legajo Digital)
 try:
     from control_documentos import documentos_bp
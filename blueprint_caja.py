@@ -10,7 +10,6 @@ from flask_login import login_required, current_user
 from extensions import db
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import func
 
 caja_bp = Blueprint('caja', __name__, url_prefix='/caja')
 
@@ -28,27 +27,11 @@ def _es_admin():
     return rol in ('administrador', 'admin') or role == 'admin'
 
 
-def saldo_caja_obra(obra_id):
-    """Calcula saldo disponible en caja de una obra."""
-    from models.templates import MovimientoCaja
-
-    ingresos = db.session.query(
-        func.coalesce(func.sum(MovimientoCaja.monto), 0)
-    ).filter(
-        MovimientoCaja.obra_id == obra_id,
-        MovimientoCaja.estado == 'confirmado',
-        MovimientoCaja.tipo == 'transferencia_a_obra'
-    ).scalar()
-
-    egresos = db.session.query(
-        func.coalesce(func.sum(MovimientoCaja.monto), 0)
-    ).filter(
-        MovimientoCaja.obra_id == obra_id,
-        MovimientoCaja.estado == 'confirmado',
-        MovimientoCaja.tipo.in_(['devolucion_obra', 'pago_proveedor', 'gasto_obra'])
-    ).scalar()
+def saldo_caja_obra(obra_id, bloquear=False):
+    """Saldo disponible en caja de una obra (ver services/caja_saldos)."""
+    from services.caja_saldos import saldo_caja_obra as _saldo
 
-    return float(ingresos) - float(egresos)
+    return _saldo(obra_id, bloquear=bloquear)
 
 
 # ============================================================
@@ -60,6 +43,7 @@ def saldo_caja_obra(obra_id):
 def dashboard():
     from models.templates import MovimientoCaja
     from models.projects import Obra
+    from services.caja_saldos import saldos_caja_obras
 
     if not _tiene_permiso_caja():
         flash('No tiene permisos para acceder a Caja.', 'danger')
@@ -69,33 +53,17 @@ def dashboard():
 
     obras = Obra.query.filter_by(organizacion_id=org_id).filter(Obra.deleted_at.is_(None)).order_by(Obra.nombre).all()
 
-    # Calcular saldo por obra
+    # Saldo por obra: una consulta para todas (caja_saldos_obra)
+    saldos = saldos_caja_obras([obra.id for obra in obras])
     resumen_obras = []
     for obra in obras:
-        saldo = saldo_caja_obra(obra.id)
-        # Totales por tipo
-        transferido = db.session.query(
-            func.coalesce(func.sum(MovimientoCaja.monto), 0)
-        ).filter(
-            MovimientoCaja.obra_id == obra.id,
-            MovimientoCaja.estado == 'confirmado',
-            MovimientoCaja.tipo == 'transferencia_a_obra'
-        ).scalar()
-
-        gastado = db.session.query(
-            func.coalesce(func.sum(MovimientoCaja.monto), 0)
-        ).filter(
-            MovimientoCaja.obra_id == obra.id,
-            MovimientoCaja.estado == 'confirmado',
-            MovimientoCaja.tipo.in_(['devolucion_obra', 'pago_proveedor', 'gasto_obra'])
-        ).scalar()
-
-        if float(transferido) > 0 or float(gastado) > 0:
+        saldo = saldos[obra.id]
+        if saldo['transferido'] > 0 or saldo['gastado'] > 0:
             resumen_obras.append({
                 'obra': obra,
-                'transferido': float(transferido),
-                'gastado': float(gastado),
-                'saldo': saldo,
+                'transferido': saldo['transferido'],
+                'gastado': saldo['gastado'],
+                'saldo': saldo['saldo'],
             })
 
     # Últimos movimientos
@@ -253,8 +221,9 @@ def gasto():
             flash('El monto debe ser mayor a 0.', 'danger')
             return redirect(url_for('caja.obra', id=obra_id))
 
-        # Verificar saldo suficiente
-        saldo = saldo_caja_obra(obra_id)
+        # Verificar saldo suficiente (la fila del saldo queda tomada hasta el
+        # commit, así dos gastos simultáneos no validan contra el mismo saldo)
+        saldo = saldo_caja_obra(obra_id, bloquear=True)
         if float(monto) > saldo:
             flash(f'Saldo insuficiente. Disponible: ${saldo:,.2f}', 'danger')
             return redirect(url_for('caja.obra', id=obra_id))
@@ -335,24 +304,12 @@ def api_saldo(obra_id):
         return jsonify(ok=False, error='Sin permisos'), 403
 
     from models.templates import MovimientoCaja
+    from services.caja_saldos import saldos_caja_obras
 
-    transferido = float(db.session.query(
-        func.coalesce(func.sum(MovimientoCaja.monto), 0)
-    ).filter(
-        MovimientoCaja.obra_id == obra_id,
-        MovimientoCaja.estado == 'confirmado',
-        MovimientoCaja.tipo == 'transferencia_a_obra'
-    ).scalar())
-
-    gastado = float(db.session.query(
-        func.coalesce(func.sum(MovimientoCaja.monto), 0)
-    ).filter(
-        MovimientoCaja.obra_id == obra_id,
-        MovimientoCaja.estado == 'confirmado',
-        MovimientoCaja.tipo.in_(['devolucion_obra', 'pago_proveedor', 'gasto_obra'])
-    ).scalar())
-
-    saldo = transferido - gastado
+    saldo_obra = saldos_caja_obras([obra_id])[obra_id]
+    transferido = saldo_obra['transferido']
+    gastado = saldo_obra['gastado']
+    saldo = saldo_obra['saldo']
 
     # Ultimos movimientos para mostrar inline en la tab
     movimientos = MovimientoCaja.query.filter_by(
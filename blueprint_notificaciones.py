@@ -1,12 +1,16 @@
 """
 Blueprint de Notificaciones
 Gestiona las notificaciones internas del sistema
+
+El badge se mantiene por long-poll (/api/eventos) contra el contador por
+usuario de services/notificaciones_push, sin COUNT por pedido.
 """
 
 from flask import Blueprint, render_template, jsonify, request, url_for, current_app
 from flask_login import login_required, current_user
 from extensions import db
 from datetime import datetime
+from services import notificaciones_push
 
 notificaciones_bp = Blueprint('notificaciones', __name__, url_prefix='/notificaciones')
 
@@ -40,7 +44,7 @@ def api_recientes():
 
     try:
         notifs = Notificacion.obtener_recientes(current_user.id, limite=10)
-        no_leidas = Notificacion.contar_no_leidas(current_user.id)
+        no_leidas = notificaciones_push.no_leidas(current_user.id)
 
         return jsonify({
             'ok': True,
@@ -87,6 +91,8 @@ def api_marcar_todas_leidas():
             'fecha_lectura': datetime.utcnow()
         })
         db.session.commit()
+        # El UPDATE masivo no pasa por los hooks del contador
+        notificaciones_push.recontar(current_user.id)
 
         return jsonify({'ok': True})
     except Exception as e:
@@ -98,15 +104,31 @@ def api_marcar_todas_leidas():
 @login_required
 def api_count():
     """API: Cuenta las notificaciones no leídas"""
-    from models.core import Notificacion
-
     try:
-        count = Notificacion.contar_no_leidas(current_user.id)
+        count = notificaciones_push.no_leidas(current_user.id)
         return jsonify({'ok': True, 'count': count})
     except Exception as e:
         current_app.logger.error(f'Error notificaciones: {e}'); return jsonify({'ok': False, 'error': 'Error interno del servidor'}), 500
 
 
+@notificaciones_bp.route('/api/eventos')
+@login_required
+def api_eventos():
+    """API: Long-poll de cambios (?v=<última versión recibida>).
+
+    Responde apenas hay eventos nuevos o al vencer la espera, con el contador
+    de no leídas. `resync: true` pide recargar /api/recientes.
+    """
+    usuario_id = current_user.id
+    version = request.args.get('v', type=int)
+    # Sin conexión del pool tomada durante la espera
+    db.session.close()
+    try:
+        return jsonify({'ok': True, **notificaciones_push.esperar_eventos(usuario_id, version)})
+    except Exception as e:
+        current_app.logger.error(f'Error notificaciones: {e}'); return jsonify({'ok': False, 'error': 'Error interno del servidor'}), 500
+
+
 @notificaciones_bp.route('/api/eliminar/<int:id>', methods=['POST', 'DELETE'])
 @login_required
 def api_eliminar(id):
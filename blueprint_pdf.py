@@ -0,0 +1,20 @@
+"""
+Estado de los jobs de PDF (render asincronico, ver services/pdf_concurrency.py).
+
+El id del job es el hash del contenido del PDF: no identifica al presupuesto ni
+a la org, y solo sirve para preguntar si el render termino. La descarga es
+siempre la URL original del PDF, que valida permisos y sale del cache.
+"""
+from flask import Blueprint, jsonify
+from flask_login import login_required
+
+pdf_bp = Blueprint('pdf', __name__, url_prefix='/pdf')
+
+
+@pdf_bp.route('/jobs/<string:job_id>')
+@login_required
+def estado_job(job_id):
+    from services.pdf_concurrency import estado_job as _estado
+    if len(job_id) != 64 or any(c not in '0123456789abcdef' for c in job_id):
+        return jsonify({'ok': False, 'error': 'Job invalido'}), 404
+    return jsonify({'ok': True, 'job_id': job_id, 'estado': _estado(job_id)})
@@ -269,8 +269,10 @@ def revision_ia(id):
         # Recalcular es un pedido explicito de volver a preguntar: se tira el memo
         # de clasificacion del presupuesto para no reusar las respuestas de la
         # corrida anterior. Sin esto, "Recalcular" devolveria lo mismo por 1 hora.
-        from services.clasificador_llm import memo_borrar, memo_scope_presupuesto
+        from services.clasificador_llm import (cache_org_olvidar, memo_borrar,
+                                               memo_scope_presupuesto)
         memo_borrar(memo_scope_presupuesto(pres.id, nivel))
+        cache_org_olvidar(pres.organizacion_id, items)
 
     # Modelo de encofrado del pliego (autodetectado sobre TODOS los items).
     from services.pipeline_presupuesto_ia import _pliego_tiene_encofrado
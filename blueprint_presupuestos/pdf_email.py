@@ -175,8 +175,8 @@ def generar_pdf(id):
         try:
             # Generar PDF con WeasyPrint
             pdf_raw = io.BytesIO()
-            from services.pdf_concurrency import render_pdf_into
-            _r = render_pdf_into(pdf_raw, html_string, presentational_hints=True)
+            from services.pdf_concurrency import render_pdf_cacheado
+            _r = render_pdf_cacheado(pdf_raw, html_string, presentational_hints=True)
             if _r is not None:
                 return _r
             pdf_raw.seek(0)
@@ -304,8 +304,8 @@ def pdf_cliente(id):
             vig_dias=vig_dias, fecha_vig=fecha_vig, logo_base64=logo_base64, now=datetime.now(),
         )
         pdf_raw = io.BytesIO()
-        from services.pdf_concurrency import render_pdf_into
-        _r = render_pdf_into(pdf_raw, html_string, presentational_hints=True)
+        from services.pdf_concurrency import render_pdf_cacheado
+        _r = render_pdf_cacheado(pdf_raw, html_string, presentational_hints=True)
         if _r is not None:
             return _r
         pdf_raw.seek(0)
@@ -491,8 +491,11 @@ Saludos cordiales,
 
         # Generar PDF y limpiar metadatos para evitar falsos positivos de antivirus
         pdf_raw = io.BytesIO()
-        from services.pdf_concurrency import render_pdf_into
-        _r = render_pdf_into(pdf_raw, html_string, presentational_hints=True)
+        from services.pdf_concurrency import render_pdf_cacheado
+        # Sin job: el PDF se adjunta ya. El cache igual evita re-renderizar el
+        # que se acaba de descargar.
+        _r = render_pdf_cacheado(pdf_raw, html_string, permitir_async=False,
+                                 presentational_hints=True)
         if _r is not None:
             return _r
         pdf_raw.seek(0)
@@ -8,6 +8,7 @@ import base64
 import json
 import logging
 import math
+import time
 from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
@@ -36,6 +37,7 @@ else:
 # Contexto CAC y tipo de cambio (requeridos por el sistema de etapas)
 from services.cac.cac_service import CACContext, get_cac_context
 from services.exchange.base import ExchangeRateSnapshot
+from config.cache_config import cache_query, invalidate_tags
 
 # ----------------- Coeficientes y constantes -----------------
 
@@ -2824,19 +2826,35 @@ ETAPA_REGLAS_BASE = {
 
 STAGE_CALC_CACHE: Dict[str, Any] = {}
 
-# Cache de precios por organización (inventario + constructoras)
-# Estructura: {org_id: {'data': {codigo: (precio, fuente, detalle)}, 'ts': datetime}}
-_PRICE_CACHE: Dict[int, Any] = {}
+# Cache de precios por organización (inventario + constructoras + MO de lista
+# propia). Dos niveles compartidos entre workers (config/cache_config: LRU en
+# proceso + Redis, versionado por tags); sin Redis queda solo el LRU local.
+# Se invalida por org con los hooks de registrar_hooks_cache_precios (cambios
+# de precio en inventario, presupuestos importados) y, la MO, con los de
+# precio_recurso_service (provider_price_list).
 _PRICE_CACHE_TTL = 300  # 5 minutos
+_PRICE_CACHE_VERSION = 2  # subir si cambia el formato del mapa cacheado
 
+_SESSION_KEY_PRECIOS_CALC = 'calc_precios_orgs_sucias'
+_hooks_cache_precios_registrados = False
 
-def _build_price_cache(org_id: int) -> Dict[str, Tuple[Decimal, str, str]]:
+
+def _tags_price_cache(org_id: int):
+    return [f'calc_precios:{org_id}']
+
+
+@cache_query(ttl=_PRICE_CACHE_TTL, key_prefix=f'calc_precios_v{_PRICE_CACHE_VERSION}',
+             tags=_tags_price_cache, local_fallback=True)
+def _build_price_cache(org_id: int) -> Dict[str, Tuple[str, str, str]]:
     """
     Construye cache de precios para una organización con dos queries:
     1. Precios del inventario (ItemInventario.precio_promedio)
     2. Promedio de precios importados de constructoras (ItemPresupuesto)
 
-    Retorna dict: {codigo: (precio, fuente, detalle)}
+    Solo columnas (sin objetos ORM) y resultado serializable a JSON, para que
+    el mapa viva en Redis y lo compartan los workers.
+
+    Retorna dict: {codigo: (precio, fuente, detalle)}, precio como string decimal
     fuente = 'inventario' | 'constructora'
     """
     from extensions import db
@@ -2844,19 +2862,24 @@ def _build_price_cache(org_id: int) -> Dict[str, Tuple[Decimal, str, str]]:
     from models.budgets import Presupuesto, ItemPresupuesto
     from sqlalchemy import func
 
-    result: Dict[str, Tuple[Decimal, str, str]] = {}
+    inicio = time.perf_counter()
+    result: Dict[str, Tuple[str, str, str]] = {}
 
     # --- Query 1: Precios del inventario ---
-    inv_items = ItemInventario.query.filter_by(
-        organizacion_id=org_id,
-        activo=True
-    ).all()
+    inv_items = (
+        db.session.query(ItemInventario.id, ItemInventario.codigo,
+                         ItemInventario.nombre, ItemInventario.precio_promedio)
+        .filter(ItemInventario.organizacion_id == org_id,
+                ItemInventario.activo.is_(True),
+                ItemInventario.precio_promedio > 0)
+        .all()
+    )
 
     inv_price_map: Dict[str, Tuple[Decimal, str, int]] = {}  # codigo -> (precio, nombre, id)
     id_to_codigo: Dict[int, str] = {}
 
     for item in inv_items:
-        if item.codigo and item.precio_promedio and float(item.precio_promedio) > 0:
+        if item.codigo:
             inv_price_map[item.codigo] = (
                 Decimal(str(item.precio_promedio)),
                 item.nombre,
@@ -2904,28 +2927,96 @@ def _build_price_cache(org_id: int) -> Dict[str, Tuple[Decimal, str, str]]:
         constr = constructora_map.get(codigo)
 
         if inv and inv[0] > 0:
-            result[codigo] = (inv[0], 'inventario', f"{inv[1]}")
+            result[codigo] = (str(inv[0]), 'inventario', f"{inv[1]}")
         elif constr and constr[0] > 0:
-            result[codigo] = (constr[0], 'constructora', f"Promedio de {constr[1]} presupuestos importados")
+            result[codigo] = (str(constr[0]), 'constructora', f"Promedio de {constr[1]} presupuestos importados")
 
     logging.info(
         f"Cache de precios org={org_id}: {len(result)} codigos "
         f"({sum(1 for v in result.values() if v[1] == 'inventario')} inventario, "
-        f"{sum(1 for v in result.values() if v[1] == 'constructora')} constructora)"
+        f"{sum(1 for v in result.values() if v[1] == 'constructora')} constructora) "
+        f"reconstruido en {(time.perf_counter() - inicio) * 1000:.0f} ms"
     )
     return result
 
 
-def _get_price_cache(org_id: int) -> Dict[str, Tuple[Decimal, str, str]]:
-    """Retorna cache de precios, reconstruyendo si expiró (TTL 5 min)."""
-    now = datetime.utcnow()
-    cached = _PRICE_CACHE.get(org_id)
-    if cached and (now - cached['ts']).total_seconds() < _PRICE_CACHE_TTL:
-        return cached['data']
+def _get_price_cache(org_id: int) -> Dict[str, Tuple[str, str, str]]:
+    """Retorna el mapa de precios de la org desde el cache compartido (TTL 5 min).
+
+    Hits, misses y tiempo promedio de reconstruccion quedan en
+    cache_stats()['prefixes']['calc_precios_v<N>'].
+    """
+    return _build_price_cache(org_id)
+
+
+def invalidar_cache_precios(*org_ids: int) -> None:
+    """Descarta el mapa de precios de las orgs en todos los workers."""
+    tags = [t for org_id in org_ids if org_id for t in _tags_price_cache(org_id)]
+    if tags:
+        invalidate_tags(*tags)
+
+
+def registrar_hooks_cache_precios() -> None:
+    """Invalida el mapa de precios al commitear cambios de precios de
+    inventario o de presupuestos importados (idempotente)."""
+    global _hooks_cache_precios_registrados
+    if _hooks_cache_precios_registrados:
+        return
+    from sqlalchemy import event, inspect, select
+    from sqlalchemy.orm import Session, object_session
+    from models import ItemInventario
+    from models.budgets import Presupuesto, ItemPresupuesto
+
+    def _anotar(target, org_id):
+        session = object_session(target)
+        if session is not None and org_id:
+            session.info.setdefault(_SESSION_KEY_PRECIOS_CALC, set()).add(org_id)
+
+    def _cambio(target, *campos):
+        estado = inspect(target)
+        return any(estado.attrs[c].history.has_changes() for c in campos)
+
+    @event.listens_for(ItemInventario, 'after_insert')
+    @event.listens_for(ItemInventario, 'after_delete')
+    def _item_alta_baja(mapper, connection, target):
+        _anotar(target, target.organizacion_id)
+
+    @event.listens_for(ItemInventario, 'after_update')
+    def _item_precio(mapper, connection, target):
+        if _cambio(target, 'precio_promedio', 'codigo', 'nombre', 'activo', 'organizacion_id'):
+            _anotar(target, target.organizacion_id)
+
+    def _item_presupuesto(connection, target):
+        if target.origen == 'importado' and target.item_inventario_id:
+            _anotar(target, connection.scalar(
+                select(Presupuesto.organizacion_id).where(Presupuesto.id == target.presupuesto_id)))
+
+    @event.listens_for(ItemPresupuesto, 'after_insert')
+    @event.listens_for(ItemPresupuesto, 'after_delete')
+    def _importado_alta_baja(mapper, connection, target):
+        _item_presupuesto(connection, target)
 
-    data = _build_price_cache(org_id)
-    _PRICE_CACHE[org_id] = {'data': data, 'ts': now}
-    return data
+    @event.listens_for(ItemPresupuesto, 'after_update')
+    def _importado_cambio(mapper, connection, target):
+        if _cambio(target, 'precio_unitario', 'item_inventario_id', 'origen'):
+            _item_presupuesto(connection, target)
+
+    @event.listens_for(Presupuesto, 'after_update')
+    def _presupuesto_borrado(mapper, connection, target):
+        if _cambio(target, 'deleted_at'):
+            _anotar(target, target.organizacion_id)
+
+    @event.listens_for(Session, 'after_commit')
+    def _despues_de_commit(session):
+        org_ids = session.info.pop(_SESSION_KEY_PRECIOS_CALC, None)
+        if org_ids:
+            invalidar_cache_precios(*org_ids)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _despues_de_rollback(session):
+        session.info.pop(_SESSION_KEY_PRECIOS_CALC, None)
+
+    _hooks_cache_precios_registrados = True
 
 
 # ----------------- Funciones base -----------------
@@ -2949,10 +3040,10 @@ def obtener_multiplicador_tipo(tipo):
     return 1.0, clave.title()
 
 
-# 2026-05-08: cache in-process del mapeo de precios MO desde lista propia
-# OBYRA. Se invalida por org. Evita 1 query por cada codigo MO (puede ser
-# decenas en un calculo de presupuesto completo).
-_CACHE_MO_LISTA_PROPIA_BY_CAT = {'org_id': None, 'data': None}
+# 2026-05-08: cache del mapeo de precios MO desde lista propia OBYRA. Evita 1
+# query por cada codigo MO (puede ser decenas en un calculo de presupuesto
+# completo). Compartido y por org (antes guardaba una sola org por proceso);
+# lo invalidan los hooks de provider_price_list (tags 'precios:<org>').
 
 
 def _mapear_mo_codigo_a_categoria(codigo: str) -> str:
@@ -2980,10 +3071,12 @@ def _obtener_mo_lista_propia_por_categoria(org_id: int):
     """
     if not org_id:
         return None
+    return _mo_lista_propia_por_categoria(org_id)
 
-    if _CACHE_MO_LISTA_PROPIA_BY_CAT.get('org_id') == org_id:
-        return _CACHE_MO_LISTA_PROPIA_BY_CAT.get('data')
 
+@cache_query(ttl=_PRICE_CACHE_TTL, key_prefix='calc_mo_lista_propia',
+             tags=lambda org_id: ['precios', f'precios:{org_id}'], local_fallback=True)
+def _mo_lista_propia_por_categoria(org_id: int):
     cats = {
         'ayudante': [],
         'medio_oficial': [],
@@ -2991,11 +3084,15 @@ def _obtener_mo_lista_propia_por_categoria(org_id: int):
         'oficial_especializado': [],
     }
     try:
+        from extensions import db
         from models.provider_price_list import ProviderPriceList
-        rows = ProviderPriceList.query.filter_by(
-            organizacion_id=org_id,
-            fuente='lista_propia_obyra',
-        ).all()
+        rows = (
+            db.session.query(ProviderPriceList.descripcion,
+                             ProviderPriceList.unidad,
+                             ProviderPriceList.precio_unitario)
+            .filter_by(organizacion_id=org_id, fuente='lista_propia_obyra')
+            .all()
+        )
 
         for row in rows:
             desc = (row.descripcion or '').lower()
@@ -3033,8 +3130,6 @@ def _obtener_mo_lista_propia_por_categoria(org_id: int):
         promedios = {'ayudante': 0.0, 'medio_oficial': 0.0,
                      'oficial': 0.0, 'oficial_especializado': 0.0}
 
-    _CACHE_MO_LISTA_PROPIA_BY_CAT['org_id'] = org_id
-    _CACHE_MO_LISTA_PROPIA_BY_CAT['data'] = promedios
     return promedios
 
 
@@ -20,6 +20,11 @@ def make_celery(app_name=__name__):
             'tasks.emails',
             'tasks.pdfs',
             'tasks.ia',
+            'tasks.evm',
+            'tasks.alertas',
+            'tasks.geocoding',
+            'tasks.offline',
+            'tasks.marketplace',
         ]
     )
 
@@ -36,6 +41,30 @@ def make_celery(app_name=__name__):
         worker_max_tasks_per_child=1000,
     )
 
+    # Tareas periódicas (celery -A celery_app beat)
+    celery_app.conf.beat_schedule = {
+        'escanear-alertas-evm': {
+            'task': 'tasks.evm.escanear_alertas_evm',
+            'schedule': float(os.getenv('EVM_ALERTAS_INTERVAL_SEC', '3600')),
+        },
+        'refrescar-alertas-dashboard': {
+            'task': 'tasks.alertas.refrescar_alertas_dashboard',
+            'schedule': float(os.getenv('ALERTAS_SNAPSHOT_INTERVAL_SEC', '300')),
+        },
+        'purgar-cache-pdf': {
+            'task': 'tasks.pdfs.purgar_cache_pdf',
+            'schedule': 24 * 3600.0,
+        },
+        'purgar-registros-sync-offline': {
+            'task': 'tasks.offline.purgar_registros_sync',
+            'schedule': 24 * 3600.0,
+        },
+        'volcar-visitas-productos': {
+            'task': 'tasks.marketplace.volcar_visitas_productos',
+            'schedule': float(os.getenv('MARKETPLACE_VISITAS_FLUSH_SEC', '60')),
+        },
+    }
+
     return celery_app
 
 
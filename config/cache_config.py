@@ -9,13 +9,32 @@ Uso:
     @cache_query(ttl=300, key_prefix='user')
     def get_user_by_email(email):
         return Usuario.query.filter_by(email=email).first()
+
+Arquitectura (dos niveles):
+    1. LRU en proceso (acotado, TTL corto) -> un hit no toca Redis.
+    2. Redis compartido entre workers -> un miss local cuesta un solo MGET.
+
+Invalidación por tags: cada entrada lleva tags (siempre `prefix:<key_prefix>`,
+más los que devuelva `tags=`, ej. `org:12`). Invalidar un tag incrementa un
+contador de versión en Redis (O(1), sin SCAN) y publica un mensaje por pub/sub
+para que el resto de los workers descarte sus copias locales.
+
+    @cache_query(ttl=300, key_prefix='org', tags=lambda org_id: [f'org:{org_id}'])
+    def get_org_settings(org_id): ...
+
+    invalidate_tags(f'org:{org_id}')
 """
 
 import os
 import json
+import time
+import uuid
+import fnmatch
 import functools
 import hashlib
-from typing import Any, Optional, Callable
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Callable, Iterable
 from datetime import timedelta, datetime, date
 
 try:
@@ -35,22 +54,36 @@ def _serialize_value(value: Any) -> str:
     Returns:
         String JSON del valor serializado
     """
-    def default_serializer(obj):
-        """Serializer personalizado para objetos no-JSON"""
-        # Manejar objetos SQLAlchemy
-        if hasattr(obj, '__table__'):
-            # Convertir modelo SQLAlchemy a dict
-            return {
-                c.name: getattr(obj, c.name)
-                for c in obj.__table__.columns
-            }
-        # Manejar datetime
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        # Para otros objetos, convertir a string
-        return str(obj)
+    return json.dumps(value, default=_default_serializer, ensure_ascii=False)
+
+
+def _default_serializer(obj):
+    """Serializer personalizado para objetos no-JSON"""
+    # Manejar objetos SQLAlchemy
+    if hasattr(obj, '__table__'):
+        # Convertir modelo SQLAlchemy a dict
+        return {
+            c.name: getattr(obj, c.name)
+            for c in obj.__table__.columns
+        }
+    # Manejar datetime
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # Para otros objetos, convertir a string
+    return str(obj)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, str(default))))
+    except (TypeError, ValueError):
+        return default
 
-    return json.dumps(value, default=default_serializer, ensure_ascii=False)
+
+# Canal pub/sub para invalidaciones entre workers
+INVALIDATION_CHANNEL = 'obyra:cache:invalidate'
+# Prefijo de los contadores de versión por tag
+TAG_VERSION_PREFIX = 'obyra:tagv:'
 
 
 class CacheConfig:
@@ -60,6 +93,12 @@ class CacheConfig:
         self.enabled = REDIS_AVAILABLE and os.getenv('REDIS_URL') is not None
         self.redis_client: Optional[redis.Redis] = None
         self.default_ttl = 300  # 5 minutos por defecto
+        # Nivel local: tamaño máximo y TTL tope de cada entrada en memoria.
+        # El TTL local acota la staleness si se pierde un mensaje de pub/sub.
+        self.local_maxsize = _env_int('CACHE_LOCAL_MAXSIZE', 1024)
+        self.local_ttl = _env_int('CACHE_LOCAL_TTL', 30)
+        # Espera máxima de un worker mientras otro recalcula la misma clave
+        self.stampede_wait = _env_int('CACHE_STAMPEDE_WAIT_MS', 2000) / 1000.0
 
         if self.enabled:
             try:
@@ -96,6 +135,255 @@ def get_cache() -> CacheConfig:
     return _cache_config
 
 
+# ============================================================
+# NIVEL LOCAL (LRU en proceso)
+# ============================================================
+
+class LocalLRUCache:
+    """
+    LRU acotado y thread-safe con TTL por entrada e índice tag -> claves.
+
+    Los valores se guardan ya deserializados y se comparten entre llamadas:
+    quien los reciba debe tratarlos como de solo lectura.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._by_tag: dict = {}
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación: un recálculo que empezó antes de
+        # una invalidación no debe publicar su resultado en el nivel local.
+        self.generation = 0
+
+    def get(self, key: str):
+        """Retorna (True, valor) si hay una entrada vigente, o (False, None)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, _tags, value = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = (),
+            generation: Optional[int] = None) -> bool:
+        if self.maxsize <= 0 or ttl <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            if key in self._data:
+                self._drop(key)
+            tags = tuple(tags)
+            self._data[key] = (time.monotonic() + ttl, tags, value)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self.generation += 1
+            return self._drop(key)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._by_tag.get(tag, ())):
+                    removed += self._drop(key)
+        return removed
+
+    def invalidate_glob(self, pattern: str) -> int:
+        with self._lock:
+            self.generation += 1
+            keys = [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+            return sum(self._drop(k) for k in keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._by_tag.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop(self, key: str) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[1]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        return True
+
+
+_local_cache = LocalLRUCache(_cache_config.local_maxsize)
+
+
+def get_local_cache() -> LocalLRUCache:
+    """Retorna el LRU en proceso compartido por todos los decoradores."""
+    return _local_cache
+
+
+# ============================================================
+# MÉTRICAS POR key_prefix
+# ============================================================
+
+_stats_lock = threading.Lock()
+_prefix_stats: dict = {}
+
+
+def _record(prefix: str, outcome: str, elapsed: float = 0.0) -> None:
+    with _stats_lock:
+        s = _prefix_stats.get(prefix)
+        if s is None:
+            s = _prefix_stats[prefix] = {
+                'local_hits': 0, 'redis_hits': 0, 'misses': 0,
+                'stampede_waits': 0, 'errors': 0,
+                'hit_time': 0.0, 'miss_time': 0.0,
+            }
+        s[outcome] += 1
+        if outcome in ('local_hits', 'redis_hits'):
+            s['hit_time'] += elapsed
+        elif outcome == 'misses':
+            s['miss_time'] += elapsed
+
+
+def _prefix_stats_snapshot() -> dict:
+    with _stats_lock:
+        out = {}
+        for prefix, s in _prefix_stats.items():
+            hits = s['local_hits'] + s['redis_hits']
+            out[prefix] = {
+                'local_hits': s['local_hits'],
+                'redis_hits': s['redis_hits'],
+                'misses': s['misses'],
+                'stampede_waits': s['stampede_waits'],
+                'errors': s['errors'],
+                'hit_rate': _calculate_hit_rate(hits, s['misses']),
+                'avg_hit_ms': round(s['hit_time'] * 1000 / hits, 3) if hits else 0.0,
+                'avg_miss_ms': (round(s['miss_time'] * 1000 / s['misses'], 3)
+                                if s['misses'] else 0.0),
+            }
+        return out
+
+
+def reset_cache_stats() -> None:
+    """Resetea los contadores por prefijo (útil en tests y benchmarks)."""
+    with _stats_lock:
+        _prefix_stats.clear()
+
+
+# ============================================================
+# INVALIDACIÓN ENTRE WORKERS (pub/sub)
+# ============================================================
+
+_PROCESS_TOKEN = uuid.uuid4().hex
+_listener_lock = threading.Lock()
+_listener_pid: Optional[int] = None
+
+
+def _apply_invalidation(message: dict) -> None:
+    """Aplica en el LRU local una invalidación recibida (o emitida) por pub/sub."""
+    op = message.get('op')
+    values = message.get('values') or []
+    if op == 'tags':
+        _local_cache.invalidate_tags(values)
+    elif op == 'keys':
+        for key in values:
+            _local_cache.delete(key)
+    elif op == 'pattern':
+        for pattern in values:
+            _local_cache.invalidate_glob(pattern)
+    elif op == 'clear':
+        _local_cache.clear()
+
+
+def _publish_invalidation(op: str, values: list) -> None:
+    cache = get_cache()
+    if not cache.is_enabled():
+        return
+    try:
+        payload = json.dumps({'op': op, 'values': values, 'origin': _PROCESS_TOKEN})
+        cache.get_client().publish(INVALIDATION_CHANNEL, payload)
+    except Exception as e:
+        print(f"[WARN] Error publicando invalidación de cache: {e}")
+
+
+def _listen_invalidations(client) -> None:
+    backoff = 1.0
+    while True:
+        pubsub = None
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Al (re)conectar pudimos perder mensajes: empezar de cero localmente
+            _local_cache.clear()
+            backoff = 1.0
+            while True:
+                msg = pubsub.get_message(timeout=1.0)
+                if not msg or msg.get('type') != 'message':
+                    continue
+                try:
+                    data = json.loads(msg.get('data') or '{}')
+                except (TypeError, ValueError):
+                    continue
+                if data.get('origin') == _PROCESS_TOKEN:
+                    continue
+                _apply_invalidation(data)
+        except Exception as e:
+            print(f"[WARN] Listener de invalidación de cache caído: {e}")
+            _local_cache.clear()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def _ensure_listener() -> None:
+    """Arranca (una vez por proceso, también después de un fork) el listener."""
+    global _listener_pid
+    pid = os.getpid()
+    if _listener_pid == pid:
+        return
+    cache = get_cache()
+    if not cache.is_enabled():
+        return
+    with _listener_lock:
+        if _listener_pid == pid:
+            return
+        # Tras un fork el LRU heredado del padre no recibió invalidaciones
+        _local_cache.clear()
+        t = threading.Thread(
+            target=_listen_invalidations,
+            args=(cache.get_client(),),
+            name='obyra-cache-invalidation',
+            daemon=True,
+        )
+        t.start()
+        _listener_pid = pid
+
+
+# ============================================================
+# CLAVES, TAGS Y SINGLE-FLIGHT
+# ============================================================
+
 def _generate_cache_key(prefix: str, *args, **kwargs) -> str:
     """
     Genera una clave de cache única basada en los argumentos.
@@ -121,13 +409,90 @@ def _generate_cache_key(prefix: str, *args, **kwargs) -> str:
     return f"obyra:{prefix}:{data_hash}"
 
 
-def cache_query(ttl: int = 300, key_prefix: str = 'query'):
+def _prefix_tag(key_prefix: str) -> str:
+    return f'prefix:{key_prefix}'
+
+
+def _resolve_tags(key_prefix: str, tags, args, kwargs) -> list:
+    resolved = [_prefix_tag(key_prefix)]
+    if tags is None:
+        return resolved
+    try:
+        extra = tags(*args, **kwargs) if callable(tags) else tags
+    except Exception as e:
+        print(f"[WARN] Error calculando tags de cache ({key_prefix}): {e}")
+        return resolved
+    for tag in extra or ():
+        tag = str(tag)
+        if tag not in resolved:
+            resolved.append(tag)
+    return resolved
+
+
+_inflight_lock = threading.Lock()
+_inflight: dict = {}
+
+
+def _single_flight_enter(key: str):
+    """Retorna (es_lider, evento). Los seguidores esperan el evento del líder."""
+    with _inflight_lock:
+        event = _inflight.get(key)
+        if event is not None:
+            return False, event
+        event = _inflight[key] = threading.Event()
+        return True, event
+
+
+def _single_flight_exit(key: str, event: threading.Event) -> None:
+    with _inflight_lock:
+        if _inflight.get(key) is event:
+            del _inflight[key]
+    event.set()
+
+
+def _read_redis(client, cache_key: str, tags: list):
+    """
+    Un solo MGET trae el valor y las versiones actuales de sus tags.
+
+    Returns:
+        (encontrado, valor, versiones_actuales)
+    """
+    raw, *versions = client.mget([cache_key] + [TAG_VERSION_PREFIX + t for t in tags])
+    current = {t: int(v or 0) for t, v in zip(tags, versions)}
+    if raw is None:
+        return False, None, current
+    try:
+        envelope = json.loads(raw)
+    except (TypeError, ValueError):
+        return False, None, current
+    # Entradas sin sobre (formato anterior) se tratan como miss y se reescriben
+    if not isinstance(envelope, dict) or '_d' not in envelope:
+        return False, None, current
+    stored = envelope.get('_tv') or {}
+    if any(int(stored.get(t, 0)) != v for t, v in current.items()):
+        return False, None, current
+    return True, envelope['_d'], current
+
+
+def cache_query(ttl: int = 300, key_prefix: str = 'query', tags=None,
+                local_ttl: Optional[int] = None, local_fallback: bool = False,
+                negative_ttl: Optional[int] = None):
     """
-    Decorador para cachear resultados de queries en Redis.
+    Decorador para cachear resultados de queries (LRU local + Redis).
 
     Args:
         ttl: Time to live en segundos (default: 300 = 5 minutos)
         key_prefix: Prefijo para la clave de cache
+        tags: Lista de tags o callable que recibe los mismos argumentos que la
+              función y retorna los tags de la entrada (ej. ``['org:12']``)
+        local_ttl: TTL del nivel en proceso (default: min(ttl, CACHE_LOCAL_TTL))
+        local_fallback: Si Redis no está disponible, cachear igual en el LRU
+              local con el mismo TTL local (sin Redis no hay invalidación
+              entre workers: usarlo solo donde un valor viejo por ese lapso
+              es aceptable)
+        negative_ttl: TTL para resultados vacíos (``[]``, ``{}``, ``''``, ``0``);
+              default: el mismo ``ttl``. Para no cachear un fallo transitorio
+              como vacío, la función debe lanzar una excepción (no se cachea)
 
     Ejemplo:
         @cache_query(ttl=600, key_prefix='user_email')
@@ -138,6 +503,9 @@ def cache_query(ttl: int = 300, key_prefix: str = 'query'):
         - Si Redis no está disponible, ejecuta la función normalmente sin cachear
         - Para forzar refrescar cache, pasar flush_cache=True como parámetro
         - Solo cachea objetos serializables a JSON (str, int, dict, list, None)
+        - Los hits devuelven el valor deserializado compartido: no mutarlo
+        - Si varios llamadores piden la misma clave en frío, solo uno recalcula
+          (single-flight en el proceso + lock corto en Redis entre workers)
     """
     def decorator(func: Callable) -> Callable:
         @functools.wraps(func)
@@ -146,49 +514,162 @@ def cache_query(ttl: int = 300, key_prefix: str = 'query'):
 
             # Si cache no está habilitado, ejecutar función directamente
             if not cache.is_enabled():
+                if local_fallback:
+                    return _local_only(func, args, kwargs, key_prefix, tags, ttl, negative_ttl,
+                                       local_ttl=local_ttl)
+                kwargs.pop('flush_cache', None)
                 return func(*args, **kwargs)
 
+            _ensure_listener()
+            started = time.perf_counter()
+
             # Permitir forzar refresh del cache
             flush_cache = kwargs.pop('flush_cache', False)
 
             # Generar clave de cache
             cache_key = _generate_cache_key(key_prefix, *args, **kwargs)
+            entry_tags = _resolve_tags(key_prefix, tags, args, kwargs)
+            effective_local_ttl = min(ttl, cache.local_ttl if local_ttl is None else local_ttl)
 
-            # Si no se fuerza flush, intentar obtener del cache
             if not flush_cache:
-                try:
-                    client = cache.get_client()
-                    cached_value = client.get(cache_key)
-
-                    if cached_value is not None:
-                        # Cache hit
-                        return json.loads(cached_value)
-                except Exception as e:
-                    # Si hay error al leer cache, continuar sin cachear
-                    print(f"[WARN] Error leyendo cache {cache_key}: {e}")
+                found, value = _local_cache.get(cache_key)
+                if found:
+                    _record(key_prefix, 'local_hits', time.perf_counter() - started)
+                    return value
+
+            leader, event = _single_flight_enter(cache_key)
+            if not leader:
+                # Otro thread de este proceso está recalculando la misma clave
+                _record(key_prefix, 'stampede_waits')
+                event.wait(cache.stampede_wait)
+                found, value = _local_cache.get(cache_key)
+                if found and not flush_cache:
+                    _record(key_prefix, 'local_hits', time.perf_counter() - started)
+                    return value
 
-            # Cache miss o flush - ejecutar función
-            result = func(*args, **kwargs)
-
-            # Intentar guardar en cache
             try:
-                if result is not None:
-                    client = cache.get_client()
-                    serialized = _serialize_value(result)
-                    client.setex(cache_key, ttl, serialized)
-            except (TypeError, ValueError) as e:
-                # Objeto no serializable, no cachear
-                print(f"[WARN] No se puede cachear resultado de {func.__name__}: {e}")
-            except Exception as e:
-                # Otros errores de Redis, continuar sin cachear
-                print(f"[WARN] Error guardando cache {cache_key}: {e}")
-
-            return result
+                return _lookup_or_compute(
+                    func, args, kwargs, cache, cache_key, entry_tags,
+                    ttl, effective_local_ttl, key_prefix, flush_cache, started,
+                    negative_ttl,
+                )
+            finally:
+                if leader:
+                    _single_flight_exit(cache_key, event)
 
         return wrapper
     return decorator
 
 
+def _ttl_for(result, ttl: int, negative_ttl: Optional[int]) -> int:
+    if negative_ttl is not None and not result:
+        return min(ttl, negative_ttl)
+    return ttl
+
+
+def _local_only(func, args, kwargs, key_prefix, tags, ttl, negative_ttl=None, local_ttl=None):
+    """cache_query(local_fallback=True) sin Redis: solo el LRU del proceso,
+    con el TTL local (min(ttl, CACHE_LOCAL_TTL) salvo `local_ttl` explícito)."""
+    started = time.perf_counter()
+    ttl = min(ttl, get_cache().local_ttl if local_ttl is None else local_ttl)
+    flush_cache = kwargs.pop('flush_cache', False)
+    cache_key = _generate_cache_key(key_prefix, *args, **kwargs)
+    if not flush_cache:
+        found, value = _local_cache.get(cache_key)
+        if found:
+            _record(key_prefix, 'local_hits', time.perf_counter() - started)
+            return value
+
+    leader, event = _single_flight_enter(cache_key)
+    if not leader:
+        _record(key_prefix, 'stampede_waits')
+        event.wait(get_cache().stampede_wait)
+        found, value = _local_cache.get(cache_key)
+        if found and not flush_cache:
+            _record(key_prefix, 'local_hits', time.perf_counter() - started)
+            return value
+
+    try:
+        generation = _local_cache.generation
+        result = func(*args, **kwargs)
+        if result is not None:
+            _local_cache.set(cache_key, result, _ttl_for(result, ttl, negative_ttl),
+                             _resolve_tags(key_prefix, tags, args, kwargs), generation)
+    finally:
+        if leader:
+            _single_flight_exit(cache_key, event)
+    _record(key_prefix, 'misses', time.perf_counter() - started)
+    return result
+
+
+def _lookup_or_compute(func, args, kwargs, cache, cache_key, entry_tags, ttl,
+                       local_ttl, key_prefix, flush_cache, started, negative_ttl=None):
+    client = cache.get_client()
+    generation = _local_cache.generation
+    current_versions = None
+    lock_key = f'{cache_key}:lock'
+    lock_acquired = False
+
+    # Si no se fuerza flush, intentar obtener del cache
+    if not flush_cache:
+        try:
+            found, value, current_versions = _read_redis(client, cache_key, entry_tags)
+            if found:
+                # Cache hit
+                _local_cache.set(cache_key, value, local_ttl, entry_tags, generation)
+                _record(key_prefix, 'redis_hits', time.perf_counter() - started)
+                return value
+
+            # Miss en Redis: si otro worker ya está recalculando, esperarlo
+            lock_ms = max(100, int(cache.stampede_wait * 1000))
+            lock_acquired = bool(client.set(lock_key, _PROCESS_TOKEN, nx=True, px=lock_ms))
+            if not lock_acquired:
+                _record(key_prefix, 'stampede_waits')
+                deadline = time.monotonic() + cache.stampede_wait
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    found, value, current_versions = _read_redis(client, cache_key, entry_tags)
+                    if found:
+                        _local_cache.set(cache_key, value, local_ttl, entry_tags, generation)
+                        _record(key_prefix, 'redis_hits', time.perf_counter() - started)
+                        return value
+        except Exception as e:
+            # Si hay error al leer cache, continuar sin cachear
+            _record(key_prefix, 'errors')
+            print(f"[WARN] Error leyendo cache {cache_key}: {e}")
+
+    # Cache miss o flush - ejecutar función
+    result = func(*args, **kwargs)
+
+    # Intentar guardar en cache
+    try:
+        if result is not None:
+            if current_versions is None:
+                current_versions = _read_redis(client, cache_key, entry_tags)[2]
+            serialized = _serialize_value(result)
+            envelope = '{"_tv": %s, "_d": %s}' % (json.dumps(current_versions), serialized)
+            entry_ttl = _ttl_for(result, ttl, negative_ttl)
+            client.setex(cache_key, entry_ttl, envelope)
+            _local_cache.set(cache_key, json.loads(serialized), min(local_ttl, entry_ttl),
+                             entry_tags, generation)
+        if lock_acquired:
+            client.delete(lock_key)
+    except (TypeError, ValueError) as e:
+        # Objeto no serializable, no cachear
+        print(f"[WARN] No se puede cachear resultado de {func.__name__}: {e}")
+    except Exception as e:
+        # Otros errores de Redis, continuar sin cachear
+        _record(key_prefix, 'errors')
+        print(f"[WARN] Error guardando cache {cache_key}: {e}")
+
+    _record(key_prefix, 'misses', time.perf_counter() - started)
+    return result
+
+
+# ============================================================
+# INVALIDACIÓN
+# ============================================================
+
 def invalidate_cache(key_prefix: str, *args, **kwargs) -> bool:
     """
     Invalida una entrada específica del cache.
@@ -205,19 +686,60 @@ def invalidate_cache(key_prefix: str, *args, **kwargs) -> bool:
         # Invalidar cache de get_user_by_email('user@example.com')
         invalidate_cache('user_email', 'user@example.com')
     """
+    cache_key = _generate_cache_key(key_prefix, *args, **kwargs)
+    _local_cache.delete(cache_key)
+
     cache = get_cache()
     if not cache.is_enabled():
         return False
 
     try:
-        cache_key = _generate_cache_key(key_prefix, *args, **kwargs)
         client = cache.get_client()
-        return client.delete(cache_key) > 0
+        deleted = client.delete(cache_key) > 0
+        _publish_invalidation('keys', [cache_key])
+        return deleted
     except Exception as e:
         print(f"[WARN] Error invalidando cache: {e}")
         return False
 
 
+def invalidate_tags(*tags: str) -> bool:
+    """
+    Invalida todas las entradas que lleven alguno de los tags.
+
+    Incrementa el contador de versión de cada tag en Redis (las entradas viejas
+    dejan de ser válidas y expiran solas por TTL) y avisa al resto de los
+    workers por pub/sub. No hace SCAN.
+
+    Ejemplo:
+        invalidate_tags(f'org:{org_id}', f'obra:{obra_id}')
+    """
+    tags = [str(t) for t in tags if t]
+    if not tags:
+        return False
+    _local_cache.invalidate_tags(tags)
+
+    cache = get_cache()
+    if not cache.is_enabled():
+        return False
+
+    try:
+        pipe = get_cache().get_client().pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(TAG_VERSION_PREFIX + tag)
+        pipe.execute()
+        _publish_invalidation('tags', tags)
+        return True
+    except Exception as e:
+        print(f"[WARN] Error invalidando tags {tags}: {e}")
+        return False
+
+
+def invalidate_prefix(key_prefix: str) -> bool:
+    """Invalida todas las entradas de un key_prefix (equivale a 'obyra:<prefix>:*')."""
+    return invalidate_tags(_prefix_tag(key_prefix))
+
+
 def invalidate_pattern(pattern: str) -> int:
     """
     Invalida múltiples claves que coincidan con un patrón.
@@ -226,7 +748,11 @@ def invalidate_pattern(pattern: str) -> int:
         pattern: Patrón de búsqueda (ej: 'obyra:user:*', 'obyra:org:123:*')
 
     Returns:
-        Número de claves eliminadas
+        Número de claves eliminadas: las borradas en Redis, o sin Redis las
+        del LRU local. Para patrones de prefijo completo ('obyra:<prefix>:*')
+        se invalida por versión de tag, sin SCAN: en Redis no se cuentan (las
+        claves viejas expiran por TTL) y se retorna cuántas entradas se
+        descartaron del LRU de este proceso.
 
     Ejemplo:
         # Invalidar todos los caches de usuarios
@@ -235,13 +761,23 @@ def invalidate_pattern(pattern: str) -> int:
         # Invalidar todos los caches de una organización específica
         invalidate_pattern('obyra:org:123:*')
     """
+    parts = pattern.split(':')
+    if len(parts) == 3 and parts[0] == 'obyra' and parts[2] == '*' \
+            and parts[1] and not any(c in parts[1] for c in '*?['):
+        locales = _local_cache.invalidate_tags([_prefix_tag(parts[1])])
+        invalidate_prefix(parts[1])
+        return locales
+
+    locales = _local_cache.invalidate_glob(pattern)
+
     cache = get_cache()
     if not cache.is_enabled():
-        return 0
+        return locales
 
     try:
         client = cache.get_client()
         keys = list(client.scan_iter(match=pattern, count=100))
+        _publish_invalidation('pattern', [pattern])
 
         if keys:
             return client.delete(*keys)
@@ -253,16 +789,25 @@ def invalidate_pattern(pattern: str) -> int:
 
 def cache_stats() -> dict:
     """
-    Retorna estadísticas del cache Redis.
+    Retorna estadísticas del cache Redis y del nivel local.
 
     Returns:
-        Diccionario con estadísticas del cache
+        Diccionario con estadísticas del cache. `prefixes` trae, por key_prefix,
+        hits locales/Redis, misses, esperas por stampede, errores, hit rate y
+        latencia promedio de hit/miss en ms (contadores de este proceso).
     """
+    local = {
+        'size': len(_local_cache),
+        'maxsize': _local_cache.maxsize,
+        'ttl': get_cache().local_ttl,
+    }
     cache = get_cache()
     if not cache.is_enabled():
         return {
             'enabled': False,
-            'message': 'Redis cache no disponible'
+            'message': 'Redis cache no disponible',
+            'local': local,
+            'prefixes': _prefix_stats_snapshot(),
         }
 
     try:
@@ -278,12 +823,16 @@ def cache_stats() -> dict:
             'hit_rate': _calculate_hit_rate(
                 info.get('keyspace_hits', 0),
                 info.get('keyspace_misses', 0)
-            )
+            ),
+            'local': local,
+            'prefixes': _prefix_stats_snapshot(),
         }
     except Exception as e:
         return {
             'enabled': False,
-            'error': str(e)
+            'error': str(e),
+            'local': local,
+            'prefixes': _prefix_stats_snapshot(),
         }
 
 
@@ -297,21 +846,21 @@ def _calculate_hit_rate(hits: int, misses: int) -> float:
 
 # Decoradores especializados para casos comunes
 
-def cache_user_query(ttl: int = 600):
+def cache_user_query(ttl: int = 600, tags=None):
     """Decorador especializado para queries de usuarios (10 min TTL)"""
-    return cache_query(ttl=ttl, key_prefix='user')
+    return cache_query(ttl=ttl, key_prefix='user', tags=tags)
 
 
-def cache_org_query(ttl: int = 300):
+def cache_org_query(ttl: int = 300, tags=None):
     """Decorador especializado para queries de organizaciones (5 min TTL)"""
-    return cache_query(ttl=ttl, key_prefix='org')
+    return cache_query(ttl=ttl, key_prefix='org', tags=tags)
 
 
-def cache_obra_query(ttl: int = 60):
+def cache_obra_query(ttl: int = 60, tags=None):
     """Decorador especializado para queries de obras (1 min TTL)"""
-    return cache_query(ttl=ttl, key_prefix='obra')
+    return cache_query(ttl=ttl, key_prefix='obra', tags=tags)
 
 
-def cache_permission_query(ttl: int = 900):
+def cache_permission_query(ttl: int = 900, tags=None):
     """Decorador especializado para queries de permisos (15 min TTL)"""
-    return cache_query(ttl=ttl, key_prefix='permission')
+    return cache_query(ttl=ttl, key_prefix='permission', tags=tags)
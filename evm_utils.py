@@ -3,8 +3,10 @@ Earned Value Management (EVM) utilities for OBYRA
 Implements S-curve analysis, planning distribution, and performance monitoring
 """
 
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+
+import numpy as np
 from sqlalchemy import func
 from extensions import db
 
@@ -64,16 +66,18 @@ def generar_plan_lineal(tarea_id):
     
     try:
         db.session.commit()
-        return True
     except Exception as e:
         db.session.rollback()
         print(f"Error generating linear plan: {e}")
         return False
 
+    _refrescar_rollup_de_tarea(tarea_id)
+    return True
+
 
 def recalcular_avance_semanal(tarea_id):
     """Recalculate weekly progress aggregation from approved advances"""
-    from models import TareaEtapa, TareaAvance, TareaAvanceSemanal
+    from models import TareaEtapa, TareaAvance, TareaAvanceSemanal, TareaPlanSemanal
     
     tarea = TareaEtapa.query.get(tarea_id)
     if not tarea:
@@ -106,6 +110,14 @@ def recalcular_avance_semanal(tarea_id):
         weekly_data[semana]['qty_real'] += float(avance.cantidad_ingresada or 0)
         weekly_data[semana]['total_horas'] += float(avance.horas_trabajadas or 0)
     
+    # EV semanal = presupuesto MO × cantidad de la semana / cantidad planificada total
+    qty_plan_total = float(
+        db.session.query(func.coalesce(func.sum(TareaPlanSemanal.qty_plan), 0))
+        .filter(TareaPlanSemanal.tarea_id == tarea_id)
+        .scalar() or 0
+    ) or 1
+    presup_total = float(tarea.presupuesto_mo or 0)
+
     # Create weekly aggregation records
     for semana, data in weekly_data.items():
         # Calculate actual cost (AC) based on hours worked
@@ -117,269 +129,542 @@ def recalcular_avance_semanal(tarea_id):
             semana=semana,
             qty_real=data['qty_real'],
             ac_mo=ac_mo,
-            ev_mo=0  # Will be calculated in curva_s_tarea function
+            ev_mo=presup_total * data['qty_real'] / qty_plan_total
         )
         db.session.add(avance_sem)
     
     try:
         db.session.commit()
-        return True
     except Exception as e:
         db.session.rollback()
         print(f"Error recalculating weekly progress: {e}")
         return False
 
+    _refrescar_rollup_de_tarea(tarea_id)
+    return True
 
-def curva_s_tarea(tarea_id, desde=None, hasta=None):
-    """Calculate S-curve data (PV, EV, AC) for a task"""
+
+# ---------------------------------------------------------------------------
+# Motor vectorizado
+# ---------------------------------------------------------------------------
+# Carga plan y real de un conjunto de tareas (una tarea, una etapa, una obra o
+# toda la organización) en tres queries y arma matrices semana × tarea. Los
+# acumulados salen de np.cumsum sobre el eje de semanas, así que el costo ya
+# no depende de cuántas tareas haya ni de cuántas veces se consulte cada una.
+
+def _scope_tareas(query, tarea_ids=None, etapa_id=None, obra_id=None,
+                  organizacion_id=None, solo_con_evm=False, con_fechas=False,
+                  con_presupuesto=False):
+    """Aplica el alcance (tarea/etapa/obra/org) a una query que ya joinea TareaEtapa."""
+    from models import TareaEtapa, EtapaObra, Obra
+
+    if tarea_ids is not None:
+        query = query.filter(TareaEtapa.id.in_(list(tarea_ids)))
+    if etapa_id is not None:
+        query = query.filter(TareaEtapa.etapa_id == etapa_id)
+    if obra_id is not None or organizacion_id is not None:
+        query = query.join(EtapaObra, EtapaObra.id == TareaEtapa.etapa_id)
+        if obra_id is not None:
+            query = query.filter(EtapaObra.obra_id == obra_id)
+        if organizacion_id is not None:
+            query = (query.join(Obra, Obra.id == EtapaObra.obra_id)
+                     .filter(Obra.organizacion_id == organizacion_id))
+    if solo_con_evm or con_fechas:
+        query = query.filter(
+            TareaEtapa.fecha_inicio.isnot(None),
+            TareaEtapa.fecha_fin.isnot(None),
+        )
+    if solo_con_evm or con_presupuesto:
+        query = query.filter(TareaEtapa.presupuesto_mo.isnot(None))
+    if solo_con_evm:
+        query = query.filter(TareaEtapa.presupuesto_mo != 0)
+    return query
+
+
+def cargar_series_evm(tarea_ids=None, etapa_id=None, obra_id=None,
+                      organizacion_id=None, solo_con_evm=False, con_fechas=False,
+                      con_presupuesto=False):
+    """Carga las series semanales de EVM de un conjunto de tareas.
+
+    Returns:
+        dict con:
+          - semanas: lista ordenada de lunes (unión de semanas con plan o real)
+          - tareas: lista de dicts {id, nombre, etapa_id, fecha_inicio, fecha_fin,
+            presupuesto_mo} alineada con las columnas de las matrices
+          - pv, qty_plan, qty_real, ac: np.ndarray (semanas × tareas)
+          - tiene_datos: np.ndarray bool por tarea (tiene plan o real)
+        o None si el alcance no tiene tareas.
+    """
     from models import TareaEtapa, TareaPlanSemanal, TareaAvanceSemanal
-    
-    tarea = TareaEtapa.query.get(tarea_id)
-    if not tarea:
-        return []
-    
-    # Get planning and actual data
-    plan_data = {r.semana: r for r in TareaPlanSemanal.query.filter_by(tarea_id=tarea_id).all()}
-    real_data = {r.semana: r for r in TareaAvanceSemanal.query.filter_by(tarea_id=tarea_id).all()}
-    
-    # Get all weeks (union of planned and actual weeks)
-    all_weeks = sorted(set(plan_data.keys()) | set(real_data.keys()))
-    
+
+    alcance = dict(tarea_ids=tarea_ids, etapa_id=etapa_id, obra_id=obra_id,
+                   organizacion_id=organizacion_id, solo_con_evm=solo_con_evm,
+                   con_fechas=con_fechas, con_presupuesto=con_presupuesto)
+
+    tareas = _scope_tareas(
+        db.session.query(
+            TareaEtapa.id, TareaEtapa.nombre, TareaEtapa.etapa_id,
+            TareaEtapa.fecha_inicio, TareaEtapa.fecha_fin, TareaEtapa.presupuesto_mo,
+        ),
+        **alcance
+    ).order_by(TareaEtapa.id).all()
+    if not tareas:
+        return None
+
+    plan_rows = _scope_tareas(
+        db.session.query(
+            TareaPlanSemanal.tarea_id, TareaPlanSemanal.semana,
+            TareaPlanSemanal.qty_plan, TareaPlanSemanal.pv_mo,
+        ).join(TareaEtapa, TareaEtapa.id == TareaPlanSemanal.tarea_id),
+        **alcance
+    ).all()
+    real_rows = _scope_tareas(
+        db.session.query(
+            TareaAvanceSemanal.tarea_id, TareaAvanceSemanal.semana,
+            TareaAvanceSemanal.qty_real, TareaAvanceSemanal.ac_mo,
+        ).join(TareaEtapa, TareaEtapa.id == TareaAvanceSemanal.tarea_id),
+        **alcance
+    ).all()
+
+    semanas = sorted({r.semana for r in plan_rows} | {r.semana for r in real_rows})
+    col = {t.id: j for j, t in enumerate(tareas)}
+    fila = {w: i for i, w in enumerate(semanas)}
+    forma = (len(semanas), len(tareas))
+
+    pv = np.zeros(forma)
+    qty_plan = np.zeros(forma)
+    qty_real = np.zeros(forma)
+    ac = np.zeros(forma)
+    for r in plan_rows:
+        i, j = fila[r.semana], col[r.tarea_id]
+        qty_plan[i, j] += float(r.qty_plan or 0)
+        pv[i, j] += float(r.pv_mo or 0)
+    for r in real_rows:
+        i, j = fila[r.semana], col[r.tarea_id]
+        qty_real[i, j] += float(r.qty_real or 0)
+        ac[i, j] += float(r.ac_mo or 0)
+
+    tiene_datos = np.zeros(len(tareas), dtype=bool)
+    tiene_datos[[col[r.tarea_id] for r in plan_rows]] = True
+    tiene_datos[[col[r.tarea_id] for r in real_rows]] = True
+
+    return {
+        'semanas': semanas,
+        'tareas': [t._asdict() for t in tareas],
+        'pv': pv,
+        'qty_plan': qty_plan,
+        'qty_real': qty_real,
+        'ac': ac,
+        'tiene_datos': tiene_datos,
+    }
+
+
+def _ev_semanal(series):
+    """EV de cada semana por tarea: presupuesto × qty_real / qty_plan_total.
+
+    El total planificado es el de la tarea completa (no el de la ventana
+    desde/hasta), igual que en el cálculo por tarea original.
+    """
+    presup = np.array([float(t['presupuesto_mo'] or 0) for t in series['tareas']])
+    qty_plan_total = series['qty_plan'].sum(axis=0)
+    qty_plan_total[qty_plan_total == 0] = 1
+    return series['qty_real'] * (presup / np.maximum(qty_plan_total, 1e-9))
+
+
+def _ventana(semanas, desde=None, hasta=None):
+    """Máscara booleana de las semanas dentro de [desde, hasta]."""
+    mask = np.ones(len(semanas), dtype=bool)
     if desde:
-        all_weeks = [w for w in all_weeks if w >= desde]
+        mask &= np.array([w >= desde for w in semanas], dtype=bool)
     if hasta:
-        all_weeks = [w for w in all_weeks if w <= hasta]
-    
-    if not all_weeks:
-        return []
-    
-    # Calculate full task totals (not filtered by date range)
-    qty_plan_total = sum((plan.qty_plan for plan in TareaPlanSemanal.query.filter_by(tarea_id=tarea_id).all())) or 1
-    presup_total = float(tarea.presupuesto_mo or 0)
-    
-    # Calculate cumulative values
-    pv_acum = ev_acum = ac_acum = qty_real_acum = 0
+        mask &= np.array([w <= hasta for w in semanas], dtype=bool)
+    return mask
+
+
+def _ratio(num, den):
+    return (num / den) if den > 0 else None
+
+
+def _filas_curva(semanas, pv_acum, ev_acum, ac_acum, extra=None):
+    """Arma la lista de dicts de la curva S con el redondeo histórico."""
     results = []
-    
-    for semana in all_weeks:
-        # Planned Value (PV) this week
-        pv_semana = plan_data[semana].pv_mo if semana in plan_data else 0
-        pv_acum += float(pv_semana or 0)
-        
-        # Actual quantities and costs this week
-        if semana in real_data:
-            qty_real_semana = float(real_data[semana].qty_real or 0)
-            ac_semana = float(real_data[semana].ac_mo or 0)
-        else:
-            qty_real_semana = 0
-            ac_semana = 0
-        
-        qty_real_acum += qty_real_semana
-        ac_acum += ac_semana
-        
-        # Earned Value (EV) calculation - based on actual quantity completed
-        # Use max to avoid division by zero
-        ev_acum = presup_total * (qty_real_acum / max(qty_plan_total, 1e-9))
-        
-        # Performance indicators with safe division
-        cpi = (ev_acum / ac_acum) if ac_acum > 0 else None
-        spi = (ev_acum / pv_acum) if pv_acum > 0 else None
-        
-        # Calculate cumulative planned quantity for this week
-        qty_plan_acum = sum((float(plan_data[w].qty_plan or 0) 
-                           for w in all_weeks if w <= semana and w in plan_data))
-        
-        results.append({
+    for i, semana in enumerate(semanas):
+        pv_v, ev_v, ac_v = float(pv_acum[i]), float(ev_acum[i]), float(ac_acum[i])
+        cpi = _ratio(ev_v, ac_v)
+        spi = _ratio(ev_v, pv_v)
+        row = {
             'semana': semana.isoformat(),
-            'pv': round(pv_acum, 2),
-            'ev': round(ev_acum, 2),
-            'ac': round(ac_acum, 2),
+            'pv': round(pv_v, 2),
+            'ev': round(ev_v, 2),
+            'ac': round(ac_v, 2),
             'cpi': round(cpi, 3) if cpi else None,
             'spi': round(spi, 3) if spi else None,
-            'qty_plan_acum': round(qty_plan_acum, 2),
-            'qty_real_acum': round(qty_real_acum, 2)
-        })
-    
+        }
+        if extra:
+            for nombre, valores in extra.items():
+                row[nombre] = round(float(valores[i]), 2)
+        results.append(row)
     return results
 
 
-def detectar_alertas_evm(obra_id=None, etapa_id=None, tarea_id=None):
-    """Detect EVM performance alerts (CPI < 0.9, SPI < 0.9, overdue tasks)"""
-    from models import TareaEtapa, EtapaObra, Obra
-    
-    alerts = []
-    
-    if tarea_id:
-        # Single task analysis
-        tareas = [TareaEtapa.query.get(tarea_id)]
-    elif etapa_id:
-        # All tasks in stage
-        etapa = EtapaObra.query.get(etapa_id)
-        tareas = etapa.tareas if etapa else []
-    elif obra_id:
-        # All tasks in project
-        obra = Obra.query.get(obra_id)
-        tareas = []
-        if obra:
-            for etapa in obra.etapas:
-                tareas.extend(etapa.tareas)
-    else:
-        # All tasks with EVM data
-        tareas = TareaEtapa.query.filter(
-            TareaEtapa.fecha_inicio.isnot(None),
-            TareaEtapa.fecha_fin.isnot(None),
-            TareaEtapa.presupuesto_mo.isnot(None)
-        ).all()
-    
-    today = date.today()
-    
-    for tarea in tareas:
-        if not tarea or not tarea.fecha_inicio or not tarea.fecha_fin:
-            continue
-            
-        # Get latest S-curve data
-        curve_data = curva_s_tarea(tarea.id)
-        if not curve_data:
+def indicadores_por_tarea(series):
+    """Últimos PV/EV/AC acumulados y CPI/SPI de cada tarea con datos.
+
+    Como los acumulados se arrastran hasta la última semana del conjunto, el
+    valor final de cada columna coincide con el de la última semana propia de
+    la tarea.
+    """
+    if series is None or not series['semanas']:
+        return {}
+    pv_tot = series['pv'].sum(axis=0)
+    ac_tot = series['ac'].sum(axis=0)
+    ev_tot = _ev_semanal(series).sum(axis=0)
+
+    out = {}
+    for j, tarea in enumerate(series['tareas']):
+        if not series['tiene_datos'][j]:
             continue
-            
-        latest_week = curve_data[-1]
-        
-        # Check for performance issues
-        if latest_week['cpi'] and latest_week['cpi'] < 0.9:
-            alerts.append({
-                'type': 'cost_performance',
-                'severity': 'high' if latest_week['cpi'] < 0.8 else 'medium',
-                'tarea_id': tarea.id,
-                'tarea_nombre': tarea.nombre,
-                'message': f"CPI bajo: {latest_week['cpi']:.2f} (sobrecosto)",
-                'cpi': latest_week['cpi'],
-                'fecha': today
-            })
-        
-        if latest_week['spi'] and latest_week['spi'] < 0.9:
-            alerts.append({
-                'type': 'schedule_performance', 
-                'severity': 'high' if latest_week['spi'] < 0.8 else 'medium',
-                'tarea_id': tarea.id,
-                'tarea_nombre': tarea.nombre,
-                'message': f"SPI bajo: {latest_week['spi']:.2f} (atraso cronograma)",
-                'spi': latest_week['spi'],
-                'fecha': today
-            })
-        
-        # Check for overdue tasks
-        if today > tarea.fecha_fin and tarea.pct_completado < 100:
-            alerts.append({
-                'type': 'overdue_task',
-                'severity': 'high',
-                'tarea_id': tarea.id,
-                'tarea_nombre': tarea.nombre,
-                'message': f"Tarea vencida: {(today - tarea.fecha_fin).days} días de retraso",
-                'days_overdue': (today - tarea.fecha_fin).days,
-                'fecha': today
-            })
-    
-    return alerts
+        cpi = _ratio(float(ev_tot[j]), float(ac_tot[j]))
+        spi = _ratio(float(ev_tot[j]), float(pv_tot[j]))
+        out[tarea['id']] = {
+            'pv': round(float(pv_tot[j]), 2),
+            'ev': round(float(ev_tot[j]), 2),
+            'ac': round(float(ac_tot[j]), 2),
+            'cpi': round(cpi, 3) if cpi else None,
+            'spi': round(spi, 3) if spi else None,
+        }
+    return out
 
 
-def curva_s_etapa(etapa_id, desde=None, hasta=None):
-    """Calculate aggregated S-curve for all tasks in a stage"""
-    from models import EtapaObra
-    
-    etapa = EtapaObra.query.get(etapa_id)
-    if not etapa:
+def curva_s_tarea(tarea_id, desde=None, hasta=None):
+    """Calculate S-curve data (PV, EV, AC) for a task"""
+    series = cargar_series_evm(tarea_ids=[tarea_id])
+    if series is None or not series['semanas']:
         return []
-    
-    # Aggregate all task curves
-    all_weeks = set()
-    task_curves = {}
-    
-    for tarea in etapa.tareas:
-        if not tarea.fecha_inicio or not tarea.fecha_fin or not tarea.presupuesto_mo:
-            continue
-            
-        curve = curva_s_tarea(tarea.id, desde, hasta)
-        if curve:
-            task_curves[tarea.id] = {item['semana']: item for item in curve}
-            all_weeks.update(item['semana'] for item in curve)
-    
-    if not all_weeks:
+
+    mask = _ventana(series['semanas'], desde, hasta)
+    if not mask.any():
         return []
-    
-    # Aggregate by week
-    all_weeks = sorted(all_weeks)
-    results = []
-    
-    for semana in all_weeks:
-        pv_total = ev_total = ac_total = 0
-        
-        for tarea_id, curve_data in task_curves.items():
-            if semana in curve_data:
-                pv_total += curve_data[semana]['pv']
-                ev_total += curve_data[semana]['ev']
-                ac_total += curve_data[semana]['ac']
-        
-        # Calculate aggregated performance indicators
-        cpi = (ev_total / ac_total) if ac_total > 0 else None
-        spi = (ev_total / pv_total) if pv_total > 0 else None
-        
-        results.append({
-            'semana': semana,
-            'pv': round(pv_total, 2),
-            'ev': round(ev_total, 2),
-            'ac': round(ac_total, 2),
-            'cpi': round(cpi, 3) if cpi else None,
-            'spi': round(spi, 3) if spi else None
-        })
-    
-    return results
+    semanas = [w for w, m in zip(series['semanas'], mask) if m]
+
+    ev = _ev_semanal(series)[mask, 0]
+    return _filas_curva(
+        semanas,
+        np.cumsum(series['pv'][mask, 0]),
+        np.cumsum(ev),
+        np.cumsum(series['ac'][mask, 0]),
+        extra={
+            'qty_plan_acum': np.cumsum(series['qty_plan'][mask, 0]),
+            'qty_real_acum': np.cumsum(series['qty_real'][mask, 0]),
+        },
+    )
+
+
+def _curva_agregada(series, desde=None, hasta=None):
+    """Curva S sumando todas las columnas (tareas) de `series`."""
+    if series is None or not series['semanas']:
+        return []
+    mask = _ventana(series['semanas'], desde, hasta)
+    if not mask.any():
+        return []
+    semanas = [w for w, m in zip(series['semanas'], mask) if m]
+    return _filas_curva(
+        semanas,
+        np.cumsum(series['pv'][mask].sum(axis=1)),
+        np.cumsum(_ev_semanal(series)[mask].sum(axis=1)),
+        np.cumsum(series['ac'][mask].sum(axis=1)),
+    )
+
+
+def curva_s_etapa(etapa_id, desde=None, hasta=None):
+    """Calculate aggregated S-curve for all tasks in a stage"""
+    series = cargar_series_evm(etapa_id=etapa_id, solo_con_evm=True)
+    return _curva_agregada(series, desde, hasta)
+
+
+# ---------------------------------------------------------------------------
+# Rollup semanal por obra (tabla obra_evm_semanal)
+# ---------------------------------------------------------------------------
+
+def actualizar_rollup_evm_obra(obra_id, commit=True):
+    """Recalcula el rollup semanal de una obra a partir de sus tareas.
+
+    Son tres queries de lectura más el upsert de las semanas que cambiaron;
+    se llama al replanificar una tarea o al reagregar sus avances, así que solo
+    se toca la obra afectada.
+    """
+    from models import ObraEvmSemanal
+
+    series = cargar_series_evm(obra_id=obra_id, solo_con_evm=True)
+    nuevas = {}
+    if series is not None and series['semanas']:
+        pv = series['pv'].sum(axis=1)
+        ev = _ev_semanal(series).sum(axis=1)
+        ac = series['ac'].sum(axis=1)
+        qty_plan = series['qty_plan'].sum(axis=1)
+        qty_real = series['qty_real'].sum(axis=1)
+        for i, semana in enumerate(series['semanas']):
+            nuevas[semana] = (
+                round(float(pv[i]), 2), round(float(ev[i]), 2), round(float(ac[i]), 2),
+                float(qty_plan[i]), float(qty_real[i]),
+            )
+
+    existentes = {r.semana: r for r in ObraEvmSemanal.query.filter_by(obra_id=obra_id).all()}
+    for semana, row in existentes.items():
+        if semana not in nuevas:
+            db.session.delete(row)
+    for semana, (pv_v, ev_v, ac_v, qp_v, qr_v) in nuevas.items():
+        row = existentes.get(semana)
+        if row is None:
+            row = ObraEvmSemanal(obra_id=obra_id, semana=semana)
+            db.session.add(row)
+        row.pv_mo = pv_v
+        row.ev_mo = ev_v
+        row.ac_mo = ac_v
+        row.qty_plan = qp_v
+        row.qty_real = qr_v
+
+    if commit:
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error updating EVM rollup for obra {obra_id}: {e}")
+            return False
+    return True
+
+
+def _obra_id_de_tarea(tarea_id):
+    from models import TareaEtapa, EtapaObra
+    return (db.session.query(EtapaObra.obra_id)
+            .join(TareaEtapa, TareaEtapa.etapa_id == EtapaObra.id)
+            .filter(TareaEtapa.id == tarea_id)
+            .scalar())
+
+
+def _refrescar_rollup_de_tarea(tarea_id):
+    obra_id = _obra_id_de_tarea(tarea_id)
+    if obra_id:
+        actualizar_rollup_evm_obra(obra_id)
+
+
+def rollup_evm_obra(obra_id, desde=None, hasta=None):
+    """Filas semanales (no acumuladas) del rollup de una obra.
+
+    Si la obra todavía no tiene rollup (datos previos a la tabla) lo construye.
+    """
+    from models import ObraEvmSemanal
+
+    def _leer():
+        q = ObraEvmSemanal.query.filter_by(obra_id=obra_id)
+        if desde:
+            q = q.filter(ObraEvmSemanal.semana >= desde)
+        if hasta:
+            q = q.filter(ObraEvmSemanal.semana <= hasta)
+        return q.order_by(ObraEvmSemanal.semana).all()
+
+    rows = _leer()
+    if not rows and not ObraEvmSemanal.query.filter_by(obra_id=obra_id).first():
+        actualizar_rollup_evm_obra(obra_id)
+        rows = _leer()
+    return rows
 
 
 def curva_s_obra(obra_id, desde=None, hasta=None):
     """Calculate aggregated S-curve for all tasks in a project"""
-    from models import Obra
-    
-    obra = Obra.query.get(obra_id)
-    if not obra:
-        return []
-    
-    # Aggregate all stage curves
-    all_weeks = set()
-    stage_curves = {}
-    
-    for etapa in obra.etapas:
-        curve = curva_s_etapa(etapa.id, desde, hasta)
-        if curve:
-            stage_curves[etapa.id] = {item['semana']: item for item in curve}
-            all_weeks.update(item['semana'] for item in curve)
-    
-    if not all_weeks:
+    rows = rollup_evm_obra(obra_id, desde, hasta)
+    if not rows:
         return []
-    
-    # Aggregate by week
-    all_weeks = sorted(all_weeks)
-    results = []
-    
-    for semana in all_weeks:
-        pv_total = ev_total = ac_total = 0
-        
-        for etapa_id, curve_data in stage_curves.items():
-            if semana in curve_data:
-                pv_total += curve_data[semana]['pv']
-                ev_total += curve_data[semana]['ev']
-                ac_total += curve_data[semana]['ac']
-        
-        # Calculate aggregated performance indicators
-        cpi = (ev_total / ac_total) if ac_total > 0 else None
-        spi = (ev_total / pv_total) if pv_total > 0 else None
-        
-        results.append({
-            'semana': semana,
-            'pv': round(pv_total, 2),
-            'ev': round(ev_total, 2),
-            'ac': round(ac_total, 2),
-            'cpi': round(cpi, 3) if cpi else None,
-            'spi': round(spi, 3) if spi else None
-        })
-    
-    return results
\ No newline at end of file
+    return _filas_curva(
+        [r.semana for r in rows],
+        np.cumsum([float(r.pv_mo or 0) for r in rows]),
+        np.cumsum([float(r.ev_mo or 0) for r in rows]),
+        np.cumsum([float(r.ac_mo or 0) for r in rows]),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Alertas EVM por lotes
+# ---------------------------------------------------------------------------
+# El último punto de la curva S de una tarea es simplemente el total de sus
+# filas de plan y de real, así que para alertar no hace falta armar la curva:
+# alcanzan tres agregados agrupados por tarea_id. Las tareas se recorren por
+# keyset (id > último) en páginas de tamaño fijo, de modo que una organización
+# grande no se carga entera en memoria.
+
+EVM_ALERTAS_PAGE_SIZE = 500
+
+
+def _alertas_de_tarea(tarea, plan, real, qty_aprobada, today):
+    """Alertas de una tarea a partir de sus totales (mismo formato histórico)."""
+    alerts = []
+    pv_total, qty_plan_total = plan if plan else (0.0, 0.0)
+    qty_real_total, ac_total = real if real else (0.0, 0.0)
+
+    ev_total = float(tarea.presupuesto_mo or 0) * (
+        qty_real_total / max(qty_plan_total or 1, 1e-9))
+    cpi = _ratio(ev_total, ac_total)
+    spi = _ratio(ev_total, pv_total)
+    cpi = round(cpi, 3) if cpi else None
+    spi = round(spi, 3) if spi else None
+
+    base = {'tarea_id': tarea.id, 'tarea_nombre': tarea.nombre,
+            'obra_id': tarea.obra_id, 'fecha': today}
+
+    if cpi and cpi < 0.9:
+        alerts.append(dict(base, **{
+            'type': 'cost_performance',
+            'severity': 'high' if cpi < 0.8 else 'medium',
+            'message': f"CPI bajo: {cpi:.2f} (sobrecosto)",
+            'cpi': cpi,
+        }))
+
+    if spi and spi < 0.9:
+        alerts.append(dict(base, **{
+            'type': 'schedule_performance',
+            'severity': 'high' if spi < 0.8 else 'medium',
+            'message': f"SPI bajo: {spi:.2f} (atraso cronograma)",
+            'spi': spi,
+        }))
+
+    # Mismo criterio que TareaEtapa.pct_completado, sin una query por tarea
+    if today > tarea.fecha_fin:
+        base_pct = qty_plan_total if qty_plan_total > 0 else float(
+            tarea.objetivo or tarea.cantidad_planificada or 0)
+        pct = min(100.0, qty_aprobada / base_pct * 100.0) if base_pct > 0 else 0
+        if pct < 100:
+            alerts.append(dict(base, **{
+                'type': 'overdue_task',
+                'severity': 'high',
+                'message': f"Tarea vencida: {(today - tarea.fecha_fin).days} días de retraso",
+                'days_overdue': (today - tarea.fecha_fin).days,
+            }))
+
+    return alerts
+
+
+def iterar_alertas_evm(organizacion_id=None, obra_id=None, etapa_id=None, tarea_id=None,
+                       page_size=EVM_ALERTAS_PAGE_SIZE, today=None):
+    """Genera las alertas EVM del alcance pedido, una lista por página de tareas.
+
+    Cada página cuesta cuatro queries (tareas + plan, real y avances aprobados
+    agrupados por tarea) sin importar cuántas tareas tenga.
+    """
+    from models import TareaEtapa, EtapaObra, Obra, TareaPlanSemanal, TareaAvanceSemanal, TareaAvance
+
+    today = today or date.today()
+
+    base = (db.session.query(
+                TareaEtapa.id, TareaEtapa.nombre, TareaEtapa.fecha_fin,
+                TareaEtapa.presupuesto_mo, TareaEtapa.objetivo,
+                TareaEtapa.cantidad_planificada, EtapaObra.obra_id,
+            )
+            .join(EtapaObra, EtapaObra.id == TareaEtapa.etapa_id)
+            .filter(TareaEtapa.fecha_inicio.isnot(None), TareaEtapa.fecha_fin.isnot(None)))
+    if tarea_id:
+        base = base.filter(TareaEtapa.id == tarea_id)
+    elif etapa_id:
+        base = base.filter(TareaEtapa.etapa_id == etapa_id)
+    elif obra_id:
+        base = base.filter(EtapaObra.obra_id == obra_id)
+    else:
+        # Sin alcance puntual: solo tareas con presupuesto de MO
+        base = base.filter(TareaEtapa.presupuesto_mo.isnot(None))
+    if organizacion_id:
+        base = (base.join(Obra, Obra.id == EtapaObra.obra_id)
+                .filter(Obra.organizacion_id == organizacion_id))
+
+    ultimo_id = 0
+    while True:
+        tareas = (base.filter(TareaEtapa.id > ultimo_id)
+                  .order_by(TareaEtapa.id)
+                  .limit(page_size)
+                  .all())
+        if not tareas:
+            return
+        ultimo_id = tareas[-1].id
+        ids = [t.id for t in tareas]
+
+        plan = {
+            r.tarea_id: (float(r.pv or 0), float(r.qty or 0))
+            for r in db.session.query(
+                TareaPlanSemanal.tarea_id,
+                func.sum(TareaPlanSemanal.pv_mo).label('pv'),
+                func.sum(TareaPlanSemanal.qty_plan).label('qty'),
+            ).filter(TareaPlanSemanal.tarea_id.in_(ids))
+             .group_by(TareaPlanSemanal.tarea_id)
+        }
+        real = {
+            r.tarea_id: (float(r.qty or 0), float(r.ac or 0))
+            for r in db.session.query(
+                TareaAvanceSemanal.tarea_id,
+                func.sum(TareaAvanceSemanal.qty_real).label('qty'),
+                func.sum(TareaAvanceSemanal.ac_mo).label('ac'),
+            ).filter(TareaAvanceSemanal.tarea_id.in_(ids))
+             .group_by(TareaAvanceSemanal.tarea_id)
+        }
+        aprobada = {
+            r.tarea_id: float(r.qty or 0)
+            for r in db.session.query(
+                TareaAvance.tarea_id,
+                func.sum(TareaAvance.cantidad_ingresada).label('qty'),
+            ).filter(TareaAvance.tarea_id.in_(ids), TareaAvance.status == 'aprobado')
+             .group_by(TareaAvance.tarea_id)
+        }
+
+        pagina = []
+        for tarea in tareas:
+            # Sin plan ni avance semanal no hay curva: no se evalúa
+            if tarea.id not in plan and tarea.id not in real:
+                continue
+            pagina.extend(_alertas_de_tarea(
+                tarea, plan.get(tarea.id), real.get(tarea.id),
+                aprobada.get(tarea.id, 0.0), today))
+        yield pagina
+
+        if len(tareas) < page_size:
+            return
+
+
+def detectar_alertas_evm(obra_id=None, etapa_id=None, tarea_id=None, organizacion_id=None):
+    """Detect EVM performance alerts (CPI < 0.9, SPI < 0.9, overdue tasks)"""
+    alerts = []
+    for pagina in iterar_alertas_evm(organizacion_id=organizacion_id, obra_id=obra_id,
+                                     etapa_id=etapa_id, tarea_id=tarea_id):
+        alerts.extend(pagina)
+    return alerts
+
+
+def persistir_alertas_evm(organizacion_id, today=None):
+    """Reemplaza el snapshot de alertas EVM de una organización (tabla alertas_evm).
+
+    Lo corre la tarea periódica tasks.evm.escanear_alertas_evm; los dashboards
+    leen la tabla en vez de recalcular. Devuelve la cantidad de alertas guardadas.
+    """
+    from models import AlertaEvm
+
+    ahora = datetime.utcnow()
+    total = 0
+    try:
+        AlertaEvm.query.filter_by(organizacion_id=organizacion_id).delete(synchronize_session=False)
+        for pagina in iterar_alertas_evm(organizacion_id=organizacion_id, today=today):
+            if not pagina:
+                continue
+            db.session.bulk_insert_mappings(AlertaEvm, [{
+                'organizacion_id': organizacion_id,
+                'obra_id': a['obra_id'],
+                'tarea_id': a['tarea_id'],
+                'tipo': a['type'],
+                'severidad': a['severity'],
+                'mensaje': a['message'],
+                'cpi': a.get('cpi'),
+                'spi': a.get('spi'),
+                'dias_atraso': a.get('days_overdue'),
+                'calculado_en': ahora,
+            } for a in pagina])
+            total += len(pagina)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return total
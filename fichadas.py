@@ -12,6 +12,8 @@ from flask import (Blueprint, render_template, request, jsonify,
 from flask_login import login_required, current_user
 from extensions import db
 from models import Obra, ObraMiembro, AsignacionObra, Fichada, Usuario
+from services.asistencia_diaria import (asistencia_periodo, rango_fichadas,
+                                        calcular_horas_dia as _calcular_horas_dia)
 from services.memberships import get_current_org_id
 
 from services.permissions import require_plan
@@ -153,7 +155,7 @@ def _ultima_fichada_hoy(usuario_id, obra_id):
     return (Fichada.query
             .filter(Fichada.usuario_id == usuario_id,
                     Fichada.obra_id == obra_id,
-                    db.func.date(Fichada.fecha_hora) == hoy)
+                    *rango_fichadas(hoy, hoy))
             .order_by(Fichada.fecha_hora.desc())
             .first())
 
@@ -164,51 +166,11 @@ def _fichadas_hoy(usuario_id, obra_id):
     return (Fichada.query
             .filter(Fichada.usuario_id == usuario_id,
                     Fichada.obra_id == obra_id,
-                    db.func.date(Fichada.fecha_hora) == hoy)
+                    *rango_fichadas(hoy, hoy))
             .order_by(Fichada.fecha_hora.asc())
             .all())
 
 
-def _calcular_horas_dia(fichadas_lista):
-    """Calcula horas trabajadas de una lista de fichadas del mismo día.
-
-    Empareja ingreso→egreso y suma las duraciones.
-    Returns: (total_segundos, pares, en_obra)
-      - total_segundos: int, total de segundos trabajados
-      - pares: list of (ingreso_fichada, egreso_fichada, duracion_timedelta)
-      - en_obra: bool, True si la última fichada es ingreso (aún en obra)
-    """
-    fichadas_ord = sorted(fichadas_lista, key=lambda f: f.fecha_hora)
-    pares = []
-    total_seg = 0
-    en_obra = False
-
-    i = 0
-    while i < len(fichadas_ord):
-        f = fichadas_ord[i]
-        if f.tipo == 'ingreso':
-            # Buscar el siguiente egreso
-            egreso = None
-            for j in range(i + 1, len(fichadas_ord)):
-                if fichadas_ord[j].tipo == 'egreso':
-                    egreso = fichadas_ord[j]
-                    i = j + 1
-                    break
-            if egreso:
-                dur = egreso.fecha_hora - f.fecha_hora
-                pares.append((f, egreso, dur))
-                total_seg += int(dur.total_seconds())
-            else:
-                # Ingreso sin egreso: aún en obra
-                en_obra = True
-                i += 1
-        else:
-            # Egreso suelto (sin ingreso previo), ignorar
-            i += 1
-
-    return total_seg, pares, en_obra
-
-
 def _formatear_horas(total_segundos):
     """Formatea segundos a 'Xh Ym'."""
     horas = total_segundos // 3600
@@ -221,6 +183,8 @@ def _formatear_horas(total_segundos):
 def calcular_resumen_horas(obra_id, desde=None, hasta=None, usuario_id=None):
     """Calcula resumen de horas trabajadas por operario en una obra.
 
+    Lee la asistencia diaria (fichadas_asistencia_diaria), no las fichadas.
+
     Returns: list of dicts, one per user:
       [{
         'usuario': Usuario,
@@ -228,54 +192,44 @@ def calcular_resumen_horas(obra_id, desde=None, hasta=None, usuario_id=None):
             'fecha': date,
             'horas_str': '8h 30m',
             'total_segundos': 30600,
-            'pares': [...],
+            'pares': [{'ingreso': '08:00', 'egreso': '16:30', 'segundos': 30600}],
             'en_obra': False,
         }],
         'total_segundos': int,
         'total_horas_str': '42h 15m',
       }]
     """
-    query = (Fichada.query
-             .filter(Fichada.obra_id == obra_id)
-             .order_by(Fichada.fecha_hora.asc()))
+    if desde and isinstance(desde, str):
+        desde = datetime.strptime(desde, '%Y-%m-%d').date()
+    if hasta and isinstance(hasta, str):
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date()
 
-    if usuario_id:
-        query = query.filter(Fichada.usuario_id == usuario_id)
-    if desde:
-        if isinstance(desde, str):
-            desde = datetime.strptime(desde, '%Y-%m-%d').date()
-        query = query.filter(db.func.date(Fichada.fecha_hora) >= desde)
-    if hasta:
-        if isinstance(hasta, str):
-            hasta = datetime.strptime(hasta, '%Y-%m-%d').date()
-        query = query.filter(db.func.date(Fichada.fecha_hora) <= hasta)
-
-    fichadas = query.all()
-    if not fichadas:
+    filas = asistencia_periodo(obra_id, desde=desde, hasta=hasta, usuario_id=usuario_id)
+    if not filas:
         return []
 
-    # Agrupar por usuario y fecha
-    por_usuario = defaultdict(lambda: defaultdict(list))
-    for f in fichadas:
-        dia = f.fecha_hora.date()
-        por_usuario[f.usuario_id][dia].append(f)
+    # Agrupar por usuario (vienen ordenadas por usuario y fecha)
+    por_usuario = defaultdict(list)
+    for fila in filas:
+        por_usuario[fila.usuario_id].append(fila)
+    usuarios = {u.id: u for u in Usuario.query.filter(Usuario.id.in_(list(por_usuario))).all()}
 
     resultado = []
-    for uid, dias_dict in por_usuario.items():
-        usuario = Usuario.query.get(uid)
+    for uid, filas_usuario in por_usuario.items():
+        usuario = usuarios.get(uid)
         if not usuario:
             continue
         dias = []
         total_seg_usuario = 0
-        for dia in sorted(dias_dict.keys()):
-            seg, pares, en_obra = _calcular_horas_dia(dias_dict[dia])
+        for fila in filas_usuario:
+            seg = fila.segundos or 0
             total_seg_usuario += seg
             dias.append({
-                'fecha': dia,
-                'horas_str': _formatear_horas(seg) if seg > 0 else ('En obra' if en_obra else '0m'),
+                'fecha': fila.fecha,
+                'horas_str': _formatear_horas(seg) if seg > 0 else ('En obra' if fila.en_obra else '0m'),
                 'total_segundos': seg,
-                'pares': pares,
-                'en_obra': en_obra,
+                'pares': fila.detalle_pares or [],
+                'en_obra': fila.en_obra,
             })
         resultado.append({
             'usuario': usuario,
@@ -347,7 +301,7 @@ def index():
             hoy = _ahora_argentina().date()
             fichadas_obra_hoy = (Fichada.query
                 .filter(Fichada.obra_id == obra.id,
-                        db.func.date(Fichada.fecha_hora) == hoy)
+                        *rango_fichadas(hoy, hoy))
                 .order_by(Fichada.fecha_hora.asc())
                 .all())
             # Agrupar por usuario y determinar quién está en obra
@@ -600,6 +554,9 @@ def api_limpiar_fichadas():
     if not _es_admin(current_user):
         return jsonify({'ok': False, 'error': 'No autorizado'}), 403
     cant = Fichada.query.delete()
+    # El DELETE masivo no pasa por los hooks de Fichada
+    from models import AsistenciaDiaria
+    AsistenciaDiaria.query.delete()
     db.session.commit()
     return jsonify({'ok': True, 'eliminadas': cant})
 
@@ -717,8 +674,7 @@ def api_consulta():
 
     query = (Fichada.query
              .filter(Fichada.obra_id == obra_id,
-                     db.func.date(Fichada.fecha_hora) >= desde,
-                     db.func.date(Fichada.fecha_hora) <= hasta)
+                     *rango_fichadas(desde, hasta))
              .order_by(Fichada.fecha_hora.asc()))
 
     if usuario_id:
@@ -732,9 +688,12 @@ def api_consulta():
         dia = f.fecha_hora.date()
         por_usuario[f.usuario_id][dia].append(f)
 
+    usuarios = ({u.id: u for u in Usuario.query.filter(Usuario.id.in_(list(por_usuario))).all()}
+                if por_usuario else {})
+
     resultado = []
     for uid, dias_dict in por_usuario.items():
-        usuario = Usuario.query.get(uid)
+        usuario = usuarios.get(uid)
         if not usuario:
             continue
         dias = []
@@ -25,44 +25,32 @@ def sugerencias_direccion(direccion: str, *, provider: Optional[str] = None):
     return search(direccion, provider=provider, limit=5)
 
 
-def geocodificar_obras_existentes():
-    """Geocodifica obras sin coordenadas usando el servicio actual."""
+def geocodificar_obras_existentes(organizacion_id: Optional[int] = None) -> Tuple[int, int]:
+    """Geocodifica en el momento las obras sin coordenadas (de una org o de todas).
 
-    from extensions import db
-    from models import Obra
+    Corre en el proceso que la llama; /obras/geocodificar-todas ya no la usa y
+    encola la tarea Celery (ver services/geocoding_batch).
+    """
 
-    obras_pendientes = Obra.query.filter(
-        Obra.deleted_at.is_(None),
-        Obra.direccion.isnot(None),
-        Obra.direccion != "",
-        db.or_(Obra.latitud.is_(None), Obra.longitud.is_(None)),
-    ).all()
+    from models import Organizacion
+    from services.geocoding_batch import geocodificar_obras_pendientes
+
+    if organizacion_id:
+        org_ids = [organizacion_id]
+    else:
+        org_ids = [oid for (oid,) in Organizacion.query.with_entities(Organizacion.id)]
 
     exitosas = 0
     fallidas = 0
-
-    for obra in obras_pendientes:
-        resultado = resolve(obra.direccion)
-        if not resultado:
-            fallidas += 1
+    for oid in org_ids:
+        try:
+            resumen = geocodificar_obras_pendientes(oid)
+        except Exception:  # pragma: no cover - logging solamente
+            if current_app:
+                current_app.logger.exception(f"No se pudo geocodificar las obras de la org {oid}")
             continue
-
-        obra.latitud = resultado.get("lat")
-        obra.longitud = resultado.get("lng")
-        obra.direccion_normalizada = resultado.get("normalized")
-        obra.geocode_place_id = resultado.get("place_id")
-        obra.geocode_provider = resultado.get("provider")
-        obra.geocode_status = resultado.get("status") or "ok"
-        exitosas += 1
-
-    try:
-        db.session.commit()
-    except Exception:  # pragma: no cover - logging solamente
-        db.session.rollback()
-        fallidas = len(obras_pendientes)
-        exitosas = 0
-        if current_app:
-            current_app.logger.exception("No se pudieron guardar los resultados de geocodificación masiva")
+        exitosas += resumen["exitosas"]
+        fallidas += resumen["fallidas"]
 
     return exitosas, fallidas
 
@@ -11,9 +11,26 @@ devolvería NULL).
 Cómo se integra (en app.py):
     from middleware.rls_middleware import setup_rls_middleware
     setup_rls_middleware(app, db)
+
+Costo por conexión:
+    - Las dos variables van en un solo statement (set_config x 2).
+    - Modo sesión (default): en el checkout solo se manda si el contexto que ya
+      tiene la conexión del pool es otro. Lo aplicado se anota en
+      `connection_record.info`, pero recién cuenta cuando la transacción
+      commitea: un SET de sesión dentro de una transacción que se revierte
+      también se revierte.
+    - RLS_SET_LOCAL=true: se manda al empezar cada transacción con alcance
+      local (SET LOCAL), así nunca queda en la conexión. Es lo que hace falta
+      detrás de PgBouncer en modo transaction.
+    - El org del request se resuelve una vez por request (queda en `g`).
+    - Fuera de un request (hilos de un pool, tareas) el contexto se fija con
+      `contexto_rls(org_id)`; si no, las conexiones salen sin organización.
 """
 
+import contextvars
 import logging
+import os
+from contextlib import contextmanager
 from flask import g, has_request_context
 from flask_login import current_user
 from sqlalchemy import event, text
@@ -21,57 +38,210 @@ from sqlalchemy import event, text
 
 logger = logging.getLogger(__name__)
 
+RLS_SET_LOCAL = os.getenv('RLS_SET_LOCAL', 'false').lower() == 'true'
+
+_SQL_CONTEXTO = ("SELECT set_config('app.current_org_id', %s, {local}), "
+                 "set_config('app.is_super_admin', %s, {local})")
+_INFO_APLICADO = 'rls_contexto'
+_INFO_PENDIENTE = 'rls_contexto_pendiente'
+
+_contadores = {'checkouts': 0, 'transacciones': 0, 'sets': 0, 'omitidos': 0}
+_middleware_activo = False
+
+# Contexto fijado explícitamente con contexto_rls(); tiene prioridad sobre el request
+_contexto_fijo = contextvars.ContextVar('rls_contexto_fijo', default=None)
+
+
+def rls_metricas():
+    """Contadores del proceso: cuántos checkouts/transacciones mandaron el SET y
+    cuántos lo evitaron porque la conexión ya tenía el contexto."""
+    return dict(_contadores)
+
+
+def reset_rls_metricas():
+    for clave in _contadores:
+        _contadores[clave] = 0
+
+
+def _formatear(org_id, is_super):
+    return (str(int(org_id)) if org_id is not None else '', 'true' if is_super else 'false')
+
+
+@contextmanager
+def contexto_rls(org_id, is_super_admin=False):
+    """Fija el contexto RLS del hilo actual (p. ej. un hilo de un pool que
+    consulta para una organización). Las conexiones que se saquen dentro del
+    bloque usan ese contexto."""
+    token = _contexto_fijo.set(_formatear(org_id, is_super_admin))
+    try:
+        yield
+    finally:
+        _contexto_fijo.reset(token)
+
+
+def _contexto_actual():
+    """(org_id como texto, 'true'/'false') del contexto fijado o del request;
+    fuera de ambos, vacío."""
+    fijo = _contexto_fijo.get()
+    if fijo is not None:
+        return fijo
+    if not has_request_context():
+        return ('', 'false')
+    contexto = getattr(g, '_rls_contexto', None)
+    if contexto is not None:
+        return contexto
+
+    org_id = None
+    is_super = False
+    # Obtener org_id de la sesión Flask
+    try:
+        from services.memberships import get_current_org_id
+        org_id = get_current_org_id()
+    except Exception:
+        pass
+
+    # Verificar super admin
+    try:
+        if current_user.is_authenticated:
+            is_super = bool(getattr(current_user, 'is_super_admin', False))
+    except Exception:
+        pass
+
+    contexto = _formatear(org_id, is_super)
+    g._rls_contexto = contexto
+    return contexto
+
+
+def invalidar_contexto_rls(sesion=None):
+    """Para cuando cambia la org activa a mitad del request: la próxima
+    conexión vuelve a resolver el contexto.
+
+    Con `sesion`, si ya tiene una transacción abierta (el user loader suele
+    abrirla antes de que se resuelva la membresía) el contexto nuevo se manda
+    en el acto sobre esa conexión, que si no seguiría con el anterior.
+    """
+    if not has_request_context():
+        return
+    g.pop('_rls_contexto', None)
+    if sesion is None or not _middleware_activo or not sesion.in_transaction():
+        return
+    try:
+        conexion = sesion.connection()
+        if conexion.dialect.name != 'postgresql':
+            return
+        contexto = _contexto_actual()
+        _aplicar(conexion.connection.dbapi_connection, contexto, local=RLS_SET_LOCAL)
+        if not RLS_SET_LOCAL:
+            conexion.connection.info[_INFO_PENDIENTE] = contexto
+    except Exception as exc:
+        logger.warning(f'[RLS] Error reaplicando contexto: {exc}')
+
+
+def refrescar_contexto_rls(sesion=None):
+    """Vuelve a resolver el contexto del request (p. ej. después de cargar la
+    membresía); si cambió respecto del ya resuelto, se invalida y se reaplica
+    como en `invalidar_contexto_rls`."""
+    if not has_request_context() or '_rls_contexto' not in g:
+        return
+    previo = g.pop('_rls_contexto')
+    if _contexto_actual() != previo:
+        invalidar_contexto_rls(sesion)
+
+
+def _aplicar(dbapi_connection, contexto, local):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(_SQL_CONTEXTO.format(local='true' if local else 'false'), contexto)
+    finally:
+        cursor.close()
+    _contadores['sets'] += 1
+
 
 def setup_rls_middleware(app, db):
     """
-    Configura el listener de SQLAlchemy para setear variables PostgreSQL en cada checkout
-    de conexión del pool.
+    Configura los listeners de SQLAlchemy que setean las variables PostgreSQL.
 
     Esto es más confiable que un before_request porque cubre TODAS las queries,
     incluyendo las que no vienen de un endpoint HTTP (Celery tasks, CLI, etc).
+
+    Returns:
+        callable sin argumentos que quita los listeners (benchmarks, tests).
     """
+    global _middleware_activo
+    listeners = []
+
+    def _listen(target, nombre, fn):
+        event.listen(target, nombre, fn)
+        listeners.append((target, nombre, fn))
 
-    @event.listens_for(db.engine, "checkout")
-    def receive_checkout(dbapi_connection, connection_record, connection_proxy):
-        """Cada vez que la app saca una conexión del pool, setea el contexto."""
-        try:
-            org_id = None
-            is_super = False
-
-            if has_request_context():
-                # Obtener org_id de la sesión Flask
-                try:
-                    from services.memberships import get_current_org_id
-                    org_id = get_current_org_id()
-                except Exception:
-                    pass
-
-                # Verificar super admin
-                try:
-                    if current_user.is_authenticated:
-                        is_super = bool(getattr(current_user, 'is_super_admin', False))
-                except Exception:
-                    pass
-
-            cursor = dbapi_connection.cursor()
+    if RLS_SET_LOCAL:
+        def receive_begin(conn):
+            """Cada transacción arranca con el contexto del request (SET LOCAL)."""
+            _contadores['transacciones'] += 1
             try:
-                # Setear variables PostgreSQL
-                if org_id is not None:
-                    cursor.execute(f"SET app.current_org_id = '{int(org_id)}';")
+                _aplicar(conn.connection.dbapi_connection, _contexto_actual(), local=True)
+            except Exception as exc:
+                logger.warning(f'[RLS] Error seteando contexto: {exc}')
+
+        _listen(db.engine, 'begin', receive_begin)
+        app.logger.info('[RLS] Middleware configurado (SET LOCAL por transacción)')
+    else:
+        def receive_checkout(dbapi_connection, connection_record, connection_proxy):
+            """Al sacar una conexión del pool, setea el contexto si cambió."""
+            _contadores['checkouts'] += 1
+            try:
+                contexto = _contexto_actual()
+                info = connection_record.info
+                vigente = info.get(_INFO_PENDIENTE) or info.get(_INFO_APLICADO)
+                if vigente == contexto:
+                    _contadores['omitidos'] += 1
+                    return
+                _aplicar(dbapi_connection, contexto, local=False)
+                if getattr(dbapi_connection, 'autocommit', False) is True:
+                    info[_INFO_APLICADO] = contexto
                 else:
-                    cursor.execute("SET app.current_org_id = '';")
+                    info[_INFO_PENDIENTE] = contexto
+            except Exception as exc:
+                # NO bloquear la app si esto falla; sin anotar, se reintenta
+                connection_record.info.pop(_INFO_PENDIENTE, None)
+                connection_record.info.pop(_INFO_APLICADO, None)
+                logger.warning(f'[RLS] Error seteando contexto: {exc}')
+
+        def receive_commit(conn):
+            """El SET de sesión quedó firme junto con la transacción."""
+            try:
+                info = conn.connection.info
+            except Exception:
+                return
+            pendiente = info.pop(_INFO_PENDIENTE, None)
+            if pendiente is not None:
+                info[_INFO_APLICADO] = pendiente
+
+        def receive_rollback(conn):
+            try:
+                conn.connection.info.pop(_INFO_PENDIENTE, None)
+            except Exception:
+                pass
+
+        def receive_reset(dbapi_connection, connection_record, reset_state):
+            # Al devolverla al pool se hace rollback: lo no commiteado se pierde
+            connection_record.info.pop(_INFO_PENDIENTE, None)
+
+        _listen(db.engine, 'checkout', receive_checkout)
+        _listen(db.engine, 'commit', receive_commit)
+        _listen(db.engine, 'rollback', receive_rollback)
+        _listen(db.engine, 'reset', receive_reset)
+        app.logger.info('[RLS] Middleware configurado correctamente')
 
-                cursor.execute(
-                    f"SET app.is_super_admin = '{'true' if is_super else 'false'}';"
-                )
-            finally:
-                cursor.close()
+    _middleware_activo = True
 
-        except Exception as exc:
-            # NO bloquear la app si esto falla
-            logger.warning(f'[RLS] Error seteando contexto: {exc}')
+    def quitar():
+        global _middleware_activo
+        for target, nombre, fn in listeners:
+            event.remove(target, nombre, fn)
+        _middleware_activo = False
 
-    app.logger.info('[RLS] Middleware configurado correctamente')
+    return quitar
 
 
 def reset_rls_context(db):
@@ -79,6 +249,9 @@ def reset_rls_context(db):
     try:
         db.session.execute(text("RESET app.current_org_id;"))
         db.session.execute(text("RESET app.is_super_admin;"))
+        info = db.session.connection().connection.info
+        info.pop(_INFO_PENDIENTE, None)
+        info.pop(_INFO_APLICADO, None)
         db.session.commit()
     except Exception:
         db.session.rollback()
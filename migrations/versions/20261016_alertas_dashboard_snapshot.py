@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Snapshot de alertas del dashboard por organizacion (alertas_dashboard_snapshot)
+
+Revision ID: 202610160003
+Revises: 202610160002
+Create Date: 2026-10-16
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160003'
+down_revision = '202610160002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS alertas_dashboard_snapshot (
+            id SERIAL PRIMARY KEY,
+            organizacion_id INTEGER NOT NULL UNIQUE REFERENCES organizaciones(id) ON DELETE CASCADE,
+            alertas JSON NOT NULL,
+            conteo_critica INTEGER NOT NULL DEFAULT 0,
+            conteo_alta INTEGER NOT NULL DEFAULT 0,
+            conteo_media INTEGER NOT NULL DEFAULT 0,
+            conteo_total INTEGER NOT NULL DEFAULT 0,
+            tiempos_ms JSON,
+            vigente BOOLEAN NOT NULL DEFAULT TRUE,
+            calculado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS alertas_dashboard_snapshot")
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Snapshot de alertas EVM por organizacion (alertas_evm)
+
+Revision ID: 202610160002
+Revises: 202610160001
+Create Date: 2026-10-16
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160002'
+down_revision = '202610160001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS alertas_evm (
+            id SERIAL PRIMARY KEY,
+            organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+            obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+            tarea_id INTEGER NOT NULL REFERENCES tareas_etapa(id) ON DELETE CASCADE,
+            tipo VARCHAR(30) NOT NULL,
+            severidad VARCHAR(10) NOT NULL,
+            mensaje VARCHAR(200),
+            cpi NUMERIC(8, 3),
+            spi NUMERIC(8, 3),
+            dias_atraso INTEGER,
+            calculado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_alertas_evm_org_sev ON alertas_evm(organizacion_id, severidad)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_alertas_evm_obra ON alertas_evm(obra_id)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS alertas_evm")
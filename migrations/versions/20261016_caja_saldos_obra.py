@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Saldo de caja por obra mantenido por hooks (caja_saldos_obra)
+
+Revision ID: 202610160009
+Revises: 202610160008
+Create Date: 2026-10-16
+
+Idempotente (IF NOT EXISTS / ON CONFLICT) para convivir con runtime_migrations.py.
+El backfill arma los saldos desde movimientos_caja confirmados.
+"""
+from alembic import op
+
+
+revision = '202610160009'
+down_revision = '202610160008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS caja_saldos_obra (
+            obra_id INTEGER PRIMARY KEY REFERENCES obras(id) ON DELETE CASCADE,
+            organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+            transferido NUMERIC(15, 2) NOT NULL DEFAULT 0,
+            gastado NUMERIC(15, 2) NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_caja_saldos_obra_organizacion_id "
+               "ON caja_saldos_obra(organizacion_id)")
+    op.execute("""
+        INSERT INTO caja_saldos_obra (obra_id, organizacion_id, transferido, gastado, updated_at)
+        SELECT obra_id, MIN(organizacion_id),
+               COALESCE(SUM(CASE WHEN tipo = 'transferencia_a_obra' THEN monto ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN tipo IN ('devolucion_obra', 'pago_proveedor', 'gasto_obra')
+                                 THEN monto ELSE 0 END), 0),
+               CURRENT_TIMESTAMP
+        FROM movimientos_caja
+        WHERE estado = 'confirmado'
+        GROUP BY obra_id
+        ON CONFLICT (obra_id) DO NOTHING
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS caja_saldos_obra")
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Asistencia diaria por operario, obra y día (fichadas_asistencia_diaria)
+
+Revision ID: 202610160011
+Revises: 202610160010
+Create Date: 2026-10-16
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+El emparejado ingreso/egreso es Python: el relleno lo hace
+runtime_migrations.py o `flask fichadas reconstruir-asistencia`.
+"""
+from alembic import op
+
+
+revision = '202610160011'
+down_revision = '202610160010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS fichadas_asistencia_diaria (
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+            fecha DATE NOT NULL,
+            segundos INTEGER NOT NULL DEFAULT 0,
+            pares INTEGER NOT NULL DEFAULT 0,
+            en_obra BOOLEAN NOT NULL DEFAULT FALSE,
+            cantidad_fichadas INTEGER NOT NULL DEFAULT 0,
+            detalle_pares JSON,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (usuario_id, obra_id, fecha)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_fichadas_asistencia_obra_fecha "
+               "ON fichadas_asistencia_diaria(obra_id, fecha)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_fichadas_obra_fecha ON fichadas(obra_id, fecha_hora)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS fichadas_asistencia_diaria")
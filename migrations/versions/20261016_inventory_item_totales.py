@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Totales de stock desnormalizados en inventory_item
+
+Revision ID: 202610160006
+Revises: 202610160005
+Create Date: 2026-10-16
+
+inventory_item.stock_total / stock_reservado los mantiene InventoryService en
+cada movimiento y reserva; aca se cargan desde stock y stock_reservation.
+`flask inventario reconciliar-stock` recalcula y reporta diferencias.
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160006'
+down_revision = '202610160005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE inventory_item ADD COLUMN IF NOT EXISTS stock_total NUMERIC(14,3) NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE inventory_item ADD COLUMN IF NOT EXISTS stock_reservado NUMERIC(14,3) NOT NULL DEFAULT 0")
+    op.execute("""
+        UPDATE inventory_item i SET
+            stock_total = COALESCE((SELECT SUM(s.cantidad) FROM stock s WHERE s.item_id = i.id), 0),
+            stock_reservado = COALESCE((SELECT SUM(r.qty) FROM stock_reservation r
+                                        WHERE r.item_id = i.id AND r.estado = 'activa'), 0)
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_inventory_item_company_stock ON inventory_item(company_id, stock_total)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_inventory_item_company_stock")
+    op.execute("ALTER TABLE inventory_item DROP COLUMN IF EXISTS stock_reservado")
+    op.execute("ALTER TABLE inventory_item DROP COLUMN IF EXISTS stock_total")
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Rollup semanal de EVM por obra (obra_evm_semanal)
+
+Revision ID: 202610160001
+Revises: 202607160001
+Create Date: 2026-10-16
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160001'
+down_revision = '202607160001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS obra_evm_semanal (
+            id SERIAL PRIMARY KEY,
+            obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+            semana DATE NOT NULL,
+            pv_mo NUMERIC(15, 2) DEFAULT 0,
+            ev_mo NUMERIC(15, 2) DEFAULT 0,
+            ac_mo NUMERIC(15, 2) DEFAULT 0,
+            qty_plan NUMERIC DEFAULT 0,
+            qty_real NUMERIC DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT uq_obra_evm_semana UNIQUE (obra_id, semana)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_obra_evm_semanal_obra_id ON obra_evm_semanal(obra_id)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS obra_evm_semanal")
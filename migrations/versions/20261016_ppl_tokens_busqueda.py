@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Tokens persistidos + indice GIN para el fuzzy de provider_price_list
+
+Revision ID: 202610160004
+Revises: 202610160003
+Create Date: 2026-10-16
+
+provider_price_list.tokens_busqueda guarda los tokens significativos de la
+descripcion (ver services/precio_recurso_service.tokens_busqueda_precio). El
+fuzzy filtra con string_to_array(tokens_busqueda, ' ') && ARRAY[...], que usa
+el GIN de abajo. Las filas existentes se rellenan al arrancar, desde
+runtime_migrations.py (rellenar_tokens_busqueda): la tokenizacion es Python.
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160004'
+down_revision = '202610160003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE provider_price_list ADD COLUMN IF NOT EXISTS tokens_busqueda TEXT")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_ppl_tokens_busqueda_gin
+            ON provider_price_list USING GIN (string_to_array(tokens_busqueda, ' '))
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_ppl_tokens_busqueda_gin")
+    op.execute("ALTER TABLE provider_price_list DROP COLUMN IF EXISTS tokens_busqueda")
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Índice full-text de productos del marketplace (product.texto_busqueda)
+
+Revision ID: 202610160010
+Revises: 202610160009
+Create Date: 2026-10-16
+
+product.texto_busqueda guarda nombre + descripcion sin acentos (ver
+services/busqueda_productos.texto_busqueda_producto). La búsqueda filtra con
+to_tsvector('spanish', coalesce(texto_busqueda, '')) @@ to_tsquery(...), que
+usa el GIN de abajo. Las filas existentes se rellenan al arrancar, desde
+runtime_migrations.py (rellenar_texto_busqueda): la normalización es Python.
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160010'
+down_revision = '202610160009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE product ADD COLUMN IF NOT EXISTS texto_busqueda TEXT")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_product_texto_busqueda_fts
+            ON product USING GIN (to_tsvector('spanish', coalesce(texto_busqueda, '')))
+    """)
+    # Listado sin texto: publicados por más visitados
+    op.execute("CREATE INDEX IF NOT EXISTS ix_product_estado_visitas "
+               "ON product(estado, visitas DESC, id DESC)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_product_variant_product_precio "
+               "ON product_variant(product_id, precio)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_product_variant_product_precio")
+    op.execute("DROP INDEX IF EXISTS ix_product_estado_visitas")
+    op.execute("DROP INDEX IF EXISTS ix_product_texto_busqueda_fts")
+    op.execute("ALTER TABLE product DROP COLUMN IF EXISTS texto_busqueda")
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Costo promedio ponderado por item y deposito (stock.costo_promedio)
+
+Revision ID: 202610160005
+Revises: 202610160004
+Create Date: 2026-10-16
+
+stock.costo_promedio lo mantiene InventoryService en cada movimiento y
+stock_movement.costo_unitario guarda el costo con el que se valuo cada uno.
+Los stocks existentes arrancan con el ultimo precio de ingreso del item:
+`flask inventario costos-iniciales` (InventoryService.seed_average_costs).
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160005'
+down_revision = '202610160004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE stock ADD COLUMN IF NOT EXISTS costo_promedio NUMERIC(15,4) NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE stock_movement ADD COLUMN IF NOT EXISTS costo_unitario NUMERIC(15,4)")
+
+
+def downgrade():
+    op.execute("ALTER TABLE stock_movement DROP COLUMN IF EXISTS costo_unitario")
+    op.execute("ALTER TABLE stock DROP COLUMN IF EXISTS costo_promedio")
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Sync offline idempotente y pulls incrementales
+
+Revision ID: 202610160007
+Revises: 202610160006
+Create Date: 2026-10-16
+
+sync_operaciones_offline: registro de offline_id ya aplicados por
+/api/offline/sync-batch. updated_at en obras, tareas_etapa e items_inventario
+(y created_at en tarea_responsables) para los pulls ?since= de /api/offline;
+las filas existentes arrancan con la fecha de la migración.
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160007'
+down_revision = '202610160006'
+branch_labels = None
+depends_on = None
+
+_TABLAS_UPDATED_AT = ('obras', 'tareas_etapa', 'items_inventario')
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS sync_operaciones_offline (
+            id SERIAL PRIMARY KEY,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+            offline_id VARCHAR(64) NOT NULL,
+            tipo VARCHAR(30) NOT NULL,
+            server_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT uq_sync_offline_usuario_op UNIQUE (usuario_id, offline_id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_sync_operaciones_offline_created_at "
+               "ON sync_operaciones_offline(created_at)")
+    for tabla in _TABLAS_UPDATED_AT:
+        op.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_updated_at ON {tabla}(updated_at)")
+    op.execute("ALTER TABLE tarea_responsables ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    op.execute("ALTER TABLE tarea_responsables DROP COLUMN IF EXISTS created_at")
+    for tabla in _TABLAS_UPDATED_AT:
+        op.execute(f"DROP INDEX IF EXISTS ix_{tabla}_updated_at")
+        op.execute(f"ALTER TABLE {tabla} DROP COLUMN IF EXISTS updated_at")
+    op.execute("DROP TABLE IF EXISTS sync_operaciones_offline")
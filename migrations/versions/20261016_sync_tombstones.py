@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Tombstones para los pulls incrementales de /api/offline (sync_tombstones)
+
+Revision ID: 202610160008
+Revises: 202610160007
+Create Date: 2026-10-16
+
+Idempotente (IF NOT EXISTS) para convivir con runtime_migrations.py.
+"""
+from alembic import op
+
+
+revision = '202610160008'
+down_revision = '202610160007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            id SERIAL PRIMARY KEY,
+            organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+            entidad VARCHAR(20) NOT NULL,
+            entidad_id INTEGER NOT NULL,
+            usuario_id INTEGER,
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_sync_tombstones_org_entidad "
+               "ON sync_tombstones(organizacion_id, entidad, deleted_at)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS sync_tombstones")
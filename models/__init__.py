@@ -43,12 +43,17 @@ from models.projects import (
     TareaAvanceFoto,
     TareaPlanSemanal,
     TareaAvanceSemanal,
+    ObraEvmSemanal,
+    AlertaEvm,
+    SyncOperacionOffline,
+    SyncTombstone,
     TareaAdjunto,
     TareaResponsables,
     EtapaDependencia,
     AsignacionObra,
     ObraMiembro,
     Fichada,
+    AsistenciaDiaria,
     resumen_tarea,
     calcular_avance_tarea,
     calcular_avance_etapa,
@@ -184,12 +189,14 @@ from models.templates import (
     LiquidacionMO,
     LiquidacionMOItem,
     MovimientoCaja,
+    SaldoCajaObra,
 )
 
 # Utility models
 from models.utils import (
     RegistroTiempo,
     ConsultaAgente,
+    AlertaDashboardSnapshot,
 )
 
 # Audit log
@@ -357,10 +364,15 @@ __all__ = [
     'TareaAvanceFoto',
     'TareaPlanSemanal',
     'TareaAvanceSemanal',
+    'ObraEvmSemanal',
+    'AlertaEvm',
+    'SyncOperacionOffline',
+    'SyncTombstone',
     'TareaAdjunto',
     'TareaResponsables',
     'AsignacionObra',
     'ObraMiembro',
+    'AsistenciaDiaria',
     'resumen_tarea',
     # Budgets
     'ExchangeRate',
@@ -453,9 +465,11 @@ __all__ = [
     'WorkCertification',
     'WorkCertificationItem',
     'WorkPayment',
+    'SaldoCajaObra',
     # Utils
     'RegistroTiempo',
     'ConsultaAgente',
+    'AlertaDashboardSnapshot',
     # Cierre de obra
     'CierreObra',
     'ActaEntrega',
@@ -1,6 +1,7 @@
 """Modelos de Inventario y Gestión de Stock"""
 
 from datetime import datetime, date
+from decimal import Decimal
 from extensions import db
 from sqlalchemy.dialects.postgresql import JSONB
 import json
@@ -245,6 +246,8 @@ class ItemInventario(db.Model):
     # factor_conversion: para convertir m² a unidades (ej: 0.0225 para cerámico 15x15)
     factor_conversion = db.Column(db.Numeric(10, 6), nullable=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    # Marca de agua para los pulls incrementales de /api/offline (?since=)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     organizacion_id = db.Column(db.Integer, db.ForeignKey('organizaciones.id'), nullable=False, index=True)
 
     # Relaciones
@@ -514,6 +517,7 @@ class InventoryItem(db.Model):
     __tablename__ = 'inventory_item'
     __table_args__ = (
         db.UniqueConstraint('company_id', 'sku', name='uq_inventory_item_company_sku'),
+        db.Index('ix_inventory_item_company_stock', 'company_id', 'stock_total'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -527,6 +531,11 @@ class InventoryItem(db.Model):
     descripcion = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     activo = db.Column(db.Boolean, default=True)
+    # Totales desnormalizados de Stock y StockReservation (activas). Los
+    # mantiene InventoryService en la misma transaccion que el movimiento;
+    # `flask inventario reconciliar-stock` los recalcula y reporta diferencias.
+    stock_total = db.Column(db.Numeric(14, 3), nullable=False, default=0, server_default='0')
+    stock_reservado = db.Column(db.Numeric(14, 3), nullable=False, default=0, server_default='0')
 
     # Relaciones
     company = db.relationship('Organizacion', backref='inventory_items')
@@ -541,12 +550,12 @@ class InventoryItem(db.Model):
     @property
     def total_stock(self):
         """Stock total en todos los depósitos"""
-        return sum(stock.cantidad for stock in self.stocks)
+        return self.stock_total if self.stock_total is not None else Decimal('0')
 
     @property
     def reserved_stock(self):
         """Stock reservado activo"""
-        return sum(res.qty for res in self.reservations if res.estado == 'activa')
+        return self.stock_reservado if self.stock_reservado is not None else Decimal('0')
 
     @property
     def available_stock(self):
@@ -673,6 +682,9 @@ class Stock(db.Model):
     item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
     warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), nullable=False)
     cantidad = db.Column(db.Numeric(14, 3), default=0)
+    # Costo promedio ponderado por unidad en este depósito. Lo mantiene
+    # InventoryService._update_stock en cada movimiento (ver get_stock_value).
+    costo_promedio = db.Column(db.Numeric(15, 4), nullable=False, default=0, server_default='0')
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relaciones
@@ -700,6 +712,9 @@ class StockMovement(db.Model):
     motivo = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    # Costo unitario con el que se valuó el movimiento (NULL en los anteriores
+    # a la valuación por promedio ponderado)
+    costo_unitario = db.Column(db.Numeric(15, 4))
 
     # Relaciones
     item = db.relationship('InventoryItem', back_populates='movements')
@@ -55,6 +55,9 @@ class Obra(db.Model):
     # Fichada / geolocalización
     radio_fichada_metros = db.Column(db.Integer, default=200)
 
+    # Marca de agua para los pulls incrementales de /api/offline (?since=)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
     # Relaciones
     organizacion = db.relationship('Organizacion', back_populates='obras')
     cliente_rel = db.relationship('Cliente', back_populates='obras')  # Nuevo: relación con Cliente
@@ -264,6 +267,9 @@ class TareaEtapa(db.Model):
     # Se setea en el endpoint api_editar_datos_tarea() al guardar.
     editado_manual = db.Column(db.Boolean, default=False, nullable=False)
 
+    # Marca de agua para los pulls incrementales de /api/offline (?since=)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
     # Relaciones
     etapa = db.relationship('EtapaObra', back_populates='tareas')
     miembros = db.relationship('TareaMiembro', back_populates='tarea', cascade='all, delete-orphan')
@@ -378,6 +384,51 @@ class TareaAvance(db.Model):
         return f'<TareaAvance tarea_id={self.tarea_id} cantidad={self.cantidad}>'
 
 
+class SyncOperacionOffline(db.Model):
+    """Operaciones de /api/offline/sync-batch ya aplicadas, por offline_id.
+
+    El cliente reintenta el lote entero cuando se corta la conexión; con este
+    registro la operación repetida devuelve el resultado original en vez de
+    crear otro TareaAvance. Se escribe en el mismo savepoint que la operación.
+    """
+    __tablename__ = "sync_operaciones_offline"
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey("usuarios.id", ondelete='CASCADE'), nullable=False)
+    organizacion_id = db.Column(db.Integer, db.ForeignKey("organizaciones.id", ondelete='CASCADE'), nullable=False)
+    offline_id = db.Column(db.String(64), nullable=False)
+    tipo = db.Column(db.String(30), nullable=False)
+    server_id = db.Column(db.Integer)  # TareaAvance / TareaEtapa afectada
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (db.UniqueConstraint('usuario_id', 'offline_id', name='uq_sync_offline_usuario_op'),)
+
+    def __repr__(self):
+        return f'<SyncOperacionOffline {self.tipo} offline_id={self.offline_id} server_id={self.server_id}>'
+
+
+class SyncTombstone(db.Model):
+    """Borrados que los pulls incrementales de /api/offline informan como `eliminados`.
+
+    Los escriben los hooks de services/offline_sync.registrar_hooks_tombstones
+    (obras, tareas, items de inventario y asignaciones). `usuario_id` se llena
+    cuando el borrado solo afecta a un usuario (le sacaron la tarea).
+    """
+    __tablename__ = "sync_tombstones"
+
+    id = db.Column(db.Integer, primary_key=True)
+    organizacion_id = db.Column(db.Integer, db.ForeignKey("organizaciones.id", ondelete='CASCADE'), nullable=False)
+    entidad = db.Column(db.String(20), nullable=False)  # obra / tarea / item
+    entidad_id = db.Column(db.Integer, nullable=False)
+    usuario_id = db.Column(db.Integer, nullable=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index('ix_sync_tombstones_org_entidad', 'organizacion_id', 'entidad', 'deleted_at'),)
+
+    def __repr__(self):
+        return f'<SyncTombstone {self.entidad} {self.entidad_id} org={self.organizacion_id}>'
+
+
 class TareaAvanceFoto(db.Model):
     """Fotos de evidencia de avances de tareas"""
     __tablename__ = "tarea_avance_fotos"
@@ -438,6 +489,60 @@ class TareaAvanceSemanal(db.Model):
         return f'<TareaAvanceSemanal tarea_id={self.tarea_id} semana={self.semana} qty_real={self.qty_real}>'
 
 
+class ObraEvmSemanal(db.Model):
+    """Rollup semanal de EVM por obra (valores de la semana, no acumulados).
+
+    Lo mantiene evm_utils.actualizar_rollup_evm_obra() cada vez que se
+    replanifica una tarea o se reagregan sus avances; la curva S de la obra y
+    el reporte /api/curva-s leen de acá en vez de recorrer tarea por tarea.
+    """
+    __tablename__ = "obra_evm_semanal"
+
+    id = db.Column(db.Integer, primary_key=True)
+    obra_id = db.Column(db.Integer, db.ForeignKey("obras.id", ondelete='CASCADE'), nullable=False, index=True)
+    semana = db.Column(db.Date, nullable=False)  # Monday of ISO week
+    pv_mo = db.Column(db.Numeric(15, 2), default=0)
+    ev_mo = db.Column(db.Numeric(15, 2), default=0)
+    ac_mo = db.Column(db.Numeric(15, 2), default=0)
+    qty_plan = db.Column(db.Numeric, default=0)
+    qty_real = db.Column(db.Numeric, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('obra_id', 'semana', name='uq_obra_evm_semana'),)
+
+    def __repr__(self):
+        return f'<ObraEvmSemanal obra_id={self.obra_id} semana={self.semana} pv={self.pv_mo} ev={self.ev_mo}>'
+
+
+class AlertaEvm(db.Model):
+    """Snapshot de alertas EVM por organización (CPI/SPI bajos, tareas vencidas).
+
+    Lo reescribe la tarea periódica tasks.evm.escanear_alertas_evm vía
+    evm_utils.persistir_alertas_evm(); los dashboards solo leen.
+    """
+    __tablename__ = "alertas_evm"
+
+    id = db.Column(db.Integer, primary_key=True)
+    organizacion_id = db.Column(db.Integer, db.ForeignKey("organizaciones.id", ondelete='CASCADE'), nullable=False)
+    obra_id = db.Column(db.Integer, db.ForeignKey("obras.id", ondelete='CASCADE'), nullable=False)
+    tarea_id = db.Column(db.Integer, db.ForeignKey("tareas_etapa.id", ondelete='CASCADE'), nullable=False)
+    tipo = db.Column(db.String(30), nullable=False)  # cost_performance, schedule_performance, overdue_task
+    severidad = db.Column(db.String(10), nullable=False)  # high, medium
+    mensaje = db.Column(db.String(200))
+    cpi = db.Column(db.Numeric(8, 3))
+    spi = db.Column(db.Numeric(8, 3))
+    dias_atraso = db.Column(db.Integer)
+    calculado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_alertas_evm_org_sev', 'organizacion_id', 'severidad'),
+        db.Index('ix_alertas_evm_obra', 'obra_id'),
+    )
+
+    def __repr__(self):
+        return f'<AlertaEvm tarea_id={self.tarea_id} tipo={self.tipo} severidad={self.severidad}>'
+
+
 class TareaAdjunto(db.Model):
     """Archivos adjuntos de tareas y avances"""
     __tablename__ = "tarea_adjuntos"
@@ -466,6 +571,8 @@ class TareaResponsables(db.Model):
     tarea_id = db.Column(db.Integer, db.ForeignKey('tareas_etapa.id', ondelete='CASCADE'), index=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='CASCADE'), index=True, nullable=False)
     cuota_planificada = db.Column(db.Numeric)  # opcional para futuras funcionalidades
+    # Una asignación nueva hace visible la tarea en el pull incremental del operario
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relaciones
     tarea = db.relationship('TareaEtapa', back_populates='asignaciones')
@@ -547,6 +654,32 @@ class Fichada(db.Model):
         return f'<Fichada {self.tipo} user={self.usuario_id} obra={self.obra_id} {self.fecha_hora}>'
 
 
+class AsistenciaDiaria(db.Model):
+    """Horas fichadas por operario, obra y día (ver services/asistencia_diaria).
+
+    La mantienen los hooks de Fichada; los resúmenes por día, semana, quincena
+    y mes se leen de acá sin traer ni emparejar las fichadas.
+    """
+    __tablename__ = 'fichadas_asistencia_diaria'
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='CASCADE'), primary_key=True)
+    obra_id = db.Column(db.Integer, db.ForeignKey('obras.id', ondelete='CASCADE'), primary_key=True)
+    fecha = db.Column(db.Date, primary_key=True)
+    segundos = db.Column(db.Integer, nullable=False, default=0)
+    pares = db.Column(db.Integer, nullable=False, default=0)
+    en_obra = db.Column(db.Boolean, nullable=False, default=False)  # último ingreso sin egreso
+    cantidad_fichadas = db.Column(db.Integer, nullable=False, default=0)
+    detalle_pares = db.Column(db.JSON)  # [{'ingreso': 'HH:MM', 'egreso': 'HH:MM', 'segundos': n}]
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_fichadas_asistencia_obra_fecha', 'obra_id', 'fecha'),
+    )
+
+    def __repr__(self):
+        return f'<AsistenciaDiaria user={self.usuario_id} obra={self.obra_id} {self.fecha} {self.segundos}s>'
+
+
 def resumen_tarea(t):
     """Helper para calcular métricas de una tarea (solo suma aprobados)"""
     plan = float(t.cantidad_planificada or 0)
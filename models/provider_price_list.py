@@ -54,6 +54,8 @@ class ProviderPriceList(db.Model):
         db.Index('ix_ppl_codigo_proveedor',
                  'organizacion_id', 'proveedor_id', 'codigo_proveedor'),
         db.Index('ix_ppl_import_batch', 'import_batch_id'),
+        # El GIN sobre string_to_array(tokens_busqueda, ' ') del fuzzy es
+        # expression-based (y Postgres-only): se crea en la migracion 202610160004.
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -67,6 +69,10 @@ class ProviderPriceList(db.Model):
                              nullable=True)
     descripcion = db.Column(db.String(300), nullable=False)
     descripcion_normalizada = db.Column(db.String(300), nullable=False)
+    # Tokens significativos de la descripcion, separados por espacio y
+    # ordenados. Se calculan al guardar (ver _ppl_tokens_busqueda) para que el
+    # fuzzy de precio_recurso_service filtre por indice y no re-tokenice.
+    tokens_busqueda = db.Column(db.Text, nullable=True)
     unidad = db.Column(db.String(20), nullable=False)
     item_inventario_id = db.Column(db.Integer, db.ForeignKey('items_inventario.id', ondelete='SET NULL'),
                                    nullable=True)
@@ -126,3 +132,21 @@ class ProviderPriceList(db.Model):
             'codigo_proveedor': self.codigo_proveedor,
             'import_batch_id': self.import_batch_id,
         }
+
+
+@db.event.listens_for(ProviderPriceList, 'before_insert')
+@db.event.listens_for(ProviderPriceList, 'before_update')
+def _ppl_tokens_busqueda(mapper, connection, target):
+    """Recalcula tokens_busqueda en cada alta y cuando cambia la descripcion.
+
+    Cubre todas las vias de carga (importador de lista propia, scraping, carga
+    manual, seeds) sin que cada una tenga que acordarse.
+    """
+    state = db.inspect(target)
+    if (target.tokens_busqueda is not None
+            and not state.attrs.descripcion.history.has_changes()
+            and not state.attrs.descripcion_normalizada.history.has_changes()):
+        return
+    from services.precio_recurso_service import tokens_busqueda_precio
+    target.tokens_busqueda = tokens_busqueda_precio(
+        target.descripcion_normalizada or target.descripcion)
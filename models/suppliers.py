@@ -198,6 +198,9 @@ class Product(db.Model):
     rating_prom = db.Column(db.Numeric(2, 1), default=0)
     published_at = db.Column(db.DateTime)  # Fecha de publicación
     visitas = db.Column(db.Integer, default=0)  # Contador de visitas
+    # nombre + descripcion en minusculas y sin acentos; lo mantiene
+    # services/busqueda_productos y lo indexa un GIN to_tsvector('spanish', ...)
+    texto_busqueda = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -236,9 +239,9 @@ class Product(db.Model):
         return main_image.url if main_image else '/static/img/product-placeholder.jpg'
 
     def increment_visits(self):
-        """Incrementa el contador de visitas"""
-        self.visitas = (self.visitas or 0) + 1
-        db.session.commit()
+        """Suma una visita al buffer; `visitas` se actualiza en el próximo volcado"""
+        from services.visitas_productos import registrar_visita
+        registrar_visita(self.id)
 
 
 class ProductVariant(db.Model):
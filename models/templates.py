@@ -550,3 +550,27 @@ class MovimientoCaja(db.Model):
             'anulado': 'secondary',
         }
         return colores.get(self.estado, 'secondary')
+
+
+class SaldoCajaObra(db.Model):
+    """Saldo de caja por obra, mantenido al confirmar / anular movimientos.
+
+    Lo actualizan los hooks de services/caja_saldos.registrar_hooks_saldos_caja
+    en la misma transacción que el MovimientoCaja; se reconstruye desde el
+    historial con `flask caja reconciliar-saldos`.
+    """
+    __tablename__ = 'caja_saldos_obra'
+
+    obra_id = db.Column(db.Integer, db.ForeignKey('obras.id', ondelete='CASCADE'), primary_key=True)
+    organizacion_id = db.Column(db.Integer, db.ForeignKey('organizaciones.id', ondelete='CASCADE'),
+                                nullable=False, index=True)
+    transferido = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    gastado = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def saldo(self):
+        return Decimal(self.transferido or 0) - Decimal(self.gastado or 0)
+
+    def __repr__(self):
+        return f'<SaldoCajaObra obra={self.obra_id} saldo={self.saldo}>'
@@ -1,5 +1,5 @@
 """
-Modelos Utilitarios: Registro de Tiempo y Asistente IA
+Modelos Utilitarios: Registro de Tiempo, Asistente IA y snapshot de alertas
 """
 from datetime import datetime
 from extensions import db
@@ -66,3 +66,29 @@ class ConsultaAgente(db.Model):
     def set_metadata(self, data_dict):
         """Convierte diccionario a JSON para guardar metadata"""
         self.metadata_consulta = json.dumps(data_dict) if data_dict else None
+
+
+class AlertaDashboardSnapshot(db.Model):
+    """Alertas del dashboard precalculadas por organización (una fila por org).
+
+    La escribe services/alertas_snapshot.py (tarea periódica o recálculo al
+    leer un snapshot vencido); los hooks de stock, fichadas y OCs solo la
+    marcan como no vigente.
+    """
+    __tablename__ = 'alertas_dashboard_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    organizacion_id = db.Column(db.Integer, db.ForeignKey('organizaciones.id', ondelete='CASCADE'),
+                                nullable=False, unique=True)
+    alertas = db.Column(db.JSON, nullable=False, default=dict)  # {colector: [alerta, ...]}
+    conteo_critica = db.Column(db.Integer, nullable=False, default=0)
+    conteo_alta = db.Column(db.Integer, nullable=False, default=0)
+    conteo_media = db.Column(db.Integer, nullable=False, default=0)
+    conteo_total = db.Column(db.Integer, nullable=False, default=0)
+    tiempos_ms = db.Column(db.JSON, nullable=True)  # {colector: ms}
+    vigente = db.Column(db.Boolean, nullable=False, default=True)
+    calculado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AlertaDashboardSnapshot org={self.organizacion_id} total={self.conteo_total}>'
+
@@ -1670,21 +1670,39 @@ def geocodificar_todas():
         flash('Solo los administradores pueden ejecutar esta accion.', 'danger')
         return redirect(url_for('obras.lista'))
 
-    try:
-        from geocoding import geocodificar_obras_existentes
-        exitosas, fallidas = geocodificar_obras_existentes()
+    org_id = get_current_org_id() or getattr(current_user, 'organizacion_id', None)
+    if not org_id:
+        flash('No hay una organizacion activa.', 'warning')
+        return redirect(url_for('obras.lista'))
 
-        if exitosas > 0:
-            flash(f'Geocodificacion completada: {exitosas} obras actualizadas, {fallidas} fallaron.', 'success')
+    try:
+        from services.geocoding_batch import encolar_geocodificacion
+        _task_id, nuevo = encolar_geocodificacion(org_id)
+        if nuevo:
+            flash('Geocodificacion iniciada: las obras se van actualizando en segundo plano.', 'info')
         else:
-            flash('No se pudieron geocodificar las obras. Verifica las direcciones.', 'warning')
-
-    except Exception as e:
-        flash(f'Error en la geocodificacion: {str(e)}', 'danger')
+            flash('Ya hay una geocodificacion en curso para esta organizacion.', 'info')
+    except Exception:
+        current_app.logger.exception("No se pudo encolar la geocodificacion masiva")
+        flash('No se pudo iniciar la geocodificacion. Intenta mas tarde.', 'danger')
 
     return redirect(url_for('obras.lista'))
 
 
+@obras_bp.route('/geocodificar-todas/estado')
+@login_required
+def geocodificar_todas_estado():
+    if not is_admin():
+        return jsonify({'ok': False, 'error': 'Sin permisos'}), 403
+
+    org_id = get_current_org_id() or getattr(current_user, 'organizacion_id', None)
+    if not org_id:
+        return jsonify({'ok': False, 'error': 'Sin organizacion activa'}), 400
+
+    from services.geocoding_batch import estado_geocodificacion
+    return jsonify({'ok': True, **estado_geocodificacion(org_id)})
+
+
 @obras_bp.route('/eliminar/<int:obra_id>', methods=['POST'])
 @login_required
 @limiter.limit("10 per minute")
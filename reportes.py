@@ -6,8 +6,7 @@ from extensions import db
 from services.plan_service import require_feature
 from models import (Obra, Usuario, Presupuesto, ItemInventario, RegistroTiempo,
                    AsignacionObra, UsoInventario, MovimientoInventario,
-                   Organizacion, OrgMembership, ItemPresupuesto, EtapaObra,
-                   TareaPlanSemanal, TareaAvanceSemanal)
+                   Organizacion, OrgMembership, ItemPresupuesto, EtapaObra)
 from services.alerts import upsert_alert_vigencia, log_activity_vigencia, limpiar_alertas_presupuestos_confirmados
 from services.alertas_dashboard import obtener_alertas_para_dashboard, contar_alertas_por_severidad
 from services.memberships import get_current_org_id
@@ -588,59 +587,31 @@ def ver_alertas():
 def api_curva_s(obra_id):
     """API: datos de Curva S (Planned Value vs Earned Value vs Actual Cost) por semana"""
     from flask import jsonify
-    from models.projects import TareaEtapa
+    from evm_utils import rollup_evm_obra
 
     obra = Obra.query.get_or_404(obra_id)
     org_id = get_current_org_id() or getattr(current_user, 'organizacion_id', None)
     if obra.organizacion_id != org_id:
         return jsonify({'error': 'No autorizado'}), 403
 
-    tarea_ids = [t.id for t in TareaEtapa.query.filter_by(obra_id=obra_id).all()]
-
     semanas = []
     pv_acum = []
     ev_acum = []
     ac_acum = []
 
-    if tarea_ids:
-        # Planned Value semanal
-        pv_data = db.session.query(
-            TareaPlanSemanal.semana,
-            func.sum(TareaPlanSemanal.pv_mo).label('pv')
-        ).filter(
-            TareaPlanSemanal.tarea_id.in_(tarea_ids)
-        ).group_by(TareaPlanSemanal.semana).order_by(TareaPlanSemanal.semana).all()
-
-        # Actual Cost y Earned Value semanal
-        av_data = db.session.query(
-            TareaAvanceSemanal.semana,
-            func.sum(TareaAvanceSemanal.ac_mo).label('ac'),
-            func.sum(TareaAvanceSemanal.ev_mo).label('ev')
-        ).filter(
-            TareaAvanceSemanal.tarea_id.in_(tarea_ids)
-        ).group_by(TareaAvanceSemanal.semana).order_by(TareaAvanceSemanal.semana).all()
-
-        # Unificar semanas
-        all_weeks = sorted(set(
-            [r.semana for r in pv_data] + [r.semana for r in av_data]
-        ))
-
-        pv_dict = {r.semana: float(r.pv or 0) for r in pv_data}
-        ac_dict = {r.semana: float(r.ac or 0) for r in av_data}
-        ev_dict = {r.semana: float(r.ev or 0) for r in av_data}
-
-        acum_pv = 0
-        acum_ev = 0
-        acum_ac = 0
-
-        for w in all_weeks:
-            acum_pv += pv_dict.get(w, 0)
-            acum_ev += ev_dict.get(w, 0)
-            acum_ac += ac_dict.get(w, 0)
-            semanas.append(w.strftime('%d/%m'))
-            pv_acum.append(round(acum_pv, 0))
-            ev_acum.append(round(acum_ev, 0))
-            ac_acum.append(round(acum_ac, 0))
+    # Rollup semanal mantenido por evm_utils (una query indexada por obra)
+    acum_pv = 0
+    acum_ev = 0
+    acum_ac = 0
+
+    for r in rollup_evm_obra(obra_id):
+        acum_pv += float(r.pv_mo or 0)
+        acum_ev += float(r.ev_mo or 0)
+        acum_ac += float(r.ac_mo or 0)
+        semanas.append(r.semana.strftime('%d/%m'))
+        pv_acum.append(round(acum_pv, 0))
+        ev_acum.append(round(acum_ev, 0))
+        ac_acum.append(round(acum_ac, 0))
 
     # Si no hay datos EVM, usar etapas como fallback visual
     if not semanas:
@@ -2103,8 +2074,8 @@ def exportar_obras_pdf():
 
     # Convertir a PDF
     pdf_buffer = io.BytesIO()
-    from services.pdf_concurrency import render_pdf_into
-    _r = render_pdf_into(pdf_buffer, html_content)
+    from services.pdf_concurrency import render_pdf_cacheado
+    _r = render_pdf_cacheado(pdf_buffer, html_content)
     if _r is not None:
         return _r
     pdf_buffer.seek(0)
@@ -2349,8 +2320,8 @@ def exportar_costos_pdf():
                                    fecha_generacion=datetime.now().strftime('%d/%m/%Y %H:%M'))
 
     pdf_buffer = io.BytesIO()
-    from services.pdf_concurrency import render_pdf_into
-    _r = render_pdf_into(pdf_buffer, html_content)
+    from services.pdf_concurrency import render_pdf_cacheado
+    _r = render_pdf_cacheado(pdf_buffer, html_content)
     if _r is not None:
         return _r
     pdf_buffer.seek(0)
@@ -2533,8 +2504,8 @@ def exportar_inventario_pdf():
                                        fecha_generacion=datetime.now().strftime('%d/%m/%Y %H:%M'))
 
         pdf_buffer = io.BytesIO()
-        from services.pdf_concurrency import render_pdf_into
-        _r = render_pdf_into(pdf_buffer, html_content)
+        from services.pdf_concurrency import render_pdf_cacheado
+        _r = render_pdf_cacheado(pdf_buffer, html_content)
         if _r is not None:
             return _r
         pdf_buffer.seek(0)
@@ -3623,3 +3623,340 @@ def run_runtime_migrations(db, app):
     except Exception as e:
         db.session.rollback()
         print(f"[WARN] Runtime vinculacion inventario: {e}")
+
+    # =====================================================
+    # 2026-10-16: Rollup semanal de EVM por obra.
+    #   obra_evm_semanal: PV/EV/AC por semana, lo mantiene evm_utils.
+    # Postgres only: en SQLite (tests) SERIAL no es alias de rowid y la tabla
+    # quedaria sin autoincremento; ahi la crea create_all() desde el modelo.
+    # =====================================================
+    _es_postgres = db.engine.dialect.name == 'postgresql'
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS obra_evm_semanal (
+                    id SERIAL PRIMARY KEY,
+                    obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+                    semana DATE NOT NULL,
+                    pv_mo NUMERIC(15, 2) DEFAULT 0,
+                    ev_mo NUMERIC(15, 2) DEFAULT 0,
+                    ac_mo NUMERIC(15, 2) DEFAULT 0,
+                    qty_plan NUMERIC DEFAULT 0,
+                    qty_real NUMERIC DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    CONSTRAINT uq_obra_evm_semana UNIQUE (obra_id, semana)
+                );
+            """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_obra_evm_semanal_obra_id ON obra_evm_semanal(obra_id);"
+            ))
+            db.session.commit()
+            print("[OK] Runtime rollup EVM aplicado (obra_evm_semanal)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime rollup EVM: {e}")
+
+    # =====================================================
+    # 2026-10-16: Snapshot de alertas EVM por organizacion.
+    #   alertas_evm: lo reescribe tasks.evm.escanear_alertas_evm.
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS alertas_evm (
+                    id SERIAL PRIMARY KEY,
+                    organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+                    obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+                    tarea_id INTEGER NOT NULL REFERENCES tareas_etapa(id) ON DELETE CASCADE,
+                    tipo VARCHAR(30) NOT NULL,
+                    severidad VARCHAR(10) NOT NULL,
+                    mensaje VARCHAR(200),
+                    cpi NUMERIC(8, 3),
+                    spi NUMERIC(8, 3),
+                    dias_atraso INTEGER,
+                    calculado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_alertas_evm_org_sev ON alertas_evm(organizacion_id, severidad);"
+            ))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_alertas_evm_obra ON alertas_evm(obra_id);"
+            ))
+            db.session.commit()
+            print("[OK] Runtime alertas EVM aplicado (alertas_evm)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime alertas EVM: {e}")
+
+    # =====================================================
+    # 2026-10-16: Snapshot de alertas del dashboard (una fila por org).
+    #   alertas_dashboard_snapshot: ver services/alertas_snapshot.py.
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS alertas_dashboard_snapshot (
+                    id SERIAL PRIMARY KEY,
+                    organizacion_id INTEGER NOT NULL UNIQUE REFERENCES organizaciones(id) ON DELETE CASCADE,
+                    alertas JSON NOT NULL,
+                    conteo_critica INTEGER NOT NULL DEFAULT 0,
+                    conteo_alta INTEGER NOT NULL DEFAULT 0,
+                    conteo_media INTEGER NOT NULL DEFAULT 0,
+                    conteo_total INTEGER NOT NULL DEFAULT 0,
+                    tiempos_ms JSON,
+                    vigente BOOLEAN NOT NULL DEFAULT TRUE,
+                    calculado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            db.session.commit()
+            print("[OK] Runtime snapshot de alertas aplicado (alertas_dashboard_snapshot)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime snapshot de alertas: {e}")
+
+    # =====================================================
+    # 2026-10-16: Tokens persistidos para el fuzzy de provider_price_list.
+    #   tokens_busqueda + GIN sobre string_to_array(...); relleno de las filas
+    #   viejas (ver services/precio_recurso_service.py).
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text(
+                "ALTER TABLE provider_price_list ADD COLUMN IF NOT EXISTS tokens_busqueda TEXT;"
+            ))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_ppl_tokens_busqueda_gin "
+                "ON provider_price_list USING GIN (string_to_array(tokens_busqueda, ' '));"
+            ))
+            db.session.commit()
+            from services.precio_recurso_service import rellenar_tokens_busqueda
+            rellenadas = rellenar_tokens_busqueda()
+            print(f"[OK] Runtime tokens de busqueda aplicado (provider_price_list, {rellenadas} filas rellenadas)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime tokens de busqueda: {e}")
+
+    # =====================================================
+    # 2026-10-16: Costo promedio ponderado del inventario por deposito.
+    #   stock.costo_promedio + stock_movement.costo_unitario (ver
+    #   InventoryService.get_stock_value / flask inventario costos-iniciales).
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text(
+                "ALTER TABLE stock ADD COLUMN IF NOT EXISTS costo_promedio NUMERIC(15,4) NOT NULL DEFAULT 0;"
+            ))
+            db.session.execute(db.text(
+                "ALTER TABLE stock_movement ADD COLUMN IF NOT EXISTS costo_unitario NUMERIC(15,4);"
+            ))
+            db.session.commit()
+            print("[OK] Runtime costo promedio de inventario aplicado (stock, stock_movement)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime costo promedio de inventario: {e}")
+
+    # =====================================================
+    # 2026-10-16: Totales de stock desnormalizados en inventory_item.
+    #   stock_total / stock_reservado (ver InventoryService._update_item_totals).
+    #   La carga inicial solo corre si se acaba de crear la columna.
+    # =====================================================
+    if _es_postgres:
+        try:
+            existe = db.session.execute(db.text("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'inventory_item' AND column_name = 'stock_total'
+            """)).first()
+            db.session.execute(db.text(
+                "ALTER TABLE inventory_item ADD COLUMN IF NOT EXISTS stock_total NUMERIC(14,3) NOT NULL DEFAULT 0;"
+            ))
+            db.session.execute(db.text(
+                "ALTER TABLE inventory_item ADD COLUMN IF NOT EXISTS stock_reservado NUMERIC(14,3) NOT NULL DEFAULT 0;"
+            ))
+            if not existe:
+                db.session.execute(db.text("""
+                    UPDATE inventory_item i SET
+                        stock_total = COALESCE((SELECT SUM(s.cantidad) FROM stock s WHERE s.item_id = i.id), 0),
+                        stock_reservado = COALESCE((SELECT SUM(r.qty) FROM stock_reservation r
+                                                    WHERE r.item_id = i.id AND r.estado = 'activa'), 0);
+                """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_inventory_item_company_stock ON inventory_item(company_id, stock_total);"
+            ))
+            db.session.commit()
+            print("[OK] Runtime totales de stock aplicado (inventory_item)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime totales de stock: {e}")
+
+    # =====================================================
+    # 2026-10-16: Sync offline idempotente + pulls incrementales.
+    #   sync_operaciones_offline (offline_id ya aplicados) y updated_at en
+    #   obras / tareas_etapa / items_inventario (ver services/offline_sync.py).
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS sync_operaciones_offline (
+                    id SERIAL PRIMARY KEY,
+                    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+                    organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+                    offline_id VARCHAR(64) NOT NULL,
+                    tipo VARCHAR(30) NOT NULL,
+                    server_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    CONSTRAINT uq_sync_offline_usuario_op UNIQUE (usuario_id, offline_id)
+                );
+            """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_sync_operaciones_offline_created_at "
+                "ON sync_operaciones_offline(created_at);"
+            ))
+            for tabla in ('obras', 'tareas_etapa', 'items_inventario'):
+                db.session.execute(db.text(
+                    f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;"
+                ))
+                db.session.execute(db.text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{tabla}_updated_at ON {tabla}(updated_at);"
+                ))
+            db.session.execute(db.text(
+                "ALTER TABLE tarea_responsables ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;"
+            ))
+            db.session.commit()
+            print("[OK] Runtime sync offline aplicado (sync_operaciones_offline, updated_at)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime sync offline: {e}")
+
+    # =====================================================
+    # 2026-10-16: Tombstones de los pulls incrementales de /api/offline.
+    #   sync_tombstones: ver services/offline_sync.registrar_hooks_tombstones.
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS sync_tombstones (
+                    id SERIAL PRIMARY KEY,
+                    organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+                    entidad VARCHAR(20) NOT NULL,
+                    entidad_id INTEGER NOT NULL,
+                    usuario_id INTEGER,
+                    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_sync_tombstones_org_entidad "
+                "ON sync_tombstones(organizacion_id, entidad, deleted_at);"
+            ))
+            db.session.commit()
+            print("[OK] Runtime tombstones offline aplicado (sync_tombstones)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime tombstones offline: {e}")
+
+    # =====================================================
+    # 2026-10-16: Saldo de caja por obra (caja_saldos_obra), mantenido por
+    #   services/caja_saldos.registrar_hooks_saldos_caja. Backfill desde los
+    #   movimientos confirmados; las obras que ya tienen fila no se tocan.
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS caja_saldos_obra (
+                    obra_id INTEGER PRIMARY KEY REFERENCES obras(id) ON DELETE CASCADE,
+                    organizacion_id INTEGER NOT NULL REFERENCES organizaciones(id) ON DELETE CASCADE,
+                    transferido NUMERIC(15, 2) NOT NULL DEFAULT 0,
+                    gastado NUMERIC(15, 2) NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_caja_saldos_obra_organizacion_id "
+                "ON caja_saldos_obra(organizacion_id);"
+            ))
+            db.session.execute(db.text("""
+                INSERT INTO caja_saldos_obra (obra_id, organizacion_id, transferido, gastado, updated_at)
+                SELECT obra_id, MIN(organizacion_id),
+                       COALESCE(SUM(CASE WHEN tipo = 'transferencia_a_obra' THEN monto ELSE 0 END), 0),
+                       COALESCE(SUM(CASE WHEN tipo IN ('devolucion_obra', 'pago_proveedor', 'gasto_obra')
+                                         THEN monto ELSE 0 END), 0),
+                       CURRENT_TIMESTAMP
+                FROM movimientos_caja
+                WHERE estado = 'confirmado'
+                GROUP BY obra_id
+                ON CONFLICT (obra_id) DO NOTHING;
+            """))
+            db.session.commit()
+            print("[OK] Runtime saldos de caja aplicado (caja_saldos_obra)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime saldos de caja: {e}")
+
+    # =====================================================
+    # 2026-10-16: Búsqueda full-text de productos del marketplace.
+    #   product.texto_busqueda + GIN to_tsvector('spanish', ...), ver
+    #   services/busqueda_productos. El relleno es Python (sin acentos).
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text(
+                "ALTER TABLE product ADD COLUMN IF NOT EXISTS texto_busqueda TEXT;"
+            ))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_product_texto_busqueda_fts "
+                "ON product USING GIN (to_tsvector('spanish', coalesce(texto_busqueda, '')));"
+            ))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_product_estado_visitas "
+                "ON product(estado, visitas DESC, id DESC);"
+            ))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_product_variant_product_precio "
+                "ON product_variant(product_id, precio);"
+            ))
+            db.session.commit()
+            from services.busqueda_productos import rellenar_texto_busqueda
+            rellenadas = rellenar_texto_busqueda()
+            print(f"[OK] Runtime búsqueda de productos aplicado (product, {rellenadas} filas rellenadas)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime búsqueda de productos: {e}")
+
+    # =====================================================
+    # 2026-10-16: Asistencia diaria por operario/obra/día
+    #   (fichadas_asistencia_diaria), mantenida por hooks de Fichada, ver
+    #   services/asistencia_diaria. El relleno es Python (emparejado
+    #   ingreso/egreso) y solo corre con la tabla vacía.
+    # =====================================================
+    if _es_postgres:
+        try:
+            db.session.execute(db.text("""
+                CREATE TABLE IF NOT EXISTS fichadas_asistencia_diaria (
+                    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+                    obra_id INTEGER NOT NULL REFERENCES obras(id) ON DELETE CASCADE,
+                    fecha DATE NOT NULL,
+                    segundos INTEGER NOT NULL DEFAULT 0,
+                    pares INTEGER NOT NULL DEFAULT 0,
+                    en_obra BOOLEAN NOT NULL DEFAULT FALSE,
+                    cantidad_fichadas INTEGER NOT NULL DEFAULT 0,
+                    detalle_pares JSON,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (usuario_id, obra_id, fecha)
+                );
+            """))
+            db.session.execute(db.text(
+                "CREATE INDEX IF NOT EXISTS ix_fichadas_asistencia_obra_fecha "
+                "ON fichadas_asistencia_diaria(obra_id, fecha);"
+            ))
+            db.session.commit()
+            vacia = db.session.execute(db.text(
+                "SELECT 1 FROM fichadas_asistencia_diaria LIMIT 1"
+            )).first() is None
+            dias = 0
+            if vacia:
+                from services.asistencia_diaria import reconstruir_asistencia
+                dias = reconstruir_asistencia()
+            print(f"[OK] Runtime asistencia diaria aplicado (fichadas_asistencia_diaria, {dias} días rellenados)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Runtime asistencia diaria: {e}")
@@ -0,0 +1,70 @@
+"""Throughput del clasificador LLM contra el stub local. NO LLAMA A LA API.
+
+El script reemplaza `_llamar_api` por un stub que espera --latencia-ms por lote y
+contesta con el clasificador por keywords, asi que el tiempo medido es el de
+despachar los lotes: secuencial (concurrencia 1) contra el pool de
+LLM_CLASIF_CONCURRENCIA.
+
+Uso
+---
+    python scripts/bench_clasificador_llm.py
+    python scripts/bench_clasificador_llm.py --items 400 --latencia-ms 1500 --concurrencia 1 4 8
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _stub_api(CLL, latencia_ms):
+    """Reemplazo de `_llamar_api`: espera la latencia de un lote real y contesta
+    con el clasificador por keywords, con el mismo formato que el tool use."""
+    def _llamar_api(system, user):
+        time.sleep(latencia_ms / 1000.0)
+        out = []
+        for linea in user.split('\n')[1:]:
+            m = re.match(r'^(\d+): (.*) \((.*)\)$', linea)
+            if not m:
+                continue
+            rid, conf = CLL._clasificar_keyword_item(m.group(2), m.group(3))
+            out.append({'indice': int(m.group(1)), 'regla_id': rid, 'confianza': conf})
+        return out
+    return _llamar_api
+
+
+def _pliego(n):
+    from services.base_tecnica_computos import REGLAS_TECNICAS
+    reglas = [r for r in REGLAS_TECNICAS if r.get('palabras_clave_fuertes')]
+    return [{'descripcion': f"{reglas[i % len(reglas)]['palabras_clave_fuertes'][0]} item {i}",
+             'unidad': reglas[i % len(reglas)].get('unidad_esperada', '')}
+            for i in range(n)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--items', type=int, default=400)
+    ap.add_argument('--latencia-ms', type=int, default=800)
+    ap.add_argument('--concurrencia', type=int, nargs='+', default=[1, 4])
+    args = ap.parse_args()
+
+    from services import clasificador_llm as CLL
+    CLL._llamar_api = _stub_api(CLL, args.latencia_ms)
+    items = _pliego(args.items)
+    catalogo = CLL.catalogo_reglas()
+    lotes = -(-len(items) // CLL._BATCH)
+    print(f'{len(items)} items en {lotes} lotes de {CLL._BATCH}, {args.latencia_ms} ms por lote')
+    for conc in args.concurrencia:
+        CLL._CONCURRENCIA = conc
+        t0 = time.perf_counter()
+        res = CLL._clasificar_llm(items, catalogo)
+        seg = time.perf_counter() - t0
+        clasificados = sum(1 for r in res if r and r['regla_id'])
+        print(f'  concurrencia {conc:>2}: {seg:6.2f} s  ({len(items) / seg:7.1f} items/s, '
+              f'{clasificados} con regla)')
+
+
+if __name__ == '__main__':
+    main()
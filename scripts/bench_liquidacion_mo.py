@@ -0,0 +1,183 @@
+"""Preview de liquidación de MO: cálculo por operario contra PeriodoMO.
+
+Arma una obra sintética (N operarios, D días, avances aprobados y fichadas
+de ingreso/egreso por día) y calcula el preview de dos formas:
+
+    operario  el recorrido anterior: buscar_operarios_obra y, por operario,
+              calcular_horas_avance/fichadas, la liquidación por modalidad y
+              la consulta de su asignación
+    lote      generar_preview_liquidacion (PeriodoMO: cuatro consultas)
+
+Reporta consultas (before_cursor_execute) y tiempo de cada modo, y verifica
+que los dos den los mismos items. Los datos se borran al terminar.
+
+Uso
+---
+    DATABASE_URL=postgresql://... python scripts/bench_liquidacion_mo.py --org-id 1
+    python scripts/bench_liquidacion_mo.py --org-id 1 --operarios 100 --dias 30 --repeticiones 3
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODALIDADES = ('hora', 'fichada', 'medida')
+
+
+def _crear_datos(org_id, n_operarios, dias, desde):
+    from extensions import db
+    from models import AsignacionObra, EtapaObra, Obra, TareaAvance, TareaEtapa, Usuario
+    from models.projects import Fichada
+
+    obra = Obra(nombre=f'Bench MO {uuid.uuid4().hex[:6]}', cliente='Bench',
+                organizacion_id=org_id, estado='en_curso')
+    db.session.add(obra)
+    db.session.flush()
+    tareas = []
+    for e in range(4):
+        etapa = EtapaObra(obra_id=obra.id, nombre=f'Etapa {e}', orden=e)
+        db.session.add(etapa)
+        db.session.flush()
+        for t in range(5):
+            tarea = TareaEtapa(etapa_id=etapa.id, nombre=f'Tarea {e}.{t}', unidad='m2')
+            db.session.add(tarea)
+            tareas.append(tarea)
+    db.session.flush()
+
+    operarios = []
+    for i in range(n_operarios):
+        op = Usuario(nombre=f'Bench{i:03d}', apellido='MO', email=f'bench_mo_{uuid.uuid4().hex[:10]}@example.com',
+                     organizacion_id=org_id, rol='operario', role='operario', activo=True,
+                     modalidad_pago=MODALIDADES[i % 3], tarifa_hora=Decimal('1500'),
+                     tarifa_m2=Decimal('900'))
+        db.session.add(op)
+        operarios.append(op)
+    db.session.flush()
+
+    avances, fichadas = [], []
+    for i, op in enumerate(operarios):
+        if i % 4:
+            db.session.add(AsignacionObra(obra_id=obra.id, usuario_id=op.id, rol_en_obra='oficial'))
+        for d in range(dias):
+            dia = desde + timedelta(days=d)
+            avances.append(dict(tarea_id=tareas[(i + d) % len(tareas)].id, user_id=op.id, fecha=dia,
+                                cantidad=Decimal('2.5'), unidad='m2', horas=Decimal('7.5'),
+                                status='aprobado'))
+            entrada = datetime.combine(dia, datetime.min.time()) + timedelta(hours=8, minutes=i % 30)
+            fichadas.append(dict(usuario_id=op.id, obra_id=obra.id, tipo='ingreso', fecha_hora=entrada))
+            fichadas.append(dict(usuario_id=op.id, obra_id=obra.id, tipo='egreso',
+                                 fecha_hora=entrada + timedelta(hours=8)))
+    db.session.execute(TareaAvance.__table__.insert(), avances)
+    db.session.execute(Fichada.__table__.insert(), fichadas)
+    db.session.commit()
+    return obra.id, [op.id for op in operarios]
+
+
+def _borrar_datos(obra_id, operario_ids):
+    from extensions import db
+    from models import AsignacionObra, EtapaObra, Obra, TareaAvance, TareaEtapa, Usuario
+    from models.projects import Fichada
+
+    db.session.rollback()
+    Fichada.query.filter_by(obra_id=obra_id).delete()
+    TareaAvance.query.filter(TareaAvance.user_id.in_(operario_ids)).delete(synchronize_session=False)
+    AsignacionObra.query.filter_by(obra_id=obra_id).delete()
+    etapa_ids = [e.id for e in EtapaObra.query.filter_by(obra_id=obra_id).all()]
+    TareaEtapa.query.filter(TareaEtapa.etapa_id.in_(etapa_ids)).delete(synchronize_session=False)
+    EtapaObra.query.filter_by(obra_id=obra_id).delete()
+    Usuario.query.filter(Usuario.id.in_(operario_ids)).delete(synchronize_session=False)
+    Obra.query.filter_by(id=obra_id).delete()
+    db.session.commit()
+
+
+def _preview_por_operario(obra_id, desde, hasta):
+    """El preview como se calculaba antes de PeriodoMO."""
+    from models import AsignacionObra, Obra
+    from services import liquidacion_mo as mo
+
+    obra = Obra.query.get(obra_id)
+    tarifa_default = mo.obtener_tarifa_default_obra(obra)
+    items = []
+    for uid, usuario in mo.buscar_operarios_obra(obra_id, desde, hasta).items():
+        avance = mo.calcular_horas_avance_operario(obra_id, uid, desde, hasta)
+        fichada = mo.calcular_horas_fichadas_operario(obra_id, uid, desde, hasta)
+        modalidad = mo.calcular_liquidacion_por_operario(usuario, obra_id, desde, hasta,
+                                                         tarifa_fallback=tarifa_default)
+        asig = AsignacionObra.query.filter_by(obra_id=obra_id, usuario_id=uid, activo=True).first()
+        items.append({
+            'operario_id': uid,
+            'rol': asig.rol_en_obra if asig else 'sin asignar',
+            'monto': modalidad['monto'],
+            'horas_avance': avance['total_horas'],
+            'horas_fichadas': fichada['total_horas'],
+            'avance_desglose': avance['desglose'],
+            'fichada_desglose': fichada['desglose'],
+        })
+    return sorted(items, key=lambda x: x['operario_id'])
+
+
+def _preview_lote(obra_id, desde, hasta):
+    from services.liquidacion_mo import generar_preview_liquidacion
+
+    claves = ('operario_id', 'rol', 'monto', 'horas_avance', 'horas_fichadas',
+              'avance_desglose', 'fichada_desglose')
+    items = generar_preview_liquidacion(obra_id, desde, hasta)
+    return sorted(({k: i[k] for k in claves} for i in items), key=lambda x: x['operario_id'])
+
+
+def _medir(fn, repeticiones):
+    from sqlalchemy import event
+    from extensions import db
+
+    conteo = {'n': 0}
+
+    def _contar(*_args, **_kwargs):
+        conteo['n'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    try:
+        tiempos = []
+        for _ in range(repeticiones):
+            db.session.expire_all()
+            t0 = time.perf_counter()
+            resultado = fn()
+            tiempos.append((time.perf_counter() - t0) * 1000)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _contar)
+    return resultado, conteo['n'] / repeticiones, min(tiempos)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--org-id', type=int, required=True)
+    ap.add_argument('--operarios', type=int, default=100)
+    ap.add_argument('--dias', type=int, default=30)
+    ap.add_argument('--repeticiones', type=int, default=3)
+    args = ap.parse_args()
+
+    from app import app
+
+    desde = date(2026, 1, 1)
+    hasta = desde + timedelta(days=args.dias - 1)
+    with app.app_context():
+        obra_id, operario_ids = _crear_datos(args.org_id, args.operarios, args.dias, desde)
+        try:
+            print(f'{args.operarios} operarios x {args.dias} días '
+                  f'({args.operarios * args.dias} avances, {args.operarios * args.dias * 2} fichadas)')
+            resultados = {}
+            for modo, fn in (('operario', _preview_por_operario), ('lote', _preview_lote)):
+                resultados[modo], consultas, ms = _medir(lambda: fn(obra_id, desde, hasta), args.repeticiones)
+                print(f'  {modo:>8}: {consultas:7.0f} consultas  {ms:9.1f} ms')
+            iguales = resultados['operario'] == resultados['lote']
+            print(f'  mismos items: {"sí" if iguales else "NO"}')
+        finally:
+            _borrar_datos(obra_id, operario_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Round trips a la base por request, con y sin el middleware RLS. NECESITA POSTGRES.
+
+Pega N veces a cada ruta con el test client y cuenta, por request, los
+statements de SQLAlchemy (before_cursor_execute) más los SET de contexto que
+manda el middleware por fuera de SQLAlchemy. Modos:
+
+    sin     sin middleware
+    sesion  set_config de sesión, solo si la conexión del pool tiene otro contexto
+    local   set_config local al empezar cada transacción (RLS_SET_LOCAL=true)
+
+Uso
+---
+    DATABASE_URL=postgresql://... python scripts/bench_rls_roundtrips.py --user-id 1
+    python scripts/bench_rls_roundtrips.py --rutas /obras/ /reportes/dashboard --requests 50
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ['RLS_ENABLED'] = 'false'  # el bench lo activa por modo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _medir(app, client, rutas, n):
+    from sqlalchemy import event
+    from extensions import db
+    from middleware import rls_middleware as rls
+
+    statements = {'n': 0}
+
+    def _contar(*_args, **_kwargs):
+        statements['n'] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _contar)
+    rls.reset_rls_metricas()
+    try:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            for ruta in rutas:
+                client.get(ruta)
+        seg = time.perf_counter() - t0
+    finally:
+        event.remove(engine, 'before_cursor_execute', _contar)
+    pedidos = n * len(rutas)
+    sets = rls.rls_metricas()['sets']
+    return (statements['n'] + sets) / pedidos, sets / pedidos, seg * 1000 / pedidos
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--rutas', nargs='+', default=['/obras/', '/reportes/dashboard'])
+    ap.add_argument('--requests', type=int, default=30)
+    ap.add_argument('--user-id', type=int, default=None,
+                    help='usuario logueado en el test client (sin esto, requests anónimos)')
+    ap.add_argument('--modos', nargs='+', default=['sin', 'sesion', 'local'])
+    args = ap.parse_args()
+
+    from app import app
+    from extensions import db
+    from middleware import rls_middleware as rls
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    if args.user_id:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(args.user_id)
+            sess['_fresh'] = True
+
+    print(f'{args.requests} x {len(args.rutas)} rutas: {", ".join(args.rutas)}')
+    for modo in args.modos:
+        quitar = None
+        if modo != 'sin':
+            rls.RLS_SET_LOCAL = modo == 'local'
+            with app.app_context():
+                quitar = rls.setup_rls_middleware(app, db)
+        try:
+            _medir(app, client, args.rutas, 1)  # calentar el pool
+            total, sets, ms = _medir(app, client, args.rutas, args.requests)
+        finally:
+            if quitar:
+                quitar()
+        print(f'  {modo:>6}: {total:6.2f} round trips/request  ({sets:5.2f} de RLS)  {ms:7.1f} ms/request')
+
+
+if __name__ == '__main__':
+    main()
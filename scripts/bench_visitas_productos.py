@@ -0,0 +1,109 @@
+"""Vistas de producto concurrentes, con contador directo y con buffer. NECESITA POSTGRES.
+
+N threads piden el mismo producto con MarketplaceService.get_product_with_variants
+(cada uno en su app context, como un request). Modos:
+
+    directo  el comportamiento anterior: visitas + 1 y commit en cada vista
+    buffer   registrar_visita (Redis si REDIS_URL, si no memoria) + un volcado al final
+
+Reporta vistas/s y la latencia p50/p95 de cada vista. En modo directo las
+vistas del mismo producto se serializan en el lock de la fila.
+
+Uso
+---
+    DATABASE_URL=postgresql://... python scripts/bench_visitas_productos.py --product-id 1
+    python scripts/bench_visitas_productos.py --product-id 1 --threads 16 --vistas 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _vista_directa(product_id):
+    from extensions import db
+    from models import Product
+
+    product = db.session.get(Product, product_id)
+    product.visitas = (product.visitas or 0) + 1
+    db.session.commit()
+
+
+def _vista_buffer(product_id):
+    from services.marketplace_service import MarketplaceService
+
+    MarketplaceService().get_product_with_variants(product_id)
+    # Fin del request: se libera la conexión (en modo directo lo hace el commit)
+    from extensions import db
+    db.session.remove()
+
+
+def _correr(app, vista, product_id, threads, vistas):
+    latencias = []
+    lock = threading.Lock()
+
+    def _trabajador():
+        for _ in range(vistas):
+            with app.app_context():
+                t0 = time.perf_counter()
+                vista(product_id)
+                ms = (time.perf_counter() - t0) * 1000
+            with lock:
+                latencias.append(ms)
+
+    hilos = [threading.Thread(target=_trabajador) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    seg = time.perf_counter() - t0
+    latencias.sort()
+    return len(latencias) / seg, statistics.median(latencias), latencias[int(len(latencias) * 0.95) - 1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--product-id', type=int, required=True)
+    ap.add_argument('--threads', type=int, default=8)
+    ap.add_argument('--vistas', type=int, default=100, help='vistas por thread')
+    ap.add_argument('--modos', nargs='+', default=['directo', 'buffer'])
+    args = ap.parse_args()
+
+    from app import app
+    from extensions import db
+    from models import Product
+    from services.visitas_productos import volcar_visitas
+
+    with app.app_context():
+        antes = db.session.get(Product, args.product_id).visitas or 0
+
+    total = args.threads * args.vistas
+    print(f'{args.threads} threads x {args.vistas} vistas del producto {args.product_id}')
+    for modo in args.modos:
+        vista = _vista_directa if modo == 'directo' else _vista_buffer
+        with app.app_context():
+            _correr(app, vista, args.product_id, 1, 1)  # calentar el pool
+            if modo == 'buffer':
+                volcar_visitas()
+        por_seg, p50, p95 = _correr(app, vista, args.product_id, args.threads, args.vistas)
+        extra = ''
+        if modo == 'buffer':
+            with app.app_context():
+                t0 = time.perf_counter()
+                volcar_visitas()
+                extra = f'  (volcado: {(time.perf_counter() - t0) * 1000:.1f} ms)'
+        print(f'  {modo:>7}: {por_seg:8.1f} vistas/s  p50 {p50:6.2f} ms  p95 {p95:6.2f} ms{extra}')
+
+    with app.app_context():
+        despues = db.session.get(Product, args.product_id).visitas or 0
+    esperado = (total + 1) * len(args.modos)
+    print(f'  visitas registradas: {despues - antes} (esperadas {esperado})')
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ from models import (
 )
 from seed_inventory_categories import seed_inventory_categories_for_company
 from datetime import date, datetime, timedelta
+from decimal import Decimal
 import random
 
 def seed_equipos_inventario():
@@ -293,6 +294,8 @@ def crear_stock_inicial(items, depositos):
                 cantidad=cantidad
             )
             db.session.add(stock)
+            # Totales desnormalizados (los mantiene InventoryService)
+            item.stock_total = item.total_stock + cantidad
             print(f"  ✓ {item.sku}: {cantidad} {item.unidad} en {deposito.nombre}")
     
     db.session.flush()
@@ -439,6 +442,7 @@ def crear_reservas_stock(items, company_id):
                 created_by=usuario.id
             )
             db.session.add(reserva)
+            item.stock_reservado = item.reserved_stock + Decimal(str(qty_reserva))
             print(f"  ✓ Reserva: {qty_reserva} {item.unidad} de {item.nombre} para {obra.nombre}")
     
     db.session.flush()
@@ -6,7 +6,16 @@ Genera alertas reales basadas en:
 - Obras demoradas
 - Tareas no completadas pasada la fecha
 - Sobrecosto de obra
+
+El dashboard lee las alertas del snapshot por organización
+(services/alertas_snapshot.py). Cuando el snapshot no está o venció, los
+colectores corren en paralelo sobre un pool acotado (`recolectar_alertas`).
 """
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import date, datetime, timedelta, timezone
 
 # Timezone Argentina (UTC-3)
@@ -16,9 +25,22 @@ _AR_TZ = timezone(timedelta(hours=-3))
 def _hoy_argentina():
     return datetime.now(_AR_TZ).replace(tzinfo=None).date()
 from decimal import Decimal
-from sqlalchemy import and_, or_
+from flask import current_app
+from sqlalchemy import and_, or_, text
 from extensions import db
 
+logger = logging.getLogger(__name__)
+
+ALERTAS_MAX_WORKERS = int(os.getenv('ALERTAS_MAX_WORKERS', '4'))
+ALERTAS_TIMEOUT_SEC = float(os.getenv('ALERTAS_TIMEOUT_SEC', '5'))
+ORDEN_SEVERIDAD = {'critica': 0, 'alta': 1, 'media': 2, 'baja': 3}
+
+_ejecutor = None
+# Colectores corriendo por organización (incluye los que expiraron y siguen
+# en el pool): no se vuelven a encolar hasta que terminen
+_en_curso = {}
+_en_curso_lock = threading.Lock()
+
 
 def obtener_alertas_stock_bajo(org_id, limite=5):
     """
@@ -687,46 +709,187 @@ def obtener_alertas_entregas_proximas(org_id, limite=5):
         return []
 
 
+def obtener_alertas_evm(org_id, limite=5):
+    """Alertas de CPI/SPI bajos leídas del snapshot alertas_evm.
+
+    El snapshot lo escribe la tarea periódica tasks.evm.escanear_alertas_evm;
+    acá solo se lee (una query indexada por organización). Las tareas vencidas
+    no se repiten: ya las cubre obtener_alertas_tareas_vencidas.
+    """
+    try:
+        from models import AlertaEvm, Obra, TareaEtapa
+
+        filas = db.session.query(
+            AlertaEvm.tipo,
+            AlertaEvm.severidad,
+            AlertaEvm.mensaje,
+            AlertaEvm.obra_id,
+            Obra.nombre.label('obra_nombre'),
+            TareaEtapa.nombre.label('tarea_nombre'),
+        ).join(
+            Obra, AlertaEvm.obra_id == Obra.id
+        ).join(
+            TareaEtapa, AlertaEvm.tarea_id == TareaEtapa.id
+        ).filter(
+            AlertaEvm.organizacion_id == org_id,
+            AlertaEvm.tipo.in_(['cost_performance', 'schedule_performance']),
+        ).order_by(
+            AlertaEvm.severidad,  # 'high' < 'medium'
+            AlertaEvm.id,
+        ).limit(limite).all()
+
+        alertas = []
+        for f in filas:
+            es_costo = f.tipo == 'cost_performance'
+            alertas.append({
+                'tipo': 'evm_costo' if es_costo else 'evm_cronograma',
+                'severidad': 'alta' if f.severidad == 'high' else 'media',
+                'titulo': f'{"Sobrecosto" if es_costo else "Atraso"}: {(f.tarea_nombre or "")[:25]}',
+                'descripcion': f.mensaje,
+                'referencia': (f.obra_nombre or 'Sin obra')[:30],
+                'url': f'/obras/{f.obra_id}',
+            })
+        return alertas
+    except Exception:
+        return []
+
+
+def _pool():
+    global _ejecutor
+    if _ejecutor is None:
+        _ejecutor = ThreadPoolExecutor(max_workers=ALERTAS_MAX_WORKERS,
+                                       thread_name_prefix='alertas')
+    return _ejecutor
+
+
+def _limitar_consultas(timeout):
+    # Que la consulta de un colector expirado no siga ocupando el pool y la base
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("SELECT set_config('statement_timeout', :ms, true)"),
+                           {'ms': str(int(timeout * 1000))})
+
+
+def _correr_colector(app, nombre, colector, org_id, limite, timeout):
+    # Cada hilo abre su propio app context: sesión y conexión propias, con el
+    # contexto RLS de la organización (el hilo no tiene request)
+    from middleware.rls_middleware import contexto_rls
+
+    inicio = time.perf_counter()
+    try:
+        with app.app_context(), contexto_rls(org_id):
+            try:
+                _limitar_consultas(timeout)
+                alertas = colector(org_id, limite)
+            except Exception as exc:
+                logger.warning(f'[ALERTAS] colector {nombre} falló para org {org_id}: {exc}')
+                alertas = []
+    finally:
+        with _en_curso_lock:
+            _en_curso.get(org_id, set()).discard(nombre)
+    return alertas, round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def recolectar_alertas(org_id, limite_por_tipo=3, timeout=None):
+    """
+    Corre todos los colectores en paralelo (pool acotado por ALERTAS_MAX_WORKERS).
+
+    Un colector que no termina dentro de `timeout` segundos se descarta en esta
+    pasada (queda como ausente en `tiempos`), en vez de bloquear el dashboard.
+    En Postgres sus consultas se cortan con statement_timeout, y mientras siga
+    ocupando el pool no se vuelve a encolar para la misma organización.
+
+    Returns:
+        (dict nombre -> lista de alertas, dict nombre -> ms o None si expiró)
+    """
+    app = current_app._get_current_object()
+    timeout = ALERTAS_TIMEOUT_SEC if timeout is None else timeout
+    futuros, tiempos = {}, {}
+    with _en_curso_lock:
+        corriendo = _en_curso.setdefault(org_id, set())
+        for nombre, colector in colectores_alertas():
+            if nombre in corriendo:
+                tiempos[nombre] = None
+                continue
+            corriendo.add(nombre)
+            futuros[nombre] = _pool().submit(_correr_colector, app, nombre, colector,
+                                             org_id, limite_por_tipo, timeout)
+    wait(futuros.values(), timeout=timeout)
+
+    por_tipo = {}
+    for nombre, futuro in futuros.items():
+        if futuro.done():
+            alertas, ms = futuro.result()
+            if ms < timeout * 1000:
+                por_tipo[nombre], tiempos[nombre] = alertas, ms
+                continue
+        elif futuro.cancel():
+            with _en_curso_lock:
+                _en_curso[org_id].discard(nombre)
+        # Terminado por statement_timeout o todavía corriendo: sin resultado
+        logger.warning(f'[ALERTAS] colector {nombre} excedió {timeout}s para org {org_id}')
+        tiempos[nombre] = None
+    return por_tipo, {nombre: tiempos[nombre] for nombre, _ in colectores_alertas()}
+
+
+def alertas_completas(tiempos):
+    """True si ningún colector expiró en la pasada."""
+    return all(ms is not None for ms in tiempos.values())
+
+
+def aplanar_alertas(por_tipo, limite_por_tipo):
+    """Junta las alertas en el orden de los colectores y ordena por severidad."""
+    alertas = []
+    for nombre, _ in colectores_alertas():
+        alertas.extend((por_tipo.get(nombre) or [])[:limite_por_tipo])
+    alertas.sort(key=lambda x: ORDEN_SEVERIDAD.get(x['severidad'], 3))
+    return alertas
+
+
 def obtener_todas_alertas(org_id, limite_por_tipo=3):
     """
     Obtiene todas las alertas del sistema agrupadas y ordenadas por severidad.
+
+    Lee el snapshot de la organización; si no hay uno vigente lo recalcula
+    (colectores en paralelo) y lo deja guardado para los próximos renders.
     """
-    alertas = []
+    from services.alertas_snapshot import obtener_snapshot
 
-    # Obtener alertas de cada tipo
-    alertas.extend(obtener_alertas_stock_bajo(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_presupuestos_vencer(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_obras_demoradas(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_etapas_demoradas(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_tareas_vencidas(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_tareas_en_riesgo(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_sobrecosto(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_fichadas(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_liquidaciones_pendientes(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_equipos_transito(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_movimientos_caja(org_id, limite_por_tipo))
-    alertas.extend(obtener_alertas_entregas_proximas(org_id, limite_por_tipo))
-
-    # Ordenar por severidad
-    orden_severidad = {'critica': 0, 'alta': 1, 'media': 2, 'baja': 3}
-    alertas.sort(key=lambda x: orden_severidad.get(x['severidad'], 3))
+    snapshot = obtener_snapshot(org_id, limite_por_tipo)
+    if snapshot is not None:
+        return aplanar_alertas(snapshot.alertas, limite_por_tipo)
 
-    return alertas
+    por_tipo, _ = recolectar_alertas(org_id, limite_por_tipo)
+    return aplanar_alertas(por_tipo, limite_por_tipo)
 
 
 def contar_alertas_por_severidad(org_id):
     """
-    Cuenta alertas agrupadas por severidad.
+    Cuenta alertas agrupadas por severidad (conteos guardados en el snapshot).
     """
-    alertas = obtener_todas_alertas(org_id, limite_por_tipo=100)
+    from services.alertas_snapshot import obtener_snapshot
+
+    snapshot = obtener_snapshot(org_id)
+    if snapshot is not None:
+        return {
+            'critica': snapshot.conteo_critica,
+            'alta': snapshot.conteo_alta,
+            'media': snapshot.conteo_media,
+            'total': snapshot.conteo_total,
+        }
 
+    por_tipo, _ = recolectar_alertas(org_id, limite_por_tipo=100)
+    return contar_por_severidad(por_tipo)
+
+
+def contar_por_severidad(por_tipo):
     conteo = {'critica': 0, 'alta': 0, 'media': 0, 'total': 0}
 
-    for alerta in alertas:
-        severidad = alerta.get('severidad', 'media')
-        if severidad in conteo:
-            conteo[severidad] += 1
-        conteo['total'] += 1
+    for alertas in por_tipo.values():
+        for alerta in alertas:
+            severidad = alerta.get('severidad', 'media')
+            if severidad in conteo:
+                conteo[severidad] += 1
+            conteo['total'] += 1
 
     return conteo
 
@@ -820,3 +983,23 @@ def obtener_alertas_equipos_transito(org_id, limite=5):
         return alertas
     except Exception:
         return []
+
+
+def colectores_alertas():
+    """Colectores en el orden en que se muestran (mismo orden que la versión serial)."""
+    return [
+        ('stock_bajo', obtener_alertas_stock_bajo),
+        ('presupuestos_vencer', obtener_alertas_presupuestos_vencer),
+        ('obras_demoradas', obtener_alertas_obras_demoradas),
+        ('etapas_demoradas', obtener_alertas_etapas_demoradas),
+        ('tareas_vencidas', obtener_alertas_tareas_vencidas),
+        ('tareas_en_riesgo', obtener_alertas_tareas_en_riesgo),
+        ('sobrecosto', obtener_alertas_sobrecosto),
+        ('fichadas', obtener_alertas_fichadas),
+        ('liquidaciones_pendientes', obtener_alertas_liquidaciones_pendientes),
+        ('equipos_transito', obtener_alertas_equipos_transito),
+        ('movimientos_caja', obtener_alertas_movimientos_caja),
+        ('entregas_proximas', obtener_alertas_entregas_proximas),
+        ('evm', obtener_alertas_evm),
+    ]
+
@@ -0,0 +1,226 @@
+"""
+Snapshot de alertas del dashboard por organización.
+
+Los colectores de services/alertas_dashboard.py se corren una vez (en paralelo,
+con límite 100 para que los conteos por severidad sean los mismos que antes)
+y el resultado queda en alertas_dashboard_snapshot: el dashboard lee una fila
+por organización en vez de trece consultas.
+
+El snapshot se refresca:
+- periódicamente con tasks.alertas.refrescar_alertas_dashboard (beat);
+- al leerlo, si venció (ALERTAS_SNAPSHOT_MAX_AGE) o un hook lo invalidó.
+
+Si algún colector expiró, el resultado parcial no se guarda: se devuelve un
+snapshot transitorio no vigente y la próxima lectura vuelve a intentar.
+
+Los hooks (`registrar_hooks_alertas`) escuchan movimientos de stock, fichadas
+y cambios de estado de OCs; al commitear marcan como no vigente el snapshot de
+las organizaciones afectadas y, si ALERTAS_REFRESCO_ASYNC=true, encolan el
+recálculo en Celery.
+
+ALERTAS_MODO=live desactiva el snapshot: cada render corre los colectores.
+"""
+import logging
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+ALERTAS_MODO = os.getenv('ALERTAS_MODO', 'snapshot')
+ALERTAS_SNAPSHOT_MAX_AGE = int(os.getenv('ALERTAS_SNAPSHOT_MAX_AGE', '600'))
+ALERTAS_REFRESCO_ASYNC = os.getenv('ALERTAS_REFRESCO_ASYNC', 'false').lower() == 'true'
+# Alertas guardadas por colector: alcanza para obtener_alertas_para_dashboard
+SNAPSHOT_LIMITE_POR_TIPO = 5
+# Límite con el que se cuentan las alertas (el de contar_alertas_por_severidad)
+SNAPSHOT_LIMITE_CONTEO = 100
+
+_SESSION_KEY = 'alertas_orgs_sucias'
+_hooks_registrados = False
+
+
+def _valor_json(valor):
+    if isinstance(valor, datetime) or isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def _alerta_json(alerta):
+    # Los colectores a veces adjuntan el objeto ORM ('item', 'obra', ...):
+    # ningún template lo usa y no se puede serializar.
+    return {k: _valor_json(v) for k, v in alerta.items() if not isinstance(v, db.Model)}
+
+
+def recalcular_snapshot(org_id):
+    """
+    Corre los colectores y reescribe el snapshot de la organización.
+
+    Returns:
+        AlertaDashboardSnapshot (persistido, o transitorio si otro proceso
+        escribió la misma organización al mismo tiempo o si la pasada quedó
+        incompleta).
+    """
+    from models import AlertaDashboardSnapshot
+    from services.alertas_dashboard import (recolectar_alertas, contar_por_severidad,
+                                            alertas_completas)
+
+    inicio = datetime.utcnow()
+    por_tipo, tiempos = recolectar_alertas(org_id, limite_por_tipo=SNAPSHOT_LIMITE_CONTEO)
+    conteo = contar_por_severidad(por_tipo)
+    datos = dict(
+        alertas={nombre: [_alerta_json(a) for a in alertas[:SNAPSHOT_LIMITE_POR_TIPO]]
+                 for nombre, alertas in por_tipo.items()},
+        conteo_critica=conteo['critica'],
+        conteo_alta=conteo['alta'],
+        conteo_media=conteo['media'],
+        conteo_total=conteo['total'],
+        tiempos_ms=tiempos,
+        vigente=True,
+        calculado_en=inicio,
+    )
+
+    lentos = {k: v for k, v in tiempos.items() if v is None or v > 1000}
+    if lentos:
+        logger.warning(f'[ALERTAS] org {org_id}: colectores lentos o expirados {lentos}')
+    if not alertas_completas(tiempos):
+        datos['vigente'] = False
+        return AlertaDashboardSnapshot(organizacion_id=org_id, **datos)
+
+    snapshot = AlertaDashboardSnapshot.query.filter_by(organizacion_id=org_id).first()
+    if snapshot is None:
+        snapshot = AlertaDashboardSnapshot(organizacion_id=org_id)
+        db.session.add(snapshot)
+    for campo, valor in datos.items():
+        setattr(snapshot, campo, valor)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        logger.info(f'[ALERTAS] snapshot de org {org_id} escrito en paralelo por otro proceso')
+        snapshot = AlertaDashboardSnapshot(organizacion_id=org_id, **datos)
+    return snapshot
+
+
+def obtener_snapshot(org_id, limite_por_tipo=SNAPSHOT_LIMITE_POR_TIPO):
+    """
+    Devuelve el snapshot vigente de la organización, recalculándolo si hace falta.
+
+    Devuelve None si el modo es 'live' o si se piden más alertas por tipo de
+    las que guarda el snapshot; el llamador corre los colectores en vivo.
+    """
+    from models import AlertaDashboardSnapshot
+
+    if ALERTAS_MODO != 'snapshot' or limite_por_tipo > SNAPSHOT_LIMITE_POR_TIPO:
+        return None
+
+    try:
+        snapshot = AlertaDashboardSnapshot.query.filter_by(organizacion_id=org_id).first()
+        limite = datetime.utcnow() - timedelta(seconds=ALERTAS_SNAPSHOT_MAX_AGE)
+        if snapshot is not None and snapshot.vigente and snapshot.calculado_en >= limite:
+            return snapshot
+        return recalcular_snapshot(org_id)
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning(f'[ALERTAS] snapshot no disponible para org {org_id}: {exc}')
+        return None
+
+
+def marcar_snapshots_vencidos(org_ids):
+    """Marca como no vigente el snapshot de las organizaciones indicadas."""
+    from models import AlertaDashboardSnapshot
+
+    org_ids = sorted(set(org_ids))
+    if not org_ids:
+        return
+    stmt = (update(AlertaDashboardSnapshot.__table__)
+            .where(AlertaDashboardSnapshot.__table__.c.organizacion_id.in_(org_ids))
+            .values(vigente=False))
+    # Conexión aparte: se llama desde after_commit, con la sesión ya cerrada
+    with db.engine.begin() as conn:
+        conn.execute(stmt)
+
+
+# ------------------------------------------------------------------ hooks ---
+
+def _anotar_org(target, org_id):
+    session = object_session(target)
+    if session is not None and org_id:
+        session.info.setdefault(_SESSION_KEY, set()).add(org_id)
+
+
+def _org_de_item(connection, item_id):
+    from models import ItemInventario
+    return connection.scalar(select(ItemInventario.organizacion_id).where(ItemInventario.id == item_id))
+
+
+def _org_de_obra(connection, obra_id):
+    from models import Obra
+    return connection.scalar(select(Obra.organizacion_id).where(Obra.id == obra_id))
+
+
+def _despues_de_commit(session):
+    org_ids = session.info.pop(_SESSION_KEY, None)
+    if not org_ids:
+        return
+    try:
+        marcar_snapshots_vencidos(org_ids)
+    except Exception as exc:
+        logger.warning(f'[ALERTAS] no se pudo invalidar snapshot de orgs {org_ids}: {exc}')
+        return
+
+    if ALERTAS_REFRESCO_ASYNC:
+        try:
+            from tasks.alertas import refrescar_alertas_dashboard
+            for org_id in org_ids:
+                refrescar_alertas_dashboard.apply_async(args=[org_id], countdown=5)
+        except Exception as exc:
+            logger.warning(f'[ALERTAS] no se pudo encolar refresco de snapshot: {exc}')
+
+
+def _despues_de_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def registrar_hooks_alertas():
+    """Registra los listeners que invalidan el snapshot (idempotente)."""
+    global _hooks_registrados
+    if _hooks_registrados:
+        return
+    from models import ItemInventario, MovimientoInventario, OrdenCompra, Fichada
+
+    @event.listens_for(MovimientoInventario, 'after_insert')
+    def _movimiento_stock(mapper, connection, target):
+        _anotar_org(target, _org_de_item(connection, target.item_id))
+
+    @event.listens_for(ItemInventario, 'after_update')
+    def _item_stock(mapper, connection, target):
+        estado = db.inspect(target)
+        if (estado.attrs.stock_actual.history.has_changes()
+                or estado.attrs.stock_minimo.history.has_changes()):
+            _anotar_org(target, target.organizacion_id)
+
+    @event.listens_for(OrdenCompra, 'after_insert')
+    def _oc_nueva(mapper, connection, target):
+        _anotar_org(target, target.organizacion_id)
+
+    @event.listens_for(OrdenCompra, 'after_update')
+    def _oc_estado(mapper, connection, target):
+        if db.inspect(target).attrs.estado.history.has_changes():
+            _anotar_org(target, target.organizacion_id)
+
+    @event.listens_for(Fichada, 'after_insert')
+    def _fichada(mapper, connection, target):
+        _anotar_org(target, _org_de_obra(connection, target.obra_id))
+
+    event.listen(Session, 'after_commit', _despues_de_commit)
+    event.listen(Session, 'after_rollback', _despues_de_rollback)
+    _hooks_registrados = True
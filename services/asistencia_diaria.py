@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Asistencia diaria por operario y obra, mantenida desde las fichadas.
+
+Los resúmenes de horas (historial de fichadas, pestaña de certificaciones)
+traían todas las fichadas de la obra filtrando con date(fecha_hora), que no
+usa el índice (obra_id, fecha_hora), emparejaban ingreso/egreso en Python y
+buscaban cada Usuario por separado. Ahora:
+
+  - fichadas_asistencia_diaria guarda por (usuario, obra, día) los segundos
+    trabajados, la cantidad de pares, si quedó un ingreso abierto y el
+    detalle de los pares. Los hooks de Fichada recalculan el día afectado con
+    la conexión del flush, así que el resumen se commitea junto con la
+    fichada (alta desde api_fichar, cambios y bajas).
+  - `rango_fichadas` arma el filtro de período sobre fecha_hora como rango
+    [desde 00:00, hasta+1 00:00), que sí usa el índice.
+  - `reconstruir_asistencia` rearma la tabla desde las fichadas (datos
+    anteriores a la tabla, o si se borraron fichadas con un DELETE masivo).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from extensions import db
+
+
+def rango_fichadas(desde=None, hasta=None):
+    """Condiciones de período sobre Fichada.fecha_hora (fechas inclusive)."""
+    from models.projects import Fichada
+
+    condiciones = []
+    if desde is not None:
+        condiciones.append(Fichada.fecha_hora >= datetime.combine(desde, datetime.min.time()))
+    if hasta is not None:
+        condiciones.append(
+            Fichada.fecha_hora < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    return condiciones
+
+
+def calcular_horas_dia(fichadas_lista):
+    """Calcula horas trabajadas de una lista de fichadas del mismo día.
+
+    Empareja ingreso→egreso y suma las duraciones.
+    Returns: (total_segundos, pares, en_obra)
+      - total_segundos: int, total de segundos trabajados
+      - pares: list of (ingreso_fichada, egreso_fichada, duracion_timedelta)
+      - en_obra: bool, True si la última fichada es ingreso (aún en obra)
+    """
+    fichadas_ord = sorted(fichadas_lista, key=lambda f: f.fecha_hora)
+    pares = []
+    total_seg = 0
+    en_obra = False
+
+    i = 0
+    while i < len(fichadas_ord):
+        f = fichadas_ord[i]
+        if f.tipo == 'ingreso':
+            # Buscar el siguiente egreso
+            egreso = None
+            for j in range(i + 1, len(fichadas_ord)):
+                if fichadas_ord[j].tipo == 'egreso':
+                    egreso = fichadas_ord[j]
+                    i = j + 1
+                    break
+            if egreso:
+                dur = egreso.fecha_hora - f.fecha_hora
+                pares.append((f, egreso, dur))
+                total_seg += int(dur.total_seconds())
+            else:
+                # Ingreso sin egreso: aún en obra
+                en_obra = True
+                i += 1
+        else:
+            # Egreso suelto (sin ingreso previo), ignorar
+            i += 1
+
+    return total_seg, pares, en_obra
+
+
+def _valores_dia(usuario_id, obra_id, fecha, fichadas):
+    """Fila de fichadas_asistencia_diaria para las fichadas de un día."""
+    segundos, pares, en_obra = calcular_horas_dia(fichadas)
+    return {
+        'usuario_id': usuario_id,
+        'obra_id': obra_id,
+        'fecha': fecha,
+        'segundos': segundos,
+        'pares': len(pares),
+        'en_obra': en_obra,
+        'cantidad_fichadas': len(fichadas),
+        'detalle_pares': [
+            {'ingreso': ingreso.fecha_hora.strftime('%H:%M'),
+             'egreso': egreso.fecha_hora.strftime('%H:%M'),
+             'segundos': int(duracion.total_seconds())}
+            for ingreso, egreso, duracion in pares
+        ],
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def _guardar_dia(connection, valores):
+    """Reemplaza la fila del día (insert o update)."""
+    from models.projects import AsistenciaDiaria
+
+    tabla = AsistenciaDiaria.__table__
+    clave = (tabla.c.usuario_id, tabla.c.obra_id, tabla.c.fecha)
+    resto = {k: v for k, v in valores.items() if k not in ('usuario_id', 'obra_id', 'fecha')}
+
+    dialecto = connection.dialect.name
+    if dialecto in ('postgresql', 'sqlite'):
+        if dialecto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(tabla).values(**valores).on_conflict_do_update(
+            index_elements=list(clave), set_=resto))
+        return
+    actualizadas = connection.execute(
+        tabla.update()
+        .where(tabla.c.usuario_id == valores['usuario_id'],
+               tabla.c.obra_id == valores['obra_id'],
+               tabla.c.fecha == valores['fecha'])
+        .values(**resto)).rowcount
+    if not actualizadas:
+        connection.execute(tabla.insert().values(**valores))
+
+
+def recalcular_dia(connection, usuario_id, obra_id, fecha):
+    """Rearma la fila (usuario, obra, día) desde las fichadas de ese día."""
+    from models.projects import AsistenciaDiaria, Fichada
+
+    if not (usuario_id and obra_id and fecha):
+        return
+    fichadas_t = Fichada.__table__
+    fichadas = connection.execute(
+        select(fichadas_t.c.id, fichadas_t.c.tipo, fichadas_t.c.fecha_hora)
+        .where(fichadas_t.c.usuario_id == usuario_id,
+               fichadas_t.c.obra_id == obra_id,
+               *rango_fichadas(fecha, fecha))
+        .order_by(fichadas_t.c.fecha_hora, fichadas_t.c.id)
+    ).all()
+    if fichadas:
+        _guardar_dia(connection, _valores_dia(usuario_id, obra_id, fecha, fichadas))
+        return
+    tabla = AsistenciaDiaria.__table__
+    connection.execute(tabla.delete().where(
+        tabla.c.usuario_id == usuario_id, tabla.c.obra_id == obra_id, tabla.c.fecha == fecha))
+
+
+def asistencia_periodo(obra_id, desde=None, hasta=None, usuario_id=None):
+    """Filas de AsistenciaDiaria de la obra en el período, por usuario y fecha."""
+    from models.projects import AsistenciaDiaria
+
+    query = AsistenciaDiaria.query.filter(AsistenciaDiaria.obra_id == obra_id)
+    if usuario_id:
+        query = query.filter(AsistenciaDiaria.usuario_id == usuario_id)
+    if desde:
+        query = query.filter(AsistenciaDiaria.fecha >= desde)
+    if hasta:
+        query = query.filter(AsistenciaDiaria.fecha <= hasta)
+    return query.order_by(AsistenciaDiaria.usuario_id, AsistenciaDiaria.fecha).all()
+
+
+def reconstruir_asistencia(obra_id=None, lote=5000):
+    """Rearma fichadas_asistencia_diaria desde las fichadas (de una obra o de
+    todas). Idempotente; devuelve cuántos días escribió."""
+    from models.projects import AsistenciaDiaria, Fichada
+
+    tabla = AsistenciaDiaria.__table__
+    borrar = tabla.delete()
+    if obra_id:
+        borrar = borrar.where(tabla.c.obra_id == obra_id)
+    db.session.execute(borrar)
+
+    fichadas_t = Fichada.__table__
+    consulta = (
+        select(fichadas_t.c.id, fichadas_t.c.usuario_id, fichadas_t.c.obra_id,
+               fichadas_t.c.tipo, fichadas_t.c.fecha_hora)
+        .order_by(fichadas_t.c.usuario_id, fichadas_t.c.obra_id, fichadas_t.c.fecha_hora, fichadas_t.c.id)
+    )
+    if obra_id:
+        consulta = consulta.where(fichadas_t.c.obra_id == obra_id)
+
+    por_dia = defaultdict(list)
+    for f in db.session.execute(consulta):
+        por_dia[(f.usuario_id, f.obra_id, f.fecha_hora.date())].append(f)
+
+    filas = [_valores_dia(uid, oid, dia, fichs) for (uid, oid, dia), fichs in por_dia.items()]
+    for i in range(0, len(filas), lote):
+        db.session.execute(tabla.insert(), filas[i:i + lote])
+    db.session.commit()
+    return len(filas)
+
+
+_hooks_asistencia_registrados = False
+
+
+def registrar_hooks_asistencia():
+    """Recalcula el día afectado al insertar, modificar o borrar una Fichada
+    (idempotente). Escribe con la conexión del flush."""
+    global _hooks_asistencia_registrados
+    if _hooks_asistencia_registrados:
+        return
+    from sqlalchemy import event, inspect
+    from models.projects import Fichada
+
+    def _dia(valor):
+        if isinstance(valor, datetime):
+            return valor.date()
+        return valor if isinstance(valor, date) else None
+
+    def _clave_anterior(connection, target):
+        tabla = Fichada.__table__
+        fila = connection.execute(
+            select(tabla.c.usuario_id, tabla.c.obra_id, tabla.c.fecha_hora)
+            .where(tabla.c.id == target.id)
+        ).first()
+        if fila is None:
+            return None
+        return fila.usuario_id, fila.obra_id, _dia(fila.fecha_hora)
+
+    @event.listens_for(Fichada, 'after_insert')
+    def _fichada_creada(mapper, connection, target):
+        recalcular_dia(connection, target.usuario_id, target.obra_id, _dia(target.fecha_hora))
+
+    @event.listens_for(Fichada, 'before_update')
+    def _antes_de_modificar(mapper, connection, target):
+        # Tras un commit la fichada queda expirada y el historial de atributos
+        # llega vacío a after_update: leemos la fila guardada antes del UPDATE.
+        estado = inspect(target)
+        if any(estado.attrs[a].history.has_changes()
+               for a in ('usuario_id', 'obra_id', 'tipo', 'fecha_hora')):
+            estado.info['_asistencia_antes'] = _clave_anterior(connection, target)
+
+    @event.listens_for(Fichada, 'after_update')
+    def _fichada_modificada(mapper, connection, target):
+        estado = inspect(target)
+        if '_asistencia_antes' not in estado.info:
+            return
+        antes = estado.info.pop('_asistencia_antes')
+        ahora = (target.usuario_id, target.obra_id, _dia(target.fecha_hora))
+        if antes and antes != ahora:
+            recalcular_dia(connection, *antes)
+        recalcular_dia(connection, *ahora)
+
+    @event.listens_for(Fichada, 'before_delete')
+    def _antes_de_borrar(mapper, connection, target):
+        inspect(target).info['_asistencia_antes'] = _clave_anterior(connection, target)
+
+    @event.listens_for(Fichada, 'after_delete')
+    def _fichada_borrada(mapper, connection, target):
+        antes = inspect(target).info.pop('_asistencia_antes', None)
+        if antes:
+            recalcular_dia(connection, *antes)
+
+    _hooks_asistencia_registrados = True
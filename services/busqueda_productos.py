@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""Búsqueda de productos del marketplace (texto, facetas y paginado).
+
+search_products filtraba con ILIKE '%texto%' sobre nombre y descripcion (no
+usa índices) y hacía JOIN a product_variant para los precios, con filas
+duplicadas por variante. Ahora:
+
+  - Product.texto_busqueda guarda nombre + descripcion en minúsculas y sin
+    acentos; lo completan los hooks de Product al insertar/modificar y
+    `rellenar_texto_busqueda` para las filas anteriores a la columna.
+  - Postgres: GIN sobre to_tsvector('spanish', texto_busqueda) (stemming en
+    español; los acentos ya vienen sacados, así que 'ladrillo ceramico'
+    encuentra 'Ladrillo Cerámico'). Cada palabra de la consulta se busca como
+    prefijo ('cem' -> cemento) y el orden es ts_rank_cd, después visitas.
+    Si todas las palabras son stopwords del diccionario español ('de', 'la')
+    el tsquery queda vacío y no encontraría nada: ahí se busca por prefijo
+    con LIKE sobre texto_busqueda.
+  - Otros motores (SQLite en tests): índice invertido en memoria por proceso
+    (token -> ids) con el mismo criterio de prefijos, que se descarta al
+    commitear cambios de productos.
+  - Precio: EXISTS sobre las variantes (sin duplicar productos).
+  - Paginado por keyset: el cursor opaco lleva las claves de orden de la
+    última fila (ranking, visitas, id) y la página siguiente filtra por
+    comparación de tuplas, sin OFFSET. Facetas por categoría y rango de precio.
+"""
+import base64
+import bisect
+import json
+import re
+import threading
+import unicodedata
+from decimal import Decimal
+from functools import lru_cache
+
+from sqlalchemy import (Float, and_, case, cast, desc, exists, func, literal_column, or_, select,
+                        tuple_)
+
+from extensions import db
+
+# Límites de los rangos de precio de la faceta (precio mínimo de las variantes
+# visibles); el último rango queda abierto.
+RANGOS_PRECIO = (0, 1000, 5000, 20000, 100000)
+
+_SESSION_KEY_BUSQUEDA = '_busqueda_productos_cambios'
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos y sin signos: lo que se guarda y lo que se busca."""
+    if not texto:
+        return ''
+    s = unicodedata.normalize('NFD', str(texto).lower())
+    s = ''.join(ch for ch in s if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', s).split())
+
+
+def texto_busqueda_producto(nombre, descripcion):
+    """Valor de Product.texto_busqueda."""
+    return ' '.join(p for p in (normalizar(nombre), normalizar(descripcion)) if p)
+
+
+def _tokens_consulta(query):
+    return [t for t in normalizar(query).split() if len(t) >= 2 or t.isdigit()]
+
+
+# ------------------------------------------------------------
+# Índice en memoria (motores sin full-text)
+# ------------------------------------------------------------
+
+class _IndiceMemoria:
+    """token -> ids de producto, con búsqueda por prefijo."""
+
+    def __init__(self, filas):
+        self.tokens = {}
+        for product_id, texto in filas:
+            for token in set((texto or '').split()):
+                self.tokens.setdefault(token, set()).add(product_id)
+        self._ordenados = sorted(self.tokens)
+
+    def _con_prefijo(self, prefijo):
+        ids = set()
+        i = bisect.bisect_left(self._ordenados, prefijo)
+        while i < len(self._ordenados) and self._ordenados[i].startswith(prefijo):
+            ids |= self.tokens[self._ordenados[i]]
+            i += 1
+        return ids
+
+    def buscar(self, tokens):
+        """{product_id: puntaje}: todos los tokens tienen que aparecer (como
+        prefijo); una palabra completa suma más que un prefijo."""
+        puntajes = None
+        for token in tokens:
+            exactos = self.tokens.get(token, set())
+            encontrados = self._con_prefijo(token)
+            parcial = {pid: (2 if pid in exactos else 1) for pid in encontrados}
+            if puntajes is None:
+                puntajes = parcial
+            else:
+                puntajes = {pid: puntajes[pid] + parcial[pid] for pid in puntajes.keys() & parcial.keys()}
+            if not puntajes:
+                return {}
+        return puntajes or {}
+
+
+_indice_lock = threading.Lock()
+_indice = None
+
+
+def _indice_memoria():
+    global _indice
+    from models import Product
+
+    with _indice_lock:
+        if _indice is None:
+            filas = db.session.execute(
+                select(Product.id, Product.texto_busqueda,
+                       Product.nombre, Product.descripcion)).all()
+            _indice = _IndiceMemoria(
+                (f.id, f.texto_busqueda if f.texto_busqueda is not None
+                 else texto_busqueda_producto(f.nombre, f.descripcion))
+                for f in filas)
+        return _indice
+
+
+def invalidar_indice_memoria():
+    global _indice
+    with _indice_lock:
+        _indice = None
+
+
+# ------------------------------------------------------------
+# Filtros
+# ------------------------------------------------------------
+
+def _es_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+@lru_cache(maxsize=4096)
+def _es_stopword(token):
+    """True si el diccionario español descarta el token (tsquery vacío)."""
+    consulta = func.to_tsquery(literal_column("'spanish'::regconfig"), f'{token}:*')
+    return db.session.execute(select(func.numnode(consulta))).scalar() == 0
+
+
+def _filtro_prefijos(tokens):
+    """Cada token como prefijo de alguna palabra de texto_busqueda (LIKE)."""
+    from models import Product
+
+    texto = func.coalesce(Product.texto_busqueda, '')
+    return and_(*(or_(texto.like(f'{t}%'), texto.like(f'% {t}%')) for t in tokens))
+
+
+def _filtro_texto(tokens):
+    """(condición, expresión de ranking) para los tokens de la consulta."""
+    from models import Product
+
+    if _es_postgres():
+        if all(_es_stopword(t) for t in tokens):
+            return _filtro_prefijos(tokens), None
+        # Literales (no binds): la expresión tiene que ser la del índice
+        vector = func.to_tsvector(literal_column("'spanish'::regconfig"),
+                                  func.coalesce(Product.texto_busqueda, literal_column("''")))
+        consulta = func.to_tsquery(literal_column("'spanish'::regconfig"),
+                                   ' & '.join(f'{t}:*' for t in tokens))
+        # float8: el valor vuelve exacto en el cursor (float4 no redondea igual)
+        return vector.op('@@')(consulta), cast(func.ts_rank_cd(vector, consulta), Float(53))
+
+    puntajes = _indice_memoria().buscar(tokens)
+    if not puntajes:
+        return Product.id.in_([]), None
+    return Product.id.in_(list(puntajes)), case(puntajes, value=Product.id, else_=0)
+
+
+def _filtro_precio(min_price, max_price):
+    from models import Product, ProductVariant
+
+    condiciones = [ProductVariant.product_id == Product.id]
+    if min_price is not None:
+        condiciones.append(ProductVariant.precio >= min_price)
+    if max_price is not None:
+        condiciones.append(ProductVariant.precio <= max_price)
+    return exists().where(and_(*condiciones))
+
+
+def _precio_minimo():
+    """Subconsulta product_id -> precio mínimo de las variantes visibles."""
+    from models import ProductVariant
+
+    return (select(ProductVariant.product_id, func.min(ProductVariant.precio).label('precio'))
+            .where(ProductVariant.visible.is_(True), ProductVariant.precio > 0)
+            .group_by(ProductVariant.product_id)
+            .subquery())
+
+
+def _rango_precio(precio):
+    """Expresión CASE con la etiqueta del rango de precio."""
+    limites = list(RANGOS_PRECIO)
+    ramas = []
+    for desde, hasta in zip(limites, limites[1:]):
+        ramas.append((and_(precio >= desde, precio < hasta), f'{desde}-{hasta}'))
+    return case(*ramas, else_=f'{limites[-1]}+')
+
+
+def _leer_cursor(cursor, claves):
+    """Valores de las claves de orden de la última fila; None si el cursor no
+    es válido para este orden (se vuelve a la primera página)."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        return None
+    if not isinstance(valores, list) or len(valores) != claves:
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in valores):
+        return None
+    return valores
+
+
+def _cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+# ------------------------------------------------------------
+# Búsqueda
+# ------------------------------------------------------------
+
+def buscar_productos(query=None, category_id=None, min_price=None, max_price=None,
+                     limit=50, cursor=None, facetas=False):
+    """Productos publicados que coinciden, ordenados por relevancia y visitas.
+
+    Devuelve {'productos', 'siguiente' (cursor o None), 'total', 'facetas'};
+    total y facetas solo se calculan con `facetas=True`. Las facetas de
+    categoría ignoran el filtro de categoría y las de precio el de precio,
+    para poder mostrar cuántos hay en las otras opciones.
+    """
+    from models import Product
+
+    base = [Product.estado == 'publicado']
+    ranking = None
+    tokens = _tokens_consulta(query)
+    if tokens:
+        condicion, ranking = _filtro_texto(tokens)
+        base.append(condicion)
+    por_categoria = [Product.category_id == category_id] if category_id else []
+    por_precio = ([_filtro_precio(min_price, max_price)]
+                  if min_price is not None or max_price is not None else [])
+
+    # Claves de orden, todas descendentes: la página siguiente es la tupla menor
+    claves = ([ranking] if ranking is not None else []) + [
+        func.coalesce(Product.visitas, 0), Product.id]
+    despues = _leer_cursor(cursor, len(claves)) if cursor else None
+    consulta = Product.query.filter(*base, *por_categoria, *por_precio)
+    if despues is not None:
+        consulta = consulta.filter(tuple_(*claves) < tuple_(*despues))
+    filas = (consulta.add_columns(*claves[:-1])
+             .order_by(*(desc(c) for c in claves)).limit(limit + 1).all())
+    productos = [fila[0] for fila in filas[:limit]]
+    siguiente = None
+    if limit and len(filas) > limit:
+        ultima = filas[limit - 1]
+        siguiente = _cursor([_numero(v) for v in ultima[1:]] + [ultima[0].id])
+
+    resultado = {'productos': productos, 'siguiente': siguiente,
+                 'total': None, 'facetas': None}
+    if facetas:
+        resultado['total'] = (db.session.query(func.count(Product.id))
+                              .filter(*base, *por_categoria, *por_precio).scalar())
+        resultado['facetas'] = {
+            'categorias': _faceta_categorias(base + por_precio),
+            'precios': _faceta_precios(base + por_categoria),
+        }
+    return resultado
+
+
+def _numero(valor):
+    return float(valor) if isinstance(valor, (float, Decimal)) else int(valor)
+
+
+def _faceta_categorias(filtros):
+    from models import Category, Product
+
+    filas = (db.session.query(Product.category_id, Category.nombre, func.count(Product.id))
+             .join(Category, Category.id == Product.category_id)
+             .filter(*filtros)
+             .group_by(Product.category_id, Category.nombre)
+             .order_by(desc(func.count(Product.id)), Category.nombre)
+             .all())
+    return [{'id': cid, 'nombre': nombre, 'cantidad': n} for cid, nombre, n in filas]
+
+
+def _faceta_precios(filtros):
+    from models import Product
+
+    precio_min = _precio_minimo()
+    rango = _rango_precio(precio_min.c.precio)
+    filas = (db.session.query(rango.label('rango'), func.count(Product.id))
+             .join(precio_min, precio_min.c.product_id == Product.id)
+             .filter(*filtros)
+             .group_by(rango)
+             .all())
+    conteos = dict(filas)
+    limites = list(RANGOS_PRECIO)
+    etiquetas = [f'{a}-{b}' for a, b in zip(limites, limites[1:])] + [f'{limites[-1]}+']
+    return [{'rango': etiqueta,
+             'desde': Decimal(limites[i]),
+             'hasta': Decimal(limites[i + 1]) if i + 1 < len(limites) else None,
+             'cantidad': conteos.get(etiqueta, 0)}
+            for i, etiqueta in enumerate(etiquetas)]
+
+
+# ------------------------------------------------------------
+# Mantenimiento
+# ------------------------------------------------------------
+
+def rellenar_texto_busqueda(lote=1000):
+    """Completa texto_busqueda en los productos que no lo tienen (datos
+    anteriores a la columna). Idempotente; devuelve cuántos actualizó."""
+    from models import Product
+
+    tabla = Product.__table__
+    total = 0
+    while True:
+        filas = db.session.execute(
+            select(tabla.c.id, tabla.c.nombre, tabla.c.descripcion)
+            .where(tabla.c.texto_busqueda.is_(None))
+            .limit(lote)
+        ).all()
+        if not filas:
+            return total
+        # updated_at se deja como estaba: no es un cambio del producto
+        db.session.execute(
+            tabla.update().where(tabla.c.id == db.bindparam('_id'))
+            .values(updated_at=tabla.c.updated_at),
+            [{'_id': f.id, 'texto_busqueda': texto_busqueda_producto(f.nombre, f.descripcion)}
+             for f in filas])
+        db.session.commit()
+        total += len(filas)
+
+
+_hooks_busqueda_registrados = False
+
+
+def registrar_hooks_busqueda_productos():
+    """Mantiene Product.texto_busqueda y descarta el índice en memoria al
+    commitear altas, bajas o cambios de texto (idempotente)."""
+    global _hooks_busqueda_registrados
+    if _hooks_busqueda_registrados:
+        return
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import Session, object_session
+    from models import Product
+
+    def _anotar(target):
+        sesion = object_session(target)
+        if sesion is not None:
+            sesion.info[_SESSION_KEY_BUSQUEDA] = True
+
+    @event.listens_for(Product, 'before_insert')
+    def _antes_de_insertar(mapper, connection, target):
+        target.texto_busqueda = texto_busqueda_producto(target.nombre, target.descripcion)
+        _anotar(target)
+
+    @event.listens_for(Product, 'before_update')
+    def _antes_de_actualizar(mapper, connection, target):
+        estado = inspect(target)
+        if any(estado.attrs[campo].history.has_changes() for campo in ('nombre', 'descripcion')):
+            target.texto_busqueda = texto_busqueda_producto(target.nombre, target.descripcion)
+            _anotar(target)
+
+    @event.listens_for(Product, 'after_delete')
+    def _borrado(mapper, connection, target):
+        _anotar(target)
+
+    @event.listens_for(Session, 'after_commit')
+    def _despues_de_commit(sesion):
+        if sesion.info.pop(_SESSION_KEY_BUSQUEDA, None):
+            invalidar_indice_memoria()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _despues_de_rollback(sesion):
+        sesion.info.pop(_SESSION_KEY_BUSQUEDA, None)
+
+    _hooks_busqueda_registrados = True
@@ -0,0 +1,257 @@
+"""
+Saldos de caja por obra (caja_saldos_obra).
+
+El dashboard de Caja sumaba movimientos_caja por obra: cuatro agregados por
+obra y por request. Ahora cada obra tiene su fila en caja_saldos_obra con lo
+transferido y lo gastado, y los hooks de MovimientoCaja la ajustan en la
+misma transacción en que se confirma, se anula o se borra un movimiento:
+
+- solo cuentan los movimientos `confirmado`;
+- ingreso: transferencia_a_obra; egreso: devolucion_obra, pago_proveedor,
+  gasto_obra (igual que el cálculo anterior);
+- el ajuste es `transferido = transferido + delta` en la base (upsert), así
+  dos movimientos concurrentes de la misma obra no se pisan.
+
+Los UPDATE/DELETE masivos (query.update()) no pasan por los hooks: para esos
+casos, o si la tabla se desfasa, `reconciliar_saldos` la reconstruye desde el
+historial (`flask caja reconciliar-saldos --fix`). Con CAJA_SALDOS_ROLLUP=0 las
+lecturas vuelven a sumar movimientos_caja, en una sola consulta agrupada.
+"""
+import os
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import case, func, inspect, select
+
+from extensions import db
+
+CAJA_SALDOS_ROLLUP = os.getenv('CAJA_SALDOS_ROLLUP', '1').lower() not in ('0', 'false', 'no')
+
+TIPOS_INGRESO = ('transferencia_a_obra',)
+TIPOS_EGRESO = ('devolucion_obra', 'pago_proveedor', 'gasto_obra')
+
+
+def _aporte(estado, tipo, monto):
+    """(transferido, gastado) con que un movimiento aporta al saldo de su obra."""
+    if estado != 'confirmado' or not monto:
+        return Decimal('0'), Decimal('0')
+    monto = Decimal(str(monto))
+    if tipo in TIPOS_INGRESO:
+        return monto, Decimal('0')
+    if tipo in TIPOS_EGRESO:
+        return Decimal('0'), monto
+    return Decimal('0'), Decimal('0')
+
+
+def _vacio():
+    return {'transferido': 0.0, 'gastado': 0.0, 'saldo': 0.0}
+
+
+def _fila(transferido, gastado):
+    transferido, gastado = float(transferido or 0), float(gastado or 0)
+    return {'transferido': transferido, 'gastado': gastado, 'saldo': transferido - gastado}
+
+
+def _saldos_agrupados(obra_ids=None, org_id=None):
+    """{obra_id: (transferido, gastado)} sumando movimientos_caja, una consulta."""
+    from models.templates import MovimientoCaja
+
+    confirmado = MovimientoCaja.estado == 'confirmado'
+    query = db.session.query(
+        MovimientoCaja.obra_id,
+        MovimientoCaja.organizacion_id,
+        func.coalesce(func.sum(case(
+            (MovimientoCaja.tipo.in_(TIPOS_INGRESO), MovimientoCaja.monto), else_=0)), 0),
+        func.coalesce(func.sum(case(
+            (MovimientoCaja.tipo.in_(TIPOS_EGRESO), MovimientoCaja.monto), else_=0)), 0),
+    ).filter(confirmado).group_by(MovimientoCaja.obra_id, MovimientoCaja.organizacion_id)
+    if obra_ids is not None:
+        query = query.filter(MovimientoCaja.obra_id.in_(obra_ids))
+    if org_id:
+        query = query.filter(MovimientoCaja.organizacion_id == org_id)
+    return {obra_id: (org, Decimal(str(transferido)), Decimal(str(gastado)))
+            for obra_id, org, transferido, gastado in query.all()}
+
+
+def saldos_caja_obras(obra_ids):
+    """{obra_id: {'transferido', 'gastado', 'saldo'}} para todas las obras pedidas.
+
+    Una sola consulta: a caja_saldos_obra, o agrupada sobre movimientos_caja si
+    el rollup está apagado. Las obras sin movimientos vuelven en cero.
+    """
+    from models.templates import SaldoCajaObra
+
+    obra_ids = [oid for oid in obra_ids if oid]
+    saldos = {oid: _vacio() for oid in obra_ids}
+    if not obra_ids:
+        return saldos
+    if CAJA_SALDOS_ROLLUP:
+        filas = db.session.query(
+            SaldoCajaObra.obra_id, SaldoCajaObra.transferido, SaldoCajaObra.gastado,
+        ).filter(SaldoCajaObra.obra_id.in_(obra_ids)).all()
+        for obra_id, transferido, gastado in filas:
+            saldos[obra_id] = _fila(transferido, gastado)
+    else:
+        for obra_id, (_, transferido, gastado) in _saldos_agrupados(obra_ids).items():
+            saldos[obra_id] = _fila(transferido, gastado)
+    return saldos
+
+
+def saldo_caja_obra(obra_id, bloquear=False):
+    """Saldo disponible en la caja de una obra.
+
+    Con `bloquear` toma la fila con FOR UPDATE hasta el commit: dos gastos
+    simultáneos de la misma obra no pueden validar contra el mismo saldo.
+    """
+    from models.templates import SaldoCajaObra
+
+    if not CAJA_SALDOS_ROLLUP:
+        return saldos_caja_obras([obra_id])[obra_id]['saldo']
+    query = db.session.query(SaldoCajaObra.transferido, SaldoCajaObra.gastado).filter(
+        SaldoCajaObra.obra_id == obra_id)
+    if bloquear:
+        query = query.with_for_update()
+    fila = query.first()
+    return _fila(*fila)['saldo'] if fila else 0.0
+
+
+def _upsert_saldo(connection, obra_id, org_id, transferido, gastado):
+    """Suma (transferido, gastado) a la fila de la obra, creándola si falta."""
+    from models.templates import SaldoCajaObra
+
+    tabla = SaldoCajaObra.__table__
+    ahora = datetime.utcnow()
+    valores = dict(obra_id=obra_id, organizacion_id=org_id, transferido=transferido,
+                   gastado=gastado, updated_at=ahora)
+    sumar = dict(transferido=tabla.c.transferido + transferido,
+                 gastado=tabla.c.gastado + gastado, updated_at=ahora)
+
+    dialecto = connection.dialect.name
+    if dialecto in ('postgresql', 'sqlite'):
+        if dialecto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(tabla).values(**valores).on_conflict_do_update(
+            index_elements=[tabla.c.obra_id], set_=sumar))
+        return
+    actualizadas = connection.execute(
+        tabla.update().where(tabla.c.obra_id == obra_id).values(**sumar)).rowcount
+    if not actualizadas:
+        connection.execute(tabla.insert().values(**valores))
+
+
+_CAMPOS_SALDO = ('obra_id', 'organizacion_id', 'estado', 'tipo', 'monto')
+
+
+def _fila_anterior(connection, target):
+    """Valores guardados del movimiento antes del UPDATE en curso.
+
+    Se leen de la base y no del historial del atributo: con el objeto expirado
+    por un commit anterior el historial no trae el valor viejo."""
+    from models.templates import MovimientoCaja
+
+    tabla = MovimientoCaja.__table__
+    fila = connection.execute(
+        select(*(tabla.c[c] for c in _CAMPOS_SALDO)).where(tabla.c.id == target.id)
+    ).first()
+    return dict(fila._mapping) if fila is not None else None
+
+
+_hooks_saldos_registrados = False
+
+
+def registrar_hooks_saldos_caja():
+    """Mantiene caja_saldos_obra al insertar, modificar o borrar MovimientoCaja
+    (idempotente). Escribe con la conexión del flush: el saldo se commitea o
+    revierte junto con el movimiento."""
+    global _hooks_saldos_registrados
+    if _hooks_saldos_registrados:
+        return
+    from sqlalchemy import event
+    from models.templates import MovimientoCaja
+
+    def _aplicar(connection, obra_id, org_id, transferido, gastado):
+        if obra_id and org_id and (transferido or gastado):
+            _upsert_saldo(connection, obra_id, org_id, transferido, gastado)
+
+    @event.listens_for(MovimientoCaja, 'after_insert')
+    def _movimiento_creado(mapper, connection, target):
+        _aplicar(connection, target.obra_id, target.organizacion_id,
+                 *_aporte(target.estado, target.tipo, target.monto))
+
+    @event.listens_for(MovimientoCaja, 'before_update')
+    def _antes_de_modificar(mapper, connection, target):
+        estado = inspect(target)
+        if any(estado.attrs[a].history.has_changes() for a in _CAMPOS_SALDO):
+            estado.info['_caja_saldo_antes'] = _fila_anterior(connection, target)
+
+    @event.listens_for(MovimientoCaja, 'after_update')
+    def _movimiento_modificado(mapper, connection, target):
+        antes = inspect(target).info.pop('_caja_saldo_antes', None)
+        if antes is None:
+            return
+        transferido_antes, gastado_antes = _aporte(antes['estado'], antes['tipo'], antes['monto'])
+        transferido, gastado = _aporte(target.estado, target.tipo, target.monto)
+        if antes['obra_id'] == target.obra_id:
+            _aplicar(connection, target.obra_id, target.organizacion_id,
+                     transferido - transferido_antes, gastado - gastado_antes)
+        else:
+            _aplicar(connection, antes['obra_id'], antes['organizacion_id'],
+                     -transferido_antes, -gastado_antes)
+            _aplicar(connection, target.obra_id, target.organizacion_id, transferido, gastado)
+
+    @event.listens_for(MovimientoCaja, 'before_delete')
+    def _antes_de_borrar(mapper, connection, target):
+        inspect(target).info['_caja_saldo_antes'] = _fila_anterior(connection, target)
+
+    @event.listens_for(MovimientoCaja, 'after_delete')
+    def _movimiento_borrado(mapper, connection, target):
+        antes = inspect(target).info.pop('_caja_saldo_antes', None)
+        if antes is None:
+            return
+        transferido, gastado = _aporte(antes['estado'], antes['tipo'], antes['monto'])
+        _aplicar(connection, antes['obra_id'], antes['organizacion_id'], -transferido, -gastado)
+
+    _hooks_saldos_registrados = True
+
+
+def reconciliar_saldos(org_id=None, fix=False):
+    """Compara caja_saldos_obra con lo que da el historial de movimientos y
+    devuelve las obras que no coinciden; con `fix` las reescribe."""
+    from models.templates import SaldoCajaObra
+
+    reales = _saldos_agrupados(org_id=org_id)
+    guardados_q = SaldoCajaObra.query
+    if org_id:
+        guardados_q = guardados_q.filter(SaldoCajaObra.organizacion_id == org_id)
+    guardados = {s.obra_id: s for s in guardados_q.all()}
+
+    diferencias = []
+    for obra_id in sorted(set(reales) | set(guardados)):
+        org, transferido, gastado = reales.get(obra_id, (None, Decimal('0'), Decimal('0')))
+        guardado = guardados.get(obra_id)
+        transferido_guardado = Decimal(guardado.transferido or 0) if guardado else Decimal('0')
+        gastado_guardado = Decimal(guardado.gastado or 0) if guardado else Decimal('0')
+        if (transferido_guardado, gastado_guardado) == (transferido, gastado):
+            continue
+        diferencias.append({
+            'obra_id': obra_id,
+            'organizacion_id': org or guardado.organizacion_id,
+            'transferido': transferido_guardado,
+            'transferido_real': transferido,
+            'gastado': gastado_guardado,
+            'gastado_real': gastado,
+        })
+
+    if fix and diferencias:
+        for d in diferencias:
+            guardado = guardados.get(d['obra_id'])
+            if guardado is None:
+                guardado = SaldoCajaObra(obra_id=d['obra_id'], organizacion_id=d['organizacion_id'])
+                db.session.add(guardado)
+            guardado.transferido = d['transferido_real']
+            guardado.gastado = d['gastado_real']
+        db.session.commit()
+
+    return diferencias
@@ -8,17 +8,30 @@ precios, coeficientes ni reglas nuevas (output constrained via tool schema).
 
 Degradacion elegante: si no hay ANTHROPIC_API_KEY o el paquete anthropic no
 esta, cae a un clasificador por keywords (base_tecnica) y marca fuente='keyword'.
+
+Los lotes de un pliego grande se mandan en paralelo (LLM_CLASIF_CONCURRENCIA) y,
+opcionalmente, las clasificaciones del LLM se reusan entre presupuestos de la
+misma org (CLASIF_CACHE_ORG). scripts/bench_clasificador_llm.py mide el
+throughput reemplazando `_llamar_api` por un stub local.
 """
+import hashlib
 import json
 import logging
 import os
 import re
+import threading
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
 MODELO = 'claude-haiku-4-5-20251001'
 _BATCH = 40  # items por request
+# Lotes en vuelo a la vez. Acotado por el rate limit de la API (requests y
+# tokens por minuto); un 429 suelto lo reintenta el cliente de anthropic con
+# backoff (max_retries=2 por defecto).
+_CONCURRENCIA = int(os.getenv('LLM_CLASIF_CONCURRENCIA', '4'))
 
 
 # ---------------------------------------------------------------------------
@@ -176,9 +189,7 @@ def _llamar_api(system, user):
         tool_choice={'type': 'tool', 'name': 'clasificar_items'},
         messages=[{'role': 'user', 'content': user}],
     )
-    # Acumula el uso REAL de tokens en el request actual (para el cap de gasto por
-    # usuario/dia; el endpoint lo lee y lo registra). Fuera de un request (scripts,
-    # tests) no hace nada. Ver services/llm_budget.py.
+    # Uso REAL de tokens, para el cap de gasto por usuario/dia (ver _acumular_uso).
     usage = getattr(resp, 'usage', None)
     _crea = (getattr(usage, 'cache_creation_input_tokens', 0) or 0) if usage else 0
     _lee = (getattr(usage, 'cache_read_input_tokens', 0) or 0) if usage else 0
@@ -193,33 +204,91 @@ def _llamar_api(system, user):
                 _crea, _lee,
                 (getattr(usage, 'output_tokens', 0) or 0) if usage else 0)
 
+    if usage is not None:
+        _acumular_uso(getattr(usage, 'input_tokens', 0) or 0,
+                      getattr(usage, 'output_tokens', 0) or 0, _crea, _lee)
+    for block in resp.content:
+        if getattr(block, 'type', None) == 'tool_use' and block.name == 'clasificar_items':
+            return block.input.get('clasificaciones', [])
+    return []
+
+
+# Uso de tokens de las llamadas hechas desde un hilo del pool: ahi no hay
+# request context (ni `g`), asi que se junta aca y el hilo del request lo suma.
+_uso_hilo = threading.local()
+
+
+def _acumular_uso(entrada, salida, cache_creacion, cache_lectura):
+    """Acumula el uso REAL de tokens en el request actual (para el cap de gasto
+    por usuario/dia; el endpoint lo lee y lo registra). Fuera de un request
+    (scripts, tests) no hace nada. Ver services/llm_budget.py."""
+    pendiente = getattr(_uso_hilo, 'pendiente', None)
+    if pendiente is not None:
+        pendiente.append((entrada, salida, cache_creacion, cache_lectura))
+        return
     try:
         from flask import g, has_request_context
-        if has_request_context() and usage is not None:
+        if has_request_context():
             # Con prompt caching, input_tokens NO incluye lo cacheado (va en
             # cache_creation/cache_read). Los sumamos para que el cap diario no
             # subcuente (conservador: los cache_read cuestan solo 10%, pero
             # contarlos a full mantiene el cap del lado seguro).
-            _inp = (getattr(usage, 'input_tokens', 0) or 0) + _crea + _lee
+            _inp = entrada + cache_creacion + cache_lectura
             g._llm_input_tokens = getattr(g, '_llm_input_tokens', 0) + _inp
-            g._llm_output_tokens = getattr(g, '_llm_output_tokens', 0) + (getattr(usage, 'output_tokens', 0) or 0)
+            g._llm_output_tokens = getattr(g, '_llm_output_tokens', 0) + salida
             # Contadores aparte, SOLO para observabilidad del cache (no tocan el cap).
-            g._llm_cache_creacion = getattr(g, '_llm_cache_creacion', 0) + _crea
-            g._llm_cache_lectura = getattr(g, '_llm_cache_lectura', 0) + _lee
+            g._llm_cache_creacion = getattr(g, '_llm_cache_creacion', 0) + cache_creacion
+            g._llm_cache_lectura = getattr(g, '_llm_cache_lectura', 0) + cache_lectura
     except Exception:
         pass
-    for block in resp.content:
-        if getattr(block, 'type', None) == 'tool_use' and block.name == 'clasificar_items':
-            return block.input.get('clasificaciones', [])
-    return []
+
+
+def _llamar_api_en_hilo(system, user):
+    """_llamar_api desde un hilo del pool: devuelve (crudas, uso) para que el
+    uso se sume en el hilo del request."""
+    _uso_hilo.pendiente = []
+    try:
+        return _llamar_api(system, user), _uso_hilo.pendiente
+    finally:
+        _uso_hilo.pendiente = None
+
+
+def _llamar_lotes(system, users):
+    """Manda los lotes y devuelve las respuestas crudas en el mismo orden.
+
+    El primero va solo: escribe el cache del prefijo (system + tools) y el resto,
+    que sale en paralelo de a `_CONCURRENCIA`, ya lo lee al 10%. Mandarlos todos
+    juntos haria que cada uno pague la escritura del cache.
+
+    No cambia cuanto se gasta, solo cuanto se espera: el endpoint ya chequeo el
+    cap diario (llm_budget) contra el pliego entero antes de llamar. Si un lote
+    falla la excepcion sube igual que antes (y clasificar_items cae a keyword).
+    """
+    if not users:
+        return []
+    respuestas = [_llamar_api(system, users[0])]
+    resto = users[1:]
+    if not resto:
+        return respuestas
+    if _CONCURRENCIA <= 1:
+        return respuestas + [_llamar_api(system, u) for u in resto]
+    with ThreadPoolExecutor(max_workers=min(_CONCURRENCIA, len(resto))) as pool:
+        resultados = list(pool.map(lambda u: _llamar_api_en_hilo(system, u), resto))
+    for crudas, uso in resultados:
+        for u in uso:
+            _acumular_uso(*u)
+        respuestas.append(crudas)
+    return respuestas
 
 
 def _clasificar_llm(items, catalogo):
     ids_validos = {c['id'] for c in catalogo}
     resultado = [None] * len(items)
-    for base in range(0, len(items), _BATCH):
+    bases = list(range(0, len(items), _BATCH))
+    system = _system_prompt(catalogo)
+    respuestas = _llamar_lotes(system, [_user_prompt(items[b:b + _BATCH]) for b in bases])
+    for base, crudas in zip(bases, respuestas):
         lote = items[base:base + _BATCH]
-        crudas = _llamar_api(_system_prompt(catalogo), _user_prompt(lote))
         for c in crudas:
             idx = c.get('indice')
             if not isinstance(idx, int) or not (0 <= idx < len(lote)):
@@ -244,40 +313,129 @@ def _norm(s):
     return ''.join(ch for ch in s if not unicodedata.combining(ch))
 
 
+# Pesos por nivel de keyword. El 0 marca las excluyentes (descartan la regla).
+_PESOS_KEYWORD = (('palabras_clave_fuertes', 3), ('palabras_clave_medias', 2),
+                  ('palabras_clave_debiles', 1), ('palabras_excluyentes', 0))
+
+
+class _MatcherReglas:
+    """Keywords de REGLAS_TECNICAS compiladas en un automata Aho-Corasick.
+
+    Antes cada item recorria las ~80 reglas y normalizaba cada keyword de nuevo
+    (un pliego de 500 lineas re-normalizaba decenas de miles de strings). Ahora
+    las keywords se normalizan una vez y el texto del item se recorre UNA vez:
+    cada keyword encontrada suma su peso a las reglas que la listan.
+
+    La semantica es la misma que el `_norm(kw) in t` de siempre: match por
+    substring, y una keyword repetida en la regla (p.ej. 'excavacion' y
+    'excavación', que normalizan igual) suma dos veces.
+    """
+
+    def __init__(self, reglas):
+        self.reglas = list(reglas)
+        self.unidades = [frozenset(_norm(u) for u in r.get('unidades_validas', []))
+                         for r in self.reglas]
+        self.por_unidad = {}
+        for idx, unidades in enumerate(self.unidades):
+            for u in unidades:
+                self.por_unidad.setdefault(u, []).append(idx)
+
+        patrones = {}     # keyword normalizada -> id de patron
+        self.postings = []  # id de patron -> [(indice de regla, peso)]
+        for idx, r in enumerate(self.reglas):
+            for campo, peso in _PESOS_KEYWORD:
+                for kw in r.get(campo, []):
+                    pid = patrones.setdefault(_norm(kw), len(patrones))
+                    if pid == len(self.postings):
+                        self.postings.append([])
+                    self.postings[pid].append((idx, peso))
+
+        # Trie + links de falla. Una keyword vacia matchea cualquier texto
+        # ('' in t), asi que queda en la salida de la raiz.
+        self._goto = [{}]
+        self._salida = [[]]
+        for kw, pid in patrones.items():
+            nodo = 0
+            for ch in kw:
+                sig = self._goto[nodo].get(ch)
+                if sig is None:
+                    sig = len(self._goto)
+                    self._goto[nodo][ch] = sig
+                    self._goto.append({})
+                    self._salida.append([])
+                nodo = sig
+            self._salida[nodo].append(pid)
+        self._falla = [0] * len(self._goto)
+        cola = list(self._goto[0].values())
+        for nodo in cola:
+            for ch, sig in self._goto[nodo].items():
+                f = self._falla[nodo]
+                while f and ch not in self._goto[f]:
+                    f = self._falla[f]
+                self._falla[sig] = self._goto[f].get(ch, 0)
+                self._salida[sig] = self._salida[sig] + self._salida[self._falla[sig]]
+                cola.append(sig)
+
+    def patrones_en(self, t):
+        """Ids de las keywords que aparecen en `t` (ya normalizado)."""
+        encontrados = set(self._salida[0])
+        nodo = 0
+        for ch in t:
+            while nodo and ch not in self._goto[nodo]:
+                nodo = self._falla[nodo]
+            nodo = self._goto[nodo].get(ch, 0)
+            encontrados.update(self._salida[nodo])
+        return encontrados
+
+    def puntuar(self, t):
+        """(puntajes, excluidas): puntaje keyword > 0 por indice de regla y el
+        conjunto de reglas descartadas por una excluyente."""
+        puntajes, excluidas = {}, set()
+        for pid in self.patrones_en(t):
+            for idx, peso in self.postings[pid]:
+                if peso:
+                    puntajes[idx] = puntajes.get(idx, 0) + peso
+                else:
+                    excluidas.add(idx)
+        for idx in excluidas:
+            puntajes.pop(idx, None)
+        return puntajes, excluidas
+
+
+@lru_cache(maxsize=1)
+def _matcher_reglas():
+    from services.base_tecnica_computos import REGLAS_TECNICAS
+    return _MatcherReglas(REGLAS_TECNICAS)
+
+
+@lru_cache(maxsize=4096)
+def _puntajes_keyword(t):
+    """Puntajes keyword de un texto normalizado, memoizados: procesar_items
+    clasifica por keyword y despues pide candidatos de la MISMA descripcion, y
+    un pliego repite mucho texto. Devuelve ((idx, score), ...) en el orden de
+    REGLAS_TECNICAS (el de los desempates) y las reglas excluidas."""
+    puntajes, excluidas = _matcher_reglas().puntuar(t)
+    return tuple(sorted(puntajes.items())), frozenset(excluidas)
+
+
 def candidatos_para(descripcion, unidad=None, n=3):
     """Top-N reglas candidatas por keyword (para la pantalla de revision).
     Devuelve datos HUMANOS (trabajo/rubro), sin ids tecnicos en primer plano."""
-    from services.base_tecnica_computos import REGLAS_TECNICAS
     try:
         from services.coeficientes_loader import tiene_coeficientes
     except Exception:
         tiene_coeficientes = lambda _r: False
-    t = _norm(descripcion)
-    scored = []
-    for r in REGLAS_TECNICAS:
-        if any(_norm(x) in t for x in r.get('palabras_excluyentes', [])):
-            continue
-        score = 0
-        for kw in r.get('palabras_clave_fuertes', []):
-            if _norm(kw) in t:
-                score += 3
-        for kw in r.get('palabras_clave_medias', []):
-            if _norm(kw) in t:
-                score += 2
-        for kw in r.get('palabras_clave_debiles', []):
-            if _norm(kw) in t:
-                score += 1
-        if score > 0:
-            scored.append((score, r))
-    scored.sort(key=lambda x: -x[0])
+    reglas = _matcher_reglas().reglas
+    puntajes, _excluidas = _puntajes_keyword(_norm(descripcion))
+    scored = sorted(puntajes, key=lambda x: (-x[1], x[0]))
     return [{
-        'regla_id': r['id'],
-        'trabajo': r.get('tarea') or r.get('id'),
-        'rubro': r.get('rubro', ''),
-        'unidad': r.get('unidad_esperada', ''),
-        'tiene_precio': bool(tiene_coeficientes(r['id'])),
+        'regla_id': reglas[idx]['id'],
+        'trabajo': reglas[idx].get('tarea') or reglas[idx].get('id'),
+        'rubro': reglas[idx].get('rubro', ''),
+        'unidad': reglas[idx].get('unidad_esperada', ''),
+        'tiene_precio': bool(tiene_coeficientes(reglas[idx]['id'])),
         'score_raw': sc,   # score keyword crudo (para la regla de auto-aplicacion)
-    } for sc, r in scored[:n]]
+    } for idx, sc in scored[:n]]
 
 
 def rescatar_candidato(descripcion, unidad):
@@ -286,7 +444,6 @@ def rescatar_candidato(descripcion, unidad):
     auto-aplicarlo (en vez de mandar el item a rojo sin razon). (regla_id, conf) o
     (None, 0.0). Conservador: exige unidad compatible + al menos un match fuerte +
     ventaja >=2 sobre el segundo + que la regla tenga coeficientes (se pueda pricear)."""
-    from services.base_tecnica_computos import REGLAS_TECNICAS
     try:
         from services.coeficientes_loader import tiene_coeficientes
     except Exception:
@@ -295,60 +452,38 @@ def rescatar_candidato(descripcion, unidad):
     if not t:
         return None, 0.0
     u = _norm(unidad)
-    scored = []
-    for r in REGLAS_TECNICAS:
-        if any(_norm(x) in t for x in r.get('palabras_excluyentes', [])):
-            continue
-        score = 0
-        for kw in r.get('palabras_clave_fuertes', []):
-            if _norm(kw) in t:
-                score += 3
-        for kw in r.get('palabras_clave_medias', []):
-            if _norm(kw) in t:
-                score += 2
-        for kw in r.get('palabras_clave_debiles', []):
-            if _norm(kw) in t:
-                score += 1
-        if score > 0:
-            unit_ok = bool(u) and u in [_norm(x) for x in r.get('unidades_validas', [])]
-            scored.append((score, unit_ok, r))
-    if not scored:
+    matcher = _matcher_reglas()
+    puntajes, _excluidas = _puntajes_keyword(t)
+    if not puntajes:
         return None, 0.0
-    scored.sort(key=lambda x: (-x[0], not x[1]))  # score desc; en empate, la de unidad ok
-    s1, u1, r1 = scored[0]
+    # score desc; en empate, la de unidad ok; despues el orden de las reglas
+    scored = sorted(((sc, bool(u) and u in matcher.unidades[idx], idx) for idx, sc in puntajes),
+                    key=lambda x: (-x[0], not x[1], x[2]))
+    s1, u1, idx1 = scored[0]
     s2 = scored[1][0] if len(scored) > 1 else 0
-    if u1 and s1 >= 3 and (s1 - s2) >= 2 and tiene_coeficientes(r1['id']):
-        return r1['id'], min(0.8, 0.55 + 0.05 * s1)
+    rid = matcher.reglas[idx1]['id']
+    if u1 and s1 >= 3 and (s1 - s2) >= 2 and tiene_coeficientes(rid):
+        return rid, min(0.8, 0.55 + 0.05 * s1)
     return None, 0.0
 
 
 def _clasificar_keyword_item(desc, unidad):
     """Scoring simple contra REGLAS_TECNICAS: fuerte=3, media=2, debil=1;
     excluyentes descartan la regla. Devuelve (regla_id|None, confianza)."""
-    from services.base_tecnica_computos import REGLAS_TECNICAS
-    t = _norm(desc)
-    mejor, mejor_score = None, 0
-    for r in REGLAS_TECNICAS:
-        if any(_norm(x) in t for x in r.get('palabras_excluyentes', [])):
-            continue
-        score = 0
-        for kw in r.get('palabras_clave_fuertes', []):
-            if _norm(kw) in t:
-                score += 3
-        for kw in r.get('palabras_clave_medias', []):
-            if _norm(kw) in t:
-                score += 2
-        for kw in r.get('palabras_clave_debiles', []):
-            if _norm(kw) in t:
-                score += 1
-        if unidad and _norm(unidad) in [_norm(u) for u in r.get('unidades_validas', [])]:
-            score += 1
-        if score > mejor_score:
-            mejor_score, mejor = score, r.get('id')
-    if mejor_score <= 0:
+    matcher = _matcher_reglas()
+    puntajes, excluidas = _puntajes_keyword(_norm(desc))
+    puntajes = dict(puntajes)
+    if unidad:
+        # +1 por unidad valida, tambien para reglas sin ninguna keyword
+        for idx in matcher.por_unidad.get(_norm(unidad), ()):
+            if idx not in excluidas:
+                puntajes[idx] = puntajes.get(idx, 0) + 1
+    if not puntajes:
         return None, 0.0
+    # Mayor score; en empate gana la primera regla (como el `>` del loop original)
+    idx, mejor_score = min(puntajes.items(), key=lambda x: (-x[1], x[0]))
     conf = min(0.6, 0.2 + 0.1 * mejor_score)  # keyword nunca da alta confianza
-    return mejor, conf
+    return matcher.reglas[idx].get('id'), conf
 
 
 # ---------------------------------------------------------------------------
@@ -404,7 +539,7 @@ def _memo_leer(scope, claves):
     return out
 
 
-def _memo_guardar(scope, por_clave):
+def _memo_guardar(scope, por_clave, ttl=_MEMO_TTL):
     if not scope or not por_clave:
         return
     r = _memo_cliente()
@@ -412,7 +547,7 @@ def _memo_guardar(scope, por_clave):
         return
     try:
         r.hset(scope, mapping={k: json.dumps(v) for k, v in por_clave.items()})
-        r.expire(scope, _MEMO_TTL)
+        r.expire(scope, ttl)
     except Exception as e:
         logger.warning('memo de clasificacion no disponible (escritura): %s', e)
 
@@ -430,6 +565,53 @@ def memo_borrar(scope):
         logger.warning('no se pudo limpiar el memo de clasificacion: %s', e)
 
 
+# ---------------------------------------------------------------------------
+# Cache de clasificacion por organizacion (opcional)
+# ---------------------------------------------------------------------------
+# El memo por presupuesto no sirve entre pliegos: "Mamposteria de ladrillo hueco
+# 18cm" se vuelve a preguntar en cada presupuesto nuevo de la empresa. Con
+# CLASIF_CACHE_ORG=1 lo que clasifico el LLM queda por org y por VERSION del
+# catalogo: la clave incluye un hash del modelo + system prompt + tool, asi que
+# agregar o editar una regla arranca un cache nuevo en vez de servir ids viejos.
+#
+# Apagado por defecto por lo mismo que el memo es por presupuesto: una
+# clasificacion mala queda pegada mas tiempo. `?recalcular=1` olvida las claves
+# del pliego (cache_org_olvidar) y una correccion del usuario (aprendizaje) le
+# gana siempre, porque se resuelve antes de clasificar.
+_CACHE_ORG_TTL = int(os.getenv('CLASIF_CACHE_ORG_TTL', str(30 * 24 * 3600)))
+
+
+def _cache_org_activo():
+    return os.environ.get('CLASIF_CACHE_ORG', '0') == '1'
+
+
+def version_catalogo(catalogo):
+    """Hash corto de todo lo que determina la respuesta del LLM."""
+    base = '\n'.join([MODELO, _system_prompt(catalogo), json.dumps(_TOOL, sort_keys=True)])
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()[:12]
+
+
+def cache_org_scope(organizacion_id, catalogo):
+    if not organizacion_id or not _cache_org_activo():
+        return None
+    return 'clasif:org:%s:%s' % (organizacion_id, version_catalogo(catalogo))
+
+
+def cache_org_olvidar(organizacion_id, items):
+    """La usa `?recalcular=1`: saca del cache de la org las filas del pliego
+    para que el recalculo vuelva a preguntarlas."""
+    scope = cache_org_scope(organizacion_id, catalogo_reglas())
+    if not scope or not items:
+        return
+    r = _memo_cliente()
+    if r is None:
+        return
+    try:
+        r.hdel(scope, *{clave_item(it.get('descripcion'), it.get('unidad')) for it in items})
+    except Exception as e:
+        logger.warning('no se pudo limpiar el cache de clasificacion de la org: %s', e)
+
+
 # ---------------------------------------------------------------------------
 # API publica
 # ---------------------------------------------------------------------------
@@ -441,7 +623,8 @@ def clave_item(descripcion, unidad):
                       (unidad or '').strip().lower())
 
 
-def clasificar_items(items, forzar_keyword: bool = False, memo_scope: str = None):
+def clasificar_items(items, forzar_keyword: bool = False, memo_scope: str = None,
+                     organizacion_id=None):
     """Clasifica una lista de items {descripcion, unidad, ...}.
 
     Devuelve lista alineada: {descripcion, unidad, regla_id, confianza, fuente,
@@ -458,6 +641,9 @@ def clasificar_items(items, forzar_keyword: bool = False, memo_scope: str = None
     manda el pliego en lotes de 40, asi que dos filas identicas pueden caer en
     requests distintos y ahi el dedup por-llamada no alcanza. Es un hash de
     Redis con TTL; si Redis no esta, se degrada a dedup por-llamada nomas.
+
+    `organizacion_id` (opcional) suma el cache por org y version de catalogo
+    (solo si CLASIF_CACHE_ORG=1, ver cache_org_scope).
     """
     catalogo = catalogo_reglas()
     coef_por_id = {c['id']: c['tiene_coef'] for c in catalogo}
@@ -469,6 +655,13 @@ def clasificar_items(items, forzar_keyword: bool = False, memo_scope: str = None
         unicos.setdefault(k, i)
 
     memo = _memo_leer(memo_scope, list(unicos)) if memo_scope else {}
+    org_scope = cache_org_scope(organizacion_id, catalogo) if not forzar_keyword else None
+    if org_scope:
+        desde_org = _memo_leer(org_scope, [k for k in unicos if k not in memo])
+        # Al memo del presupuesto tambien: el resto del pliego queda consistente
+        # aunque el cache de la org venza o cambie en el medio.
+        _memo_guardar(memo_scope, desde_org)
+        memo.update(desde_org)
     pendientes = [k for k in unicos if k not in memo]
     items_pend = [items[unicos[k]] for k in pendientes]
 
@@ -511,8 +704,9 @@ def clasificar_items(items, forzar_keyword: bool = False, memo_scope: str = None
         nuevos[k] = cl
     # Solo se memoiza lo que salio del LLM. El keyword es el modo degradado: no
     # queremos congelar una clasificacion peor que la que daria el proximo intento.
-    if memo_scope and nuevos and fuente == 'llm':
+    if nuevos and fuente == 'llm':
         _memo_guardar(memo_scope, nuevos)
+        _memo_guardar(org_scope, nuevos, ttl=_CACHE_ORG_TTL)
 
     salida = []
     for it, k in zip(items, claves):
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""Geocodificación masiva de obras (corre en Celery, ver tasks/geocoding.py).
+
+Antes /obras/geocodificar-todas llamaba a resolve() obra por obra dentro del
+request, para todas las orgs, y cada resolve() podía probar varias variantes de
+la dirección contra Google/Nominatim en serie. Acá:
+
+  - Se trabaja de a una org y de a lotes de GEOCODE_LOTE obras, commiteando cada
+    lote: si el worker se cae, la próxima corrida sigue por las que faltan.
+  - Obras con la misma dirección normalizada se geocodifican una sola vez, y
+    antes de ir a la red se busca en GeocodeCache (mismo key que resolve()).
+  - Las direcciones que faltan salen en paralelo, pero cada request HTTP espera
+    cupo en el limitador del proveedor (GEOCODE_QPS_GOOGLE, GEOCODE_QPS_NOMINATIM).
+    Con Redis el cupo es uno solo entre todos los workers.
+  - Una obra que no se pudo geocodificar queda en geocode_status='fail' y no se
+    reintenta hasta pasadas GEOCODE_REINTENTO_HORAS.
+  - MAPS_PROVIDER=stub usa un geocodificador local determinístico (tests, dev
+    sin red).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import GeocodeCache, Obra
+from services.geocoding_service import (DEFAULT_PROVIDER, _normalize_query, _should_refresh,
+                                        _store_in_cache, limite_proveedor, search)
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_LOTE = int(os.getenv('GEOCODE_LOTE', '50'))
+GEOCODE_MAX_WORKERS = int(os.getenv('GEOCODE_MAX_WORKERS', '4'))
+GEOCODE_REINTENTO_HORAS = int(os.getenv('GEOCODE_REINTENTO_HORAS', '24'))
+# Requests por segundo por proveedor. Nominatim pide 1/s como máximo.
+CUOTAS_PROVEEDOR = {
+    'google': float(os.getenv('GEOCODE_QPS_GOOGLE', '10')),
+    'nominatim': float(os.getenv('GEOCODE_QPS_NOMINATIM', '1')),
+}
+# Un lote por org a la vez; uno sin terminar pasado esto se da por perdido.
+GEOCODE_LOTE_TTL = int(os.getenv('GEOCODE_LOTE_TTL', '3600'))
+
+
+def _redis():
+    try:
+        from config.cache_config import get_cache
+        return get_cache().get_client()
+    except Exception:
+        return None
+
+
+class LimitadorProveedor:
+    """Cupo de requests por segundo por proveedor.
+
+    Con Redis es una ventana fija de 1s compartida por todos los procesos; sin
+    Redis (o si falla) espacia los requests dentro del proceso.
+    """
+
+    def __init__(self, cuotas):
+        self.cuotas = cuotas
+        self._lock = threading.Lock()
+        self._proximo = {}
+
+    def __call__(self, provider):
+        qps = self.cuotas.get(provider)
+        if not qps:
+            return
+        r = _redis()
+        if r is not None:
+            try:
+                self._esperar_redis(r, provider, qps)
+                return
+            except Exception:
+                pass
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._proximo.get(provider, 0.0))
+            self._proximo[provider] = turno + 1.0 / qps
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+    @staticmethod
+    def _esperar_redis(r, provider, qps):
+        cupo = max(1, int(qps))
+        while True:
+            ahora = time.time()
+            clave = f'geocode:cupo:{provider}:{int(ahora)}'
+            pipe = r.pipeline()
+            pipe.incr(clave)
+            pipe.expire(clave, 2)
+            usados, _ = pipe.execute()
+            if usados <= cupo:
+                return
+            time.sleep(int(ahora) + 1 - ahora)
+
+
+limitador = LimitadorProveedor(CUOTAS_PROVEEDOR)
+
+
+def geocodificar_stub(direccion):
+    """Geocodificador local: coordenadas fijas por dirección dentro del AMBA."""
+    normalizada = _normalize_query(direccion)
+    h = int(hashlib.sha1(normalizada.encode('utf-8')).hexdigest()[:8], 16)
+    return {
+        'display_name': direccion.strip(),
+        'lat': round(-34.9 + (h % 6000) / 10000.0, 6),
+        'lng': round(-58.8 + (h // 6000 % 6000) / 10000.0, 6),
+        'provider': 'stub',
+        'place_id': f'stub-{h:08x}',
+        'normalized': normalizada,
+        'status': 'ok',
+    }
+
+
+def _provider_key(provider=None):
+    return (provider or current_app.config.get('MAPS_PROVIDER') or DEFAULT_PROVIDER).lower()
+
+
+def _geocodificador_para(provider_key):
+    if provider_key == 'stub':
+        return geocodificar_stub
+
+    def _buscar(direccion):
+        resultados = search(direccion, provider=provider_key, limit=1)
+        return resultados[0] if resultados else None
+
+    return _buscar
+
+
+def _workers_para(provider_key, pendientes):
+    # Más threads que requests por segundo no aceleran nada: solo esperan cupo
+    cuota = CUOTAS_PROVEEDOR.get('nominatim' if provider_key == 'osm' else provider_key)
+    workers = GEOCODE_MAX_WORKERS if not cuota else min(GEOCODE_MAX_WORKERS, max(1, int(cuota)))
+    return max(1, min(workers, pendientes))
+
+
+def consulta_obras_pendientes(organizacion_id):
+    """Obras de la org sin coordenadas, salvo las que fallaron hace poco."""
+    reintento = datetime.utcnow() - timedelta(hours=GEOCODE_REINTENTO_HORAS)
+    return Obra.query.filter(
+        Obra.organizacion_id == organizacion_id,
+        Obra.deleted_at.is_(None),
+        Obra.direccion.isnot(None),
+        Obra.direccion != '',
+        db.or_(Obra.latitud.is_(None), Obra.longitud.is_(None)),
+        db.or_(
+            Obra.geocode_status.is_(None),
+            Obra.geocode_status != 'fail',
+            Obra.geocode_actualizado.is_(None),
+            Obra.geocode_actualizado < reintento,
+        ),
+    )
+
+
+def _buscar_en_cache(provider_key, normalizadas):
+    if not normalizadas:
+        return {}
+    entradas = GeocodeCache.query.filter(
+        GeocodeCache.provider == provider_key,
+        GeocodeCache.normalized_text.in_(list(normalizadas)),
+    ).all()
+    return {
+        e.normalized_text: e.to_payload()
+        for e in entradas
+        if (e.status or 'ok') == 'ok' and e.latitud is not None and not _should_refresh(e)
+    }
+
+
+def _geocodificar_una(geocodificar, direccion):
+    token = limite_proveedor.set(limitador)
+    try:
+        return geocodificar(direccion)
+    except Exception as exc:
+        logger.warning(f'[GEOCODE] fallo geocodificando "{direccion}": {exc}')
+        return None
+    finally:
+        limite_proveedor.reset(token)
+
+
+def _geocodificar_en_hilo(app, geocodificar, direccion):
+    # Cada hilo abre su propio app context (search() usa current_app)
+    with app.app_context():
+        return _geocodificar_una(geocodificar, direccion)
+
+
+def _geocodificar_direcciones(provider_key, geocodificar, direcciones):
+    """normalizada -> dirección original  =>  normalizada -> resultado o None."""
+    workers = _workers_para(provider_key, len(direcciones))
+    if workers <= 1:
+        return {n: _geocodificar_una(geocodificar, d) for n, d in direcciones.items()}
+    app = current_app._get_current_object()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='geocode') as pool:
+        futuros = {n: pool.submit(_geocodificar_en_hilo, app, geocodificar, d)
+                   for n, d in direcciones.items()}
+        return {n: f.result() for n, f in futuros.items()}
+
+
+def _aplicar_resultado(obra, resultado, ahora):
+    obra.geocode_actualizado = ahora
+    if not resultado:
+        obra.geocode_status = 'fail'
+        return False
+    obra.latitud = resultado.get('lat')
+    obra.longitud = resultado.get('lng')
+    obra.direccion_normalizada = resultado.get('normalized')
+    obra.geocode_place_id = resultado.get('place_id')
+    obra.geocode_provider = resultado.get('provider')
+    obra.geocode_status = resultado.get('status') or 'ok'
+    return True
+
+
+def geocodificar_obras_pendientes(organizacion_id, *, provider=None, geocodificador=None,
+                                  progreso=None, tamano_lote=None):
+    """
+    Geocodifica las obras pendientes de una org, de a lotes.
+
+    Args:
+        organizacion_id: org a procesar (nunca mezcla orgs).
+        provider: proveedor a usar; por defecto MAPS_PROVIDER.
+        geocodificador: callable(direccion) -> dict | None; por defecto el del
+            proveedor (search() o el stub).
+        progreso: callable(dict) que se llama después de commitear cada lote.
+        tamano_lote: obras por lote (GEOCODE_LOTE).
+
+    Returns:
+        dict con exitosas, fallidas, direcciones únicas, cuántas salieron del
+        cache y cuántas fueron a la red.
+    """
+    provider_key = _provider_key(provider)
+    geocodificar = geocodificador or _geocodificador_para(provider_key)
+    tamano_lote = tamano_lote or GEOCODE_LOTE
+    resumen = {'exitosas': 0, 'fallidas': 0, 'direcciones': 0, 'desde_cache': 0, 'consultas': 0}
+    sin_resultado = set()
+    ultimo_id = 0
+
+    while True:
+        obras = (consulta_obras_pendientes(organizacion_id)
+                 .filter(Obra.id > ultimo_id)
+                 .order_by(Obra.id)
+                 .limit(tamano_lote)
+                 .all())
+        if not obras:
+            break
+        ultimo_id = obras[-1].id
+
+        por_direccion = defaultdict(list)
+        for obra in obras:
+            por_direccion[_normalize_query(obra.direccion)].append(obra)
+
+        resultados = _buscar_en_cache(provider_key, por_direccion.keys())
+        resumen['desde_cache'] += len(resultados)
+        faltantes = {n: obras_dir[0].direccion for n, obras_dir in por_direccion.items()
+                     if n not in resultados and n not in sin_resultado}
+        resumen['consultas'] += len(faltantes)
+
+        for normalizada, resultado in _geocodificar_direcciones(provider_key, geocodificar,
+                                                                 faltantes).items():
+            if resultado:
+                _store_in_cache(faltantes[normalizada], normalizada, provider_key, resultado)
+                resultados[normalizada] = resultado
+            else:
+                sin_resultado.add(normalizada)
+
+        ahora = datetime.utcnow()
+        for normalizada, obras_dir in por_direccion.items():
+            for obra in obras_dir:
+                if _aplicar_resultado(obra, resultados.get(normalizada), ahora):
+                    resumen['exitosas'] += 1
+                else:
+                    resumen['fallidas'] += 1
+        resumen['direcciones'] += len(por_direccion)
+
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception(f'[GEOCODE] org {organizacion_id}: no se pudo guardar el lote')
+            raise
+
+        if progreso is not None:
+            progreso(dict(resumen))
+
+    return resumen
+
+
+# ----------------------------------------------------------------- jobs ---
+
+def _clave_lote(organizacion_id):
+    return f'geocode:lote:{organizacion_id}'
+
+
+def _lote_en_curso(r, organizacion_id):
+    task_id = r.get(_clave_lote(organizacion_id))
+    if isinstance(task_id, bytes):
+        task_id = task_id.decode()
+    return task_id
+
+
+def encolar_geocodificacion(organizacion_id):
+    """Encola el lote de la org, salvo que ya haya uno sin terminar.
+
+    El id del último lote queda en Redis GEOCODE_LOTE_TTL segundos (para
+    consultar su estado); uno que no terminó en ese tiempo se da por perdido.
+
+    Returns:
+        (task_id, nuevo): el id del lote (el existente si ya había uno).
+    """
+    from celery import uuid as celery_uuid
+    from celery_app import celery
+    from tasks.geocoding import geocodificar_obras
+
+    task_id = celery_uuid()
+    r = _redis()
+    if r is not None:
+        try:
+            clave = _clave_lote(organizacion_id)
+            if not r.set(clave, task_id, nx=True, ex=GEOCODE_LOTE_TTL):
+                existente = _lote_en_curso(r, organizacion_id)
+                if existente and not celery.AsyncResult(existente).ready():
+                    return existente, False
+                r.set(clave, task_id, ex=GEOCODE_LOTE_TTL)
+        except Exception:
+            pass
+    geocodificar_obras.apply_async(args=[organizacion_id], task_id=task_id)
+    return task_id, True
+
+
+def estado_geocodificacion(organizacion_id):
+    """Estado del último lote de la org: estado de Celery + progreso, y cuántas
+    obras quedan pendientes."""
+    estado = {'pendientes': consulta_obras_pendientes(organizacion_id).count(),
+              'task_id': None, 'estado': None, 'progreso': None}
+    r = _redis()
+    if r is None:
+        return estado
+    try:
+        task_id = _lote_en_curso(r, organizacion_id)
+    except Exception:
+        return estado
+    if not task_id:
+        return estado
+    from celery_app import celery
+    resultado = celery.AsyncResult(task_id)
+    estado.update(task_id=task_id, estado=resultado.state,
+                  progreso=resultado.info if isinstance(resultado.info, dict) else None)
+    return estado
@@ -4,14 +4,19 @@ from __future__ import annotations
 
 import json
 import os
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import requests
 from flask import current_app
 
+from config.cache_config import cache_query, get_cache
 from extensions import db
 from models import GeocodeCache
 
@@ -21,6 +26,29 @@ DEFAULT_PROVIDER = "google" if GOOGLE_MAPS_API_KEY else "nominatim"
 DEFAULT_USER_AGENT = os.environ.get("MAPS_USER_AGENT", "OBYRA-IA/1.0 (+https://obyra.com)")
 DEFAULT_TIMEOUT = 10
 CACHE_TTL_SECONDS = int(os.environ.get("GEOCODE_CACHE_TTL", "86400"))  # 24h
+# Cache de search() (LRU del proceso + Redis): las respuestas vacías duran menos
+SEARCH_CACHE_TTL = int(os.environ.get("GEOCODE_SEARCH_TTL", "86400"))
+SEARCH_NEGATIVE_TTL = int(os.environ.get("GEOCODE_SEARCH_NEGATIVE_TTL", "600"))
+# Variantes de una búsqueda consultadas a la vez. Por defecto de a una: cada
+# request a Google se cobra y casi siempre gana la primera variante. Se puede
+# adelantar una más con GEOCODE_FANOUT=2 (tope SEARCH_FANOUT_MAX); Nominatim
+# siempre de a una.
+SEARCH_FANOUT = int(os.environ.get("GEOCODE_FANOUT", "1"))
+SEARCH_FANOUT_MAX = 2
+SEARCH_FANOUT_WORKERS = int(os.environ.get("GEOCODE_FANOUT_WORKERS", "8"))
+
+# Lo setea el geocodificador masivo (services/geocoding_batch) en sus threads
+# para que cada request HTTP respete la cuota del proveedor. En las búsquedas
+# interactivas queda en None y no se espera.
+limite_proveedor: ContextVar[Optional[Callable[[str], None]]] = ContextVar(
+    "geocode_limite_proveedor", default=None
+)
+
+
+def _esperar_cupo(provider: str) -> None:
+    esperar = limite_proveedor.get()
+    if esperar is not None:
+        esperar(provider)
 
 
 @dataclass
@@ -647,6 +675,7 @@ def _fetch_google_maps(query: str, *, limit: int = 5) -> List[GeocodeResult]:
     }
 
     try:
+        _esperar_cupo("google")
         response = requests.get(
             "https://maps.googleapis.com/maps/api/geocode/json",
             params=params,
@@ -657,15 +686,16 @@ def _fetch_google_maps(query: str, *, limit: int = 5) -> List[GeocodeResult]:
 
         if data.get("status") == "REQUEST_DENIED":
             current_app.logger.error(f"Google Maps API denegada: {data.get('error_message', 'Sin mensaje')}")
-            return []
+            raise requests.RequestException("Google Maps REQUEST_DENIED")
 
         if data.get("status") == "ZERO_RESULTS":
             current_app.logger.info(f"Google Maps no encontró resultados para: {query}")
             return []
 
         if data.get("status") != "OK":
+            # OVER_QUERY_LIMIT, UNKNOWN_ERROR...: no es "no existe", no cachear como vacío
             current_app.logger.warning(f"Google Maps status: {data.get('status')} - {data.get('error_message', '')}")
-            return []
+            raise requests.RequestException(f"Google Maps status {data.get('status')}")
 
         results: List[GeocodeResult] = []
         for item in data.get("results", [])[:limit]:
@@ -715,7 +745,7 @@ def _fetch_google_maps(query: str, *, limit: int = 5) -> List[GeocodeResult]:
 
     except requests.RequestException as exc:
         current_app.logger.error(f"Error al consultar Google Maps API: {exc}")
-        return []
+        raise
 
 
 def _fetch_nominatim(query: str, *, limit: int = 5) -> List[GeocodeResult]:
@@ -732,6 +762,7 @@ def _fetch_nominatim(query: str, *, limit: int = 5) -> List[GeocodeResult]:
         "Accept": "application/json",
     }
 
+    _esperar_cupo("nominatim")
     response = requests.get(
         "https://nominatim.openstreetmap.org/search",
         params=params,
@@ -772,12 +803,218 @@ def _fetch_nominatim(query: str, *, limit: int = 5) -> List[GeocodeResult]:
     return results
 
 
+# ------------------------------------------------------------ latencias ---
+
+_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+_REDIS_LATENCIAS = "geocode:latencia:"
+_latencias_locales: Dict[str, Dict[str, float]] = {}
+_latencias_lock = threading.Lock()
+
+
+def _redis():
+    try:
+        return get_cache().get_client()
+    except Exception:
+        return None
+
+
+def _registrar_latencia(provider: str, ms: float, error: bool = False) -> None:
+    """Suma la consulta al histograma del proveedor (Redis o, sin Redis, el proceso)."""
+    bucket = next((f"le_{b}" for b in _BUCKETS_MS if ms <= b), "le_inf")
+    valores = {bucket: 1, "count": 1, "sum_ms": ms, "errores": int(error)}
+    r = _redis()
+    if r is not None:
+        try:
+            pipe = r.pipeline()
+            for campo, v in valores.items():
+                if isinstance(v, float):
+                    pipe.hincrbyfloat(_REDIS_LATENCIAS + provider, campo, v)
+                else:
+                    pipe.hincrby(_REDIS_LATENCIAS + provider, campo, v)
+            pipe.execute()
+            return
+        except Exception:
+            pass
+    with _latencias_lock:
+        datos = _latencias_locales.setdefault(provider, {})
+        for campo, v in valores.items():
+            datos[campo] = datos.get(campo, 0) + v
+
+
+def geocode_metricas() -> Dict[str, Any]:
+    """Histograma de latencia por proveedor (ms, buckets no acumulados) y
+    contadores del cache de search()."""
+    from config.cache_config import _prefix_stats_snapshot
+
+    proveedores: Dict[str, Dict[str, float]] = {}
+    with _latencias_lock:
+        for provider, datos in _latencias_locales.items():
+            proveedores[provider] = dict(datos)
+    r = _redis()
+    if r is not None:
+        try:
+            for clave in r.scan_iter(match=_REDIS_LATENCIAS + "*", count=100):
+                clave = clave.decode() if isinstance(clave, bytes) else clave
+                crudos = r.hgetall(clave) or {}
+                proveedores[clave[len(_REDIS_LATENCIAS):]] = {
+                    (k.decode() if isinstance(k, bytes) else k): float(v) for k, v in crudos.items()
+                }
+        except Exception:
+            pass
+
+    salida = {}
+    for provider, datos in proveedores.items():
+        count = datos.get("count", 0)
+        salida[provider] = {
+            "count": int(count),
+            "errores": int(datos.get("errores", 0)),
+            "avg_ms": round(datos.get("sum_ms", 0.0) / count, 1) if count else 0.0,
+            "buckets": {f"le_{b}": int(datos.get(f"le_{b}", 0)) for b in _BUCKETS_MS}
+            | {"le_inf": int(datos.get("le_inf", 0))},
+        }
+    return {"proveedores": salida, "cache": _prefix_stats_snapshot().get("geocode_search")}
+
+
+# --------------------------------------------------------------- search ---
+
+class _SinRespuesta(Exception):
+    """Ninguna variante tuvo respuesta del proveedor: el vacío no se cachea."""
+
+
+_fanout_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _fanout_pool
+    if _fanout_pool is None:
+        _fanout_pool = ThreadPoolExecutor(max_workers=SEARCH_FANOUT_WORKERS,
+                                          thread_name_prefix="geocode-fanout")
+    return _fanout_pool
+
+
+def _proveedor_fetch(provider_key: str):
+    """(nombre, fetch) del proveedor que realmente se va a consultar."""
+    if provider_key == "google" and GOOGLE_MAPS_API_KEY:
+        return "google", _fetch_google_maps
+    if provider_key in {"nominatim", "osm"}:
+        return "nominatim", _fetch_nominatim
+    # Fallback: Google si hay key, si no Nominatim
+    if GOOGLE_MAPS_API_KEY:
+        current_app.logger.info("Usando Google Maps como proveedor principal")
+        return "google", _fetch_google_maps
+    current_app.logger.info("Google Maps no configurado, usando Nominatim")
+    return "nominatim", _fetch_nominatim
+
+
+def _fetch_medido(nombre: str, fetch, variant: str, limit: int) -> List[GeocodeResult]:
+    inicio = time.perf_counter()
+    error = False
+    try:
+        return fetch(variant, limit=limit)
+    except Exception:
+        error = True
+        raise
+    finally:
+        _registrar_latencia(nombre, (time.perf_counter() - inicio) * 1000, error)
+
+
+def _fetch_en_hilo(app, nombre: str, fetch, variant: str, limit: int) -> List[GeocodeResult]:
+    # Cada hilo abre su propio app context (los fetch usan current_app.logger)
+    with app.app_context():
+        return _fetch_medido(nombre, fetch, variant, limit)
+
+
+def _ancho_fanout(nombre: str) -> int:
+    # Nominatim pide no paralelizar; el geocodificador masivo (limite_proveedor
+    # seteado) ya paraleliza por dirección y no debe gastar cuota en variantes
+    # que no se van a usar.
+    if nombre == "nominatim" or limite_proveedor.get() is not None:
+        return 1
+    return max(1, min(SEARCH_FANOUT, SEARCH_FANOUT_MAX))
+
+
+def _buscar_variantes(nombre: str, fetch, variants: List[str], limit: int):
+    """
+    Prueba las variantes en orden y devuelve los resultados de la primera que
+    encuentra algo, junto con la cantidad de variantes que fallaron por red.
+
+    Por defecto van en serie y se corta en la primera con resultados. Con
+    GEOCODE_FANOUT > 1 se consultan hasta `_ancho_fanout` a la vez, pero gana
+    siempre la de menor índice con resultados (la misma que en serie): las
+    siguientes solo adelantan trabajo, y al haber ganadora las que no
+    arrancaron se cancelan.
+    """
+    errores = 0
+    ancho = min(_ancho_fanout(nombre), len(variants))
+
+    if ancho <= 1:
+        for i, variant in enumerate(variants, 1):
+            current_app.logger.info(f"🔍 Intentando variante {i}/{len(variants)}: {variant}")
+            try:
+                variant_results = _fetch_medido(nombre, fetch, variant, limit)
+            except requests.RequestException as exc:  # pragma: no cover - network errors
+                current_app.logger.warning(f"Fallo al consultar geocodificador con variante {i}: {exc}")
+                errores += 1
+                continue
+            if variant_results:
+                current_app.logger.info(f"✅ Variante {i} encontró {len(variant_results)} resultados")
+                return variant_results, errores
+            current_app.logger.info(f"⚠️ Variante {i} no encontró resultados")
+        return [], errores
+
+    app = current_app._get_current_object()
+    pendientes = deque(variants)
+    futuros = []
+
+    def _lanzar():
+        futuros.append(_pool().submit(_fetch_en_hilo, app, nombre, fetch, pendientes.popleft(), limit))
+
+    for _ in range(ancho):
+        _lanzar()
+    try:
+        for i in range(len(variants)):
+            try:
+                variant_results = futuros[i].result()
+            except requests.RequestException as exc:  # pragma: no cover - network errors
+                current_app.logger.warning(f"Fallo al consultar geocodificador con variante {i + 1}: {exc}")
+                errores += 1
+                variant_results = []
+            if variant_results:
+                current_app.logger.info(f"✅ Variante {i + 1} encontró {len(variant_results)} resultados")
+                return variant_results, errores
+            if pendientes:
+                _lanzar()
+        return [], errores
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+
+
 def search(query: str, *, provider: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
-    """Returns a list of candidate addresses for the given query."""
+    """Returns a list of candidate addresses for the given query.
+
+    Cacheado por (query, proveedor, limit): LRU del proceso + Redis, con las
+    respuestas vacías por SEARCH_NEGATIVE_TTL. Dos pedidos iguales en vuelo
+    comparten la misma consulta al proveedor. Si el proveedor no respondió
+    (errores de red, cuota), devuelve [] sin cachearlo.
+    """
 
     if not query or not query.strip():
         return []
 
+    provider_key = (provider or current_app.config.get("MAPS_PROVIDER") or DEFAULT_PROVIDER).lower()
+    try:
+        resultados = _search_cacheado(" ".join(query.split()), provider_key, limit)
+    except _SinRespuesta:
+        current_app.logger.warning(f"❌ El geocodificador no respondió para: {query}")
+        return []
+    # Los valores cacheados se comparten entre llamadas: devolver copias
+    return [dict(r) for r in resultados]
+
+
+@cache_query(ttl=SEARCH_CACHE_TTL, key_prefix="geocode_search", local_fallback=True,
+             negative_ttl=SEARCH_NEGATIVE_TTL)
+def _search_cacheado(query: str, provider_key: str, limit: int) -> List[Dict[str, Any]]:
     # Normalizar dirección argentina para mejorar precisión
     normalized_query = _normalize_argentina_address(query)
 
@@ -791,38 +1028,8 @@ def search(query: str, *, provider: Optional[str] = None, limit: int = 5) -> Lis
 
     current_app.logger.info(f"🔍 Buscando dirección con {len(variants)} variantes: {variants}")
 
-    provider_key = (provider or current_app.config.get("MAPS_PROVIDER") or DEFAULT_PROVIDER).lower()
-
-    results = []
-    # Intentar cada variante hasta obtener resultados
-    for i, variant in enumerate(variants, 1):
-        try:
-            current_app.logger.info(f"🔍 Intentando variante {i}/{len(variants)}: {variant}")
-
-            # Usar Google Maps como proveedor principal si está configurado
-            if provider_key == "google" and GOOGLE_MAPS_API_KEY:
-                variant_results = _fetch_google_maps(variant, limit=limit)
-            elif provider_key in {"nominatim", "osm"}:
-                variant_results = _fetch_nominatim(variant, limit=limit)
-            else:
-                # Fallback: intentar Google primero, luego Nominatim
-                if GOOGLE_MAPS_API_KEY:
-                    current_app.logger.info("Usando Google Maps como proveedor principal")
-                    variant_results = _fetch_google_maps(variant, limit=limit)
-                else:
-                    current_app.logger.info("Google Maps no configurado, usando Nominatim")
-                    variant_results = _fetch_nominatim(variant, limit=limit)
-
-            if variant_results:
-                current_app.logger.info(f"✅ Variante {i} encontró {len(variant_results)} resultados")
-                results = variant_results
-                break  # Si encontramos resultados, usarlos y detener búsqueda
-            else:
-                current_app.logger.info(f"⚠️ Variante {i} no encontró resultados")
-
-        except requests.RequestException as exc:  # pragma: no cover - network errors
-            current_app.logger.warning(f"Fallo al consultar geocodificador con variante {i}: {exc}")
-            continue  # Intentar siguiente variante
+    nombre, fetch = _proveedor_fetch(provider_key)
+    results, errores = _buscar_variantes(nombre, fetch, variants, limit)
 
     if not results and GOOGLE_MAPS_API_KEY:
         # Ultimo intento: query original sin modificar, directo a Google Maps
@@ -830,13 +1037,16 @@ def search(query: str, *, provider: Optional[str] = None, limit: int = 5) -> Lis
         try:
             clean_query = query.strip()
             current_app.logger.info(f"🔄 Ultimo intento con query limpia: {clean_query}")
-            results = _fetch_google_maps(clean_query, limit=limit)
+            results = _fetch_medido("google", _fetch_google_maps, clean_query, limit)
             if results:
                 current_app.logger.info(f"✅ Query limpia encontró {len(results)} resultados")
         except Exception as e:
+            errores += 1
             current_app.logger.warning(f"Ultimo intento falló: {e}")
 
     if not results:
+        if errores:
+            raise _SinRespuesta(query)
         current_app.logger.warning(f"❌ No se encontraron resultados para ninguna variante de: {query}")
         return []
 
@@ -956,4 +1166,4 @@ def _store_in_cache(original_query: str, normalized: str, provider: str, result:
     db.session.flush()
 
 
-__all__ = ["search", "resolve"]
+__all__ = ["search", "resolve", "geocode_metricas"]
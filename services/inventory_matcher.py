@@ -34,10 +34,25 @@ items; no hay N+1 aunque el pliego traiga 200 renglones.
     for it in items:
         inv_id, score, motivo = vincular_item_inventario(
             it['descripcion'], it['unidad'], indice)
+
+INDICE INVERTIDO (2026-10-16)
+-----------------------------
+El indice trae ademas token -> posiciones de los items que lo tienen. Un
+renglon solo puntua los items con los que comparte algun token: los demas no
+podian pasar ni aparecer como rechazados (sin tokens en comun se descartan),
+asi que el ranking es identico al barrido completo y cuesta proporcional a los
+candidatos, no al catalogo. Con 10k items y 200 renglones eso era 2M
+intersecciones por import.
+
+`obtener_indice_inventario(org_id)` lo cachea por org en el LRU del proceso
+(config/cache_config.py) con el tag `inventario:<org_id>`; los hooks de
+`registrar_hooks_indice` lo invalidan cuando se commitea un alta, baja o cambio
+de nombre/unidad/activo de ItemInventario.
 """
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 # Se reusan el tokenizador y el comparador de unidades que ya existen para el
 # matching de precios. Mismo criterio de normalizacion en todo el sistema.
@@ -77,7 +92,38 @@ def _tokens_utiles(texto: str) -> set:
     return _tokens_significativos(texto) - _STOPWORDS_PLIEGO
 
 
-def construir_indice_inventario(org_id: int) -> List[Dict[str, Any]]:
+# Vida del indice cacheado si ningun hook lo invalida (otro worker sin Redis).
+INDICE_TTL = int(os.getenv('INVENTARIO_INDICE_TTL', '600'))
+
+_SESSION_KEY = 'inventario_orgs_sucias'
+_hooks_registrados = False
+
+
+class IndiceInventario(list):
+    """Lista de items del indice (mismo formato de siempre) mas las posting
+    lists token -> posiciones, en orden de la lista.
+
+    Es de solo lectura una vez armado: se comparte entre requests via cache.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = ()):
+        super().__init__(items)
+        postings: Dict[str, List[int]] = {}
+        for pos, inv in enumerate(self):
+            for tk in inv['tokens']:
+                postings.setdefault(tk, []).append(pos)
+        self.postings = postings
+
+    def posiciones_con_tokens(self, tokens: Iterable[str]) -> Dict[int, int]:
+        """posicion -> cantidad de tokens de `tokens` que tiene ese item."""
+        cuenta: Dict[int, int] = {}
+        for tk in tokens:
+            for pos in self.postings.get(tk, ()):
+                cuenta[pos] = cuenta.get(pos, 0) + 1
+        return cuenta
+
+
+def construir_indice_inventario(org_id: int) -> IndiceInventario:
     """Carga los items de inventario activos de la org con sus tokens ya
     calculados. UNA query; el resultado se reusa para todos los items del import.
 
@@ -95,9 +141,80 @@ def construir_indice_inventario(org_id: int) -> List[Dict[str, Any]]:
              .order_by(ItemInventario.id)     # determinista: sin esto el desempate
              .all())                          # dependeria del plan de Postgres
 
-    return [{'id': f.id, 'nombre': f.nombre, 'unidad': f.unidad,
-             'tokens': _tokens_utiles(f.nombre)}
-            for f in filas]
+    return IndiceInventario({'id': f.id, 'nombre': f.nombre, 'unidad': f.unidad,
+                             'tokens': _tokens_utiles(f.nombre)}
+                            for f in filas)
+
+
+def _tag_indice(org_id: int) -> str:
+    return f'inventario:{org_id}'
+
+
+def obtener_indice_inventario(org_id: int) -> IndiceInventario:
+    """Indice de la org desde el cache del proceso; lo arma si no esta.
+
+    Para la pantalla de confirmacion, que se abre muchas veces sobre el mismo
+    catalogo. El dry-run sigue usando construir_indice_inventario(): quiere la
+    foto exacta de la DB.
+    """
+    from config.cache_config import get_local_cache
+
+    registrar_hooks_indice()
+    cache = get_local_cache()
+    clave = f'inventario_indice:{org_id}'
+    hit, indice = cache.get(clave)
+    if hit:
+        return indice
+    generacion = cache.generation
+    indice = construir_indice_inventario(org_id)
+    # Si hubo una invalidacion mientras se armaba, no se guarda
+    cache.set(clave, indice, INDICE_TTL, [_tag_indice(org_id)], generation=generacion)
+    return indice
+
+
+def invalidar_indice_inventario(*org_ids: int) -> None:
+    """Descarta el indice cacheado de las orgs (en todos los workers si hay Redis)."""
+    from config.cache_config import invalidate_tags
+    invalidate_tags(*[_tag_indice(o) for o in org_ids if o])
+
+
+def registrar_hooks_indice() -> None:
+    """Invalida el indice al commitear cambios de ItemInventario (idempotente)."""
+    global _hooks_registrados
+    if _hooks_registrados:
+        return
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import Session, object_session
+    from models.inventory import ItemInventario
+
+    def _anotar(target):
+        session = object_session(target)
+        if session is not None and target.organizacion_id:
+            session.info.setdefault(_SESSION_KEY, set()).add(target.organizacion_id)
+
+    @event.listens_for(ItemInventario, 'after_insert')
+    @event.listens_for(ItemInventario, 'after_delete')
+    def _alta_baja(mapper, connection, target):
+        _anotar(target)
+
+    @event.listens_for(ItemInventario, 'after_update')
+    def _cambio(mapper, connection, target):
+        estado = inspect(target)
+        if any(estado.attrs[campo].history.has_changes()
+               for campo in ('nombre', 'unidad', 'activo', 'organizacion_id')):
+            _anotar(target)
+
+    @event.listens_for(Session, 'after_commit')
+    def _despues_de_commit(session):
+        org_ids = session.info.pop(_SESSION_KEY, None)
+        if org_ids:
+            invalidar_indice_inventario(*org_ids)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _despues_de_rollback(session):
+        session.info.pop(_SESSION_KEY, None)
+
+    _hooks_registrados = True
 
 
 def evaluar_candidatos(
@@ -120,50 +237,57 @@ def evaluar_candidatos(
 
     Devuelve la lista ordenada de mejor a peor: cobertura desc, tokens comunes
     desc, id asc (determinista, no depende del plan de Postgres).
+
+    Solo recorre los items que comparten algun token con la descripcion (ver
+    IndiceInventario). Una lista comun tambien sirve: se indexa al vuelo.
     """
     tk_desc = _tokens_utiles(descripcion)
     if not tk_desc:
         return []
 
+    if not isinstance(indice, IndiceInventario):
+        indice = IndiceInventario(indice)
+
+    compatibles: Dict[str, bool] = {}
     out = []
-    for inv in indice:
+    # En orden de posicion: mismo orden de recorrido que el barrido completo
+    for pos, n_comunes in sorted(indice.posiciones_con_tokens(tk_desc).items()):
+        inv = indice[pos]
         tk_inv = inv['tokens']
-        if not tk_inv:
-            continue
 
         # Guard de unidad. Un renglon de pliego en m2 (superficie de pared) NO se
         # reserva contra un inventario en 'un' (ladrillos sueltos) ni en 'balde':
         # hace falta un factor de conversion que hoy no se aplica. Si el pliego no
         # trae unidad no se filtra, pero el resto de los umbrales sigue aplicando.
-        unidad_mala = bool(
-            unidad and inv['unidad']
-            and not _unidades_compatibles(unidad, inv['unidad'])
-        )
+        unidad_mala = False
+        if unidad and inv['unidad']:
+            if inv['unidad'] not in compatibles:
+                compatibles[inv['unidad']] = _unidades_compatibles(unidad, inv['unidad'])
+            unidad_mala = not compatibles[inv['unidad']]
 
-        comunes = tk_desc & tk_inv
         # Cobertura del NOMBRE DE INVENTARIO, no de la descripcion: los nombres de
         # inventario son cortos y especificos ("Hormigon H21 elaborado") y las
         # descripciones de pliego son largas. Lo que queremos saber es si el nombre
         # del inventario esta contenido en la descripcion, no al reves.
-        cobertura = len(comunes) / len(tk_inv)
+        cobertura = n_comunes / len(tk_inv)
 
         if unidad_mala:
             rechazo = 'unidad'
-        elif len(comunes) < _MIN_TOKENS_COMUNES:
+        elif n_comunes < _MIN_TOKENS_COMUNES:
             rechazo = 'pocos_tokens'
         elif cobertura < _MIN_COBERTURA:
             rechazo = 'cobertura_baja'
         else:
             rechazo = None
 
-        if rechazo is not None:
-            # Sin tokens en comun no aporta ni al diagnostico: seria ruido.
-            if not incluir_rechazados or not comunes:
-                continue
+        # Los que no comparten tokens ni llegan aca: no aportarian ni al
+        # diagnostico, serian ruido.
+        if rechazo is not None and not incluir_rechazados:
+            continue
 
         out.append({
             'id': inv['id'], 'nombre': inv['nombre'], 'unidad': inv['unidad'],
-            'comunes': sorted(comunes), 'n_comunes': len(comunes),
+            'comunes': sorted(tk_desc & tk_inv), 'n_comunes': n_comunes,
             'cobertura': round(cobertura, 3), 'rechazo': rechazo,
         })
 
@@ -14,7 +14,7 @@ Servicio para gestión completa de inventario, incluyendo:
 from datetime import datetime, date
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Optional, List, Dict, Any, Tuple
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, case, update
 from sqlalchemy.exc import SQLAlchemyError
 
 from services.base import BaseService, ValidationException, NotFoundException, ServiceException
@@ -42,6 +42,12 @@ class InventoryService(BaseService[InventoryItem]):
 
     model_class = InventoryItem
 
+    # Columnas de los exports de valuación (campo de iter_stock_valuation, título)
+    STOCK_VALUE_COLUMNS = [
+        ('sku', 'SKU'), ('nombre', 'Item'), ('unidad', 'Unidad'), ('warehouse', 'Depósito'),
+        ('cantidad', 'Cantidad'), ('costo_promedio', 'Costo promedio'), ('valor_total', 'Valor'),
+    ]
+
     # ===== ITEM MANAGEMENT =====
 
     def create_item(self, data: Dict[str, Any]) -> InventoryItem:
@@ -307,8 +313,9 @@ class InventoryService(BaseService[InventoryItem]):
             )
             db.session.add(movimiento)
 
-            # Actualizar stock
-            self._update_stock(item_id, warehouse_id, cantidad)
+            # Actualizar stock (y costo promedio si vino precio)
+            stock = self._update_stock(item_id, warehouse_id, cantidad, costo_unitario=precio)
+            movimiento.costo_unitario = precio if precio is not None else stock.costo_promedio
 
             db.session.commit()
             self._log_info(f"Ingreso registrado: {cantidad} {item.unidad} de {item.nombre} en {warehouse.nombre}")
@@ -394,8 +401,9 @@ class InventoryService(BaseService[InventoryItem]):
             )
             db.session.add(movimiento)
 
-            # Actualizar stock
-            self._update_stock(item_id, warehouse_id, -cantidad)
+            # Actualizar stock (el egreso sale al costo promedio)
+            stock = self._update_stock(item_id, warehouse_id, -cantidad)
+            movimiento.costo_unitario = stock.costo_promedio
 
             db.session.commit()
             self._log_info(f"Egreso registrado: {cantidad} {item.unidad} de {item.nombre} desde {warehouse.nombre}")
@@ -482,9 +490,12 @@ class InventoryService(BaseService[InventoryItem]):
             )
             db.session.add(movimiento)
 
-            # Actualizar stocks
-            self._update_stock(item_id, from_warehouse, -cantidad)
-            self._update_stock(item_id, to_warehouse, cantidad)
+            # Actualizar stocks: la mercadería entra al destino con el costo
+            # promedio del origen
+            stock_origen = self._update_stock(item_id, from_warehouse, -cantidad)
+            movimiento.costo_unitario = stock_origen.costo_promedio
+            self._update_stock(item_id, to_warehouse, cantidad,
+                               costo_unitario=stock_origen.costo_promedio)
 
             db.session.commit()
             self._log_info(f"Transferencia registrada: {cantidad} {item.unidad} de {item.nombre} de {origen.nombre} a {destino.nombre}")
@@ -561,8 +572,9 @@ class InventoryService(BaseService[InventoryItem]):
             )
             db.session.add(movimiento)
 
-            # Actualizar stock
-            self._update_stock(item_id, warehouse_id, cantidad)
+            # Actualizar stock (el ajuste no cambia el costo promedio)
+            stock = self._update_stock(item_id, warehouse_id, cantidad)
+            movimiento.costo_unitario = stock.costo_promedio
 
             db.session.commit()
             tipo_ajuste = "positivo" if cantidad > 0 else "negativo"
@@ -632,6 +644,7 @@ class InventoryService(BaseService[InventoryItem]):
                 created_at=datetime.utcnow()
             )
             db.session.add(reserva)
+            self._update_item_totals(item_id, reserved_delta=cantidad)
             db.session.commit()
 
             self._log_info(f"Reserva creada: {cantidad} {item.unidad} de {item.nombre} para {obra.nombre}")
@@ -669,6 +682,7 @@ class InventoryService(BaseService[InventoryItem]):
         try:
             reserva.estado = 'liberada'
             reserva.updated_at = datetime.utcnow()
+            self._update_item_totals(reserva.item_id, reserved_delta=-reserva.qty)
             db.session.commit()
 
             self._log_info(f"Reserva liberada: ID {reservation_id}")
@@ -706,6 +720,7 @@ class InventoryService(BaseService[InventoryItem]):
         try:
             reserva.estado = 'consumida'
             reserva.updated_at = datetime.utcnow()
+            self._update_item_totals(reserva.item_id, reserved_delta=-reserva.qty)
             db.session.commit()
 
             self._log_info(f"Reserva confirmada: ID {reservation_id}")
@@ -1003,25 +1018,36 @@ class InventoryService(BaseService[InventoryItem]):
         Returns:
             List[Dict]: Lista de items con stock bajo
         """
-        query = db.session.query(
-            InventoryItem.id,
-            InventoryItem.sku,
-            InventoryItem.nombre,
-            InventoryItem.unidad,
-            InventoryItem.min_stock,
-            func.sum(Stock.cantidad).label('stock_total')
-        ).join(Stock, Stock.item_id == InventoryItem.id)\
-         .group_by(
-             InventoryItem.id,
-             InventoryItem.sku,
-             InventoryItem.nombre,
-             InventoryItem.unidad,
-             InventoryItem.min_stock
-         )\
-         .having(func.sum(Stock.cantidad) <= InventoryItem.min_stock)
-
         if warehouse_id:
-            query = query.filter(Stock.warehouse_id == warehouse_id)
+            # Por depósito hay que sumar los Stock de ese depósito
+            query = db.session.query(
+                InventoryItem.id,
+                InventoryItem.sku,
+                InventoryItem.nombre,
+                InventoryItem.unidad,
+                InventoryItem.min_stock,
+                func.sum(Stock.cantidad).label('stock_total')
+            ).join(Stock, Stock.item_id == InventoryItem.id)\
+             .filter(Stock.warehouse_id == warehouse_id)\
+             .group_by(
+                 InventoryItem.id,
+                 InventoryItem.sku,
+                 InventoryItem.nombre,
+                 InventoryItem.unidad,
+                 InventoryItem.min_stock
+             )\
+             .having(func.sum(Stock.cantidad) <= InventoryItem.min_stock)
+        else:
+            # Total de todos los depósitos: lectura directa del total mantenido
+            query = db.session.query(
+                InventoryItem.id,
+                InventoryItem.sku,
+                InventoryItem.nombre,
+                InventoryItem.unidad,
+                InventoryItem.min_stock,
+                InventoryItem.stock_total
+            ).filter(InventoryItem.stock_total <= InventoryItem.min_stock)\
+             .filter(InventoryItem.stocks.any())
 
         if company_id:
             query = query.filter(InventoryItem.company_id == company_id)
@@ -1049,7 +1075,7 @@ class InventoryService(BaseService[InventoryItem]):
         company_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
-        Calcula el valor total del inventario basado en movimientos recientes.
+        Calcula el valor total del inventario a costo promedio ponderado.
 
         Args:
             warehouse_id: ID del depósito (opcional)
@@ -1058,74 +1084,174 @@ class InventoryService(BaseService[InventoryItem]):
         Returns:
             Dict: Información del valor del inventario
         """
-        # Esta es una estimación basada en los últimos ingresos
-        # En un sistema real, se debería mantener un precio promedio ponderado
+        valor = Stock.cantidad * Stock.costo_promedio
+        query = self._stock_value_query(warehouse_id, company_id)
 
-        query = db.session.query(
+        totales = query.with_entities(
+            func.count(Stock.id),
+            func.coalesce(func.sum(Stock.cantidad), 0),
+            func.coalesce(func.sum(valor), 0),
+            func.count(case((Stock.costo_promedio > 0, 1))),
+        ).one()
+
+        top = query.with_entities(
             InventoryItem.id,
             InventoryItem.sku,
             InventoryItem.nombre,
             InventoryItem.unidad,
             Stock.warehouse_id,
-            Stock.cantidad
-        ).join(Stock, Stock.item_id == InventoryItem.id)\
-         .filter(Stock.cantidad > 0)
+            Stock.cantidad,
+            Stock.costo_promedio,
+            valor.label('valor_total')
+        ).filter(Stock.costo_promedio > 0)\
+         .order_by(valor.desc(), Stock.id)\
+         .limit(20)\
+         .all()
 
-        if warehouse_id:
-            query = query.filter(Stock.warehouse_id == warehouse_id)
+        return {
+            'total_items': totales[0],
+            'total_quantity': float(totales[1]),
+            'estimated_value': float(totales[2]),
+            'items_with_value': totales[3],
+            'items_detail': [{
+                'item_id': row.id,
+                'sku': row.sku,
+                'nombre': row.nombre,
+                'cantidad': float(row.cantidad),
+                'unidad': row.unidad,
+                'precio_unitario': float(row.costo_promedio),
+                'valor_total': float(row.valor_total),
+                'warehouse_id': row.warehouse_id
+            } for row in top]  # Top 20
+        }
 
-        if company_id:
-            query = query.filter(InventoryItem.company_id == company_id)
+    def iter_stock_valuation(
+        self,
+        warehouse_id: Optional[int] = None,
+        company_id: Optional[int] = None,
+        batch_size: int = 1000
+    ):
+        """
+        Recorre la valuación del inventario fila por fila (item x depósito)
+        sin cargarla entera en memoria. Base de los exports CSV/XLSX.
 
-        stocks = query.all()
+        Yields:
+            Dict: sku, nombre, unidad, depósito, cantidad, costo promedio y valor
+        """
+        query = self._stock_value_query(warehouse_id, company_id)\
+            .join(Warehouse, Warehouse.id == Stock.warehouse_id)\
+            .with_entities(
+                InventoryItem.id,
+                InventoryItem.sku,
+                InventoryItem.nombre,
+                InventoryItem.unidad,
+                Stock.warehouse_id,
+                Warehouse.nombre.label('warehouse_nombre'),
+                Stock.cantidad,
+                Stock.costo_promedio
+            ).order_by(Stock.warehouse_id, InventoryItem.sku)
+
+        for row in query.yield_per(batch_size):
+            yield {
+                'item_id': row.id,
+                'sku': row.sku,
+                'nombre': row.nombre,
+                'unidad': row.unidad,
+                'warehouse_id': row.warehouse_id,
+                'warehouse': row.warehouse_nombre,
+                'cantidad': row.cantidad,
+                'costo_promedio': row.costo_promedio,
+                'valor_total': (row.cantidad * row.costo_promedio).quantize(Decimal('0.01'), ROUND_HALF_UP)
+            }
+
+    def export_stock_value_csv(
+        self,
+        warehouse_id: Optional[int] = None,
+        company_id: Optional[int] = None
+    ):
+        """
+        Export CSV de la valuación, como generador de líneas: se puede devolver
+        directo en un Response(stream_with_context(...), mimetype='text/csv').
+        """
+        import csv
+        import io
 
-        total_items = 0
-        total_quantity = Decimal('0')
-        estimated_value = Decimal('0')
-        items_detail = []
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
 
-        for stock in stocks:
-            # Obtener el último precio de ingreso
-            ultimo_ingreso = StockMovement.query\
-                .filter_by(item_id=stock.id, tipo='ingreso')\
-                .order_by(StockMovement.fecha.desc())\
-                .first()
-
-            # Extraer precio del motivo si existe (formato: "... | Precio: $XXX")
-            precio_unitario = Decimal('0')
-            if ultimo_ingreso and ultimo_ingreso.motivo:
-                try:
-                    if "Precio: $" in ultimo_ingreso.motivo:
-                        precio_str = ultimo_ingreso.motivo.split("Precio: $")[1].split("|")[0].strip()
-                        precio_unitario = Decimal(precio_str)
-                except (IndexError, ValueError):
-                    pass
-
-            valor_item = stock.cantidad * precio_unitario
-
-            total_items += 1
-            total_quantity += stock.cantidad
-            estimated_value += valor_item
-
-            if precio_unitario > 0:
-                items_detail.append({
-                    'item_id': stock.id,
-                    'sku': stock.sku,
-                    'nombre': stock.nombre,
-                    'cantidad': float(stock.cantidad),
-                    'unidad': stock.unidad,
-                    'precio_unitario': float(precio_unitario),
-                    'valor_total': float(valor_item),
-                    'warehouse_id': stock.warehouse_id
-                })
+        def _volcar():
+            linea = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return linea
 
-        return {
-            'total_items': total_items,
-            'total_quantity': float(total_quantity),
-            'estimated_value': float(estimated_value),
-            'items_with_value': len(items_detail),
-            'items_detail': sorted(items_detail, key=lambda x: x['valor_total'], reverse=True)[:20]  # Top 20
-        }
+        writer.writerow([titulo for _, titulo in self.STOCK_VALUE_COLUMNS])
+        yield _volcar()
+        for fila in self.iter_stock_valuation(warehouse_id, company_id):
+            writer.writerow([fila[campo] for campo, _ in self.STOCK_VALUE_COLUMNS])
+            yield _volcar()
+
+    def export_stock_value_xlsx(
+        self,
+        output,
+        warehouse_id: Optional[int] = None,
+        company_id: Optional[int] = None
+    ):
+        """
+        Export XLSX de la valuación. Usa el modo write_only de openpyxl, que
+        escribe las filas a medida que llegan en vez de armar la hoja en memoria.
+
+        Args:
+            output: Ruta o archivo binario donde guardar el libro
+        """
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Valuación')
+        ws.append([titulo for _, titulo in self.STOCK_VALUE_COLUMNS])
+        for fila in self.iter_stock_valuation(warehouse_id, company_id):
+            ws.append([float(fila[campo]) if isinstance(fila[campo], Decimal) else fila[campo]
+                       for campo, _ in self.STOCK_VALUE_COLUMNS])
+        wb.save(output)
+        return output
+
+    def seed_average_costs(self, company_id: Optional[int] = None) -> int:
+        """
+        Carga el costo promedio inicial de los stocks que todavía no tienen
+        (datos anteriores a la valuación por promedio ponderado).
+
+        Usa el último precio de ingreso del item, que es lo que estimaba
+        get_stock_value antes: la valuación no salta al migrar. Idempotente.
+
+        Returns:
+            int: Cantidad de registros de stock actualizados
+        """
+        query = StockMovement.query\
+            .filter(StockMovement.tipo == 'ingreso')\
+            .order_by(StockMovement.item_id, StockMovement.fecha.desc(), StockMovement.id.desc())
+        if company_id:
+            query = query.join(InventoryItem, InventoryItem.id == StockMovement.item_id)\
+                .filter(InventoryItem.company_id == company_id)
+
+        ultimo_precio = {}
+        for mov in query.yield_per(1000):
+            if mov.item_id in ultimo_precio:
+                continue
+            precio = mov.costo_unitario
+            if precio is None:
+                precio = self._precio_desde_motivo(mov.motivo)
+            if precio:
+                ultimo_precio[mov.item_id] = precio
+
+        actualizados = 0
+        stocks = Stock.query.filter(Stock.item_id.in_(list(ultimo_precio)),
+                                    or_(Stock.costo_promedio.is_(None), Stock.costo_promedio == 0))
+        for stock in stocks:
+            stock.costo_promedio = ultimo_precio[stock.item_id]
+            actualizados += 1
+        db.session.commit()
+        self._log_info(f"Costo promedio inicial cargado en {actualizados} registros de stock")
+        return actualizados
 
     def get_movement_history(
         self,
@@ -1189,7 +1315,50 @@ class InventoryService(BaseService[InventoryItem]):
 
     # ===== HELPER METHODS =====
 
-    def _update_stock(self, item_id: int, warehouse_id: int, delta: Decimal):
+    def _stock_value_query(self, warehouse_id: Optional[int], company_id: Optional[int]):
+        """Stock con cantidad positiva, filtrado por depósito y organización."""
+        query = db.session.query(Stock)\
+            .join(InventoryItem, Stock.item_id == InventoryItem.id)\
+            .filter(Stock.cantidad > 0)
+        if warehouse_id:
+            query = query.filter(Stock.warehouse_id == warehouse_id)
+        if company_id:
+            query = query.filter(InventoryItem.company_id == company_id)
+        return query
+
+    @staticmethod
+    def _precio_desde_motivo(motivo: Optional[str]) -> Optional[Decimal]:
+        """Precio de los ingresos viejos, que solo lo guardaban en el motivo
+        (formato: "... | Precio: $XXX")."""
+        if not motivo or "Precio: $" not in motivo:
+            return None
+        try:
+            return Decimal(motivo.split("Precio: $")[1].split("|")[0].strip())
+        except (IndexError, ArithmeticError):
+            return None
+
+    @staticmethod
+    def _weighted_average(
+        cantidad_actual: Decimal,
+        costo_actual: Decimal,
+        cantidad_nueva: Decimal,
+        costo_nuevo: Decimal
+    ) -> Decimal:
+        """Costo promedio ponderado después de sumar cantidad_nueva a costo_nuevo."""
+        cantidad_actual = max(cantidad_actual or Decimal('0'), Decimal('0'))
+        total = cantidad_actual + cantidad_nueva
+        if total <= 0:
+            return Decimal(costo_nuevo)
+        valor = cantidad_actual * (costo_actual or Decimal('0')) + cantidad_nueva * costo_nuevo
+        return (valor / total).quantize(Decimal('0.0001'), ROUND_HALF_UP)
+
+    def _update_stock(
+        self,
+        item_id: int,
+        warehouse_id: int,
+        delta: Decimal,
+        costo_unitario: Optional[Decimal] = None
+    ) -> Stock:
         """
         Actualiza el stock de un item en un depósito.
 
@@ -1197,16 +1366,28 @@ class InventoryService(BaseService[InventoryItem]):
             item_id: ID del item
             warehouse_id: ID del depósito
             delta: Cambio en la cantidad (positivo o negativo)
+            costo_unitario: Costo de lo que entra (solo si delta > 0). Si se
+                informa, recalcula el costo promedio ponderado; si no, lo que
+                entra se valúa al promedio vigente. Las salidas no lo cambian.
+
+        Returns:
+            Stock: Registro de stock actualizado
         """
         stock = Stock.query.filter_by(item_id=item_id, warehouse_id=warehouse_id).first()
 
         if stock:
+            if delta > 0 and costo_unitario is not None:
+                stock.costo_promedio = self._weighted_average(
+                    stock.cantidad, stock.costo_promedio, delta, costo_unitario
+                )
+            anterior = stock.cantidad
             stock.cantidad += delta
             stock.updated_at = datetime.utcnow()
 
             # Evitar cantidades negativas por errores de redondeo
             if stock.cantidad < 0:
                 stock.cantidad = Decimal('0')
+            self._update_item_totals(item_id, stock_delta=stock.cantidad - anterior)
         else:
             # Crear nuevo registro de stock si no existe
             if delta > 0:
@@ -1214,13 +1395,96 @@ class InventoryService(BaseService[InventoryItem]):
                     item_id=item_id,
                     warehouse_id=warehouse_id,
                     cantidad=delta,
+                    costo_promedio=costo_unitario if costo_unitario is not None else Decimal('0'),
                     updated_at=datetime.utcnow()
                 )
                 db.session.add(stock)
+                self._update_item_totals(item_id, stock_delta=delta)
             else:
                 raise ServiceException(
                     f"No se puede crear stock con cantidad negativa en depósito {warehouse_id}"
                 )
+        return stock
+
+    def _update_item_totals(
+        self,
+        item_id: int,
+        stock_delta: Decimal = Decimal('0'),
+        reserved_delta: Decimal = Decimal('0')
+    ):
+        """
+        Aplica deltas a InventoryItem.stock_total / stock_reservado con un UPDATE
+        atómico (col = col + delta) dentro de la transacción del movimiento.
+        """
+        valores = {}
+        if stock_delta:
+            valores['stock_total'] = InventoryItem.stock_total + stock_delta
+        if reserved_delta:
+            valores['stock_reservado'] = InventoryItem.stock_reservado + reserved_delta
+        if valores:
+            db.session.execute(
+                update(InventoryItem).where(InventoryItem.id == item_id).values(**valores)
+            )
+
+    def reconcile_stock_totals(
+        self,
+        company_id: Optional[int] = None,
+        fix: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Recalcula los totales desnormalizados desde Stock y StockReservation y
+        devuelve los items donde no coinciden.
+
+        Args:
+            company_id: ID de la organización (opcional)
+            fix: Si es True, corrige las diferencias encontradas
+
+        Returns:
+            List[Dict]: item, valores guardados y valores recalculados
+        """
+        stock_sq = db.session.query(
+            Stock.item_id, func.sum(Stock.cantidad).label('total')
+        ).group_by(Stock.item_id).subquery()
+        reservas_sq = db.session.query(
+            StockReservation.item_id, func.sum(StockReservation.qty).label('total')
+        ).filter(StockReservation.estado == 'activa')\
+         .group_by(StockReservation.item_id).subquery()
+
+        query = db.session.query(
+            InventoryItem.id,
+            InventoryItem.sku,
+            InventoryItem.stock_total,
+            InventoryItem.stock_reservado,
+            func.coalesce(stock_sq.c.total, 0).label('stock_real'),
+            func.coalesce(reservas_sq.c.total, 0).label('reservado_real')
+        ).outerjoin(stock_sq, stock_sq.c.item_id == InventoryItem.id)\
+         .outerjoin(reservas_sq, reservas_sq.c.item_id == InventoryItem.id)\
+         .filter(or_(
+             InventoryItem.stock_total != func.coalesce(stock_sq.c.total, 0),
+             InventoryItem.stock_reservado != func.coalesce(reservas_sq.c.total, 0)
+         ))
+        if company_id:
+            query = query.filter(InventoryItem.company_id == company_id)
+
+        diferencias = [{
+            'item_id': row.id,
+            'sku': row.sku,
+            'stock_total': Decimal(row.stock_total or 0),
+            'stock_real': Decimal(row.stock_real),
+            'stock_reservado': Decimal(row.stock_reservado or 0),
+            'reservado_real': Decimal(row.reservado_real),
+        } for row in query.all()]
+
+        if fix and diferencias:
+            db.session.execute(update(InventoryItem), [{
+                'id': d['item_id'],
+                'stock_total': d['stock_real'],
+                'stock_reservado': d['reservado_real'],
+            } for d in diferencias])
+            db.session.commit()
+            self._log_warning(f"Totales de stock corregidos en {len(diferencias)} items")
+
+        return diferencias
 
     def get_item_summary(self, item_id: int) -> Dict[str, Any]:
         """
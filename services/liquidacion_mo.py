@@ -65,33 +65,66 @@ def obtener_tarifa_default_obra(obra):
         return Decimal('0')
 
 
-def calcular_horas_avance_operario(obra_id, operario_id, desde, hasta):
-    """Calcula horas de avances aprobados de un operario en un período.
-
-    Returns: dict con horas totales y desglose por tarea.
-    """
-    avances = (
-        TareaAvance.query
+def _rango_fichadas(desde, hasta):
+    """Condición de período sobre Fichada.fecha_hora que puede usar el índice
+    (obra_id, fecha_hora): [desde 00:00, hasta+1 00:00)."""
+    from services.asistencia_diaria import rango_fichadas
+
+    return rango_fichadas(desde, hasta)
+
+
+def _avances_periodo(obra_id, desde, hasta, operario_ids=None):
+    """Avances aprobados de la obra en el período, con nombre de tarea y etapa
+    en la misma consulta (sin lazy loads de av.tarea.etapa)."""
+    query = (
+        db.session.query(
+            TareaAvance.id,
+            TareaAvance.user_id,
+            TareaAvance.horas,
+            TareaAvance.horas_trabajadas,
+            TareaAvance.cantidad,
+            TareaAvance.unidad,
+            TareaAvance.fecha,
+            TareaEtapa.nombre.label('tarea_nombre'),
+            EtapaObra.nombre.label('etapa_nombre'),
+        )
         .join(TareaEtapa, TareaAvance.tarea_id == TareaEtapa.id)
         .join(EtapaObra, TareaEtapa.etapa_id == EtapaObra.id)
         .filter(
             EtapaObra.obra_id == obra_id,
-            TareaAvance.user_id == operario_id,
             TareaAvance.status == 'aprobado',
             TareaAvance.fecha >= desde,
             TareaAvance.fecha <= hasta,
         )
-        .all()
     )
+    if operario_ids is not None:
+        query = query.filter(TareaAvance.user_id.in_(list(operario_ids)))
+    return query.order_by(TareaAvance.id).all()
+
+
+def _fichadas_periodo(obra_id, desde, hasta, operario_ids=None):
+    """Fichadas de la obra en el período, ordenadas por operario y hora."""
+    from models.projects import Fichada
+
+    query = (
+        db.session.query(Fichada.id, Fichada.usuario_id, Fichada.tipo, Fichada.fecha_hora)
+        .filter(Fichada.obra_id == obra_id, *_rango_fichadas(desde, hasta))
+    )
+    if operario_ids is not None:
+        query = query.filter(Fichada.usuario_id.in_(list(operario_ids)))
+    return query.order_by(Fichada.usuario_id, Fichada.fecha_hora, Fichada.id).all()
 
+
+def _horas_avances(avances):
+    """Horas y desglose por tarea a partir de filas de _avances_periodo."""
     total_horas = Decimal('0')
     desglose = []
     for av in avances:
         h = _decimal(av.horas) or _decimal(av.horas_trabajadas)
         total_horas += h
         desglose.append({
-            'tarea': av.tarea.nombre if av.tarea else 'N/A',
-            'etapa': av.tarea.etapa.nombre if av.tarea and av.tarea.etapa else 'N/A',
+            'tarea': av.tarea_nombre or 'N/A',
+            'etapa': av.etapa_nombre or 'N/A',
             'horas': float(h),
             'cantidad': float(av.cantidad or 0),
             'unidad': av.unidad or '',
@@ -104,27 +137,11 @@ def calcular_horas_avance_operario(obra_id, operario_id, desde, hasta):
     }
 
 
-def calcular_horas_fichadas_operario(obra_id, operario_id, desde, hasta):
-    """Calcula horas fichadas (ingreso/egreso) de un operario en un período.
-
-    Returns: dict con horas totales y desglose por día.
-    """
-    from models.projects import Fichada
-
-    fichadas = (
-        Fichada.query
-        .filter(
-            Fichada.obra_id == obra_id,
-            Fichada.usuario_id == operario_id,
-            db.func.date(Fichada.fecha_hora) >= desde,
-            db.func.date(Fichada.fecha_hora) <= hasta,
-        )
-        .order_by(Fichada.fecha_hora.asc())
-        .all()
-    )
+def _horas_fichadas(fichadas):
+    """Horas y desglose por día a partir de las fichadas de un operario."""
+    from collections import defaultdict
 
     # Agrupar por día
-    from collections import defaultdict
     por_dia = defaultdict(list)
     for f in fichadas:
         dia = f.fecha_hora.date()
@@ -181,21 +198,8 @@ def calcular_horas_fichadas_operario(obra_id, operario_id, desde, hasta):
     }
 
 
-def calcular_cantidad_avance_operario(obra_id, operario_id, desde, hasta):
-    """Suma la cantidad (m², u, etc.) ejecutada por un operario desde sus avances aprobados."""
-    avances = (
-        TareaAvance.query
-        .join(TareaEtapa, TareaAvance.tarea_id == TareaEtapa.id)
-        .join(EtapaObra, TareaEtapa.etapa_id == EtapaObra.id)
-        .filter(
-            EtapaObra.obra_id == obra_id,
-            TareaAvance.user_id == operario_id,
-            TareaAvance.status == 'aprobado',
-            TareaAvance.fecha >= desde,
-            TareaAvance.fecha <= hasta,
-        )
-        .all()
-    )
+def _cantidad_avances(avances):
+    """Cantidad ejecutada y unidad dominante a partir de filas de _avances_periodo."""
     total_cantidad = Decimal('0')
     unidades = set()
     for av in avances:
@@ -207,9 +211,102 @@ def calcular_cantidad_avance_operario(obra_id, operario_id, desde, hasta):
     return {'cantidad': total_cantidad, 'unidad': unidad}
 
 
-def calcular_liquidacion_por_operario(operario, obra_id, desde, hasta, tarifa_fallback=None):
+def calcular_horas_avance_operario(obra_id, operario_id, desde, hasta):
+    """Calcula horas de avances aprobados de un operario en un período.
+
+    Returns: dict con horas totales y desglose por tarea.
+    """
+    return _horas_avances(_avances_periodo(obra_id, desde, hasta, operario_ids=[operario_id]))
+
+
+def calcular_horas_fichadas_operario(obra_id, operario_id, desde, hasta):
+    """Calcula horas fichadas (ingreso/egreso) de un operario en un período.
+
+    Returns: dict con horas totales y desglose por día.
+    """
+    return _horas_fichadas(_fichadas_periodo(obra_id, desde, hasta, operario_ids=[operario_id]))
+
+
+def calcular_cantidad_avance_operario(obra_id, operario_id, desde, hasta):
+    """Suma la cantidad (m², u, etc.) ejecutada por un operario desde sus avances aprobados."""
+    return _cantidad_avances(_avances_periodo(obra_id, desde, hasta, operario_ids=[operario_id]))
+
+
+class PeriodoMO:
+    """Datos de mano de obra de una obra en un período, cargados de una vez.
+
+    Los cálculos por operario (calcular_horas_*_operario) hacen sus propias
+    consultas; en una obra de 60 operarios por un mes eran cientos. Acá se
+    traen en cuatro consultas (avances aprobados con tarea/etapa, fichadas,
+    asignaciones activas con su usuario y los usuarios restantes) y se
+    agrupan por operario en memoria. Los resultados son los mismos que los
+    de las funciones por operario.
+
+    Con `operario_ids` solo se cargan esos operarios.
+    """
+
+    def __init__(self, obra_id, desde, hasta, operario_ids=None):
+        from collections import defaultdict
+        from sqlalchemy.orm import joinedload
+
+        self.obra_id = obra_id
+        self.desde = desde
+        self.hasta = hasta
+        ids = set(int(uid) for uid in operario_ids) if operario_ids is not None else None
+
+        self._avances = defaultdict(list)
+        for av in _avances_periodo(obra_id, desde, hasta, operario_ids=ids):
+            self._avances[av.user_id].append(av)
+        self._fichadas = defaultdict(list)
+        for f in _fichadas_periodo(obra_id, desde, hasta, operario_ids=ids):
+            self._fichadas[f.usuario_id].append(f)
+
+        asignaciones = (
+            AsignacionObra.query
+            .options(joinedload(AsignacionObra.usuario))
+            .filter(AsignacionObra.obra_id == obra_id, AsignacionObra.activo.is_(True))
+        )
+        if ids is not None:
+            asignaciones = asignaciones.filter(AsignacionObra.usuario_id.in_(list(ids)))
+        asignaciones = asignaciones.order_by(AsignacionObra.id).all()
+
+        self._roles = {}
+        self.usuarios = {}
+        for asig in asignaciones:
+            self._roles.setdefault(asig.usuario_id, asig.rol_en_obra)
+            if asig.usuario:
+                self.usuarios.setdefault(asig.usuario_id, asig.usuario)
+
+        faltantes = (set(self._avances) | set(self._fichadas) | (ids or set())) - set(self.usuarios)
+        faltantes.discard(None)
+        if faltantes:
+            for u in Usuario.query.filter(Usuario.id.in_(list(faltantes))).all():
+                self.usuarios[u.id] = u
+
+        # Mismo orden que buscar_operarios_obra: asignaciones, avances, fichadas
+        self.operarios = {}
+        for uid in list(self._roles) + list(self._avances) + list(self._fichadas):
+            if uid and uid not in self.operarios and uid in self.usuarios:
+                self.operarios[uid] = self.usuarios[uid]
+
+    def horas_avance(self, operario_id):
+        return _horas_avances(self._avances.get(operario_id, []))
+
+    def horas_fichadas(self, operario_id):
+        return _horas_fichadas(self._fichadas.get(operario_id, []))
+
+    def cantidad_avance(self, operario_id):
+        return _cantidad_avances(self._avances.get(operario_id, []))
+
+    def rol(self, operario_id, default=None):
+        return self._roles.get(operario_id, default)
+
+
+def calcular_liquidacion_por_operario(operario, obra_id, desde, hasta, tarifa_fallback=None, periodo=None):
     """Calcula liquidación de un operario según su modalidad de pago configurada.
 
+    Con `periodo` (PeriodoMO de la misma obra y período) no hace consultas.
+
     Retorna un dict con:
       - modalidad: 'medida' | 'hora' | 'fichada'
       - base: cantidad numérica (m² ó h)
@@ -226,7 +323,10 @@ def calcular_liquidacion_por_operario(operario, obra_id, desde, hasta, tarifa_fa
     warning = None
 
     if modalidad == 'medida':
-        avance = calcular_cantidad_avance_operario(obra_id, operario.id, desde, hasta)
+        if periodo is not None:
+            avance = periodo.cantidad_avance(operario.id)
+        else:
+            avance = calcular_cantidad_avance_operario(obra_id, operario.id, desde, hasta)
         cantidad = avance['cantidad']
         unidad = avance['unidad'] or 'm2'
         tarifa = tarifa_m2_user
@@ -243,7 +343,10 @@ def calcular_liquidacion_por_operario(operario, obra_id, desde, hasta, tarifa_fa
         }
 
     if modalidad == 'fichada':
-        fich = calcular_horas_fichadas_operario(obra_id, operario.id, desde, hasta)
+        if periodo is not None:
+            fich = periodo.horas_fichadas(operario.id)
+        else:
+            fich = calcular_horas_fichadas_operario(obra_id, operario.id, desde, hasta)
         horas = _decimal(fich['total_horas'])
         tarifa = tarifa_hora_user if tarifa_hora_user > 0 else tarifa_fallback
         if tarifa <= 0:
@@ -259,7 +362,10 @@ def calcular_liquidacion_por_operario(operario, obra_id, desde, hasta, tarifa_fa
         }
 
     # 'hora' (default): horas de avance aprobado × tarifa/h
-    av = calcular_horas_avance_operario(obra_id, operario.id, desde, hasta)
+    if periodo is not None:
+        av = periodo.horas_avance(operario.id)
+    else:
+        av = calcular_horas_avance_operario(obra_id, operario.id, desde, hasta)
     horas = _decimal(av['total_horas'])
     tarifa = tarifa_hora_user if tarifa_hora_user > 0 else tarifa_fallback
     if tarifa <= 0:
@@ -280,10 +386,17 @@ def buscar_operarios_obra(obra_id, desde, hasta):
 
     Combina: asignaciones de obra + avances registrados + fichadas.
     """
+    from sqlalchemy.orm import joinedload
+
     operarios = {}
 
-    # 1. Asignaciones activas
-    asignaciones = AsignacionObra.query.filter_by(obra_id=obra_id, activo=True).all()
+    # 1. Asignaciones activas (con el usuario en la misma consulta)
+    asignaciones = (
+        AsignacionObra.query
+        .options(joinedload(AsignacionObra.usuario))
+        .filter_by(obra_id=obra_id, activo=True)
+        .all()
+    )
     for asig in asignaciones:
         if asig.usuario and asig.usuario_id not in operarios:
             operarios[asig.usuario_id] = asig.usuario
@@ -302,29 +415,23 @@ def buscar_operarios_obra(obra_id, desde, hasta):
         .distinct()
         .all()
     )
-    for (uid,) in avance_users:
-        if uid and uid not in operarios:
-            u = Usuario.query.get(uid)
-            if u:
-                operarios[uid] = u
 
     # 3. Operarios con fichadas en el período
     from models.projects import Fichada
     fichada_users = (
         db.session.query(Fichada.usuario_id)
-        .filter(
-            Fichada.obra_id == obra_id,
-            db.func.date(Fichada.fecha_hora) >= desde,
-            db.func.date(Fichada.fecha_hora) <= hasta,
-        )
+        .filter(Fichada.obra_id == obra_id, *_rango_fichadas(desde, hasta))
         .distinct()
         .all()
     )
-    for (uid,) in fichada_users:
-        if uid and uid not in operarios:
-            u = Usuario.query.get(uid)
-            if u:
-                operarios[uid] = u
+
+    # Los usuarios que no vinieron con una asignación, en una sola consulta
+    extras = [uid for (uid,) in avance_users + fichada_users if uid and uid not in operarios]
+    if extras:
+        usuarios = {u.id: u for u in Usuario.query.filter(Usuario.id.in_(set(extras))).all()}
+        for uid in extras:
+            if uid in usuarios and uid not in operarios:
+                operarios[uid] = usuarios[uid]
 
     return operarios
 
@@ -339,30 +446,25 @@ def generar_preview_liquidacion(obra_id, desde, hasta):
         return []
 
     tarifa_default = obtener_tarifa_default_obra(obra)
-    operarios = buscar_operarios_obra(obra_id, desde, hasta)
+    periodo = PeriodoMO(obra_id, desde, hasta)
 
     items = []
-    for uid, usuario in operarios.items():
-        avance_data = calcular_horas_avance_operario(obra_id, uid, desde, hasta)
-        fichada_data = calcular_horas_fichadas_operario(obra_id, uid, desde, hasta)
+    for uid, usuario in periodo.operarios.items():
+        avance_data = periodo.horas_avance(uid)
+        fichada_data = periodo.horas_fichadas(uid)
 
         horas_avance = avance_data['total_horas']
         horas_fichadas = fichada_data['total_horas']
 
         # Cálculo por modalidad configurada en el usuario
         modalidad_data = calcular_liquidacion_por_operario(
-            usuario, obra_id, desde, hasta, tarifa_fallback=tarifa_default
+            usuario, obra_id, desde, hasta, tarifa_fallback=tarifa_default, periodo=periodo
         )
 
-        # Obtener rol en obra
-        asig = AsignacionObra.query.filter_by(
-            obra_id=obra_id, usuario_id=uid, activo=True
-        ).first()
-
         items.append({
             'operario_id': uid,
             'operario_nombre': usuario.nombre_completo,
-            'rol': asig.rol_en_obra if asig else 'sin asignar',
+            'rol': periodo.rol(uid, 'sin asignar'),
             'modalidad': modalidad_data['modalidad'],
             'base': modalidad_data['base'],
             'unidad': modalidad_data['unidad'],
@@ -382,6 +484,27 @@ def generar_preview_liquidacion(obra_id, desde, hasta):
     return items
 
 
+def _conteo_tareas_etapas(obra_id):
+    """{etapa_id: {'nombre', 'total', 'completadas'}} de las etapas de la obra."""
+    completada = db.case((TareaEtapa.estado.in_(('completada', 'finalizada')), 1), else_=0)
+    filas = (
+        db.session.query(
+            EtapaObra.id,
+            EtapaObra.nombre,
+            db.func.count(TareaEtapa.id),
+            db.func.coalesce(db.func.sum(completada), 0),
+        )
+        .outerjoin(TareaEtapa, TareaEtapa.etapa_id == EtapaObra.id)
+        .filter(EtapaObra.obra_id == obra_id)
+        .group_by(EtapaObra.id, EtapaObra.nombre)
+        .all()
+    )
+    return {
+        eid: {'nombre': nombre, 'total': int(total or 0), 'completadas': int(completadas or 0)}
+        for eid, nombre, total, completadas in filas
+    }
+
+
 def generar_preview_unificado(obra_id, desde, hasta):
     """Genera preview unificado: etapas → operarios → detalle.
 
@@ -393,10 +516,9 @@ def generar_preview_unificado(obra_id, desde, hasta):
         return {'etapas': [], 'operarios_sin_etapa': []}
 
     from services.certifications import compute_etapa_breakdown
-    from models.projects import EtapaObra
 
     tarifa_default = obtener_tarifa_default_obra(obra)
-    operarios = buscar_operarios_obra(obra_id, desde, hasta)
+    periodo = PeriodoMO(obra_id, desde, hasta)
     etapa_breakdown = compute_etapa_breakdown(obra)
 
     # Obtener tareas ya liquidadas (para marcar en preview)
@@ -421,32 +543,30 @@ def generar_preview_unificado(obra_id, desde, hasta):
     # liquidar diferencias o tareas nuevas completadas en el mismo período.
     # El historial de liquidaciones muestra qué ya se pagó.
 
-    # Calcular avance por conteo simple de tareas (igual que cronograma)
+    # Calcular avance por conteo simple de tareas (igual que cronograma).
+    # Conteos de todas las etapas de la obra en una consulta.
+    conteo_etapas = _conteo_tareas_etapas(obra_id)
+    etapa_por_nombre = {}
+    for eid in sorted(conteo_etapas):
+        etapa_por_nombre.setdefault(conteo_etapas[eid]['nombre'], eid)
+
     def _pct_etapa_simple(etapa_id):
-        etapa = EtapaObra.query.get(etapa_id)
-        if not etapa:
-            return 0
-        tareas = etapa.tareas.all() if hasattr(etapa.tareas, 'all') else (etapa.tareas or [])
-        if not tareas:
+        conteo = conteo_etapas.get(etapa_id)
+        if not conteo or not conteo['total']:
             return 0
-        completadas = sum(1 for t in tareas if t.estado in ('completada', 'finalizada'))
-        return round((completadas / len(tareas)) * 100, 2)
+        return round((conteo['completadas'] / conteo['total']) * 100, 2)
 
     pct_simple_map = {ei['etapa_id']: _pct_etapa_simple(ei['etapa_id']) for ei in (etapa_breakdown.get('etapas') or [])}
 
     # Calcular datos de cada operario
     operarios_data = {}
-    for uid, usuario in operarios.items():
-        avance_data = calcular_horas_avance_operario(obra_id, uid, desde, hasta)
-        fichada_data = calcular_horas_fichadas_operario(obra_id, uid, desde, hasta)
-
-        asig = AsignacionObra.query.filter_by(
-            obra_id=obra_id, usuario_id=uid, activo=True
-        ).first()
+    for uid, usuario in periodo.operarios.items():
+        avance_data = periodo.horas_avance(uid)
+        fichada_data = periodo.horas_fichadas(uid)
 
         # Cálculo según modalidad configurada del operario
         modalidad_data = calcular_liquidacion_por_operario(
-            usuario, obra_id, desde, hasta, tarifa_fallback=tarifa_default
+            usuario, obra_id, desde, hasta, tarifa_fallback=tarifa_default, periodo=periodo
         )
 
         # Marcar tareas ya pagadas en el desglose de avances
@@ -457,7 +577,7 @@ def generar_preview_unificado(obra_id, desde, hasta):
         operarios_data[uid] = {
             'operario_id': uid,
             'operario_nombre': usuario.nombre_completo,
-            'rol': asig.rol_en_obra if asig else 'operario',
+            'rol': periodo.rol(uid, 'operario'),
             'horas_fichadas': fichada_data['total_horas'],
             'fichada_desglose': fichada_data['desglose'],
             'avance_desglose': avance_data['desglose'],
@@ -492,14 +612,10 @@ def generar_preview_unificado(obra_id, desde, hasta):
         if etapa_nombre_av in etapas_en_breakdown:
             continue
         # Buscar la etapa por nombre para conseguir id y porcentaje
-        etapa_obj = EtapaObra.query.filter_by(obra_id=obra_id, nombre=etapa_nombre_av).first()
-        eid = etapa_obj.id if etapa_obj else None
-        tareas_total = 0
-        tareas_completadas = 0
-        if etapa_obj:
-            tareas_all = etapa_obj.tareas.all() if hasattr(etapa_obj.tareas, 'all') else (etapa_obj.tareas or [])
-            tareas_total = len(tareas_all)
-            tareas_completadas = sum(1 for t in tareas_all if t.estado in ('completada', 'finalizada'))
+        eid = etapa_por_nombre.get(etapa_nombre_av)
+        conteo = conteo_etapas.get(eid) or {}
+        tareas_total = conteo.get('total', 0)
+        tareas_completadas = conteo.get('completadas', 0)
         etapas_extras.append({
             'etapa_id': eid,
             'etapa_nombre': etapa_nombre_av,
@@ -634,14 +750,14 @@ def generar_liquidacion_desde_fichadas(obra_id, desde, hasta, notas=None, commit
     if tarifa_default <= 0:
         return None, {'error': 'No se pudo determinar la tarifa hora. Configura el costo de mano de obra en el presupuesto.'}
 
-    operarios = buscar_operarios_obra(obra_id, desde, hasta)
-    if not operarios:
+    periodo = PeriodoMO(obra_id, desde, hasta)
+    if not periodo.operarios:
         return None, {'error': 'No hay operarios con fichadas/avances en el periodo seleccionado'}
 
     items_data = []
     operarios_sin_horas = []
-    for uid, usuario in operarios.items():
-        fichada_data = calcular_horas_fichadas_operario(obra_id, uid, desde, hasta)
+    for uid, usuario in periodo.operarios.items():
+        fichada_data = periodo.horas_fichadas(uid)
         horas = fichada_data['total_horas']
         if horas <= 0:
             operarios_sin_horas.append(usuario.nombre_completo)
@@ -696,6 +812,10 @@ def crear_liquidacion(obra_id, desde, hasta, items_data, notas=None, commit=True
     db.session.add(liq)
     db.session.flush()  # Obtener ID
 
+    # Horas informativas y modalidad de todos los operarios en una pasada
+    periodo = PeriodoMO(obra_id, desde, hasta,
+                        operario_ids=[item_data['operario_id'] for item_data in items_data])
+
     monto_total = Decimal('0')
     for item_data in items_data:
         operario_id = int(item_data['operario_id'])
@@ -708,7 +828,7 @@ def crear_liquidacion(obra_id, desde, hasta, items_data, notas=None, commit=True
 
         # Si no viene modalidad explícita, inferir del usuario
         if not modalidad:
-            op_user = Usuario.query.get(operario_id)
+            op_user = periodo.usuarios.get(operario_id)
             modalidad = (op_user.modalidad_pago or 'hora') if op_user else 'hora'
 
         # Si monto es 0 pero hay horas y tarifa, calcular
@@ -719,8 +839,8 @@ def crear_liquidacion(obra_id, desde, hasta, items_data, notas=None, commit=True
             monto = _q2(cantidad_liq * tarifa)
 
         # Recalcular horas informativas
-        avance = calcular_horas_avance_operario(obra_id, operario_id, desde, hasta)
-        fichada = calcular_horas_fichadas_operario(obra_id, operario_id, desde, hasta)
+        avance = periodo.horas_avance(operario_id)
+        fichada = periodo.horas_fichadas(operario_id)
 
         # Desglose por tarea (si viene del frontend)
         desglose = item_data.get('desglose_tareas')
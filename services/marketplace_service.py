@@ -18,10 +18,12 @@ from typing import Optional, List, Dict, Any
 from decimal import Decimal
 import os
 
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy import and_, func, desc
 from sqlalchemy.exc import SQLAlchemyError
 
 from services.base import BaseService, ValidationException, NotFoundException, ServiceException
+from services.busqueda_productos import buscar_productos
+from services.visitas_productos import registrar_visita
 from models import (
     Cart, CartItem, Order, OrderItem, OrderCommission,
     Product, ProductVariant, Category, Supplier, SupplierPayout,
@@ -1158,38 +1160,45 @@ class MarketplaceService(BaseService[Order]):
             limit: Máximo de resultados
 
         Returns:
-            Lista de productos que coinciden
+            Lista de productos que coinciden, por relevancia y más visitados
         """
-        search_query = Product.query.filter_by(estado='publicado')
-
-        # Filtro de texto
-        if query:
-            search_pattern = f"%{query}%"
-            search_query = search_query.filter(
-                or_(
-                    Product.nombre.ilike(search_pattern),
-                    Product.descripcion.ilike(search_pattern)
-                )
-            )
-
-        # Filtro de categoría
-        if category_id:
-            search_query = search_query.filter_by(category_id=category_id)
+        return self.search_products_page(
+            query=query, category_id=category_id, min_price=min_price,
+            max_price=max_price, limit=limit
+        )['productos']
 
-        # Filtros de precio (basados en las variantes)
-        if min_price is not None or max_price is not None:
-            search_query = search_query.join(ProductVariant)
-
-            if min_price is not None:
-                search_query = search_query.filter(ProductVariant.precio >= min_price)
+    def search_products_page(
+        self,
+        query: Optional[str] = None,
+        category_id: Optional[int] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        facetas: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Página de resultados de búsqueda (ver services/busqueda_productos).
 
-            if max_price is not None:
-                search_query = search_query.filter(ProductVariant.precio <= max_price)
+        Args:
+            query: Texto de búsqueda (nombre, descripción; sin acentos, por prefijo)
+            category_id: Filtrar por categoría
+            min_price: Precio mínimo
+            max_price: Precio máximo
+            limit: Resultados por página
+            cursor: Cursor de la página anterior ('siguiente')
+            facetas: Si es True, incluye total y conteos por categoría y rango de precio
 
-        # Ordenar por más visitados
-        search_query = search_query.order_by(desc(Product.visitas))
+        Returns:
+            Dict con productos, siguiente, total y facetas
+        """
+        if limit <= 0:
+            raise ValidationException("El límite debe ser mayor a 0")
 
-        return search_query.limit(limit).all()
+        return buscar_productos(
+            query=query, category_id=category_id, min_price=min_price,
+            max_price=max_price, limit=limit, cursor=cursor, facetas=facetas
+        )
 
     def get_product_with_variants(self, product_id: int) -> Product:
         """
@@ -1208,8 +1217,9 @@ class MarketplaceService(BaseService[Order]):
         if not product:
             raise NotFoundException('Product', product_id)
 
-        # Incrementar contador de visitas
-        product.increment_visits()
+        # La visita va al buffer (services/visitas_productos): la lectura no
+        # escribe la fila del producto
+        registrar_visita(product.id)
 
         # Las relaciones se cargan automáticamente vía lazy loading
         return product
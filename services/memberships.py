@@ -1,16 +1,40 @@
+"""Membresía y organización activas del usuario del request.
+
+La identidad del request (usuario, membresía, org, rol) se resuelve una sola
+vez en `load_membership_into_context` y queda en `g.identidad`; el resto
+(`get_current_org_id`, el hook de RLS, los context processors, el plan) la lee
+de ahí. Los datos de la membresía salen de un cache corto entre requests
+(MEMBERSHIP_CACHE_TTL, tag por usuario) que se invalida al commitear cualquier
+cambio de OrgMembership del usuario. Es solo con Redis: la invalidación llega a
+todos los workers por pub/sub. Sin Redis no hay cache local (un cambio de rol o
+una baja tardaría hasta el TTL en verse en los otros workers) y se consulta en
+cada request. El objeto ORM de la membresía se carga recién cuando alguien lo
+pide (`get_current_membership`).
+"""
 from __future__ import annotations
 
+import logging
+import os
+from dataclasses import dataclass
 from datetime import datetime
-from functools import wraps
+from functools import cached_property, wraps
 from typing import Iterable, Optional, Tuple
 
-from flask import current_app, g, redirect, request, session, url_for, flash
+from flask import current_app, g, has_app_context, redirect, request, session, url_for, flash
 from flask_login import current_user
 
 from sqlalchemy.orm.attributes import set_committed_value
 
+from config.cache_config import cache_query, invalidate_tags
 from models import OrgMembership, Usuario, db
 
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', '60'))
+# Más búsquedas de membresía en la base que esto en un request se loguean
+MEMBERSHIP_QUERIES_WARN = int(os.getenv('MEMBERSHIP_QUERIES_WARN', '3'))
+_SESSION_KEY_MEMBRESIAS = 'membresias_usuarios_modificados'
+
 
 def _membership_query(user_id: int) -> Iterable[OrgMembership]:
     return (
@@ -110,9 +134,16 @@ def _ensure_membership_from_legacy(usuario: Usuario) -> Tuple[Optional[OrgMember
     return None, False
 
 
+def _contar_consulta_membresia() -> None:
+    """Suma una búsqueda de membresía en la base al contador del request."""
+    if has_app_context():
+        g._consultas_membresia = g.get('_consultas_membresia', 0) + 1
+
+
 def ensure_active_membership_for_user(usuario: Usuario) -> Optional[OrgMembership]:
     """Public helper to reactivate or crear membresías según datos legados."""
 
+    _contar_consulta_membresia()
     membership, changed = _ensure_membership_from_legacy(usuario)
 
     if changed:
@@ -165,23 +196,75 @@ def initialize_membership_session(usuario: Usuario) -> Optional[str]:
     return url_for('auth.seleccionar_organizacion') if requires_selection else None
 
 
-def load_membership_into_context() -> None:
-    """Carga la membresía activa en el contexto de la petición."""
-    g.current_membership = None
-    g.current_org_id = None
+@dataclass
+class IdentidadRequest:
+    """Quién hace el request, resuelto una vez por request (queda en g.identidad)."""
+
+    user_id: int
+    membership_id: Optional[int]
+    org_id: Optional[int]
+    role: Optional[str]
+    status: Optional[str]
+    is_super_admin: bool = False
+
+    @property
+    def es_admin(self) -> bool:
+        return self.is_super_admin or (self.role or '').lower() in {'admin', 'administrador'}
+
+    def tiene_rol(self, rol: Optional[str]) -> bool:
+        return self.status == 'active' and (self.role or '').lower() == (rol or '').lower()
+
+    @cached_property
+    def membership(self) -> Optional[OrgMembership]:
+        return db.session.get(OrgMembership, self.membership_id) if self.membership_id else None
+
+    @cached_property
+    def organizacion(self):
+        from models import Organizacion
+        return db.session.get(Organizacion, self.org_id) if self.org_id else None
+
+    @property
+    def estado_plan(self) -> Tuple[str, int, bool]:
+        """(status, days_remaining, is_writable) de la org, como get_subscription_status.
+
+        Se recalcula solo si en el request cambiaron los campos del plan (p.ej.
+        al acreditar un pago)."""
+        org = self.organizacion
+        if org is None:
+            return 'suspended', 0, False
+        clave = (org.plan_tipo, org.fecha_fin_plan, getattr(org, 'contract_type', None),
+                 getattr(org, 'annual_service_due_date', None))
+        memo = self.__dict__.get('_estado_plan')
+        if memo is None or memo[0] != clave:
+            from services.plan_service import calcular_estado_suscripcion
+            memo = self.__dict__['_estado_plan'] = (clave, calcular_estado_suscripcion(org))
+        return memo[1]
+
+
+def _datos_membresia(membership: Optional[OrgMembership]) -> Optional[dict]:
+    if membership is None:
+        return None
+    return {'id': membership.id, 'org_id': membership.org_id,
+            'role': membership.role, 'status': membership.status}
 
-    if not current_user.is_authenticated:
-        return
 
-    membership_id = session.get('current_membership_id')
-    membership: Optional[OrgMembership] = None
+def _tag_usuario(user_id: int) -> str:
+    return f'membresias_usuario:{user_id}'
+
 
+@cache_query(ttl=MEMBERSHIP_CACHE_TTL, key_prefix='membresia_actual',
+             tags=lambda user_id, membership_id=None: [_tag_usuario(user_id)])
+def _membresia_cacheada(user_id: int, membership_id: Optional[int] = None) -> Optional[dict]:
+    """Datos de la membresía `membership_id` del usuario (no archivada), o de la
+    primera activa si no se indica."""
+    # Solo corre en un miss del cache: cuenta como consulta del request
+    _contar_consulta_membresia()
     if membership_id:
         membership = (
             OrgMembership.query
             .filter(
                 OrgMembership.id == membership_id,
-                OrgMembership.user_id == current_user.id,
+                OrgMembership.user_id == user_id,
                 db.or_(
                     OrgMembership.archived.is_(False),
                     OrgMembership.archived.is_(None),
@@ -189,40 +272,146 @@ def load_membership_into_context() -> None:
             )
             .first()
         )
+        return _datos_membresia(membership)
+
+    active = [m for m in _membership_query(user_id) if m.status == 'active']
+    return _datos_membresia(active[0]) if active else None
+
+
+def invalidar_membresias_usuario(*user_ids: int) -> None:
+    """Descarta el cache de membresía de esos usuarios (todos los workers)."""
+    if user_ids:
+        invalidate_tags(*(_tag_usuario(uid) for uid in user_ids))
+
+
+_hooks_membresias_registrados = False
+
+
+def registrar_hooks_membresias() -> None:
+    """Invalida el cache de membresías al commitear altas, bajas o cambios de
+    OrgMembership (idempotente)."""
+    global _hooks_membresias_registrados
+    if _hooks_membresias_registrados:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session, object_session
+
+    @event.listens_for(OrgMembership, 'after_insert')
+    @event.listens_for(OrgMembership, 'after_update')
+    @event.listens_for(OrgMembership, 'after_delete')
+    def _membresia_cambio(mapper, connection, target):
+        sesion = object_session(target)
+        if sesion is not None and target.user_id:
+            sesion.info.setdefault(_SESSION_KEY_MEMBRESIAS, set()).add(target.user_id)
+
+    @event.listens_for(Session, 'after_commit')
+    def _despues_de_commit(sesion):
+        user_ids = sesion.info.pop(_SESSION_KEY_MEMBRESIAS, None)
+        if user_ids:
+            invalidar_membresias_usuario(*user_ids)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _despues_de_rollback(sesion):
+        sesion.info.pop(_SESSION_KEY_MEMBRESIAS, None)
+
+    _hooks_membresias_registrados = True
+
+
+def registrar_instrumentacion_membresias(app) -> None:
+    """Reporta cuántas búsquedas de membresía en la base hizo cada request.
+
+    Las cuentan `_membresia_cacheada` (en un miss del cache) y
+    `ensure_active_membership_for_user`, sin listeners sobre el engine. Más de
+    MEMBERSHIP_QUERIES_WARN se loguea; con MEMBERSHIP_QUERY_HEADER=True en la
+    config, el conteo va en el header X-Membership-Queries.
+    """
+    @app.after_request
+    def _reportar_consultas_membresia(response):
+        consultas = consultas_membresia_request()
+        if app.config.get('MEMBERSHIP_QUERY_HEADER'):
+            response.headers['X-Membership-Queries'] = str(consultas)
+        if consultas > MEMBERSHIP_QUERIES_WARN:
+            logger.warning(f'[MEMBRESIAS] {request.method} {request.path}: '
+                           f'{consultas} consultas de membresía')
+        return response
+
+
+def consultas_membresia_request() -> int:
+    """Búsquedas de membresía en la base hechas en lo que va del request."""
+    return g.get('_consultas_membresia', 0) if has_app_context() else 0
+
+
+def identidad_actual() -> Optional[IdentidadRequest]:
+    if not has_app_context():
+        return None
+    return g.get('identidad')
+
+
+def load_membership_into_context() -> None:
+    """Carga la membresía activa en el contexto de la petición.
+
+    Si el contexto RLS ya se había resuelto en el request (p. ej. al cargar el
+    usuario) con otra org, se descarta y se reaplica con la que quedó.
+    """
+    _cargar_membresia()
+    try:
+        from middleware.rls_middleware import refrescar_contexto_rls
+        refrescar_contexto_rls(db.session)
+    except Exception:
+        pass
+
+
+def _cargar_membresia() -> None:
+    g.current_membership = None
+    g.current_org_id = None
+    g.identidad = None
+
+    if not current_user.is_authenticated:
+        return
+
+    membership_id = session.get('current_membership_id')
+    datos: Optional[dict] = None
 
-        if not membership or membership.status != 'active':
+    if membership_id:
+        datos = _membresia_cacheada(current_user.id, membership_id)
+
+        if not datos or datos['status'] != 'active':
             session.pop('current_membership_id', None)
             session.pop('current_org_id', None)
-            membership = None
+            datos = None
 
-    if membership is None:
-        memberships = list(_membership_query(current_user.id))
-        active = [m for m in memberships if m.status == 'active']
-        if active:
-            membership = active[0]
-            session['current_membership_id'] = membership.id
-            session['current_org_id'] = membership.org_id
-        else:
+    if datos is None:
+        datos = _membresia_cacheada(current_user.id)
+        if datos is None:
             fallback = ensure_active_membership_for_user(current_user)
             if fallback:
-                membership = fallback
-                session['current_membership_id'] = membership.id
-                session['current_org_id'] = membership.org_id
+                g.current_membership = fallback
+                datos = _datos_membresia(fallback)
+        if datos is not None:
+            session['current_membership_id'] = datos['id']
+            session['current_org_id'] = datos['org_id']
 
-    if membership is None:
+    if datos is None:
         return
 
-    g.current_membership = membership
-    g.current_org_id = membership.org_id
+    g.identidad = IdentidadRequest(
+        user_id=current_user.id,
+        membership_id=datos['id'],
+        org_id=datos['org_id'],
+        role=datos['role'],
+        status=datos['status'],
+        is_super_admin=bool(getattr(current_user, 'is_super_admin', False)),
+    )
+    g.current_org_id = datos['org_id']
 
     # Actualizar cache de selección para evitar re-prompt innecesarios
-    session['membership_selection_confirmed'] = membership.id
+    session['membership_selection_confirmed'] = datos['id']
 
     # Sincronizar atributos comunes del usuario con la membresía actual
     try:
-        set_committed_value(current_user, 'organizacion_id', membership.org_id)
+        set_committed_value(current_user, 'organizacion_id', datos['org_id'])
         if getattr(current_user, 'primary_org_id', None) is None:
-            set_committed_value(current_user, 'primary_org_id', membership.org_id)
+            set_committed_value(current_user, 'primary_org_id', datos['org_id'])
 
         # Fase 2a: el rol de la membresia se pasa TAL CUAL a Usuario.role
         # (su nombre coincide con custom_roles de la org). Antes esto colapsaba
@@ -235,7 +424,7 @@ def load_membership_into_context() -> None:
             'administrador': 'admin', 'project_manager': 'pm',
             'technical': 'tecnico', 'worker': 'operario',
         }
-        raw_role = (membership.role or 'operario').strip()
+        raw_role = (datos['role'] or 'operario').strip()
         canon = _ALIAS_LEGACY.get(raw_role.lower(), raw_role)
         set_committed_value(current_user, 'role', canon)
         set_committed_value(current_user, 'rol', Usuario._sync_rol_from_role(canon))
@@ -245,11 +434,19 @@ def load_membership_into_context() -> None:
 
 
 def get_current_membership() -> Optional[OrgMembership]:
-    return getattr(g, 'current_membership', None)
+    membership = getattr(g, 'current_membership', None)
+    if membership is None:
+        identidad = g.get('identidad')
+        if identidad is not None and identidad.membership_id:
+            membership = g.current_membership = identidad.membership
+    return membership
 
 
 def get_current_org_id() -> Optional[int]:
-    membership = get_current_membership()
+    identidad = g.get('identidad')
+    if identidad is not None and identidad.org_id:
+        return identidad.org_id
+    membership = getattr(g, 'current_membership', None)
     if membership:
         return membership.org_id
     return session.get('current_org_id')
@@ -283,6 +480,8 @@ def set_current_membership(membership_id: int) -> bool:
     if not current_user.is_authenticated:
         return False
 
+    _contar_consulta_membresia()
+
     membership = (
         OrgMembership.query
         .filter(
@@ -317,6 +516,22 @@ def set_current_membership(membership_id: int) -> bool:
     session['current_membership_id'] = membership.id
     session['current_org_id'] = membership.org_id
     session['membership_selection_confirmed'] = membership.id
+    # Lo que queda del request ya trabaja con la membresía nueva
+    g.current_membership = membership
+    g.current_org_id = membership.org_id
+    g.identidad = IdentidadRequest(
+        user_id=current_user.id,
+        membership_id=membership.id,
+        org_id=membership.org_id,
+        role=membership.role,
+        status=membership.status,
+        is_super_admin=bool(getattr(current_user, 'is_super_admin', False)),
+    )
+    try:
+        from middleware.rls_middleware import invalidar_contexto_rls
+        invalidar_contexto_rls(db.session)
+    except Exception:
+        pass
     return True
 
 
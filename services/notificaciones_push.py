@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""Contador de no leídas y canal push de notificaciones.
+
+Cada pestaña abierta consultaba /notificaciones/api/count y /api/recientes
+cada 60s: un COUNT sobre notificaciones más la lista, por usuario y por
+pestaña. Ahora:
+
+  - Contador por usuario (`no_leidas`): vive en Redis (notif:no_leidas:<uid>)
+    y lo ajustan los hooks de Notificacion al commitear altas, lecturas y
+    bajas. Si la clave no está (TTL, Redis reiniciado) se siembra con un COUNT
+    y se vuelve a mantener por deltas. Los UPDATE masivos (marcar todas como
+    leídas) no pasan por los hooks: llaman a `recontar()`.
+  - Canal (`esperar_eventos`): long-poll. Cada cambio publica un evento con
+    versión creciente por usuario; el cliente pide `?v=<última versión>` y la
+    respuesta sale en cuanto hay algo nuevo o a los NOTIF_ESPERA_SEGUNDOS.
+    Con Redis los eventos van por pub/sub (sirve entre workers y desde
+    Celery).
+  - Sin Redis no hay nada compartido entre workers y Celery: un contador en
+    memoria se desviaría en cada proceso. `no_leidas` vuelve al COUNT y el
+    canal responde `polling: true` para que el cliente siga con el polling
+    de siempre cada NOTIF_POLL_SEGUNDOS.
+
+Long-poll y no SSE: los workers de gunicorn son sync con pocos threads y un
+stream abierto por pestaña los agotaría. Por eso también hay un cupo de
+esperas por proceso (NOTIF_MAX_ESPERAS): sin cupo la respuesta sale en el acto
+con `reintentar_en` y el cliente vuelve a preguntar más tarde (no antes que el
+polling anterior), igual sin tocar la base porque el contador sale de Redis.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from config.cache_config import get_cache
+
+logger = logging.getLogger(__name__)
+
+# Cuánto retiene el servidor un long-poll sin novedades
+NOTIF_ESPERA_SEGUNDOS = int(os.getenv('NOTIF_ESPERA_SEGUNDOS', '25'))
+# Long-polls esperando a la vez por proceso; el resto responde en el acto
+NOTIF_MAX_ESPERAS = max(1, int(os.getenv('NOTIF_MAX_ESPERAS', '2')))
+# Intervalo del polling sin Redis (el mismo que tenía la campanita)
+NOTIF_POLL_SEGUNDOS = int(os.getenv('NOTIF_POLL_SEGUNDOS', '60'))
+# Cada cuánto vuelve a preguntar un cliente que no consiguió cupo: nunca más
+# seguido que el polling
+NOTIF_REINTENTO_SEGUNDOS = max(NOTIF_POLL_SEGUNDOS,
+                               int(os.getenv('NOTIF_REINTENTO_SEGUNDOS', '60')))
+# Vida del contador sembrado: acota cualquier desvío que se escape de los hooks
+NOTIF_CONTADOR_TTL = int(os.getenv('NOTIF_CONTADOR_TTL', '3600'))
+# Eventos que se guardan por usuario para clientes que vuelven con `v` viejo
+NOTIF_EVENTOS_MAX = 50
+
+_SESSION_KEY_NOTIF = '_notificaciones_cambios'
+
+_esperas = threading.BoundedSemaphore(NOTIF_MAX_ESPERAS)
+
+
+class BrokerLocal:
+    """Contadores y eventos en memoria del proceso (tests / sin Redis).
+
+    No es `compartido`: otros workers y Celery no ven sus contadores ni sus
+    eventos, así que fuera de los tests solo sirve para el modo polling.
+    """
+
+    def __init__(self, compartido=False):
+        self.compartido = compartido
+        self._cond = threading.Condition()
+        self._contadores = {}
+        self._versiones = {}
+        self._eventos = {}
+
+    def leer_contador(self, usuario_id):
+        with self._cond:
+            return self._contadores.get(usuario_id)
+
+    def sembrar_contador(self, usuario_id, valor):
+        with self._cond:
+            self._contadores.setdefault(usuario_id, valor)
+            return self._contadores[usuario_id]
+
+    def sumar_contador(self, usuario_id, delta):
+        with self._cond:
+            if usuario_id not in self._contadores:
+                return None
+            self._contadores[usuario_id] = max(0, self._contadores[usuario_id] + delta)
+            return self._contadores[usuario_id]
+
+    def borrar_contador(self, usuario_id):
+        with self._cond:
+            self._contadores.pop(usuario_id, None)
+
+    def publicar(self, usuario_id, evento):
+        with self._cond:
+            version = self._versiones.get(usuario_id, 0) + 1
+            self._versiones[usuario_id] = version
+            self._eventos.setdefault(usuario_id, deque(maxlen=NOTIF_EVENTOS_MAX)).append(
+                dict(evento, v=version))
+            self._cond.notify_all()
+            return version
+
+    def eventos_desde(self, usuario_id, version):
+        with self._cond:
+            actual = self._versiones.get(usuario_id, 0)
+            return actual, _filtrar(self._eventos.get(usuario_id, ()), version, actual)
+
+    def esperar(self, usuario_id, version, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._versiones.get(usuario_id, 0) != version, timeout)
+        return self.eventos_desde(usuario_id, version)
+
+
+class BrokerRedis:
+    """Contadores y eventos en Redis; los long-polls se despiertan por pub/sub."""
+
+    # INCRBY solo si la clave existe: si expiró, la próxima lectura resiembra
+    _LUA_SUMAR = ("if redis.call('exists', KEYS[1]) == 1 then "
+                  "local v = redis.call('incrby', KEYS[1], ARGV[1]) "
+                  "if v < 0 then redis.call('set', KEYS[1], 0, 'KEEPTTL') v = 0 end "
+                  "return v end return false")
+
+    compartido = True
+
+    def __init__(self, client):
+        self.client = client
+        self._sumar = client.register_script(self._LUA_SUMAR)
+
+    @staticmethod
+    def _claves(usuario_id):
+        return (f'notif:no_leidas:{usuario_id}', f'notif:version:{usuario_id}',
+                f'notif:eventos:{usuario_id}', f'obyra:notif:{usuario_id}')
+
+    def leer_contador(self, usuario_id):
+        valor = self.client.get(self._claves(usuario_id)[0])
+        return int(valor) if valor is not None else None
+
+    def sembrar_contador(self, usuario_id, valor):
+        clave = self._claves(usuario_id)[0]
+        self.client.set(clave, valor, nx=True, ex=NOTIF_CONTADOR_TTL)
+        return self.leer_contador(usuario_id)
+
+    def sumar_contador(self, usuario_id, delta):
+        valor = self._sumar(keys=[self._claves(usuario_id)[0]], args=[delta])
+        return int(valor) if valor is not None else None
+
+    def borrar_contador(self, usuario_id):
+        self.client.delete(self._claves(usuario_id)[0])
+
+    def publicar(self, usuario_id, evento):
+        _, clave_version, clave_eventos, canal = self._claves(usuario_id)
+        version = self.client.incr(clave_version)
+        pipe = self.client.pipeline()
+        pipe.lpush(clave_eventos, json.dumps(dict(evento, v=version), default=str))
+        pipe.ltrim(clave_eventos, 0, NOTIF_EVENTOS_MAX - 1)
+        pipe.expire(clave_eventos, 86400)
+        pipe.expire(clave_version, 86400)
+        pipe.publish(canal, version)
+        pipe.execute()
+        return version
+
+    def eventos_desde(self, usuario_id, version):
+        _, clave_version, clave_eventos, _ = self._claves(usuario_id)
+        actual = int(self.client.get(clave_version) or 0)
+        if actual == version:
+            return actual, []
+        guardados = [json.loads(e) for e in self.client.lrange(clave_eventos, 0, -1)]
+        return actual, _filtrar(reversed(guardados), version, actual)
+
+    def esperar(self, usuario_id, version, timeout):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Suscribirse antes de mirar la versión: no se pierde un evento
+            # publicado entre la lectura y la espera
+            pubsub.subscribe(self._claves(usuario_id)[3])
+            actual, eventos = self.eventos_desde(usuario_id, version)
+            if actual != version:
+                return actual, eventos
+            fin = time.monotonic() + timeout
+            while (resta := fin - time.monotonic()) > 0:
+                mensaje = pubsub.get_message(timeout=min(resta, 1.0))
+                if mensaje and mensaje.get('type') == 'message':
+                    break
+            return self.eventos_desde(usuario_id, version)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
+def _filtrar(eventos, version, actual):
+    """Eventos posteriores a `version`; None si hay un hueco (el cliente debe
+    recargar la lista completa)."""
+    if version is None or version > actual:
+        return None
+    nuevos = [e for e in eventos if e['v'] > version]
+    if len(nuevos) != actual - version:
+        return None
+    return nuevos
+
+
+_broker_local = BrokerLocal()
+_broker_redis = None
+
+
+def broker():
+    """BrokerRedis si el cache Redis está activo, si no el broker en memoria."""
+    global _broker_redis
+    cache = get_cache()
+    if not cache.is_enabled():
+        return _broker_local
+    if _broker_redis is None or _broker_redis.client is not cache.get_client():
+        _broker_redis = BrokerRedis(cache.get_client())
+    return _broker_redis
+
+
+def no_leidas(usuario_id):
+    """Notificaciones no leídas del usuario, sin COUNT salvo para sembrar (o
+    sin Redis, donde no hay contador compartido)."""
+    from models.core import Notificacion
+
+    try:
+        if not broker().compartido:
+            return Notificacion.contar_no_leidas(usuario_id)
+        valor = broker().leer_contador(usuario_id)
+        if valor is not None:
+            return valor
+        return broker().sembrar_contador(usuario_id, Notificacion.contar_no_leidas(usuario_id))
+    except Exception as e:
+        logger.warning(f'[NOTIF] Contador no disponible para {usuario_id}: {e}')
+        return Notificacion.contar_no_leidas(usuario_id)
+
+
+def recontar(usuario_id):
+    """Descarta el contador (lo resiembra la próxima lectura) y avisa al
+    cliente. Para cambios que no pasan por los hooks (UPDATE masivos)."""
+    try:
+        broker().borrar_contador(usuario_id)
+        broker().publicar(usuario_id, {'nuevas': [], 'recontar': True})
+    except Exception as e:
+        logger.warning(f'[NOTIF] No se pudo recontar {usuario_id}: {e}')
+
+
+def esperar_eventos(usuario_id, version, espera=None):
+    """Respuesta del long-poll: {'v', 'eventos', 'resync', 'no_leidas'}.
+
+    Sin `version` (primera llamada) o con un hueco en los eventos vuelve
+    `resync: True`: el cliente recarga /api/recientes. Sin cupo de espera,
+    responde en el acto con `reintentar_en`. Sin broker compartido responde
+    `polling: True` y el cliente pasa a recargar cada `reintentar_en`.
+    """
+    espera = NOTIF_ESPERA_SEGUNDOS if espera is None else espera
+    respuesta = {}
+    if not broker().compartido:
+        return {'v': None, 'eventos': [], 'resync': False, 'polling': True,
+                'reintentar_en': NOTIF_POLL_SEGUNDOS, 'no_leidas': no_leidas(usuario_id)}
+    if version is None:
+        actual, eventos = broker().eventos_desde(usuario_id, None)
+    elif _esperas.acquire(blocking=False):
+        try:
+            actual, eventos = broker().esperar(usuario_id, version, espera)
+        finally:
+            _esperas.release()
+    else:
+        actual, eventos = broker().eventos_desde(usuario_id, version)
+        respuesta['reintentar_en'] = NOTIF_REINTENTO_SEGUNDOS
+    respuesta.update({
+        'v': actual,
+        'eventos': eventos or [],
+        'resync': eventos is None,
+        'no_leidas': no_leidas(usuario_id),
+    })
+    return respuesta
+
+
+def _publicar_cambios(cambios):
+    """Aplica los deltas de un commit y publica un evento por usuario."""
+    if not broker().compartido:
+        return  # modo polling: nadie escucha eventos de este proceso
+    for usuario_id, cambio in cambios.items():
+        try:
+            if cambio['delta']:
+                broker().sumar_contador(usuario_id, cambio['delta'])
+            broker().publicar(usuario_id, {'nuevas': cambio['nuevas'], 'delta': cambio['delta']})
+        except Exception as e:
+            logger.warning(f'[NOTIF] No se pudo publicar para {usuario_id}: {e}')
+
+
+_hooks_notificaciones_registrados = False
+
+
+def registrar_hooks_notificaciones():
+    """Mantiene el contador y publica eventos al commitear altas, lecturas y
+    bajas de Notificacion (idempotente). Lo del commit se junta en
+    session.info y se descarta en un rollback."""
+    global _hooks_notificaciones_registrados
+    if _hooks_notificaciones_registrados:
+        return
+    from sqlalchemy import event, inspect, select
+    from sqlalchemy.orm import Session, object_session
+    from models.core import Notificacion
+
+    def _fila_guardada(connection, target):
+        tabla = Notificacion.__table__
+        return connection.execute(
+            select(tabla.c.usuario_id, tabla.c.leida).where(tabla.c.id == target.id)).first()
+
+    def _anotar(target, delta, nueva=None, usuario_id=None):
+        sesion = object_session(target)
+        usuario_id = usuario_id or target.usuario_id
+        if sesion is None or not usuario_id:
+            return
+        cambios = sesion.info.setdefault(_SESSION_KEY_NOTIF, {})
+        cambio = cambios.setdefault(usuario_id, {'delta': 0, 'nuevas': []})
+        cambio['delta'] += delta
+        if nueva is not None:
+            cambio['nuevas'].append(nueva)
+
+    @event.listens_for(Notificacion, 'after_insert')
+    def _notificacion_creada(mapper, connection, target):
+        # to_dict acá: después del commit los atributos están expirados
+        _anotar(target, 0 if target.leida else 1, nueva=target.to_dict())
+
+    @event.listens_for(Notificacion, 'before_update')
+    def _antes_de_modificar(mapper, connection, target):
+        # Con la notificación expirada (tras un commit) el historial no trae
+        # el valor anterior: se lee la fila antes del UPDATE
+        estado = inspect(target)
+        if estado.attrs.leida.history.has_changes():
+            estado.info['_notif_antes'] = _fila_guardada(connection, target)
+
+    @event.listens_for(Notificacion, 'after_update')
+    def _notificacion_modificada(mapper, connection, target):
+        antes = inspect(target).info.pop('_notif_antes', None)
+        if antes is not None and bool(antes.leida) != bool(target.leida):
+            _anotar(target, -1 if target.leida else 1)
+
+    @event.listens_for(Notificacion, 'before_delete')
+    def _antes_de_borrar(mapper, connection, target):
+        inspect(target).info['_notif_antes'] = _fila_guardada(connection, target)
+
+    @event.listens_for(Notificacion, 'after_delete')
+    def _notificacion_borrada(mapper, connection, target):
+        antes = inspect(target).info.pop('_notif_antes', None)
+        if antes is not None and not antes.leida:
+            _anotar(target, -1, usuario_id=antes.usuario_id)
+
+    @event.listens_for(Session, 'after_commit')
+    def _despues_de_commit(sesion):
+        cambios = sesion.info.pop(_SESSION_KEY_NOTIF, None)
+        if cambios:
+            _publicar_cambios(cambios)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _despues_de_rollback(sesion):
+        sesion.info.pop(_SESSION_KEY_NOTIF, None)
+
+    _hooks_notificaciones_registrados = True
@@ -0,0 +1,414 @@
+"""
+Motor de sincronización de /api/offline.
+
+sync-batch (`aplicar_lote`)
+---------------------------
+Los equipos en obra reintentan el lote entero cuando se corta la conexión, así
+que cada operación con `offline_id` queda registrada en sync_operaciones_offline
+y un reintento devuelve el resultado original (`duplicado: True`) en vez de
+crear otro TareaAvance. Por lote:
+
+1. los offline_id ya aplicados se leen en una consulta;
+2. todas las tareas referenciadas (filtradas por org) en otra;
+3. cada operación corre en su propio savepoint junto con su fila del registro:
+   una operación que falla se revierte sola y el resto del lote sigue;
+4. un solo commit al final.
+
+Dos reintentos concurrentes del mismo offline_id chocan en la UNIQUE del
+registro; el que pierde se informa como duplicado. Cada lote devuelve sus
+tiempos (resolver / aplicar / commit) y se loguea.
+
+Pulls incrementales (`leer_cursor` / `desde_cursor` / `cursor_respuesta`)
+------------------------------------------------------------------------
+Las respuestas de mis-obras, mis-tareas, tareas-obra e inventario-basico
+traen un `cursor`: el updated_at más nuevo de lo que devolvieron (o el cursor
+recibido si no hubo cambios). Con `?since=<cursor>` el cliente pide solo lo
+que cambió, más los `eliminados` (sync_tombstones y obras dadas de baja).
+El filtro se retrocede OFFLINE_SYNC_SOLAPE_SEGUNDOS para no perder filas de
+transacciones que commitearon tarde; el cliente hace upsert por id.
+
+Como el cursor sale de los datos y no del reloj, dos pulls sin cambios dan
+exactamente la misma respuesta y el ETag corta en 304. Un cursor más viejo
+que OFFLINE_TOMBSTONE_DIAS (lo que se guardan los tombstones) se trata como
+pull completo (`incremental: false`): el cliente reemplaza su copia.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy.exc import IntegrityError
+
+from config.cache_config import cache_query
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_SYNC_SOLAPE_SEGUNDOS = int(os.getenv('OFFLINE_SYNC_SOLAPE_SEGUNDOS', '120'))
+# Retención de tombstones y del registro de offline_id (purgar_registros_sync)
+OFFLINE_TOMBSTONE_DIAS = int(os.getenv('OFFLINE_TOMBSTONE_DIAS', '30'))
+OFFLINE_SYNC_STATUS_TTL = int(os.getenv('OFFLINE_SYNC_STATUS_TTL', '60'))
+# Operaciones por request de sync-batch; el resto se rechaza sin aplicar
+OFFLINE_SYNC_MAX_OPERACIONES = int(os.getenv('OFFLINE_SYNC_MAX_OPERACIONES', '500'))
+
+OPERACIONES = ('CREATE_AVANCE', 'UPDATE_TAREA')
+
+
+class OperacionInvalida(Exception):
+    """La operación no se puede aplicar (tarea ajena, datos faltantes...)."""
+
+
+def _decimal(valor, campo):
+    if valor in (None, ''):
+        return None
+    try:
+        return Decimal(str(valor))
+    except (InvalidOperation, ValueError):
+        raise OperacionInvalida(f'{campo} inválido')
+
+
+def _offline_id(op_data):
+    valor = op_data.get('offline_id')
+    return str(valor)[:64] if valor not in (None, '') else None
+
+
+def _tarea_id(op_type, op_data):
+    valor = op_data.get('tarea_id') if op_type == 'CREATE_AVANCE' else op_data.get('id')
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _tareas_de_la_org(tarea_ids, org_id):
+    """{id: TareaEtapa} de las tareas pedidas que pertenecen a la org (una consulta)."""
+    from models.projects import EtapaObra, Obra, TareaEtapa
+
+    if not tarea_ids:
+        return {}
+    tareas = (
+        TareaEtapa.query.join(EtapaObra).join(Obra)
+        .filter(TareaEtapa.id.in_(tarea_ids), Obra.organizacion_id == org_id)
+        .all()
+    )
+    return {t.id: t for t in tareas}
+
+
+def _ya_aplicadas(offline_ids, usuario_id):
+    from models.projects import SyncOperacionOffline
+
+    if not offline_ids:
+        return {}
+    filas = SyncOperacionOffline.query.filter(
+        SyncOperacionOffline.usuario_id == usuario_id,
+        SyncOperacionOffline.offline_id.in_(offline_ids),
+    ).all()
+    return {f.offline_id: f for f in filas}
+
+
+def _crear_avance(tarea, op_data, usuario_id):
+    from models.projects import TareaAvance
+
+    cantidad = _decimal(op_data.get('cantidad_ingresada'), 'cantidad_ingresada') or Decimal('0')
+    unidad = op_data.get('unidad') or tarea.unidad
+    avance = TareaAvance(
+        tarea_id=tarea.id,
+        user_id=usuario_id,
+        cantidad=cantidad,
+        unidad=unidad,
+        cantidad_ingresada=cantidad,
+        unidad_ingresada=unidad,
+        horas=_decimal(op_data.get('horas'), 'horas'),
+        notas=op_data.get('descripcion') or None,
+        status='pendiente',
+    )
+    db.session.add(avance)
+
+    porcentaje = _decimal(op_data.get('porcentaje'), 'porcentaje')
+    if porcentaje:
+        tarea.porcentaje_avance = porcentaje
+        if porcentaje >= 100:
+            tarea.estado = 'completada'
+        elif porcentaje > 0:
+            tarea.estado = 'en_curso'
+    db.session.flush()
+    return avance.id
+
+
+def _actualizar_tarea(tarea, op_data):
+    if 'estado' in op_data:
+        tarea.estado = op_data['estado']
+    if 'porcentaje_avance' in op_data:
+        tarea.porcentaje_avance = _decimal(op_data['porcentaje_avance'], 'porcentaje_avance')
+    db.session.flush()
+    return tarea.id
+
+
+def aplicar_lote(operaciones, org_id, usuario_id):
+    """Aplica las operaciones de un sync-batch y commitea una vez.
+
+    Returns:
+        (results, timing_ms): un resultado por operación, en orden
+        ({offline_id, success, server_id?, duplicado?, error?}) y los tiempos
+        del lote.
+    """
+    from models.projects import SyncOperacionOffline
+
+    t0 = time.perf_counter()
+    operaciones = [op for op in (operaciones or []) if isinstance(op, dict)]
+    excedentes = operaciones[OFFLINE_SYNC_MAX_OPERACIONES:]
+    operaciones = operaciones[:OFFLINE_SYNC_MAX_OPERACIONES]
+
+    normalizadas = []
+    for op in operaciones:
+        op_type = op.get('type')
+        op_data = op.get('data') or {}
+        normalizadas.append((op_type, op_data, _offline_id(op_data), _tarea_id(op_type, op_data)))
+
+    previas = _ya_aplicadas({oid for _, _, oid, _ in normalizadas if oid}, usuario_id)
+    tareas = _tareas_de_la_org({tid for _, _, _, tid in normalizadas if tid}, org_id)
+    t_resuelto = time.perf_counter()
+
+    results = []
+    vistas = {}  # offline_id -> resultado dentro de este lote
+    for op_type, op_data, offline_id, tarea_id in normalizadas:
+        if offline_id and offline_id in previas:
+            results.append({'offline_id': offline_id, 'success': True,
+                            'server_id': previas[offline_id].server_id, 'duplicado': True})
+            continue
+        if offline_id and offline_id in vistas:
+            results.append({**vistas[offline_id], 'duplicado': True})
+            continue
+
+        resultado = {'offline_id': offline_id}
+        try:
+            if op_type not in OPERACIONES:
+                raise OperacionInvalida(f'Operación desconocida: {op_type}')
+            tarea = tareas.get(tarea_id)
+            if tarea is None:
+                raise OperacionInvalida('Tarea no encontrada')
+
+            with db.session.begin_nested():
+                if op_type == 'CREATE_AVANCE':
+                    server_id = _crear_avance(tarea, op_data, usuario_id)
+                else:
+                    server_id = _actualizar_tarea(tarea, op_data)
+                if offline_id:
+                    db.session.add(SyncOperacionOffline(
+                        usuario_id=usuario_id, organizacion_id=org_id,
+                        offline_id=offline_id, tipo=op_type, server_id=server_id,
+                    ))
+                    db.session.flush()
+            resultado.update(success=True, server_id=server_id)
+        except IntegrityError:
+            # Otro request aplicó el mismo offline_id mientras tanto
+            previa = _ya_aplicadas({offline_id}, usuario_id).get(offline_id) if offline_id else None
+            if previa is not None:
+                resultado.update(success=True, server_id=previa.server_id, duplicado=True)
+            else:
+                resultado.update(success=False, error='Conflicto de integridad')
+        except OperacionInvalida as exc:
+            resultado.update(success=False, error=str(exc))
+        except Exception as exc:
+            logger.warning(f'[OFFLINE] operación {op_type} ({offline_id}) falló: {exc}')
+            resultado.update(success=False, error='Error aplicando la operación')
+
+        if offline_id and resultado['success']:
+            vistas[offline_id] = resultado
+        results.append(resultado)
+
+    for op in excedentes:
+        results.append({'offline_id': _offline_id(op.get('data') or {}), 'success': False,
+                        'error': 'Lote demasiado grande, reenviar'})
+    t_aplicado = time.perf_counter()
+
+    db.session.commit()
+    t_fin = time.perf_counter()
+
+    timing = {
+        'resolver': round((t_resuelto - t0) * 1000, 1),
+        'aplicar': round((t_aplicado - t_resuelto) * 1000, 1),
+        'commit': round((t_fin - t_aplicado) * 1000, 1),
+        'total': round((t_fin - t0) * 1000, 1),
+    }
+    duplicadas = sum(1 for r in results if r.get('duplicado'))
+    fallidas = sum(1 for r in results if not r['success'])
+    logger.info(f'[OFFLINE] sync-batch org {org_id} usuario {usuario_id}: {len(results)} ops, '
+                f'{duplicadas} duplicadas, {fallidas} fallidas en {timing["total"]}ms '
+                f'(resolver {timing["resolver"]}, aplicar {timing["aplicar"]}, commit {timing["commit"]})')
+    return results, timing
+
+
+def leer_cursor(valor, alcance=None):
+    """`?since=` del cliente -> datetime UTC naive, tal cual.
+
+    None si no vino o si es de otro alcance (otro usuario / org en el mismo
+    dispositivo): pull completo. ValueError si no es una fecha ISO.
+    """
+    if not valor:
+        return None
+    momento, _, alcance_cursor = str(valor).partition('~')
+    if alcance is not None and alcance_cursor != str(alcance):
+        return None
+    momento = datetime.fromisoformat(momento.replace('Z', '+00:00'))
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    return momento
+
+
+def desde_cursor(cursor):
+    """Desde cuándo filtrar para ese cursor (con solape); None = pull completo.
+
+    Un cursor anterior a la retención de tombstones también da pull completo:
+    los borrados de entonces ya no se pueden informar.
+    """
+    if cursor is None:
+        return None
+    if cursor < datetime.utcnow() - timedelta(days=OFFLINE_TOMBSTONE_DIAS):
+        return None
+    return cursor - timedelta(seconds=OFFLINE_SYNC_SOLAPE_SEGUNDOS)
+
+
+def parse_cursor(valor):
+    """`?since=` -> desde cuándo filtrar (leer_cursor + desde_cursor)."""
+    return desde_cursor(leer_cursor(valor))
+
+
+def cursor_respuesta(*momentos, alcance=None):
+    """Cursor de la respuesta: el más nuevo de los momentos dados (None si no
+    hay), con el alcance pegado (`<iso>~<alcance>`)."""
+    vigentes = [m for m in momentos if m is not None]
+    if not vigentes:
+        return None
+    cursor = max(vigentes).isoformat()
+    return f'{cursor}~{alcance}' if alcance is not None else cursor
+
+
+def tombstones(org_id, entidad, desde, usuario_id=None):
+    """[(entidad_id, deleted_at)] borrados desde `desde`: los de la org y, si se
+    indica usuario, también los que solo lo afectan a él."""
+    from models.projects import SyncTombstone
+
+    if not org_id or desde is None:
+        return []
+    query = SyncTombstone.query.with_entities(SyncTombstone.entidad_id, SyncTombstone.deleted_at).filter(
+        SyncTombstone.organizacion_id == org_id,
+        SyncTombstone.entidad == entidad,
+        SyncTombstone.deleted_at >= desde,
+    )
+    if usuario_id is None:
+        query = query.filter(SyncTombstone.usuario_id.is_(None))
+    else:
+        query = query.filter(db.or_(SyncTombstone.usuario_id.is_(None),
+                                    SyncTombstone.usuario_id == usuario_id))
+    return query.all()
+
+
+_hooks_tombstones_registrados = False
+
+
+def registrar_hooks_tombstones():
+    """Anota en sync_tombstones los borrados de obras, tareas, items de
+    inventario y asignaciones de tareas (idempotente).
+
+    Se escribe con la misma conexión del flush, así el tombstone se commitea o
+    revierte junto con el borrado. Los DELETE masivos (query.delete()) y los
+    ON DELETE CASCADE de la base no pasan por acá.
+    """
+    global _hooks_tombstones_registrados
+    if _hooks_tombstones_registrados:
+        return
+    from sqlalchemy import event, select
+    from models.inventory import ItemInventario
+    from models.projects import EtapaObra, Obra, SyncTombstone, TareaEtapa, TareaResponsables
+
+    tabla = SyncTombstone.__table__
+
+    def _anotar(connection, org_id, entidad, entidad_id, usuario_id=None):
+        # Un tombstone por (entidad, entidad_id): si ya hay uno se actualiza la
+        # fecha. El de toda la org reemplaza a los de un usuario (al borrar una
+        # tarea también se borran sus asignaciones en el mismo flush).
+        if not (org_id and entidad_id):
+            return
+        misma = (tabla.c.organizacion_id == org_id, tabla.c.entidad == entidad,
+                 tabla.c.entidad_id == entidad_id)
+        ahora = datetime.utcnow()
+        if usuario_id is None:
+            connection.execute(tabla.delete().where(*misma, tabla.c.usuario_id.isnot(None)))
+            alcance = tabla.c.usuario_id.is_(None)
+        else:
+            alcance = db.or_(tabla.c.usuario_id.is_(None), tabla.c.usuario_id == usuario_id)
+        existente = connection.execute(
+            select(tabla.c.id, tabla.c.usuario_id).where(*misma, alcance)
+            .order_by(tabla.c.usuario_id.is_(None).desc()).limit(1)
+        ).first()
+        if existente is not None:
+            connection.execute(tabla.update().where(tabla.c.id == existente.id).values(deleted_at=ahora))
+            return
+        connection.execute(tabla.insert().values(
+            organizacion_id=org_id, entidad=entidad, entidad_id=entidad_id,
+            usuario_id=usuario_id, deleted_at=ahora,
+        ))
+
+    def _org_de_etapa(connection, etapa_id):
+        return connection.execute(
+            select(Obra.organizacion_id).join(EtapaObra, EtapaObra.obra_id == Obra.id)
+            .where(EtapaObra.id == etapa_id)
+        ).scalar()
+
+    @event.listens_for(Obra, 'after_delete')
+    def _obra_borrada(mapper, connection, target):
+        _anotar(connection, target.organizacion_id, 'obra', target.id)
+
+    @event.listens_for(TareaEtapa, 'after_delete')
+    def _tarea_borrada(mapper, connection, target):
+        _anotar(connection, _org_de_etapa(connection, target.etapa_id), 'tarea', target.id)
+
+    @event.listens_for(TareaResponsables, 'after_delete')
+    def _asignacion_borrada(mapper, connection, target):
+        etapa_id = connection.execute(
+            select(TareaEtapa.etapa_id).where(TareaEtapa.id == target.tarea_id)
+        ).scalar()
+        if etapa_id:
+            _anotar(connection, _org_de_etapa(connection, etapa_id), 'tarea',
+                    target.tarea_id, usuario_id=target.user_id)
+
+    @event.listens_for(ItemInventario, 'after_delete')
+    def _item_borrado(mapper, connection, target):
+        _anotar(connection, target.organizacion_id, 'item', target.id)
+
+    _hooks_tombstones_registrados = True
+
+
+def purgar_registros_sync(dias=None):
+    """Borra tombstones y offline_id aplicados más viejos que la retención."""
+    from models.projects import SyncOperacionOffline, SyncTombstone
+
+    limite = datetime.utcnow() - timedelta(days=dias or OFFLINE_TOMBSTONE_DIAS)
+    tombstones_borrados = SyncTombstone.query.filter(
+        SyncTombstone.deleted_at < limite).delete(synchronize_session=False)
+    operaciones_borradas = SyncOperacionOffline.query.filter(
+        SyncOperacionOffline.created_at < limite).delete(synchronize_session=False)
+    db.session.commit()
+    return {'tombstones': tombstones_borrados, 'operaciones': operaciones_borradas}
+
+
+@cache_query(ttl=OFFLINE_SYNC_STATUS_TTL, key_prefix='offline_sync_status', local_fallback=True)
+def conteos_sync(org_id, usuario_id):
+    """Conteos de /api/offline/sync-status (cacheados OFFLINE_SYNC_STATUS_TTL)."""
+    from models.inventory import ItemInventario
+    from models.projects import Obra, TareaEtapa, TareaResponsables
+
+    tareas = db.session.query(TareaEtapa).join(TareaResponsables).filter(
+        TareaResponsables.user_id == usuario_id,
+        TareaEtapa.estado.in_(['pendiente', 'en_curso'])
+    ).count()
+    return {
+        'obras': Obra.query.filter(
+            Obra.organizacion_id == org_id,
+            Obra.deleted_at.is_(None),
+        ).count(),
+        'tareas_pendientes': tareas,
+        'inventario': ItemInventario.query.filter_by(organizacion_id=org_id, activo=True).count(),
+    }
@@ -13,11 +13,42 @@ corren a la vez POR PROCESO (gunicorn) con un semaforo:
 Cupo configurable por env PDF_MAX_CONCURRENT (default 2 por proceso). El semaforo es
 per-process: con N workers de gunicorn, el maximo real de renders concurrentes es
 N * PDF_MAX_CONCURRENT, pero cada exceso se rechaza rapido en vez de encolarse.
+
+Cache y jobs (render_pdf_cacheado):
+  - El PDF se guarda en storage bajo un hash del HTML renderizado (que ya trae el
+    branding: logo, colores, nombre de la org) + opciones de WeasyPrint + version.
+    Volver a bajar un presupuesto que no cambio es leer un archivo.
+  - Con PDF_ASYNC=true el render no corre en el worker web: se encola en Celery
+    (tasks.pdfs.render_pdf_job) con el hash como id de job y la vista devuelve
+    202; el cliente consulta /pdf/jobs/<id> y vuelve a pedir la misma URL, que
+    ya sale del cache. Dos pedidos del mismo PDF comparten el job.
+  - pdf_metricas(): hits/misses, renders y tiempo de render, jobs en cola.
 """
+import hashlib
+import io
+import json
+import logging
 import os
 import threading
+import time
 from contextlib import contextmanager
 
+logger = logging.getLogger(__name__)
+
+# Subir al cambiar algo del render que no este en el HTML (fuentes, CSS global).
+PDF_CACHE_VERSION = 1
+PDF_ASYNC = os.getenv('PDF_ASYNC', 'false').lower() == 'true'
+# Un job sin terminar despues de esto se considera perdido (worker caido) y se
+# puede volver a encolar; tambien es la ventana de la profundidad de cola.
+PDF_JOB_TTL = int(os.getenv('PDF_JOB_TTL', '300'))
+# Dias que se conserva un PDF cacheado (storage local; en S3, regla de lifecycle
+# sobre el prefijo pdf_cache/).
+PDF_CACHE_DIAS = int(os.getenv('PDF_CACHE_DIAS', '30'))
+
+_PREFIJO_CACHE = 'pdf_cache'
+_REDIS_METRICAS = 'pdf:metricas'
+_REDIS_PENDIENTES = 'pdf:jobs:pendientes'
+
 
 def _max_concurrent():
     try:
@@ -74,3 +105,248 @@ def pdf_render_lock(timeout=90):
     finally:
         if got:
             _sem.release()
+
+
+# ---------------------------------------------------------------- cache ---
+
+def _version_weasyprint():
+    # Por metadata: importar weasyprint hace dlopen de pango en cada intento.
+    try:
+        from importlib.metadata import version
+        return version('weasyprint')
+    except Exception:
+        return ''
+
+
+def pdf_cache_key(html_string, **kwargs):
+    """Hash del contenido: HTML + opciones de render + version de WeasyPrint."""
+    h = hashlib.sha256()
+    h.update(f'v{PDF_CACHE_VERSION}|{_version_weasyprint()}|'.encode())
+    h.update(json.dumps(kwargs, sort_keys=True, default=str).encode())
+    h.update(html_string.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _storage_key(job_id, ext):
+    return f'{_PREFIJO_CACHE}/{job_id[:2]}/{job_id}.{ext}'
+
+
+def leer_pdf_cacheado(job_id):
+    """Bytes del PDF si esta en cache, o None. Un archivo a medio escribir (sin
+    el trailer %%EOF) cuenta como ausente."""
+    from services.storage_service import storage
+    key = _storage_key(job_id, 'pdf')
+    try:
+        if not storage.exists(key):
+            return None
+        datos = storage.read(key)
+    except Exception as exc:
+        logger.warning(f'[PDF] no se pudo leer {key} del cache: {exc}')
+        return None
+    return datos if b'%%EOF' in datos[-32:] else None
+
+
+def guardar_pdf_cacheado(job_id, datos):
+    from services.storage_service import storage
+    try:
+        # Objeto archivo, no bytes: S3 sube con upload_fileobj
+        storage.save(io.BytesIO(datos), _storage_key(job_id, 'pdf'), content_type='application/pdf')
+    except Exception as exc:
+        logger.warning(f'[PDF] no se pudo guardar {job_id} en cache: {exc}')
+
+
+def purgar_cache_local(dias=PDF_CACHE_DIAS):
+    """Borra los PDFs cacheados mas viejos que `dias`. Solo storage local."""
+    from services.storage_service import storage
+    base = getattr(storage, 'base_path', None)
+    if base is None:
+        return 0
+    limite = time.time() - dias * 86400
+    borrados = 0
+    for raiz, _dirs, archivos in os.walk(os.path.join(str(base), _PREFIJO_CACHE)):
+        for nombre in archivos:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+                    borrados += 1
+            except OSError:
+                pass
+    return borrados
+
+
+def renderizar_pdf(html_string, **kwargs):
+    """Render WeasyPrint a bytes, midiendo el tiempo (sin cupo: lo pone el caller)."""
+    import io
+    from weasyprint import HTML
+    inicio = time.perf_counter()
+    buf = io.BytesIO()
+    HTML(string=html_string).write_pdf(buf, **kwargs)
+    _sumar_metricas(renders=1, render_ms=(time.perf_counter() - inicio) * 1000)
+    return buf.getvalue()
+
+
+# ------------------------------------------------------------- metricas ---
+
+_metricas_locales = {'hits': 0, 'misses': 0, 'renders': 0, 'render_ms': 0.0,
+                     'encolados': 0, 'rechazados': 0}
+_metricas_lock = threading.Lock()
+
+
+def _redis():
+    try:
+        from config.cache_config import get_cache
+        return get_cache().get_client()
+    except Exception:
+        return None
+
+
+def _sumar_metricas(**valores):
+    """Suma en Redis (compartido entre web y workers) o, sin Redis, en el proceso."""
+    r = _redis()
+    if r is not None:
+        try:
+            pipe = r.pipeline()
+            for campo, v in valores.items():
+                if isinstance(v, float):
+                    pipe.hincrbyfloat(_REDIS_METRICAS, campo, v)
+                else:
+                    pipe.hincrby(_REDIS_METRICAS, campo, v)
+            pipe.execute()
+            return
+        except Exception:
+            pass
+    with _metricas_lock:
+        for campo, v in valores.items():
+            _metricas_locales[campo] += v
+
+
+def pdf_metricas():
+    """Contadores del cache y de los renders + jobs en cola (ultimos PDF_JOB_TTL s)."""
+    datos = dict(_metricas_locales)
+    en_cola = None
+    r = _redis()
+    if r is not None:
+        try:
+            crudos = r.hgetall(_REDIS_METRICAS) or {}
+            for campo in datos:
+                v = crudos.get(campo) or crudos.get(campo.encode())
+                if v is not None:
+                    datos[campo] = float(v)
+            r.zremrangebyscore(_REDIS_PENDIENTES, 0, time.time() - PDF_JOB_TTL)
+            en_cola = r.zcard(_REDIS_PENDIENTES)
+        except Exception:
+            pass
+    pedidos = datos['hits'] + datos['misses']
+    return {
+        **datos,
+        'hit_rate': round(datos['hits'] / pedidos, 3) if pedidos else 0.0,
+        'avg_render_ms': round(datos['render_ms'] / datos['renders'], 1) if datos['renders'] else 0.0,
+        'jobs_en_cola': en_cola,
+    }
+
+
+# ----------------------------------------------------------------- jobs ---
+
+def job_terminado(job_id):
+    """Lo llama la tarea al terminar (bien o mal): saca el job de la cola."""
+    r = _redis()
+    if r is not None:
+        try:
+            r.zrem(_REDIS_PENDIENTES, job_id)
+            r.delete(f'pdf:job:{job_id}')
+        except Exception:
+            pass
+
+
+def encolar_pdf(job_id, html_string, **kwargs):
+    """Deja el HTML en storage y encola el render (una vez por job en PDF_JOB_TTL)."""
+    from services.storage_service import storage
+    r = _redis()
+    if r is not None:
+        try:
+            if not r.set(f'pdf:job:{job_id}', '1', nx=True, ex=PDF_JOB_TTL):
+                return False  # ya hay un job en curso para este mismo PDF
+        except Exception:
+            pass
+    try:
+        storage.save(io.BytesIO(html_string.encode('utf-8')), _storage_key(job_id, 'html'),
+                     content_type='text/html')
+        from tasks.pdfs import render_pdf_job
+        render_pdf_job.apply_async(args=[job_id, kwargs], task_id=job_id)
+    except Exception:
+        # Sin job encolado: que el próximo pedido pueda volver a intentarlo
+        job_terminado(job_id)
+        raise
+    if r is not None:
+        try:
+            r.zadd(_REDIS_PENDIENTES, {job_id: time.time()})
+        except Exception:
+            pass
+    _sumar_metricas(encolados=1)
+    return True
+
+
+def estado_job(job_id):
+    """'listo' | 'error' | 'pendiente'."""
+    if leer_pdf_cacheado(job_id) is not None:
+        return 'listo'
+    try:
+        from celery_app import celery
+        if celery.AsyncResult(job_id).state == 'FAILURE':
+            return 'error'
+    except Exception:
+        pass
+    return 'pendiente'
+
+
+def pdf_en_cola_response(job_id):
+    """202 para un PDF que se esta generando. JSON para fetch/XHR; para una
+    navegacion, una pagina que se recarga sola hasta que el PDF esta listo."""
+    from flask import jsonify, make_response, render_template, request, url_for
+    estado_url = url_for('pdf.estado_job', job_id=job_id)
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        resp = jsonify({'ok': True, 'estado': 'pendiente', 'job_id': job_id,
+                        'estado_url': estado_url, 'descargar_url': request.url})
+    else:
+        resp = make_response(render_template('pdf/generando.html', estado_url=estado_url,
+                                             descargar_url=request.url))
+    resp.status_code = 202
+    resp.headers['Retry-After'] = '3'
+    return resp
+
+
+def render_pdf_cacheado(target, html_string, permitir_async=True, **kwargs):
+    """Como render_pdf_into (mismo contrato: None si escribio el PDF en `target`,
+    o un Response para devolver tal cual), con cache por contenido.
+
+    - Hit: copia el PDF del cache, sin render.
+    - Miss con PDF_ASYNC y `permitir_async`: encola el job y devuelve 202.
+    - Miss sincronico: render con cupo (503 si no hay) y lo guarda en cache.
+    `permitir_async=False` es para quien necesita los bytes en el momento
+    (ej. adjuntarlo a un email)."""
+    job_id = pdf_cache_key(html_string, **kwargs)
+    datos = leer_pdf_cacheado(job_id)
+    if datos is not None:
+        _sumar_metricas(hits=1)
+        target.write(datos)
+        return None
+    _sumar_metricas(misses=1)
+
+    if PDF_ASYNC and permitir_async:
+        try:
+            encolar_pdf(job_id, html_string, **kwargs)
+            return pdf_en_cola_response(job_id)
+        except Exception as exc:
+            logger.warning(f'[PDF] no se pudo encolar {job_id}, render sincronico: {exc}')
+
+    if not _sem.acquire(blocking=False):
+        _sumar_metricas(rechazados=1)
+        return pdf_busy_response()
+    try:
+        datos = renderizar_pdf(html_string, **kwargs)
+    finally:
+        _sem.release()
+    guardar_pdf_cacheado(job_id, datos)
+    target.write(datos)
+    return None
@@ -142,7 +142,8 @@ def _clasificar_con_aprendizaje(items, organizacion_id, forzar_keyword, memo_sco
                 if normalizar_texto_item(it.get('descripcion')) not in aprendidos]
     pend = [items[i] for i in idx_pend]
     clasif_pend = (clasificar_items(pend, forzar_keyword=forzar_keyword,
-                                    memo_scope=memo_scope) if pend else [])
+                                    memo_scope=memo_scope, organizacion_id=organizacion_id)
+                   if pend else [])
     por_idx = {i: clasif_pend[k] for k, i in enumerate(idx_pend)}
 
     out = []
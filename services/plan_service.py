@@ -181,6 +181,11 @@ def get_org():
     """Obtiene la organización del usuario actual."""
     if not current_user or not current_user.is_authenticated:
         return None
+    # La org del request ya resuelta (y memoizada) por load_membership_into_context
+    from services.memberships import identidad_actual
+    identidad = identidad_actual()
+    if identidad is not None and identidad.org_id:
+        return identidad.organizacion
     org_id = None
     from flask import session
     org_id = session.get('current_org_id') or getattr(current_user, 'organizacion_id', None)
@@ -214,6 +219,17 @@ def get_subscription_status(org=None):
     if not org:
         return 'suspended', 0, False
 
+    # Para la org del request se calcula una sola vez (g.identidad.estado_plan)
+    from services.memberships import identidad_actual
+    identidad = identidad_actual()
+    if identidad is not None and identidad.org_id == getattr(org, 'id', None):
+        return identidad.estado_plan
+    return calcular_estado_suscripcion(org)
+
+
+def calcular_estado_suscripcion(org):
+    """get_subscription_status sin memo: siempre calcula sobre `org`."""
+
     plan = org.plan_tipo or 'prueba'
     contract_type = getattr(org, 'contract_type', None) or 'subscription'
     now = datetime.utcnow()
@@ -20,9 +20,13 @@ Jerarquia DUAL segun el tipo de recurso:
 Conversion de moneda: si la fuente trae moneda != ARS y el presupuesto
 tiene exchange_rate_value cargado, se convierte. Si no, queda en
 'requiere_tc' con precio_unitario=0.
+
+estimar_precios_presupuesto resuelve todas las composiciones juntas con
+resolver_precios_lote (misma jerarquia, pocas queries).
 """
 from __future__ import annotations
 
+import os
 import re
 from datetime import date, datetime, timedelta
 from decimal import Decimal, ROUND_HALF_UP
@@ -310,6 +314,45 @@ def _tokens_significativos(texto: str) -> set:
     return out
 
 
+def tokens_busqueda_precio(texto: str) -> str:
+    """Valor de ProviderPriceList.tokens_busqueda: los tokens significativos
+    ordenados y separados por espacio ('' si no hay ninguno)."""
+    return ' '.join(sorted(_tokens_significativos(texto)))
+
+
+def _tokens_de_fila(tokens_busqueda, descripcion_normalizada, descripcion) -> set:
+    """Tokens de una fila de provider_price_list: los persistidos, o tokenizar
+    si la fila todavia no fue rellenada (tokens_busqueda NULL)."""
+    if tokens_busqueda is not None:
+        return set(tokens_busqueda.split())
+    return _tokens_significativos(descripcion_normalizada or descripcion or '')
+
+
+def rellenar_tokens_busqueda(lote: int = 1000) -> int:
+    """Completa tokens_busqueda en las filas que no lo tienen (datos anteriores
+    a la columna). Idempotente; devuelve cuantas filas actualizo."""
+    from models.provider_price_list import ProviderPriceList
+
+    tabla = ProviderPriceList.__table__
+    total = 0
+    while True:
+        filas = db.session.execute(
+            db.select(tabla.c.id, tabla.c.descripcion_normalizada, tabla.c.descripcion)
+            .where(tabla.c.tokens_busqueda.is_(None))
+            .limit(lote)
+        ).all()
+        if not filas:
+            return total
+        # UPDATE de Core: no dispara los hooks de invalidacion del indice fuzzy,
+        # que de todos modos no cambia (los tokens son los mismos).
+        db.session.execute(
+            tabla.update().where(tabla.c.id == db.bindparam('_id')),
+            [{'_id': f.id, 'tokens_busqueda': tokens_busqueda_precio(f.descripcion_normalizada or f.descripcion)}
+             for f in filas])
+        db.session.commit()
+        total += len(filas)
+
+
 # 2026-08-05: se agregaron 'uni', 'lts' y 'jor' a partir de un censo de unidades
 # reales del inventario en produccion (40 variantes distintas en org 1). 'UNI' sola
 # cubria 7.210 de 11.265 items --el 64% del inventario-- y no matcheaba con nada,
@@ -342,6 +385,87 @@ def _unidades_compatibles(u1: str, u2: str) -> bool:
     return False
 
 
+def _scope_price_list(organizacion_id):
+    """(filtro, orden) de provider_price_list para una org.
+
+    Fase 1 IA: se busca en los precios de la ORG y en la BASE GLOBAL (org NULL).
+    Los precios propios de la org PISAN la base global -> se ordena poniendo
+    primero las filas de la org (org_first) y en fuzzy se les da un bonus.
+    """
+    from models.provider_price_list import ProviderPriceList
+
+    scope = db.or_(ProviderPriceList.organizacion_id == organizacion_id,
+                   ProviderPriceList.organizacion_id.is_(None))
+    # org propio (0) antes que global (1). CASE, no boolean.desc(): para las
+    # filas globales `org == X` da NULL y en Postgres NULL ordena primero en
+    # DESC, lo que dejaba ganar a la global sobre el precio propio de la org.
+    org_first = db.case((ProviderPriceList.organizacion_id == organizacion_id, 0), else_=1)
+    return scope, org_first
+
+
+def _tokens_prefiltro(tokens_item: set) -> list:
+    """Tokens con los que se pre-filtran candidatos fuzzy.
+
+    Compartir uno es condicion NECESARIA para que _score_fuzzy acepte: si la
+    query tiene tokens lexicos el gate exige compartir uno de esos; si no,
+    alcanza con cualquier token en comun. El pre-filtro no pierde matches.
+    """
+    return sorted(_tokens_lexicos(tokens_item) or tokens_item)
+
+
+def _filtro_tokens_sql(toks: list):
+    """Candidatos que comparten al menos un token con `toks`.
+
+    Postgres: overlap de arrays sobre string_to_array(tokens_busqueda, ' '),
+    que usa el GIN ix_ppl_tokens_busqueda_gin. Otros motores (SQLite en tests):
+    LIKE por token completo sobre ' ' || tokens_busqueda || ' '.
+    """
+    from sqlalchemy.dialects import postgresql
+    from models.provider_price_list import ProviderPriceList
+
+    col = ProviderPriceList.tokens_busqueda
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # ' ' literal (no bind): la expresion tiene que ser la del indice
+        arr = db.func.string_to_array(col, db.literal_column("' '"),
+                                      type_=postgresql.ARRAY(db.Text))
+        return arr.op('&&')(postgresql.array(toks, type_=db.Text))
+    padded = db.literal(' ') + col + db.literal(' ')
+    return db.or_(*[padded.like(f'% {t} %') for t in toks])
+
+
+def _score_fuzzy(tokens_item, lex_item, tokens_c, lex_c, unidad_c, org_c,
+                 unidad, organizacion_id):
+    """Score fuzzy de un candidato, o None si no pasa. Lo comparten la busqueda
+    de a uno y el resolutor en lote: el ranking tiene que ser el mismo."""
+    if not tokens_c:
+        return None
+    inter = tokens_item & tokens_c
+    if not inter:
+        return None
+    if lex_item:
+        # Gate: hay que compartir al menos UNA palabra que identifique el
+        # material. Sin esto, compartir '15x15' bastaba (ver _tokens_lexicos).
+        inter_lex = lex_item & lex_c
+        if not inter_lex:
+            return None
+        cov_item = len(inter_lex) / len(lex_item)
+    else:
+        # Query sin sustantivo propio (ej. un codigo): se cae al criterio viejo.
+        cov_item = len(inter) / len(tokens_item)
+    union = tokens_item | tokens_c
+    jaccard = len(inter) / len(union)
+    # Cobertura de la QUERY: cuanto del concepto buscado esta en el candidato.
+    # Fixea "cemento" (1 token) vs "Bolsa de Cemento Loma Negra 50 kg" (Jaccard
+    # 0.17 pero cov_item 1.0). Fase 2.1: sube fuerte la cobertura de recursos.
+    cov_cand = len(inter) / len(tokens_c)  # especificidad (desempata hacia el menos verboso)
+    # Aceptar si la query esta mayormente cubierta O el Jaccard clasico es alto.
+    if cov_item < 0.65 and jaccard < 0.4:
+        return None
+    unidad_bonus = 0.2 if _unidades_compatibles(unidad_c, unidad) else 0.0
+    org_bonus = 0.5 if org_c == organizacion_id else 0.0
+    return 0.55 * cov_item + 0.30 * jaccard + 0.15 * cov_cand + unidad_bonus + org_bonus
+
+
 def _buscar_provider_price_list(organizacion_id, descripcion_norm, unidad, item_inventario_id=None):
     """Busca en provider_price_list. Devuelve (mejor, alternativas).
 
@@ -360,15 +484,7 @@ def _buscar_provider_price_list(organizacion_id, descripcion_norm, unidad, item_
     """
     from models.provider_price_list import ProviderPriceList
 
-    # Fase 1 IA: buscar en los precios de la ORG y en la BASE GLOBAL (org NULL).
-    # Los precios propios de la org PISAN la base global -> se ordena poniendo
-    # primero las filas de la org (_org_first) y en fuzzy se les da un bonus.
-    _scope = db.or_(ProviderPriceList.organizacion_id == organizacion_id,
-                    ProviderPriceList.organizacion_id.is_(None))
-    # org propio (0) antes que global (1). CASE, no boolean.desc(): para las
-    # filas globales `org == X` da NULL y en Postgres NULL ordena primero en
-    # DESC, lo que dejaba ganar a la global sobre el precio propio de la org.
-    _org_first = db.case((ProviderPriceList.organizacion_id == organizacion_id, 0), else_=1)
+    _scope, _org_first = _scope_price_list(organizacion_id)
 
     # Prioridad 0: matching por item_inventario_id (mas fuerte)
     if item_inventario_id:
@@ -406,19 +522,11 @@ def _buscar_provider_price_list(organizacion_id, descripcion_norm, unidad, item_
     if not tokens_item:
         return None, []
 
-    # Pre-filtro SQL (perf): traer solo candidatos que comparten al menos un
-    # token significativo con la query. Sin esto se cargaban/tokenizaban ~8000
-    # filas en Python POR CADA recurso -> minutos en un pliego de 192 items.
-    # Es seguro: un candidato sin ningun token en comun tiene interseccion 0 y
-    # nunca pasaria el umbral, asi que no se pierde ningun match posible.
-    toks_filtro = [t for t in tokens_item if len(t) >= 4]
-    if not toks_filtro:
-        toks_filtro = [t for t in tokens_item if len(t) >= 3]
-    q = ProviderPriceList.query.filter(_scope)
-    if toks_filtro:
-        like = [ProviderPriceList.descripcion_normalizada.ilike('%' + t + '%')
-                for t in sorted(toks_filtro, key=len, reverse=True)[:8]]
-        q = q.filter(db.or_(*like))
+    # Pre-filtro SQL (perf): traer solo candidatos que comparten un token con
+    # la query, contra los tokens persistidos al importar (tokens_busqueda). Sin
+    # esto se cargaban/tokenizaban ~8000 filas en Python POR CADA recurso; el
+    # ILIKE '%tok%' que se usaba antes no podia usar indices.
+    q = ProviderPriceList.query.filter(_scope, _filtro_tokens_sql(_tokens_prefiltro(tokens_item)))
     todos = (q.order_by(_org_first, ProviderPriceList.fecha_actualizacion.desc())
              .limit(2000)
              .all())
@@ -430,35 +538,11 @@ def _buscar_provider_price_list(organizacion_id, descripcion_norm, unidad, item_
     lex_item = _tokens_lexicos(tokens_item)
     scored = []
     for c in todos:
-        tokens_c = _tokens_significativos(c.descripcion_normalizada or c.descripcion or '')
-        if not tokens_c:
-            continue
-        inter = tokens_item & tokens_c
-        if not inter:
-            continue
-        if lex_item:
-            # Gate: hay que compartir al menos UNA palabra que identifique el
-            # material. Sin esto, compartir '15x15' bastaba (ver _tokens_lexicos).
-            inter_lex = lex_item & _tokens_lexicos(tokens_c)
-            if not inter_lex:
-                continue
-            cov_item = len(inter_lex) / len(lex_item)
-        else:
-            # Query sin sustantivo propio (ej. un codigo): se cae al criterio viejo.
-            cov_item = len(inter) / len(tokens_item)
-        union = tokens_item | tokens_c
-        jaccard = len(inter) / len(union)
-        # Cobertura de la QUERY: cuanto del concepto buscado esta en el candidato.
-        # Fixea "cemento" (1 token) vs "Bolsa de Cemento Loma Negra 50 kg" (Jaccard
-        # 0.17 pero cov_item 1.0). Fase 2.1: sube fuerte la cobertura de recursos.
-        cov_cand = len(inter) / len(tokens_c)  # especificidad (desempata hacia el menos verboso)
-        # Aceptar si la query esta mayormente cubierta O el Jaccard clasico es alto.
-        if cov_item < 0.65 and jaccard < 0.4:
-            continue
-        unidad_bonus = 0.2 if _unidades_compatibles(c.unidad, unidad) else 0.0
-        org_bonus = 0.5 if c.organizacion_id == organizacion_id else 0.0
-        score = 0.55 * cov_item + 0.30 * jaccard + 0.15 * cov_cand + unidad_bonus + org_bonus
-        scored.append((score, c))
+        tokens_c = _tokens_de_fila(c.tokens_busqueda, c.descripcion_normalizada, c.descripcion)
+        score = _score_fuzzy(tokens_item, lex_item, tokens_c, _tokens_lexicos(tokens_c),
+                             c.unidad, c.organizacion_id, unidad, organizacion_id)
+        if score is not None:
+            scored.append((score, c))
 
     if not scored:
         return None, []
@@ -469,14 +553,13 @@ def _buscar_provider_price_list(organizacion_id, descripcion_norm, unidad, item_
     return mejor, alternativas
 
 
-def _buscar_historial_proveedor(organizacion_id, descripcion_norm, unidad):
-    """Busca en HistorialPrecioProveedor ultimos 6 meses."""
+def _cargar_historial_proveedor(organizacion_id):
+    """Ultimas 50 compras (6 meses) de proveedores de la org, mas recientes primero."""
     from models.proveedores_oc import HistorialPrecioProveedor, ProveedorOC
-    from models.provider_price_list import normalizar_descripcion_precio
 
     # Filtrar por proveedores de la organizacion + ultimos 6m
     seis_meses = date.today() - timedelta(days=180)
-    candidatos = (
+    return (
         db.session.query(HistorialPrecioProveedor, ProveedorOC)
         .join(ProveedorOC, HistorialPrecioProveedor.proveedor_id == ProveedorOC.id)
         .filter(ProveedorOC.organizacion_id == organizacion_id)
@@ -485,48 +568,159 @@ def _buscar_historial_proveedor(organizacion_id, descripcion_norm, unidad):
         .limit(50)
         .all()
     )
+
+
+def _info_historial(h, p):
+    return {
+        'precio': float(h.precio_unitario or 0),
+        'fuente': 'historial_proveedor',
+        'estado': _calcular_estado(h.fecha),
+        'proveedor_id': p.id,
+        'proveedor_nombre': p.razon_social,
+        'fecha': h.fecha,
+        'moneda': h.moneda or 'ARS',
+        'notas': f'Historial OC del proveedor {p.razon_social}',
+        'referencia_id': h.id,
+    }
+
+
+def _buscar_historial_proveedor(organizacion_id, descripcion_norm, unidad):
+    """Busca en HistorialPrecioProveedor ultimos 6 meses."""
+    from models.provider_price_list import normalizar_descripcion_precio
+
     # Match por descripcion normalizada (in-memory porque la columna no esta normalizada en BD)
-    for h, p in candidatos:
+    for h, p in _cargar_historial_proveedor(organizacion_id):
         if normalizar_descripcion_precio(h.descripcion_item) == descripcion_norm:
-            return {
-                'precio': float(h.precio_unitario or 0),
-                'fuente': 'historial_proveedor',
-                'estado': _calcular_estado(h.fecha),
-                'proveedor_id': p.id,
-                'proveedor_nombre': p.razon_social,
-                'fecha': h.fecha,
-                'moneda': h.moneda or 'ARS',
-                'notas': f'Historial OC del proveedor {p.razon_social}',
-                'referencia_id': h.id,
-            }
+            return _info_historial(h, p)
     return None
 
 
-def _buscar_referencia_constructora(organizacion_id, descripcion_norm, unidad):
-    """Busca en ItemReferenciaConstructora (precios de mercado)."""
+def _cargar_referencias_constructora(organizacion_id):
     from models.budgets import ItemReferenciaConstructora
-    from models.provider_price_list import normalizar_descripcion_precio
 
-    candidatos = ItemReferenciaConstructora.query.filter(
+    return ItemReferenciaConstructora.query.filter(
         ItemReferenciaConstructora.organizacion_id == organizacion_id,
         ItemReferenciaConstructora.activo.is_(True),
     ).limit(200).all()
-    for ref in candidatos:
+
+
+def _info_referencia(ref):
+    return {
+        'precio': float(ref.precio_unitario or 0),
+        'fuente': 'referencia_constructora',
+        'estado': 'estimado',  # referencia de mercado, no proveedor propio
+        'proveedor_id': None,
+        'proveedor_nombre': None,
+        'fecha': ref.fecha_carga.date() if ref.fecha_carga else None,
+        'moneda': 'ARS',
+        'notas': f'Referencia constructora: {ref.constructora}',
+        'referencia_id': ref.id,
+    }
+
+
+def _buscar_referencia_constructora(organizacion_id, descripcion_norm, unidad):
+    """Busca en ItemReferenciaConstructora (precios de mercado)."""
+    from models.provider_price_list import normalizar_descripcion_precio
+
+    for ref in _cargar_referencias_constructora(organizacion_id):
         if normalizar_descripcion_precio(ref.descripcion) == descripcion_norm and ref.unidad == unidad:
-            return {
-                'precio': float(ref.precio_unitario or 0),
-                'fuente': 'referencia_constructora',
-                'estado': 'estimado',  # referencia de mercado, no proveedor propio
-                'proveedor_id': None,
-                'proveedor_nombre': None,
-                'fecha': ref.fecha_carga.date() if ref.fecha_carga else None,
-                'moneda': 'ARS',
-                'notas': f'Referencia constructora: {ref.constructora}',
-                'referencia_id': ref.id,
-            }
+            return _info_referencia(ref)
     return None
 
 
+def _buscar_info_mo(organizacion_id, descripcion, unidad, zona):
+    # Fase 2.1: fuente principal = costo empresa via categorias_jornal + recargos.
+    info = _buscar_costo_mo_v2(organizacion_id, descripcion, unidad, zona)
+    if not info:
+        info = _buscar_mo_costo_referencia(organizacion_id, descripcion, unidad, zona)
+    if not info:
+        info = _buscar_categoria_jornal(organizacion_id, descripcion, unidad)
+    return info
+
+
+def _info_price_list(mejor, alternativas):
+    """(info, alternativas_raw) de un match en provider_price_list."""
+    if not mejor:
+        return None, []
+    info = {
+        'precio': float(mejor.precio_unitario),
+        'fuente': 'provider_price_list',
+        'fuente_lista': mejor.fuente,  # 'estimado' | proveedor | etc (Fase 2.5)
+        'estado': _calcular_estado(mejor.fecha_actualizacion),
+        'proveedor_id': mejor.proveedor_id,
+        'proveedor_nombre': mejor.proveedor.razon_social if mejor.proveedor else None,
+        'fecha': mejor.fecha_actualizacion,
+        'moneda': mejor.moneda or 'ARS',
+        'notas': f'Lista de precios{" - " + mejor.proveedor.razon_social if mejor.proveedor else ""}',
+        'referencia_id': mejor.id,
+    }
+    if not mejor.esta_vigente():
+        # Vencido por vigencia_hasta -> estado mas pesimista
+        info['estado'] = 'vencido'
+    alternativas_raw = [{
+        'precio': float(a.precio_unitario),
+        'proveedor_nombre': a.proveedor.razon_social if a.proveedor else None,
+        'fuente': 'provider_price_list',
+        'estado': _calcular_estado(a.fecha_actualizacion),
+        'fecha': a.fecha_actualizacion.isoformat() if a.fecha_actualizacion else None,
+    } for a in (alternativas or [])][:5]
+    return info, alternativas_raw
+
+
+def _resultado_precio(info, alternativas_raw, presupuesto):
+    """Arma la respuesta publica de buscar_mejor_precio (con conversion de moneda)."""
+    # Sin matching
+    if not info:
+        return {
+            'precio': 0.0,
+            'fuente': 'sin_precio',
+            'estado': 'sin_precio',
+            'proveedor_id': None,
+            'proveedor_nombre': None,
+            'fecha': None,
+            'moneda_original': 'ARS',
+            'requiere_tc': False,
+            'auditoria_moneda': None,
+            'alternativas': [],
+            'notas': '',
+        }
+
+    # Conversion de moneda si corresponde
+    moneda = info.get('moneda', 'ARS')
+    precio_ars, audit_moneda, requiere_tc = _convertir_moneda(
+        info['precio'], moneda, presupuesto,
+    )
+    if requiere_tc:
+        return {
+            'precio': 0.0,
+            'fuente': info['fuente'],
+            'estado': 'requiere_tc',
+            'proveedor_id': info.get('proveedor_id'),
+            'proveedor_nombre': info.get('proveedor_nombre'),
+            'fecha': info.get('fecha'),
+            'moneda_original': moneda,
+            'requiere_tc': True,
+            'auditoria_moneda': audit_moneda,
+            'alternativas': alternativas_raw,
+            'notas': info.get('notas') + ' (requiere tipo de cambio)',
+        }
+
+    return {
+        'precio': float(precio_ars),
+        'fuente': info['fuente'],
+        'fuente_lista': info.get('fuente_lista'),
+        'estado': info['estado'],
+        'proveedor_id': info.get('proveedor_id'),
+        'proveedor_nombre': info.get('proveedor_nombre'),
+        'fecha': info.get('fecha'),
+        'moneda_original': moneda,
+        'requiere_tc': False,
+        'auditoria_moneda': audit_moneda,
+        'alternativas': alternativas_raw,
+        'notas': info.get('notas', ''),
+    }
+
+
 # =====================================================================
 # API PUBLICA
 # =====================================================================
@@ -576,97 +770,299 @@ def buscar_mejor_precio(
 
     # ----- MANO DE OBRA -----
     if tipo == 'mano_obra':
-        # Fase 2.1: fuente principal = costo empresa via categorias_jornal + recargos.
-        info = _buscar_costo_mo_v2(organizacion_id, descripcion, unidad, zona)
-        if not info:
-            info = _buscar_mo_costo_referencia(organizacion_id, descripcion, unidad, zona)
-        if not info:
-            info = _buscar_categoria_jornal(organizacion_id, descripcion, unidad)
+        info = _buscar_info_mo(organizacion_id, descripcion, unidad, zona)
 
     # ----- MATERIAL / EQUIPO / OTRO -----
     else:
         mejor, alternativas = _buscar_provider_price_list(
             organizacion_id, desc_norm, unidad, item_inventario_id
         )
-        if mejor:
-            info = {
-                'precio': float(mejor.precio_unitario),
-                'fuente': 'provider_price_list',
-                'fuente_lista': mejor.fuente,  # 'estimado' | proveedor | etc (Fase 2.5)
-                'estado': _calcular_estado(mejor.fecha_actualizacion),
-                'proveedor_id': mejor.proveedor_id,
-                'proveedor_nombre': mejor.proveedor.razon_social if mejor.proveedor else None,
-                'fecha': mejor.fecha_actualizacion,
-                'moneda': mejor.moneda or 'ARS',
-                'notas': f'Lista de precios{" - " + mejor.proveedor.razon_social if mejor.proveedor else ""}',
-                'referencia_id': mejor.id,
-            }
-            if not mejor.esta_vigente():
-                # Vencido por vigencia_hasta -> estado mas pesimista
-                info['estado'] = 'vencido'
-            alternativas_raw = [{
-                'precio': float(a.precio_unitario),
-                'proveedor_nombre': a.proveedor.razon_social if a.proveedor else None,
-                'fuente': 'provider_price_list',
-                'estado': _calcular_estado(a.fecha_actualizacion),
-                'fecha': a.fecha_actualizacion.isoformat() if a.fecha_actualizacion else None,
-            } for a in (alternativas or [])][:5]
+        info, alternativas_raw = _info_price_list(mejor, alternativas)
 
         if not info:
             info = _buscar_historial_proveedor(organizacion_id, desc_norm, unidad)
         if not info:
             info = _buscar_referencia_constructora(organizacion_id, desc_norm, unidad)
 
-    # Sin matching
-    if not info:
-        return {
-            'precio': 0.0,
-            'fuente': 'sin_precio',
-            'estado': 'sin_precio',
-            'proveedor_id': None,
-            'proveedor_nombre': None,
-            'fecha': None,
-            'moneda_original': 'ARS',
-            'requiere_tc': False,
-            'auditoria_moneda': None,
-            'alternativas': [],
-            'notas': '',
-        }
+    return _resultado_precio(info, alternativas_raw, presupuesto)
 
-    # Conversion de moneda si corresponde
-    moneda = info.get('moneda', 'ARS')
-    precio_ars, audit_moneda, requiere_tc = _convertir_moneda(
-        info['precio'], moneda, presupuesto,
-    )
-    if requiere_tc:
-        return {
-            'precio': 0.0,
-            'fuente': info['fuente'],
-            'estado': 'requiere_tc',
-            'proveedor_id': info.get('proveedor_id'),
-            'proveedor_nombre': info.get('proveedor_nombre'),
-            'fecha': info.get('fecha'),
-            'moneda_original': moneda,
-            'requiere_tc': True,
-            'auditoria_moneda': audit_moneda,
-            'alternativas': alternativas_raw,
-            'notas': info.get('notas') + ' (requiere tipo de cambio)',
-        }
+# =====================================================================
+# RESOLUCION EN LOTE
+# =====================================================================
+#
+# estimar_precios_presupuesto llamaba a buscar_mejor_precio por composicion:
+# hasta 4 queries a provider_price_list cada una, mas un ILIKE-OR de hasta 2000
+# filas que se re-tokenizaban en Python. Un pliego de 300 items con ~5
+# composiciones eran miles de queries.
+#
+# resolver_precios_lote recorre la MISMA jerarquia para todas las consultas
+# juntas: prioridades 0-2 con dos queries IN (...), el fuzzy contra un indice de
+# la org ya tokenizado (cacheado por org, se invalida al cambiar la lista) e
+# historial/referencias cargados una sola vez. Unica diferencia deliberada: el
+# fuzzy no corta en 2000 candidatos (ese LIMIT era solo perf del camino SQL).
+
+PRECIOS_INDICE_TTL = int(os.getenv('PRECIOS_INDICE_TTL', '300'))
+_LOTE_IN = 500  # ids / descripciones por IN (...)
+
+_SESSION_KEY_PRECIOS = 'precios_orgs_sucias'
+_hooks_precios_registrados = False
+
+
+class _IndicePrecios:
+    """provider_price_list de una org (+ base global) ya tokenizada, en el
+    orden del camino SQL (org primero, fecha desc), con posting lists."""
+
+    def __init__(self, filas):
+        self.ids = []
+        self.entradas = []  # (tokens, lexicos, unidad, organizacion_id)
+        self.postings = {}
+        for pos, f in enumerate(filas):
+            tokens = _tokens_de_fila(f.tokens_busqueda, f.descripcion_normalizada, f.descripcion)
+            self.ids.append(f.id)
+            self.entradas.append((tokens, _tokens_lexicos(tokens), f.unidad, f.organizacion_id))
+            for tk in tokens:
+                self.postings.setdefault(tk, []).append(pos)
+
+    def fuzzy(self, organizacion_id, descripcion_norm, unidad):
+        """ids de [mejor, *alternativas] con el mismo ranking que el paso 3."""
+        tokens_item = _tokens_significativos(descripcion_norm)
+        if not tokens_item:
+            return []
+        lex_item = _tokens_lexicos(tokens_item)
+        # Mismo pre-filtro que el camino SQL (_filtro_tokens_sql)
+        posiciones = set()
+        for tk in _tokens_prefiltro(tokens_item):
+            posiciones.update(self.postings.get(tk, ()))
+
+        scored = []
+        for pos in sorted(posiciones):
+            tokens_c, lex_c, unidad_c, org_c = self.entradas[pos]
+            score = _score_fuzzy(tokens_item, lex_item, tokens_c, lex_c,
+                                 unidad_c, org_c, unidad, organizacion_id)
+            if score is not None:
+                scored.append((score, self.ids[pos]))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [i for _, i in scored[:6]]
+
+
+def _tags_indice_precios(organizacion_id):
+    return ['precios', f'precios:{organizacion_id}']
+
+
+def _indice_precios(organizacion_id, refrescar=False):
+    """Indice fuzzy de la org desde el cache del proceso."""
+    from config.cache_config import get_local_cache
+    from models.provider_price_list import ProviderPriceList
 
-    return {
-        'precio': float(precio_ars),
-        'fuente': info['fuente'],
-        'fuente_lista': info.get('fuente_lista'),
-        'estado': info['estado'],
-        'proveedor_id': info.get('proveedor_id'),
-        'proveedor_nombre': info.get('proveedor_nombre'),
-        'fecha': info.get('fecha'),
-        'moneda_original': moneda,
-        'requiere_tc': False,
-        'auditoria_moneda': audit_moneda,
-        'alternativas': alternativas_raw,
-        'notas': info.get('notas', ''),
-    }
+    registrar_hooks_precios()
+    cache = get_local_cache()
+    clave = f'precios_indice:{organizacion_id}'
+    if not refrescar:
+        hit, indice = cache.get(clave)
+        if hit:
+            return indice
+    generacion = cache.generation
+    scope, org_first = _scope_price_list(organizacion_id)
+    filas = (db.session.query(ProviderPriceList.id,
+                              ProviderPriceList.descripcion,
+                              ProviderPriceList.descripcion_normalizada,
+                              ProviderPriceList.tokens_busqueda,
+                              ProviderPriceList.unidad,
+                              ProviderPriceList.organizacion_id)
+             .filter(scope)
+             .order_by(org_first, ProviderPriceList.fecha_actualizacion.desc())
+             .all())
+    indice = _IndicePrecios(filas)
+    cache.set(clave, indice, PRECIOS_INDICE_TTL, _tags_indice_precios(organizacion_id),
+              generation=generacion)
+    return indice
+
+
+def invalidar_indice_precios(organizacion_id=None):
+    """Descarta el indice fuzzy de una org (o de todas si es None: base global)."""
+    from config.cache_config import invalidate_tags
+    if organizacion_id is None:
+        invalidate_tags('precios')
+    else:
+        invalidate_tags(f'precios:{organizacion_id}')
+
+
+def registrar_hooks_precios():
+    """Invalida el indice fuzzy al commitear cambios en provider_price_list
+    (idempotente). Un cambio en la base global invalida todas las orgs."""
+    global _hooks_precios_registrados
+    if _hooks_precios_registrados:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session, object_session
+    from models.provider_price_list import ProviderPriceList
+
+    def _anotar(session, org_id):
+        if session is not None:
+            session.info.setdefault(_SESSION_KEY_PRECIOS, set()).add(org_id)
+
+    @event.listens_for(ProviderPriceList, 'after_insert')
+    @event.listens_for(ProviderPriceList, 'after_update')
+    @event.listens_for(ProviderPriceList, 'after_delete')
+    def _fila(mapper, connection, target):
+        _anotar(object_session(target), target.organizacion_id)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _masivo(orm_execute_state):
+        # query.delete()/update() no pasan por los eventos de mapper
+        if ((orm_execute_state.is_update or orm_execute_state.is_delete)
+                and orm_execute_state.bind_mapper is not None
+                and orm_execute_state.bind_mapper.class_ is ProviderPriceList):
+            _anotar(orm_execute_state.session, None)
+
+    @event.listens_for(Session, 'after_commit')
+    def _despues_de_commit(session):
+        org_ids = session.info.pop(_SESSION_KEY_PRECIOS, None)
+        if not org_ids:
+            return
+        if None in org_ids:
+            invalidar_indice_precios(None)
+        else:
+            for org_id in org_ids:
+                invalidar_indice_precios(org_id)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _despues_de_rollback(session):
+        session.info.pop(_SESSION_KEY_PRECIOS, None)
+
+    _hooks_precios_registrados = True
+
+
+def _en_lotes(valores):
+    valores = list(valores)
+    for i in range(0, len(valores), _LOTE_IN):
+        yield valores[i:i + _LOTE_IN]
+
+
+def _filas_price_list(organizacion_id, columna, valores):
+    """Filas de la org (+ global) con `columna` IN valores, agrupadas por valor
+    y en el orden de la jerarquia (org primero, fecha desc)."""
+    from sqlalchemy.orm import selectinload
+    from models.provider_price_list import ProviderPriceList
+
+    scope, org_first = _scope_price_list(organizacion_id)
+    grupos = {}
+    for lote in _en_lotes(valores):
+        filas = (ProviderPriceList.query
+                 .options(selectinload(ProviderPriceList.proveedor))
+                 .filter(scope, columna.in_(lote))
+                 .order_by(org_first, ProviderPriceList.fecha_actualizacion.desc())
+                 .all())
+        for f in filas:
+            grupos.setdefault(getattr(f, columna.key), []).append(f)
+    return grupos
+
+
+def resolver_precios_lote(organizacion_id, consultas, *, presupuesto=None, zona='CABA'):
+    """buscar_mejor_precio para muchas consultas a la vez.
+
+    Args:
+      consultas: lista de dicts con descripcion, unidad, tipo_recurso e
+        item_inventario_id (mismos argumentos que buscar_mejor_precio).
+
+    Returns:
+      lista de resultados en el mismo orden, con el mismo formato (fuente,
+      estado, alternativas, ...) que devolveria buscar_mejor_precio.
+    """
+    from sqlalchemy.orm import selectinload
+    from models.provider_price_list import ProviderPriceList, normalizar_descripcion_precio
+
+    claves = []
+    for c in consultas:
+        descripcion = c.get('descripcion') or ''
+        unidad = c.get('unidad') or ''
+        if (c.get('tipo_recurso') or '').lower() == 'mano_obra':
+            claves.append(('mo', descripcion, unidad))
+        else:
+            claves.append(('mat', normalizar_descripcion_precio(descripcion), unidad,
+                           c.get('item_inventario_id')))
+
+    infos = {}  # clave -> (info, alternativas_raw)
+
+    # ----- MANO DE OBRA: de a una, pero sin repetir recursos -----
+    for clave in dict.fromkeys(k for k in claves if k[0] == 'mo'):
+        infos[clave] = (_buscar_info_mo(organizacion_id, clave[1], clave[2], zona), [])
+
+    pendientes = list(dict.fromkeys(k for k in claves if k[0] == 'mat'))
+
+    # ----- Prioridad 0: item_inventario_id (una query) -----
+    por_item = _filas_price_list(organizacion_id, ProviderPriceList.item_inventario_id,
+                                 {k[3] for k in pendientes if k[3]})
+    resto = []
+    for clave in pendientes:
+        filas = por_item.get(clave[3]) if clave[3] else None
+        if filas:
+            infos[clave] = _info_price_list(filas[0], filas[1:6])
+        else:
+            resto.append(clave)
+
+    # ----- Prioridades 1 y 2: descripcion exacta (una query) -----
+    por_desc = _filas_price_list(organizacion_id, ProviderPriceList.descripcion_normalizada,
+                                 {k[1] for k in resto})
+    sin_exacto = []
+    for clave in resto:
+        _, desc_norm, unidad, _ = clave
+        filas = por_desc.get(desc_norm, [])
+        exactas = [f for f in filas if f.unidad == unidad]
+        if not exactas:
+            exactas = [f for f in filas if _unidades_compatibles(f.unidad, unidad)]
+        if exactas:
+            infos[clave] = _info_price_list(exactas[0], exactas[1:6])
+        else:
+            sin_exacto.append(clave)
+
+    # ----- Prioridad 3: fuzzy contra el indice tokenizado -----
+    ranking = {}
+    if sin_exacto:
+        indice = _indice_precios(organizacion_id)
+        ranking = {k: indice.fuzzy(organizacion_id, k[1], k[2]) for k in sin_exacto}
+        ids = {i for ids_k in ranking.values() for i in ids_k}
+        filas = {}
+        for lote in _en_lotes(ids):
+            filas.update((f.id, f) for f in ProviderPriceList.query
+                         .options(selectinload(ProviderPriceList.proveedor))
+                         .filter(ProviderPriceList.id.in_(lote)))
+        if len(filas) < len(ids):
+            # Indice viejo (una fila se borro por fuera del ORM): se rearma una vez
+            indice = _indice_precios(organizacion_id, refrescar=True)
+            ranking = {k: indice.fuzzy(organizacion_id, k[1], k[2]) for k in sin_exacto}
+            faltan = {i for ids_k in ranking.values() for i in ids_k} - set(filas)
+            for lote in _en_lotes(faltan):
+                filas.update((f.id, f) for f in ProviderPriceList.query
+                             .options(selectinload(ProviderPriceList.proveedor))
+                             .filter(ProviderPriceList.id.in_(lote)))
+        for clave, ids_k in ranking.items():
+            encontrados = [filas[i] for i in ids_k if i in filas]
+            if encontrados:
+                infos[clave] = _info_price_list(encontrados[0], encontrados[1:6])
+
+    # ----- Historial y referencias: se cargan una vez -----
+    sin_lista = [k for k in sin_exacto if k not in infos]
+    if sin_lista:
+        historial = {}
+        for h, p in _cargar_historial_proveedor(organizacion_id):
+            historial.setdefault(normalizar_descripcion_precio(h.descripcion_item), (h, p))
+        referencias = None
+        for clave in sin_lista:
+            _, desc_norm, unidad, _ = clave
+            if desc_norm in historial:
+                infos[clave] = (_info_historial(*historial[desc_norm]), [])
+                continue
+            if referencias is None:
+                referencias = {}
+                for ref in _cargar_referencias_constructora(organizacion_id):
+                    referencias.setdefault(
+                        (normalizar_descripcion_precio(ref.descripcion), ref.unidad), ref)
+            ref = referencias.get((desc_norm, unidad))
+            infos[clave] = (_info_referencia(ref) if ref else None, [])
+
+    return [_resultado_precio(*infos.get(clave, (None, [])), presupuesto)
+            for clave in claves]
 
 
 def estimar_precios_presupuesto(presupuesto, *, user_id=None):
@@ -711,6 +1107,16 @@ def estimar_precios_presupuesto(presupuesto, *, user_id=None):
         solo_interno=False,
     ).all()
 
+    # Composiciones de todos los items en una query (la relacion es dynamic:
+    # item.composiciones.all() era una query por item, dos veces).
+    comps_por_item = {it.id: [] for it in items}
+    for lote in _en_lotes(comps_por_item):
+        for comp in (ItemPresupuestoComposicion.query
+                     .filter(ItemPresupuestoComposicion.item_presupuesto_id.in_(lote))
+                     .order_by(ItemPresupuestoComposicion.id)):
+            comps_por_item[comp.item_presupuesto_id].append(comp)
+
+    a_estimar = []
     for item in items:
         # Lock Manual MVP: si el item tiene precio_locked, la IA no toca
         # ninguna de sus composiciones — el usuario lo ajusto a mano y no
@@ -719,49 +1125,50 @@ def estimar_precios_presupuesto(presupuesto, *, user_id=None):
             contadores['manuales_respetados'] += 1
             continue
 
-        for comp in (item.composiciones.all() if hasattr(item.composiciones, 'all') else item.composiciones):
+        for comp in comps_por_item[item.id]:
             contadores['composiciones_evaluadas'] += 1
             # Skip si es manual
             if (comp.precio_estado or '').lower() == 'manual':
                 contadores['manual'] += 1
                 continue
+            a_estimar.append(comp)
+
+    # Todas las composiciones se resuelven juntas (ver resolver_precios_lote).
+    resultados = resolver_precios_lote(org_id, [{
+        'descripcion': comp.descripcion or '',
+        'unidad': comp.unidad or '',
+        'tipo_recurso': comp.tipo,
+        'item_inventario_id': comp.item_inventario_id,
+    } for comp in a_estimar], presupuesto=presupuesto)
+
+    for comp, info in zip(a_estimar, resultados):
+        comp.precio_unitario = Decimal(str(info['precio']))
+        comp.total = (Decimal(str(comp.cantidad or 0)) * comp.precio_unitario).quantize(Decimal('0.01'))
+        comp.precio_fuente = info['fuente']
+        comp.precio_estado = info['estado']
+        comp.precio_proveedor_id = info.get('proveedor_id')
+        comp.precio_actualizado_at = datetime.utcnow()
+
+        audit = info.get('auditoria_moneda') or {}
+        comp.precio_original = audit.get('precio_original')
+        comp.precio_moneda_original = audit.get('precio_moneda_original')
+        comp.precio_tipo_cambio_usado = audit.get('precio_tipo_cambio_usado')
+        comp.precio_tipo_cambio_fecha = audit.get('precio_tipo_cambio_fecha')
+
+        estado = info['estado']
+        if estado == 'actualizado':
+            contadores['actualizados'] += 1
+        elif estado == 'estimado':
+            contadores['estimados'] += 1
+        elif estado == 'vencido':
+            contadores['vencidos'] += 1
+        elif estado == 'requiere_tc':
+            contadores['requiere_tc'] += 1
+        else:
+            contadores['sin_precio'] += 1
 
-            info = buscar_mejor_precio(
-                organizacion_id=org_id,
-                descripcion=comp.descripcion or '',
-                unidad=comp.unidad or '',
-                tipo_recurso=comp.tipo,
-                item_inventario_id=comp.item_inventario_id,
-                presupuesto=presupuesto,
-            )
-
-            comp.precio_unitario = Decimal(str(info['precio']))
-            comp.total = (Decimal(str(comp.cantidad or 0)) * comp.precio_unitario).quantize(Decimal('0.01'))
-            comp.precio_fuente = info['fuente']
-            comp.precio_estado = info['estado']
-            comp.precio_proveedor_id = info.get('proveedor_id')
-            comp.precio_actualizado_at = datetime.utcnow()
-
-            audit = info.get('auditoria_moneda') or {}
-            comp.precio_original = audit.get('precio_original')
-            comp.precio_moneda_original = audit.get('precio_moneda_original')
-            comp.precio_tipo_cambio_usado = audit.get('precio_tipo_cambio_usado')
-            comp.precio_tipo_cambio_fecha = audit.get('precio_tipo_cambio_fecha')
-
-            estado = info['estado']
-            if estado == 'actualizado':
-                contadores['actualizados'] += 1
-            elif estado == 'estimado':
-                contadores['estimados'] += 1
-            elif estado == 'vencido':
-                contadores['vencidos'] += 1
-            elif estado == 'requiere_tc':
-                contadores['requiere_tc'] += 1
-            else:
-                contadores['sin_precio'] += 1
-
-            if (comp.tipo or '').lower() == 'mano_obra' and info['precio'] > 0:
-                contadores['mo_aplicadas'] += 1
+        if (comp.tipo or '').lower() == 'mano_obra' and info['precio'] > 0:
+            contadores['mo_aplicadas'] += 1
 
     # Margen comercial unico para el presupuesto (override > org > 25%).
     margen = (
@@ -791,15 +1198,29 @@ def estimar_precios_presupuesto(presupuesto, *, user_id=None):
     total_costo = Decimal('0')
     items_total = len(items)
 
+    costos = {item.id: sum((Decimal(str(comp.total or 0)) for comp in comps_por_item[item.id]),
+                           Decimal('0'))
+              for item in items}
+    # Items que van a necesitar precio directo por descripcion: tambien en lote.
+    directos = [item for item in items
+                if not getattr(item, 'precio_locked', False)
+                and Decimal(str(item.cantidad or 0)) > 0
+                and not (comps_por_item[item.id] and costos[item.id] > 0)]
+    try:
+        precios_directos = dict(zip((item.id for item in directos), resolver_precios_lote(org_id, [{
+            'descripcion': item.descripcion or '',
+            'unidad': item.unidad or '',
+            'tipo_recurso': item.tipo,
+            'item_inventario_id': getattr(item, 'item_inventario_id', None),
+        } for item in directos], presupuesto=presupuesto)))
+    except Exception:
+        precios_directos = {}
+
     for item in items:
         # items ya filtra solo_interno=False. Falta saltar locked aqui.
         item_locked = bool(getattr(item, 'precio_locked', False))
-        comps = list(
-            item.composiciones.all() if hasattr(item.composiciones, 'all') else item.composiciones
-        )
-        costo_item = Decimal('0')
-        for comp in comps:
-            costo_item += Decimal(str(comp.total or 0))
+        comps = comps_por_item[item.id]
+        costo_item = costos[item.id]
         total_costo += costo_item
 
         if item_locked:
@@ -824,17 +1245,7 @@ def estimar_precios_presupuesto(presupuesto, *, user_id=None):
             # items que generar-preliminar no descompuso) intentan precio
             # directo desde la lista propia / proveedores por descripcion.
             # Esto evita que el comercial quede en $0 cuando hay items sin APU.
-            try:
-                info = buscar_mejor_precio(
-                    organizacion_id=org_id,
-                    descripcion=item.descripcion or '',
-                    unidad=item.unidad or '',
-                    tipo_recurso=item.tipo,
-                    item_inventario_id=getattr(item, 'item_inventario_id', None),
-                    presupuesto=presupuesto,
-                )
-            except Exception:
-                info = None
+            info = precios_directos.get(item.id)
 
             precio_directo = Decimal(str((info or {}).get('precio') or 0))
             if precio_directo > 0:
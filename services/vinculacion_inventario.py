@@ -32,9 +32,9 @@ from typing import Any, Dict, List, Optional
 
 from services.inventory_matcher import (
     _MIN_COBERTURA,
-    construir_indice_inventario,
     evaluar_candidatos,
     hay_empate,
+    obtener_indice_inventario,
 )
 
 # Los de cobertura menor a esto se proponen pero DESMARCADOS.
@@ -91,6 +91,7 @@ def preparar_pantalla(presupuesto, org_id: int) -> Dict[str, Any]:
 
     No escribe nada. Costo: 2 queries (indice de inventario + stocks) mas la
     carga de los items del presupuesto, sin importar cuantos renglones tenga.
+    El indice sale del cache por org mientras el catalogo no cambie.
     """
     from sqlalchemy.orm import selectinload
     from models.budgets import ItemPresupuesto
@@ -105,7 +106,7 @@ def preparar_pantalla(presupuesto, org_id: int) -> Dict[str, Any]:
              .order_by(ItemPresupuesto.id)
              .all())
 
-    indice = construir_indice_inventario(org_id)
+    indice = obtener_indice_inventario(org_id)
     stocks = _stock_por_item(org_id)
     nombres = {inv['id']: inv['nombre'] for inv in indice}
 
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Contador de visitas de productos del marketplace con escritura diferida.
+
+Cada vista de producto hacía `visitas = visitas + 1` y commit sobre la fila
+de Product: una lectura convertida en UPDATE, y los que miraban el mismo
+producto a la vez esperaban el lock de esa fila. Ahora la vista solo suma en
+un buffer y la fila se actualiza por lotes:
+
+  - Con Redis: HINCRBY en el hash marketplace:visitas:pendientes. La tarea
+    tasks.marketplace.volcar_visitas_productos (beat, cada
+    MARKETPLACE_VISITAS_FLUSH_SEC) renombra el hash de forma atómica y aplica
+    todos los incrementos en un solo UPDATE por lote. Si la base falla, los
+    incrementos vuelven al hash.
+  - Sin Redis (desarrollo, tests): un dict por proceso que se vuelca en línea
+    cuando pasan MARKETPLACE_VISITAS_FLUSH_SEC desde el último volcado.
+
+`Product.visitas` queda atrasado a lo sumo un intervalo de volcado; el orden
+por más visitados de search_products lo tolera.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import bindparam, update
+
+from config.cache_config import get_cache
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+MARKETPLACE_VISITAS_FLUSH_SEC = int(os.getenv('MARKETPLACE_VISITAS_FLUSH_SEC', '60'))
+
+_CLAVE_PENDIENTES = 'marketplace:visitas:pendientes'
+_CLAVE_VOLCANDO = 'marketplace:visitas:volcando:'
+
+_lock_local = threading.Lock()
+_pendientes_local = {}
+_ultimo_volcado_local = time.monotonic()
+
+
+def _redis():
+    cache = get_cache()
+    return cache.get_client() if cache.is_enabled() else None
+
+
+def registrar_visita(product_id):
+    """Suma una visita al buffer; no toca la fila del producto."""
+    global _ultimo_volcado_local
+    client = _redis()
+    if client is not None:
+        try:
+            client.hincrby(_CLAVE_PENDIENTES, product_id, 1)
+            return
+        except Exception as e:
+            logger.warning(f'[VISITAS] Redis no disponible, buffer local: {e}')
+    with _lock_local:
+        _pendientes_local[product_id] = _pendientes_local.get(product_id, 0) + 1
+        vencido = time.monotonic() - _ultimo_volcado_local >= MARKETPLACE_VISITAS_FLUSH_SEC
+        if vencido:
+            _ultimo_volcado_local = time.monotonic()
+    if vencido:
+        try:
+            volcar_visitas(solo_local=True)
+        except Exception as e:
+            logger.warning(f'[VISITAS] No se pudo volcar el buffer local: {e}')
+
+
+def visitas_pendientes(product_id=None):
+    """Visitas todavía en el buffer: de un producto, o {product_id: n} de todos."""
+    pendientes = {}
+    client = _redis()
+    if client is not None:
+        try:
+            pendientes = {int(k): int(v) for k, v in client.hgetall(_CLAVE_PENDIENTES).items()}
+        except Exception as e:
+            logger.warning(f'[VISITAS] No se pudo leer el buffer en Redis: {e}')
+    with _lock_local:
+        for pid, n in _pendientes_local.items():
+            pendientes[pid] = pendientes.get(pid, 0) + n
+    if product_id is not None:
+        return pendientes.get(product_id, 0)
+    return pendientes
+
+
+def _aplicar(incrementos):
+    """Un UPDATE por lote (executemany); updated_at no se toca porque una
+    visita no es una modificación del producto."""
+    from models import Product
+
+    filas = [{'pid': pid, 'n': n} for pid, n in sorted(incrementos.items()) if n > 0]
+    if not filas:
+        return 0
+    tabla = Product.__table__
+    db.session.execute(
+        update(tabla)
+        .where(tabla.c.id == bindparam('pid'))
+        .values(visitas=db.func.coalesce(tabla.c.visitas, 0) + bindparam('n'),
+                updated_at=tabla.c.updated_at),
+        filas,
+    )
+    db.session.commit()
+    return len(filas)
+
+
+def _tomar_redis(client):
+    """Saca el hash pendiente de forma atómica: {product_id: n} y la clave temporal."""
+    temporal = f'{_CLAVE_VOLCANDO}{uuid.uuid4().hex}'
+    try:
+        client.rename(_CLAVE_PENDIENTES, temporal)
+    except Exception:
+        # RENAME falla si no hay nada pendiente
+        return {}, None
+    return {int(k): int(v) for k, v in client.hgetall(temporal).items()}, temporal
+
+
+def volcar_visitas(solo_local=False):
+    """Aplica en Product.visitas lo acumulado. Devuelve {'productos', 'visitas'}."""
+    global _ultimo_volcado_local
+    with _lock_local:
+        incrementos = dict(_pendientes_local)
+        _pendientes_local.clear()
+        _ultimo_volcado_local = time.monotonic()
+
+    client = None if solo_local else _redis()
+    temporal = None
+    if client is not None:
+        desde_redis, temporal = _tomar_redis(client)
+        for pid, n in desde_redis.items():
+            incrementos[pid] = incrementos.get(pid, 0) + n
+
+    try:
+        productos = _aplicar(incrementos)
+    except Exception:
+        db.session.rollback()
+        # Devolver los incrementos al buffer para el próximo volcado
+        if client is not None and temporal is not None:
+            pipe = client.pipeline()
+            for pid, n in incrementos.items():
+                pipe.hincrby(_CLAVE_PENDIENTES, pid, n)
+            pipe.delete(temporal)
+            pipe.execute()
+        else:
+            with _lock_local:
+                for pid, n in incrementos.items():
+                    _pendientes_local[pid] = _pendientes_local.get(pid, 0) + n
+        raise
+    if temporal is not None:
+        client.delete(temporal)
+    return {'productos': productos, 'visitas': sum(incrementos.values())}
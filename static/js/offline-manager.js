@@ -201,32 +201,13 @@ const OfflineManager = {
         console.log('[Offline] Descargando datos para modo offline...');
 
         try {
-            // Descargar obras del usuario
-            const obrasResponse = await fetch('/api/offline/mis-obras');
-            if (obrasResponse.ok) {
-                const obrasData = await obrasResponse.json();
-                if (obrasData.obras) {
-                    await ObyraDB.saveObras(obrasData.obras);
-                }
-            }
-
-            // Descargar tareas asignadas
-            const tareasResponse = await fetch('/api/offline/mis-tareas');
-            if (tareasResponse.ok) {
-                const tareasData = await tareasResponse.json();
-                if (tareasData.tareas) {
-                    await ObyraDB.saveTareas(tareasData.tareas);
-                }
-            }
-
-            // Descargar inventario básico (solo nombres y códigos para búsqueda)
-            const invResponse = await fetch('/api/offline/inventario-basico?limit=1000');
-            if (invResponse.ok) {
-                const invData = await invResponse.json();
-                if (invData.items) {
-                    await ObyraDB.saveInventario(invData.items);
-                }
-            }
+            // Obras, tareas asignadas e inventario básico: solo cambios desde el último cursor
+            await this.pullIncremental('/api/offline/mis-obras', ObyraDB.STORES.OBRAS, 'obras',
+                items => ObyraDB.saveObras(items));
+            await this.pullIncremental('/api/offline/mis-tareas', ObyraDB.STORES.TAREAS, 'tareas',
+                items => ObyraDB.saveTareas(items));
+            await this.pullIncremental('/api/offline/inventario-basico?limit=1000', ObyraDB.STORES.INVENTARIO, 'items',
+                items => ObyraDB.saveInventario(items));
 
             const stats = await ObyraDB.getStats();
             console.log('[Offline] Datos descargados:', stats);
@@ -236,6 +217,34 @@ const OfflineManager = {
         }
     },
 
+    /**
+     * Traer de un endpoint de /api/offline solo lo que cambió desde el último
+     * cursor guardado. Sin cambios el servidor contesta 304 (ETag) y el
+     * navegador devuelve la copia que ya tenía; un pull completo
+     * (incremental: false) reemplaza el store.
+     */
+    async pullIncremental(url, storeName, key, save) {
+        const configKey = `cursor_${storeName}`;
+        const cursor = await ObyraDB.getConfig(configKey);
+        const sep = url.includes('?') ? '&' : '?';
+        const response = await fetch(cursor ? `${url}${sep}since=${encodeURIComponent(cursor)}` : url);
+        if (!response.ok) return;
+
+        const data = await response.json();
+        if (!data.incremental) {
+            await ObyraDB.clear(storeName);
+        }
+        if (data[key]) {
+            await save(data[key]);
+        }
+        for (const id of data.eliminados || []) {
+            await ObyraDB.delete(storeName, id);
+        }
+        if (data.cursor) {
+            await ObyraDB.setConfig(configKey, data.cursor);
+        }
+    },
+
     /**
      * Sincronizar cambios pendientes
      */
@@ -248,19 +257,18 @@ const OfflineManager = {
         try {
             const queue = await ObyraDB.getSyncQueue();
 
+            // Avances y tareas van juntos en un sync-batch (idempotente por offline_id)
+            const lote = queue.filter(op => op.type === 'CREATE_AVANCE' || op.type === 'UPDATE_TAREA');
+            if (lote.length) {
+                await this.syncBatch(lote);
+            }
+
             for (const operation of queue) {
+                if (lote.includes(operation)) continue;
                 try {
                     let response;
 
                     switch (operation.type) {
-                        case 'CREATE_AVANCE':
-                            response = await this.syncAvance(operation.data);
-                            break;
-
-                        case 'UPDATE_TAREA':
-                            response = await this.syncTarea(operation.data);
-                            break;
-
                         case 'UPLOAD_FOTO':
                             response = await this.syncFoto(operation.data);
                             break;
@@ -290,6 +298,40 @@ const OfflineManager = {
         }
     },
 
+    /**
+     * Sincronizar avances y actualizaciones de tareas en un solo request.
+     * Los resultados vienen en el mismo orden que las operaciones; las que
+     * fallan quedan en la cola para el próximo intento.
+     */
+    async syncBatch(operations) {
+        try {
+            const response = await fetch('/api/offline/sync-batch', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    operations: operations.map(op => ({ type: op.type, data: op.data }))
+                })
+            });
+            if (!response.ok) return;
+
+            const result = await response.json();
+            const results = result.results || [];
+            for (let i = 0; i < operations.length && i < results.length; i++) {
+                if (!results[i].success) continue;
+                const operation = operations[i];
+                if (operation.type === 'CREATE_AVANCE' && operation.data.id) {
+                    await ObyraDB.markAvanceSynced(operation.data.id, results[i].server_id);
+                }
+                await ObyraDB.removeFromSyncQueue(operation.id);
+            }
+            console.log(`[Offline] Lote sincronizado: ${result.synced} ok, ${result.failed} con error`);
+        } catch (error) {
+            console.error('[Offline] Error sincronizando lote:', error);
+        }
+    },
+
     /**
      * Sincronizar un avance
      */
@@ -490,6 +532,9 @@ const OfflineManager = {
             await ObyraDB.clear(ObyraDB.STORES.TAREAS);
             await ObyraDB.clear(ObyraDB.STORES.INVENTARIO);
             await ObyraDB.clear(ObyraDB.STORES.SYNC_QUEUE);
+            for (const store of [ObyraDB.STORES.OBRAS, ObyraDB.STORES.TAREAS, ObyraDB.STORES.INVENTARIO]) {
+                await ObyraDB.setConfig(`cursor_${store}`, null);
+            }
             this.showNotification('Datos eliminados', 'Se han eliminado los datos offline', 'info');
         }
     }
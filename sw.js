@@ -3,7 +3,7 @@
  * Permite a los operarios trabajar sin conexión a internet
  */
 
-const CACHE_VERSION = 'v5.1.0';  // Fix desync: auto-reload tras update + cleanup cache HTML
+const CACHE_VERSION = 'v5.2.0';  // /api/offline fuera del cache del SW (pull incremental + ETag)
 const STATIC_CACHE = `obyra-static-${CACHE_VERSION}`;
 const DYNAMIC_CACHE = `obyra-dynamic-${CACHE_VERSION}`;
 const DATA_CACHE = `obyra-data-${CACHE_VERSION}`;
@@ -121,6 +121,13 @@ self.addEventListener('fetch', (event) => {
         return;
     }
 
+    // /api/offline: los datos quedan en IndexedDB y el pull es incremental
+    // (?since=); el navegador revalida con ETag. Cachear cada URL con su
+    // cursor solo llenaría el cache.
+    if (url.pathname.startsWith('/api/offline/')) {
+        return;
+    }
+
     // Estrategia según el tipo de recurso
     if (isStaticAsset(url)) {
         // Cache First para estáticos
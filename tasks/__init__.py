@@ -10,6 +10,11 @@ Estructura:
 - emails.py: envío de emails (Resend API)
 - pdfs.py: generación de PDFs (WeasyPrint, ReportLab)
 - ia.py: cálculos pesados de IA (OpenAI)
+- evm.py: escaneo periódico de alertas EVM
+- alertas.py: snapshot de alertas del dashboard
+- geocoding.py: geocodificación masiva de obras
+- offline.py: limpieza de tombstones / registro del sync offline
+- marketplace.py: volcado por lotes de visitas de productos
 - reports.py: generación de reportes pesados
 
 Uso desde el código:
@@ -21,3 +26,8 @@ Uso desde el código:
 from tasks import emails  # noqa: F401
 from tasks import pdfs    # noqa: F401
 from tasks import ia      # noqa: F401
+from tasks import evm     # noqa: F401
+from tasks import alertas  # noqa: F401
+from tasks import geocoding  # noqa: F401
+from tasks import offline   # noqa: F401
+from tasks import marketplace  # noqa: F401
@@ -0,0 +1,50 @@
+"""
+Tareas Celery del snapshot de alertas del dashboard.
+
+Se corre periódicamente (ver beat_schedule en celery_app.py) y, si
+ALERTAS_REFRESCO_ASYNC=true, también a demanda cuando un movimiento de stock,
+una fichada o un cambio de estado de OC invalida el snapshot de una org.
+"""
+
+import logging
+from celery_app import celery
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name='tasks.alertas.refrescar_alertas_dashboard', bind=True, max_retries=2)
+def refrescar_alertas_dashboard(self, organizacion_id=None):
+    """
+    Recalcula el snapshot de alertas del dashboard.
+
+    Args:
+        organizacion_id: Si se indica, solo esa organización; si no, todas.
+
+    Returns:
+        dict con el total de alertas por organización
+    """
+    try:
+        from app import app
+        with app.app_context():
+            from models import Organizacion
+            from services.alertas_snapshot import recalcular_snapshot
+
+            if organizacion_id:
+                org_ids = [organizacion_id]
+            else:
+                org_ids = [oid for (oid,) in Organizacion.query.with_entities(Organizacion.id)]
+
+            resultado = {}
+            for oid in org_ids:
+                try:
+                    resultado[oid] = recalcular_snapshot(oid).conteo_total
+                except Exception as exc:
+                    logger.error(f'[TASK refrescar_alertas_dashboard] org {oid}: {exc}')
+                    resultado[oid] = None
+            return {'ok': True, 'alertas': resultado}
+    except Exception as exc:
+        logger.error(f'[TASK refrescar_alertas_dashboard] Error: {exc}')
+        try:
+            raise self.retry(countdown=60, exc=exc)
+        except self.MaxRetriesExceededError:
+            return {'ok': False, 'error': 'Error al refrescar alertas del dashboard'}
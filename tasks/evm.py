@@ -0,0 +1,51 @@
+"""
+Tareas Celery de Earned Value Management.
+
+El escaneo de alertas EVM recorre todas las tareas de cada organización; se
+corre periódicamente (ver beat_schedule en celery_app.py) y deja el resultado
+en la tabla alertas_evm para que los dashboards no recalculen por request.
+"""
+
+import logging
+from celery_app import celery
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name='tasks.evm.escanear_alertas_evm', bind=True, max_retries=2)
+def escanear_alertas_evm(self, organizacion_id=None):
+    """
+    Recalcula y persiste las alertas EVM.
+
+    Args:
+        organizacion_id: Si se indica, solo esa organización; si no, todas.
+
+    Returns:
+        dict con cantidad de alertas por organización
+    """
+    try:
+        from app import app
+        with app.app_context():
+            from models import Organizacion
+            from evm_utils import persistir_alertas_evm
+
+            if organizacion_id:
+                org_ids = [organizacion_id]
+            else:
+                org_ids = [oid for (oid,) in Organizacion.query.with_entities(Organizacion.id)]
+
+            resultado = {}
+            for oid in org_ids:
+                try:
+                    resultado[oid] = persistir_alertas_evm(oid)
+                except Exception as exc:
+                    # Una organización con datos rotos no frena al resto
+                    logger.error(f'[TASK escanear_alertas_evm] org {oid}: {exc}')
+                    resultado[oid] = None
+            return {'ok': True, 'alertas': resultado}
+    except Exception as exc:
+        logger.error(f'[TASK escanear_alertas_evm] Error: {exc}')
+        try:
+            raise self.retry(countdown=120, exc=exc)
+        except self.MaxRetriesExceededError:
+            return {'ok': False, 'error': 'Error al escanear alertas EVM'}
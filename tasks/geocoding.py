@@ -0,0 +1,59 @@
+"""
+Tareas Celery de geocodificación masiva de obras.
+
+La encola /obras/geocodificar-todas (una por org, ver
+services/geocoding_batch.encolar_geocodificacion). Cada lote de obras se
+commitea al terminar, así que un reintento o una corrida nueva sigue por las
+que faltan.
+"""
+
+import logging
+from celery_app import celery
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name='tasks.geocoding.geocodificar_obras', bind=True, max_retries=2)
+def geocodificar_obras(self, organizacion_id=None):
+    """
+    Geocodifica las obras sin coordenadas.
+
+    Args:
+        organizacion_id: Si se indica, solo esa organización; si no, todas.
+
+    Returns:
+        dict con el resumen (exitosas, fallidas, ...) por organización
+    """
+    try:
+        from app import app
+        with app.app_context():
+            from models import Organizacion
+            from services.geocoding_batch import geocodificar_obras_pendientes
+
+            if organizacion_id:
+                org_ids = [organizacion_id]
+            else:
+                org_ids = [oid for (oid,) in Organizacion.query.with_entities(Organizacion.id)]
+
+            def _progreso(org_id):
+                def _reportar(resumen):
+                    self.update_state(state='PROGRESS', meta={'organizacion_id': org_id, **resumen})
+                return _reportar
+
+            resultado = {}
+            for oid in org_ids:
+                try:
+                    resultado[oid] = geocodificar_obras_pendientes(oid, progreso=_progreso(oid))
+                except Exception as exc:
+                    if organizacion_id:
+                        raise
+                    logger.error(f'[TASK geocodificar_obras] org {oid}: {exc}')
+                    resultado[oid] = None
+            return {'ok': True, 'geocodificadas': resultado}
+    except Exception as exc:
+        logger.error(f'[TASK geocodificar_obras] Error: {exc}')
+        try:
+            raise self.retry(countdown=60, exc=exc)
+        except self.MaxRetriesExceededError:
+            return {'ok': False, 'error': 'Error al geocodificar obras'}
+
@@ -0,0 +1,30 @@
+"""
+Tareas Celery del marketplace.
+
+Las visitas de productos se acumulan en Redis (services/visitas_productos) y se
+vuelcan a Product.visitas por lotes cada MARKETPLACE_VISITAS_FLUSH_SEC (beat).
+"""
+
+import logging
+from celery_app import celery
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name='tasks.marketplace.volcar_visitas_productos', bind=True, max_retries=2)
+def volcar_visitas_productos(self):
+    """Aplica en Product.visitas las visitas acumuladas en el buffer."""
+    try:
+        from app import app
+        with app.app_context():
+            from services.visitas_productos import volcar_visitas
+            resultado = volcar_visitas()
+            if resultado['visitas']:
+                logger.info(f'[TASK volcar_visitas_productos] {resultado}')
+            return {'ok': True, **resultado}
+    except Exception as exc:
+        logger.error(f'[TASK volcar_visitas_productos] Error: {exc}')
+        try:
+            raise self.retry(countdown=30, exc=exc)
+        except self.MaxRetriesExceededError:
+            return {'ok': False, 'error': 'Error al volcar visitas de productos'}
@@ -0,0 +1,30 @@
+"""
+Tareas Celery del sync offline (/api/offline).
+
+Los tombstones y el registro de offline_id aplicados solo hacen falta mientras
+un cliente pueda mandar un cursor o reintentar un lote de esa época
+(OFFLINE_TOMBSTONE_DIAS); pasado eso se borran una vez por día (beat).
+"""
+
+import logging
+from celery_app import celery
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task(name='tasks.offline.purgar_registros_sync', bind=True, max_retries=2)
+def purgar_registros_sync(self):
+    """Borra tombstones y offline_id aplicados fuera de la retención."""
+    try:
+        from app import app
+        with app.app_context():
+            from services.offline_sync import purgar_registros_sync as purgar
+            borrados = purgar()
+            logger.info(f'[TASK purgar_registros_sync] {borrados}')
+            return {'ok': True, 'borrados': borrados}
+    except Exception as exc:
+        logger.error(f'[TASK purgar_registros_sync] Error: {exc}')
+        try:
+            raise self.retry(countdown=300, exc=exc)
+        except self.MaxRetriesExceededError:
+            return {'ok': False, 'error': 'Error al purgar registros del sync offline'}
@@ -3,6 +3,10 @@ Tareas Celery para generación de PDFs.
 
 Las generaciones de PDF (presupuestos, recibos, reportes) son operaciones
 pesadas que pueden bloquear workers HTTP por varios segundos.
+
+render_pdf_job es el que usan las vistas con PDF_ASYNC=true (ver
+services/pdf_concurrency.render_pdf_cacheado): la vista deja el HTML ya
+renderizado en storage y el worker solo corre WeasyPrint.
 """
 
 import logging
@@ -71,3 +75,49 @@ def generate_reporte_pdf_async(self, reporte_tipo, params):
     except Exception as exc:
         logger.error(f'[TASK generate_reporte_pdf_async] Error: {exc}')
         return {'ok': False, 'error': 'Error al generar reporte'}
+
+
+@celery.task(name='tasks.pdfs.render_pdf_job', bind=True, max_retries=2)
+def render_pdf_job(self, job_id, opciones=None):
+    """
+    Renderiza el HTML de un job de PDF y deja el resultado en el cache.
+
+    Args:
+        job_id: hash del contenido (services.pdf_concurrency.pdf_cache_key)
+        opciones: kwargs de WeasyPrint (ej. presentational_hints)
+
+    Returns:
+        dict con 'ok' y 'job_id'
+    """
+    from services.pdf_concurrency import (_storage_key, guardar_pdf_cacheado,
+                                          job_terminado, leer_pdf_cacheado,
+                                          renderizar_pdf)
+    from services.storage_service import storage
+
+    html_key = _storage_key(job_id, 'html')
+    try:
+        if leer_pdf_cacheado(job_id) is None:
+            html = storage.read(html_key).decode('utf-8')
+            guardar_pdf_cacheado(job_id, renderizar_pdf(html, **(opciones or {})))
+        storage.delete(html_key)
+        job_terminado(job_id)
+        return {'ok': True, 'job_id': job_id}
+    except FileNotFoundError:
+        job_terminado(job_id)
+        logger.error(f'[TASK render_pdf_job] {job_id}: HTML no encontrado')
+        raise
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=10)
+        job_terminado(job_id)
+        logger.error(f'[TASK render_pdf_job] {job_id}: {exc}')
+        raise
+
+
+@celery.task(name='tasks.pdfs.purgar_cache_pdf', bind=True, max_retries=2)
+def purgar_cache_pdf(self):
+    """Borra del cache local los PDFs mas viejos que PDF_CACHE_DIAS (beat)."""
+    from services.pdf_concurrency import purgar_cache_local
+    borrados = purgar_cache_local()
+    logger.info(f'[TASK purgar_cache_pdf] {borrados} PDFs borrados del cache')
+    return {'ok': True, 'borrados': borrados}
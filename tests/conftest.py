@@ -271,3 +271,76 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "integration: tests de integración")
     config.addinivalue_line("markers", "slow: tests lentos")
     config.addinivalue_line("markers", "security: tests de seguridad/multi-tenant")
+
+
+# === Redis en memoria para el cache de dos niveles (config/cache_config.py) ===
+# Implementa solo los comandos que usa el modulo y cuenta los round trips.
+
+class _Pipeline:
+    def __init__(self, r):
+        self.r = r
+        self.ops = []
+
+    def incr(self, key):
+        self.ops.append(key)
+
+    def execute(self):
+        return [self.r.incr(k) for k in self.ops]
+
+
+class _RedisEnMemoria:
+    def __init__(self):
+        self.data = {}
+        self.llamadas = 0
+        self.publicados = []
+
+    def mget(self, keys):
+        self.llamadas += 1
+        return [self.data.get(k) for k in keys]
+
+    def set(self, key, value, nx=False, px=None):
+        self.llamadas += 1
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.llamadas += 1
+        self.data[key] = value
+
+    def delete(self, *keys):
+        self.llamadas += 1
+        return sum(1 for k in keys if self.data.pop(k, None) is not None)
+
+    def incr(self, key):
+        self.llamadas += 1
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+    def pipeline(self, transaction=False):
+        return _Pipeline(self)
+
+    def publish(self, channel, payload):
+        self.publicados.append(payload)
+
+    def scan_iter(self, match=None, count=100):
+        raise AssertionError('no deberia hacer SCAN')
+
+
+@pytest.fixture
+def redis_fake(monkeypatch):
+    from config import cache_config as cc
+
+    fake = _RedisEnMemoria()
+    cfg = cc.get_cache()
+    monkeypatch.setattr(cfg, 'enabled', True)
+    monkeypatch.setattr(cfg, 'redis_client', fake)
+    monkeypatch.setattr(cfg, 'stampede_wait', 0.1)
+    # Sin listener de pub/sub: el proceso de test hace de unico worker
+    monkeypatch.setattr(cc, '_listener_pid', cc.os.getpid())
+    cc.get_local_cache().clear()
+    cc.reset_cache_stats()
+    yield fake
+    cc.get_local_cache().clear()
+    cc.reset_cache_stats()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Tests del snapshot de alertas del dashboard (services/alertas_snapshot.py).
+
+Fija que el dashboard lee del snapshot lo mismo que daban los colectores en
+vivo, que un movimiento de stock lo invalida al commitear y que un colector
+colgado no frena al resto ni deja guardado un snapshot parcial.
+"""
+import time
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from extensions import db
+from models import ItemInventario, MovimientoInventario, AlertaDashboardSnapshot
+from services import alertas_dashboard
+from services.alertas_dashboard import (obtener_todas_alertas, contar_alertas_por_severidad,
+                                        recolectar_alertas, aplanar_alertas, contar_por_severidad)
+from services.alertas_snapshot import recalcular_snapshot
+
+
+def _item_sin_stock(test_org):
+    item = ItemInventario(codigo=f'SNAP-{uuid.uuid4().hex[:6]}', nombre='Cemento snapshot',
+                          unidad='bolsa', stock_actual=Decimal('0'), stock_minimo=Decimal('10'),
+                          organizacion_id=test_org.id)
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+@pytest.mark.unit
+def test_snapshot_igual_a_colectores_en_vivo(app, test_org):
+    with app.app_context():
+        item = _item_sin_stock(test_org)
+        try:
+            with app.test_request_context():
+                por_tipo, tiempos = recolectar_alertas(test_org.id, limite_por_tipo=100)
+                vivo = aplanar_alertas(por_tipo, 3)
+
+                alertas = obtener_todas_alertas(test_org.id)
+                snapshot = AlertaDashboardSnapshot.query.filter_by(organizacion_id=test_org.id).one()
+                assert snapshot.vigente
+                assert set(snapshot.tiempos_ms) == set(tiempos)
+                assert [(a['tipo'], a['titulo']) for a in alertas] == \
+                    [(a['tipo'], a['titulo']) for a in vivo]
+                # El objeto ORM del colector no se guarda en el JSON
+                assert 'item' not in snapshot.alertas['stock_bajo'][0]
+                assert contar_alertas_por_severidad(test_org.id) == contar_por_severidad(por_tipo)
+        finally:
+            AlertaDashboardSnapshot.query.filter_by(organizacion_id=test_org.id).delete()
+            db.session.delete(item)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_movimiento_de_stock_invalida_snapshot(app, test_org, test_user):
+    with app.app_context():
+        item = _item_sin_stock(test_org)
+        try:
+            with app.test_request_context():
+                obtener_todas_alertas(test_org.id)
+            mov = MovimientoInventario(item_id=item.id, tipo='entrada', cantidad=Decimal('50'),
+                                       usuario_id=test_user.id)
+            item.stock_actual = Decimal('50')
+            db.session.add(mov)
+            db.session.commit()
+
+            snapshot = AlertaDashboardSnapshot.query.filter_by(organizacion_id=test_org.id).one()
+            db.session.refresh(snapshot)
+            assert snapshot.vigente is False
+
+            with app.test_request_context():
+                titulos = [a['titulo'] for a in obtener_todas_alertas(test_org.id, limite_por_tipo=5)]
+            assert 'Sin stock: Cemento snapshot' not in titulos
+            db.session.delete(mov)
+        finally:
+            AlertaDashboardSnapshot.query.filter_by(organizacion_id=test_org.id).delete()
+            db.session.delete(item)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_colector_lento_expira_sin_frenar_al_resto(app, test_org, monkeypatch):
+    def lento(org_id, limite):
+        time.sleep(0.5)
+        return [{'tipo': 'lento', 'severidad': 'alta', 'titulo': 'x'}]
+
+    colectores = alertas_dashboard.colectores_alertas()
+    monkeypatch.setattr(alertas_dashboard, 'colectores_alertas',
+                        lambda: colectores[:2] + [('lento', lento)])
+    with app.test_request_context():
+        por_tipo, tiempos = recolectar_alertas(test_org.id, timeout=0.2)
+    assert tiempos['lento'] is None and 'lento' not in por_tipo
+    assert all(tiempos[nombre] is not None for nombre, _ in colectores[:2])
+
+
+@pytest.mark.unit
+def test_pasada_incompleta_no_se_guarda_ni_reencola(app, test_org, monkeypatch):
+    corridas = []
+
+    def colgado(org_id, limite):
+        corridas.append(org_id)
+        time.sleep(0.5)
+        return []
+
+    monkeypatch.setattr(alertas_dashboard, 'colectores_alertas', lambda: [('colgado', colgado)])
+    monkeypatch.setattr(alertas_dashboard, 'ALERTAS_TIMEOUT_SEC', 0.1)
+    with app.app_context():
+        AlertaDashboardSnapshot.query.filter_by(organizacion_id=test_org.id).delete()
+        db.session.commit()
+        snapshot = recalcular_snapshot(test_org.id)
+        assert snapshot.vigente is False and snapshot.tiempos_ms == {'colgado': None}
+        assert AlertaDashboardSnapshot.query.filter_by(organizacion_id=test_org.id).count() == 0
+
+        # Mientras el colector expirado sigue en el pool no se encola de nuevo
+        _, tiempos = recolectar_alertas(test_org.id, timeout=0.1)
+        assert tiempos == {'colgado': None} and corridas == [test_org.id]
+    time.sleep(0.5)
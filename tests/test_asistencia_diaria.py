@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Tests de la asistencia diaria (services/asistencia_diaria.py).
+
+Fija que fichadas_asistencia_diaria sigue a las fichadas (alta, cambio de
+día, baja), que reconstruir_asistencia da lo mismo que los hooks y que
+calcular_resumen_horas arma días, semanas, quincenas y meses desde la tabla.
+"""
+import uuid
+from datetime import date, datetime
+
+import pytest
+
+from extensions import db
+from models import AsistenciaDiaria, Fichada, Obra
+from services import asistencia_diaria
+
+
+def _obra(org):
+    obra = Obra(nombre=f"Obra fichadas {uuid.uuid4().hex[:6]}", cliente="Cliente",
+                organizacion_id=org.id, estado='en_curso')
+    db.session.add(obra)
+    db.session.commit()
+    return obra
+
+
+def _fichar(obra, usuario, tipo, cuando):
+    fichada = Fichada(usuario_id=usuario.id, obra_id=obra.id, tipo=tipo, fecha_hora=cuando)
+    db.session.add(fichada)
+    db.session.commit()
+    return fichada
+
+
+def _dias(obra):
+    return {a.fecha: (a.segundos, a.pares, a.en_obra, a.cantidad_fichadas)
+            for a in AsistenciaDiaria.query.filter_by(obra_id=obra.id).all()}
+
+
+def _limpiar(obra):
+    Fichada.query.filter_by(obra_id=obra.id).delete()
+    AsistenciaDiaria.query.filter_by(obra_id=obra.id).delete()
+    db.session.delete(obra)
+    db.session.commit()
+
+
+@pytest.mark.unit
+def test_asistencia_sigue_a_las_fichadas(app, test_org, test_user):
+    asistencia_diaria.registrar_hooks_asistencia()
+    with app.app_context():
+        obra = _obra(test_org)
+        try:
+            _fichar(obra, test_user, 'ingreso', datetime(2026, 3, 2, 8, 0))
+            assert _dias(obra) == {date(2026, 3, 2): (0, 0, True, 1)}
+
+            _fichar(obra, test_user, 'egreso', datetime(2026, 3, 2, 12, 30))
+            _fichar(obra, test_user, 'ingreso', datetime(2026, 3, 2, 13, 30))
+            tarde = _fichar(obra, test_user, 'egreso', datetime(2026, 3, 2, 17, 0))
+            fila = AsistenciaDiaria.query.filter_by(obra_id=obra.id).one()
+            assert (fila.segundos, fila.pares, fila.en_obra) == (8 * 3600, 2, False)
+            assert fila.detalle_pares[1] == {'ingreso': '13:30', 'egreso': '17:00', 'segundos': 12600}
+
+            # Mover una fichada a otro día recalcula los dos días
+            tarde.fecha_hora = datetime(2026, 3, 3, 17, 0)
+            db.session.commit()
+            assert _dias(obra) == {date(2026, 3, 2): (16200, 1, True, 3),
+                                   date(2026, 3, 3): (0, 0, False, 1)}
+
+            db.session.delete(tarde)
+            db.session.commit()
+            assert date(2026, 3, 3) not in _dias(obra)
+
+            # Rearmar desde las fichadas da lo mismo que los hooks
+            antes = _dias(obra)
+            assert asistencia_diaria.reconstruir_asistencia(obra_id=obra.id) == 1
+            assert _dias(obra) == antes
+        finally:
+            _limpiar(obra)
+
+
+@pytest.mark.unit
+def test_resumen_desde_la_asistencia(app, test_org, test_user):
+    asistencia_diaria.registrar_hooks_asistencia()
+    from fichadas import calcular_resumen_horas
+
+    with app.app_context():
+        obra = _obra(test_org)
+        try:
+            for dia in (10, 16, 17):
+                _fichar(obra, test_user, 'ingreso', datetime(2026, 4, dia, 8, 0))
+                _fichar(obra, test_user, 'egreso', datetime(2026, 4, dia, 16, 0))
+            # Fuera del período
+            _fichar(obra, test_user, 'ingreso', datetime(2026, 5, 4, 8, 0))
+
+            resumen = calcular_resumen_horas(obra.id, desde='2026-04-01', hasta='2026-04-30')
+            assert len(resumen) == 1
+            item = resumen[0]
+            assert item['usuario'].id == test_user.id
+            assert [d['fecha'] for d in item['dias']] == [date(2026, 4, 10), date(2026, 4, 16),
+                                                         date(2026, 4, 17)]
+            assert item['dias'][0]['pares'] == [{'ingreso': '08:00', 'egreso': '16:00', 'segundos': 28800}]
+            assert item['total_horas_str'] == '24h 00m'
+            assert [q['quincena'] for q in item['por_quincena']] == ['2026-04 1ra', '2026-04 2da']
+            assert [s['total_segundos'] for s in item['por_semana']] == [28800, 57600]
+            assert item['por_mes'] == [{'mes': '2026-04', 'horas_str': '24h 00m', 'total_segundos': 86400}]
+
+            assert calcular_resumen_horas(obra.id)[0]['dias'][-1]['horas_str'] == 'En obra'
+        finally:
+            _limpiar(obra)
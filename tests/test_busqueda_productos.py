@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Tests de la búsqueda de productos (services/busqueda_productos.py).
+
+En SQLite corre el índice en memoria: se fija que la búsqueda ignora acentos
+y busca por prefijo, que un cambio de nombre se ve después del commit, el
+paginado por keyset sin duplicados (aunque cambien filas de páginas ya vistas),
+el filtro por prefijos que se usa cuando el tsquery queda vacío y las facetas
+por categoría y precio.
+"""
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from extensions import db
+from models import Category, Product, ProductVariant, Supplier
+from services import busqueda_productos
+from services.marketplace_service import MarketplaceService
+
+
+@pytest.fixture
+def catalogo(app):
+    busqueda_productos.registrar_hooks_busqueda_productos()
+    with app.app_context():
+        sufijo = uuid.uuid4().hex[:8]
+        supplier = Supplier(razon_social=f'Proveedor {sufijo}', cuit=f'30-{sufijo}',
+                            email=f'prov_{sufijo}@example.com')
+        materiales = Category(nombre=f'Materiales {sufijo}')
+        herramientas = Category(nombre=f'Herramientas {sufijo}')
+        db.session.add_all([supplier, materiales, herramientas])
+        db.session.flush()
+
+        def _producto(nombre, categoria, precio, visitas=0, estado='publicado', descripcion=None):
+            product = Product(supplier_id=supplier.id, category_id=categoria.id, nombre=nombre,
+                              descripcion=descripcion, slug=f'{uuid.uuid4().hex}', estado=estado,
+                              visitas=visitas)
+            product.variants.append(ProductVariant(sku=uuid.uuid4().hex[:12], unidad='u',
+                                                   precio=Decimal(precio), stock=10))
+            db.session.add(product)
+            return product
+
+        productos = {
+            'ladrillo': _producto(f'Ladrillo Cerámico {sufijo}', materiales, '800', visitas=5),
+            'hueco': _producto(f'Ladrillo hueco {sufijo}', materiales, '1500', visitas=9),
+            'cemento': _producto(f'Cemento Portland {sufijo}', materiales, '9000',
+                                 descripcion='Bolsa de 50 kg, fragüe normal'),
+            'amoladora': _producto(f'Amoladora angular {sufijo}', herramientas, '85000'),
+            'borrador': _producto(f'Ladrillo borrador {sufijo}', materiales, '100', estado='borrador'),
+        }
+        db.session.commit()
+        yield sufijo, productos, materiales
+        for product in productos.values():
+            db.session.delete(product)
+        db.session.delete(supplier)
+        db.session.delete(materiales)
+        db.session.delete(herramientas)
+        db.session.commit()
+
+
+def _nombres(productos):
+    return [' '.join(p.nombre.split()[:2]) for p in productos]
+
+
+@pytest.mark.unit
+def test_busqueda_sin_acentos_y_por_prefijo(app, catalogo):
+    sufijo, productos, _ = catalogo
+    servicio = MarketplaceService()
+
+    assert productos['ladrillo'].texto_busqueda.startswith('ladrillo ceramico')
+    encontrados = servicio.search_products(query=f'ceramico {sufijo}')
+    assert encontrados == [productos['ladrillo']]
+    # Prefijo, sin borradores, por relevancia y después más visitados
+    assert _nombres(servicio.search_products(query=f'LADRI {sufijo}')) == [
+        'Ladrillo hueco', 'Ladrillo Cerámico']
+    # También busca en la descripción
+    assert servicio.search_products(query=f'fragüe {sufijo}') == [productos['cemento']]
+    assert servicio.search_products(query=f'ladrillo {sufijo}', max_price=Decimal('1000')) == [
+        productos['ladrillo']]
+
+    # El cambio de nombre se ve después del commit
+    productos['amoladora'].nombre = f'Amoladora inalámbrica {sufijo}'
+    db.session.commit()
+    assert servicio.search_products(query=f'inalambrica {sufijo}') == [productos['amoladora']]
+
+
+@pytest.mark.unit
+def test_paginado_y_facetas(app, catalogo):
+    sufijo, productos, materiales = catalogo
+    servicio = MarketplaceService()
+
+    vistos = []
+    pagina = servicio.search_products_page(query=sufijo, limit=2, facetas=True)
+    assert pagina['total'] == 4
+    while True:
+        vistos.extend(pagina['productos'])
+        if not pagina['siguiente']:
+            break
+        pagina = servicio.search_products_page(query=sufijo, limit=2, cursor=pagina['siguiente'])
+    assert len(vistos) == 4 and len(set(p.id for p in vistos)) == 4
+
+    facetas = servicio.search_products_page(query=sufijo, category_id=materiales.id,
+                                            facetas=True)['facetas']
+    # La faceta de categoría ignora el filtro de categoría
+    assert sorted(c['cantidad'] for c in facetas['categorias']) == [1, 3]
+    precios = {r['rango']: r['cantidad'] for r in facetas['precios']}
+    assert precios == {'0-1000': 1, '1000-5000': 1, '5000-20000': 1, '20000-100000': 0, '100000+': 0}
+
+
+@pytest.mark.unit
+def test_cursor_keyset_no_se_corre_con_altas(app, catalogo):
+    sufijo, productos, _ = catalogo
+    primera = busqueda_productos.buscar_productos(query=sufijo, limit=2)
+    assert _nombres(primera['productos']) == ['Ladrillo hueco', 'Ladrillo Cerámico']
+
+    # Un producto más visitado entra antes de la página ya vista: con OFFSET
+    # se repetiría 'Ladrillo Cerámico' en la segunda página
+    productos['borrador'].estado = 'publicado'
+    productos['borrador'].visitas = 50
+    db.session.commit()
+    segunda = busqueda_productos.buscar_productos(query=sufijo, limit=2, cursor=primera['siguiente'])
+    assert {p.id for p in segunda['productos']} == {productos['cemento'].id, productos['amoladora'].id}
+
+    # Un cursor roto (o del formato anterior) vuelve a la primera página
+    assert busqueda_productos.buscar_productos(query=sufijo, limit=2, cursor='MTA=')['productos'][0] == \
+        productos['borrador']
+
+
+@pytest.mark.unit
+def test_filtro_por_prefijos(app, catalogo):
+    sufijo, productos, _ = catalogo
+    filtro = busqueda_productos._filtro_prefijos(['cerami', sufijo])
+    assert Product.query.filter(filtro).all() == [productos['ladrillo']]
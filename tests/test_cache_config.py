@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Tests del cache de dos niveles (config/cache_config.py).
+
+No hace falta un Redis real: el fixture `redis_fake` (conftest) implementa solo
+los comandos que usa el modulo (MGET/SET NX/SETEX/DEL/INCR/PUBLISH) y cuenta los
+round trips, que es justamente lo que queremos fijar: un hit local no toca Redis
+y una invalidacion por tag no hace SCAN.
+"""
+import pytest
+
+from config import cache_config as cc
+
+
+def _contador():
+    llamadas = {'n': 0}
+
+    @cc.cache_query(ttl=60, key_prefix='t_org', tags=lambda org_id: [f'org:{org_id}'])
+    def settings(org_id):
+        llamadas['n'] += 1
+        return {'org': org_id, 'n': llamadas['n']}
+
+    return settings, llamadas
+
+
+@pytest.mark.unit
+def test_hit_local_no_toca_redis(redis_fake):
+    settings, llamadas = _contador()
+    assert settings(1) == {'org': 1, 'n': 1}
+    antes = redis_fake.llamadas
+    assert settings(1) == {'org': 1, 'n': 1}
+    assert redis_fake.llamadas == antes
+    assert llamadas['n'] == 1
+    stats = cc.cache_stats()['prefixes']['t_org']
+    assert stats['misses'] == 1 and stats['local_hits'] == 1
+
+
+@pytest.mark.unit
+def test_hit_redis_cuando_el_lru_local_esta_vacio(redis_fake):
+    settings, llamadas = _contador()
+    settings(1)
+    cc.get_local_cache().clear()  # simula otro worker
+    assert settings(1) == {'org': 1, 'n': 1}
+    assert llamadas['n'] == 1
+    assert cc.cache_stats()['prefixes']['t_org']['redis_hits'] == 1
+
+
+@pytest.mark.unit
+def test_invalidar_tag_solo_afecta_esa_org(redis_fake):
+    settings, llamadas = _contador()
+    settings(1)
+    settings(2)
+    assert cc.invalidate_tags('org:1') is True
+    assert settings(1)['n'] == 3
+    assert settings(2)['n'] == 2
+    # La version invalida tambien la copia en Redis (otro worker sin LRU)
+    cc.get_local_cache().clear()
+    assert settings(1)['n'] == 3
+    assert any('"org:1"' in p for p in redis_fake.publicados)
+
+
+@pytest.mark.unit
+def test_invalidate_pattern_de_prefijo_no_hace_scan(redis_fake):
+    settings, llamadas = _contador()
+    settings(1)
+    assert cc.invalidate_pattern('obyra:t_org:*') == 1  # la entrada del LRU local
+    cc.get_local_cache().clear()
+    settings(1)
+    assert llamadas['n'] == 2
+
+
+@pytest.mark.unit
+def test_lru_local_acotado_y_por_tags():
+    lru = cc.LocalLRUCache(maxsize=2)
+    lru.set('a', 1, 60, ['x'])
+    lru.set('b', 2, 60, ['y'])
+    lru.get('a')
+    lru.set('c', 3, 60, ['x'])
+    assert lru.get('b') == (False, None)  # el menos usado se va
+    assert lru.invalidate_tags(['x']) == 2
+    assert len(lru) == 0
+
+
+@pytest.mark.unit
+def test_recalculo_previo_a_invalidacion_no_se_guarda_local():
+    lru = cc.LocalLRUCache()
+    gen = lru.generation
+    lru.invalidate_tags(['org:1'])
+    assert lru.set('k', 'viejo', 60, ['org:1'], generation=gen) is False
+    assert lru.get('k') == (False, None)
+
+
+@pytest.mark.unit
+def test_local_fallback_sin_redis_cachea_en_el_lru(monkeypatch):
+    monkeypatch.setattr(cc.get_cache(), 'enabled', False)
+    cc.get_local_cache().clear()
+    llamadas = {'n': 0}
+
+    @cc.cache_query(ttl=60, key_prefix='t_fallback', tags=lambda org_id: [f'org:{org_id}'],
+                    local_fallback=True)
+    def precios(org_id):
+        llamadas['n'] += 1
+        return {'org': org_id}
+
+    precios(1)
+    precios(1)
+    assert llamadas['n'] == 1
+    cc.invalidate_tags('org:1')
+    precios(1)
+    assert llamadas['n'] == 2
+    cc.get_local_cache().clear()
+
+
+@pytest.mark.unit
+def test_local_fallback_respeta_el_ttl_local(monkeypatch):
+    monkeypatch.setattr(cc.get_cache(), 'enabled', False)
+    monkeypatch.setattr(cc.get_cache(), 'local_ttl', 5)
+    cc.get_local_cache().clear()
+    ttls = []
+    monkeypatch.setattr(cc.get_local_cache(), 'set',
+                        lambda key, value, ttl, *a, **k: ttls.append(ttl) or True)
+
+    @cc.cache_query(ttl=3600, key_prefix='t_fallback_ttl', local_fallback=True)
+    def valor(x):
+        return {'x': x}
+
+    valor(1)
+    assert ttls == [5]
+    assert cc.invalidate_pattern('obyra:t_fallback_ttl:nada*') == 0
+
+
+@pytest.mark.unit
+def test_negative_ttl_aplica_solo_a_resultados_vacios(monkeypatch):
+    monkeypatch.setattr(cc.get_cache(), 'enabled', False)
+    cc.get_local_cache().clear()
+    llamadas = []
+
+    @cc.cache_query(ttl=60, key_prefix='t_negativo', local_fallback=True, negative_ttl=0)
+    def buscar(q):
+        llamadas.append(q)
+        return [q] if q != 'nada' else []
+
+    buscar('algo')
+    buscar('algo')
+    buscar('nada')
+    buscar('nada')
+    assert llamadas == ['algo', 'nada', 'nada']
+    cc.get_local_cache().clear()
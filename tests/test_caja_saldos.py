@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests del saldo de caja por obra (services/caja_saldos.py).
+
+Fija que caja_saldos_obra sigue a los movimientos confirmados (alta, anulación,
+borrado), que la lectura agrupada da lo mismo que el rollup y que la
+reconciliación detecta y corrige un saldo desfasado.
+"""
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from extensions import db
+from models import MovimientoCaja, Obra, SaldoCajaObra
+from services import caja_saldos
+
+
+def _obra(org):
+    obra = Obra(nombre=f"Obra caja {uuid.uuid4().hex[:6]}", cliente="Cliente",
+                organizacion_id=org.id, estado='en_curso')
+    db.session.add(obra)
+    db.session.commit()
+    return obra
+
+
+def _movimiento(obra, tipo, monto, estado='confirmado'):
+    mov = MovimientoCaja(numero=f"MV-T-{uuid.uuid4().hex[:8]}", organizacion_id=obra.organizacion_id,
+                         obra_id=obra.id, tipo=tipo, monto=Decimal(monto),
+                         fecha_movimiento=date.today(), estado=estado)
+    db.session.add(mov)
+    db.session.commit()
+    return mov
+
+
+def _limpiar(obra):
+    MovimientoCaja.query.filter_by(obra_id=obra.id).delete()
+    SaldoCajaObra.query.filter_by(obra_id=obra.id).delete()
+    db.session.delete(obra)
+    db.session.commit()
+
+
+@pytest.mark.unit
+def test_saldo_sigue_a_los_movimientos(app, test_org):
+    caja_saldos.registrar_hooks_saldos_caja()
+    with app.app_context():
+        obra = _obra(test_org)
+        try:
+            _movimiento(obra, 'transferencia_a_obra', '1000')
+            gasto = _movimiento(obra, 'gasto_obra', '300')
+            pendiente = _movimiento(obra, 'pago_proveedor', '50', estado='pendiente')
+            assert caja_saldos.saldo_caja_obra(obra.id) == 700.0
+
+            # Confirmar y anular ajustan el saldo en el mismo commit
+            pendiente.estado = 'confirmado'
+            db.session.commit()
+            assert caja_saldos.saldo_caja_obra(obra.id) == 650.0
+            gasto.estado = 'anulado'
+            db.session.commit()
+            assert caja_saldos.saldos_caja_obras([obra.id])[obra.id] == {
+                'transferido': 1000.0, 'gastado': 50.0, 'saldo': 950.0}
+
+            db.session.delete(pendiente)
+            db.session.commit()
+            assert caja_saldos.saldo_caja_obra(obra.id, bloquear=True) == 1000.0
+            db.session.rollback()
+        finally:
+            _limpiar(obra)
+
+
+@pytest.mark.unit
+def test_lectura_agrupada_y_reconciliacion(app, test_org, monkeypatch):
+    caja_saldos.registrar_hooks_saldos_caja()
+    with app.app_context():
+        obra = _obra(test_org)
+        vacia = _obra(test_org)
+        try:
+            _movimiento(obra, 'transferencia_a_obra', '500')
+            _movimiento(obra, 'devolucion_obra', '120')
+            rollup = caja_saldos.saldos_caja_obras([obra.id, vacia.id])
+            assert rollup[vacia.id]['saldo'] == 0.0
+
+            monkeypatch.setattr(caja_saldos, 'CAJA_SALDOS_ROLLUP', False)
+            assert caja_saldos.saldos_caja_obras([obra.id, vacia.id]) == rollup
+            monkeypatch.setattr(caja_saldos, 'CAJA_SALDOS_ROLLUP', True)
+
+            assert caja_saldos.reconciliar_saldos(org_id=test_org.id) == []
+
+            # Un UPDATE masivo no pasa por los hooks: la reconciliación lo detecta
+            MovimientoCaja.query.filter_by(obra_id=obra.id, tipo='devolucion_obra').update(
+                {'estado': 'anulado'}, synchronize_session=False)
+            db.session.commit()
+            diferencias = caja_saldos.reconciliar_saldos(org_id=test_org.id, fix=True)
+            assert [(d['obra_id'], d['gastado'], d['gastado_real']) for d in diferencias] == [
+                (obra.id, Decimal('120'), Decimal('0'))]
+            assert caja_saldos.saldo_caja_obra(obra.id) == 500.0
+            assert caja_saldos.reconciliar_saldos(org_id=test_org.id) == []
+        finally:
+            _limpiar(obra)
+            _limpiar(vacia)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests del cache de precios de la calculadora IA (calculadora_ia.py).
+
+Sin Redis el mapa queda en el LRU local (mismo comportamiento que el dict por
+proceso de antes); lo que se fija es que es por org, que un hit no consulta la
+base y que cambiar un precio de inventario o importar un presupuesto lo invalida.
+"""
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from config import cache_config as cc
+from extensions import db
+from models import ItemInventario
+
+
+@pytest.fixture
+def lru_limpio():
+    cc.get_local_cache().clear()
+    cc.reset_cache_stats()
+    yield
+    cc.get_local_cache().clear()
+    cc.reset_cache_stats()
+
+
+def _item(org_id, codigo, precio):
+    item = ItemInventario(codigo=codigo, nombre=f'Item {codigo}', unidad='u',
+                          precio_promedio=Decimal(str(precio)), organizacion_id=org_id)
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+@pytest.mark.unit
+def test_mapa_de_precios_cacheado_por_org_e_invalidado(app, test_org, test_org_b, lru_limpio):
+    from sqlalchemy import event
+    from calculadora_ia import _get_price_cache, _PRICE_CACHE_VERSION
+
+    codigo = f'MAT-CALC-{uuid.uuid4().hex[:6]}'
+    with app.app_context():
+        item = _item(test_org.id, codigo, 1200)
+        otro = _item(test_org_b.id, codigo, 999)
+        try:
+            assert _get_price_cache(test_org.id)[codigo][:2] == ('1200.00', 'inventario')
+            assert _get_price_cache(test_org_b.id)[codigo][0] == '999.00'
+
+            queries = []
+
+            def _contar(conn, cursor, statement, *args):
+                queries.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', _contar)
+            try:
+                _get_price_cache(test_org.id)
+                _get_price_cache(test_org_b.id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', _contar)
+            assert queries == []
+
+            # Cambio de precio: al commitear se invalida solo esa org
+            item.precio_promedio = Decimal('1500')
+            db.session.commit()
+            assert _get_price_cache(test_org.id)[codigo][0] == '1500.00'
+
+            stats = cc.cache_stats()['prefixes'][f'calc_precios_v{_PRICE_CACHE_VERSION}']
+            assert stats['misses'] == 3 and stats['local_hits'] == 2
+            assert stats['avg_miss_ms'] > 0
+        finally:
+            db.session.delete(item)
+            db.session.delete(otro)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_mo_lista_propia_guarda_varias_orgs(app, test_org, test_org_b, lru_limpio, monkeypatch):
+    import calculadora_ia
+    from models.provider_price_list import ProviderPriceList
+
+    with app.app_context():
+        for org, precio in ((test_org.id, 10000), (test_org_b.id, 20000)):
+            db.session.add(ProviderPriceList(
+                organizacion_id=org, descripcion='Oficial albañil', descripcion_normalizada='oficial albanil',
+                unidad='jornal', precio_unitario=Decimal(precio), fuente='lista_propia_obyra'))
+        db.session.commit()
+        try:
+            a = calculadora_ia._obtener_mo_lista_propia_por_categoria(test_org.id)
+            b = calculadora_ia._obtener_mo_lista_propia_por_categoria(test_org_b.id)
+            assert (a['oficial'], b['oficial']) == (10000.0, 20000.0)
+
+            # Alternar orgs ya no recalcula (antes el cache guardaba una sola)
+            llamadas = []
+            monkeypatch.setattr(db.session, 'query', lambda *a, **k: llamadas.append(a))
+            calculadora_ia._obtener_mo_lista_propia_por_categoria(test_org.id)
+            calculadora_ia._obtener_mo_lista_propia_por_categoria(test_org_b.id)
+            assert llamadas == []
+        finally:
+            monkeypatch.undo()
+            ProviderPriceList.query.filter_by(fuente='lista_propia_obyra').delete()
+            db.session.commit()
@@ -243,3 +243,148 @@ def test_llm_no_disponible_sin_key(app, monkeypatch):
     with app.app_context():
         monkeypatch.delenv('ANTHROPIC_API_KEY', raising=False)
         assert CLL.llm_disponible() is False
+
+
+def _score_loop(regla, t):
+    """El scoring por loop de antes (referencia para el matcher compilado)."""
+    if any(CLL._norm(x) in t for x in regla.get('palabras_excluyentes', [])):
+        return None
+    score = 0
+    for campo, peso in (('palabras_clave_fuertes', 3), ('palabras_clave_medias', 2),
+                        ('palabras_clave_debiles', 1)):
+        score += sum(peso for kw in regla.get(campo, []) if CLL._norm(kw) in t)
+    return score
+
+
+@pytest.mark.unit
+def test_matcher_compilado_da_los_mismos_scores_que_el_loop(app):
+    """El automata de keywords tiene que puntuar EXACTAMENTE como el loop por
+    regla: mismo substring match, keywords repetidas que suman dos veces,
+    excluyentes y desempates por orden de REGLAS_TECNICAS."""
+    from services.base_tecnica_computos import REGLAS_TECNICAS
+
+    textos = ['Excavación de bases', 'Demolicion de muro existente', 'Losas', '',
+              'Revoque grueso a la cal con yeso', 'Cañería de agua fría termofusión',
+              'Hormigon H21 para columnas y vigas', 'contrapiso alivianado sobre losa']
+    for r in REGLAS_TECNICAS[::4]:
+        kws = r.get('palabras_clave_fuertes', []) + r.get('palabras_clave_debiles', [])
+        textos.append(' '.join(kws[:2] + r.get('palabras_excluyentes', [])[:1]))
+
+    with app.app_context():
+        for texto in textos:
+            t = CLL._norm(texto)
+            esperado = [(sc, r['id']) for r in REGLAS_TECNICAS
+                        for sc in [_score_loop(r, t)] if sc]
+            esperado.sort(key=lambda x: -x[0])
+            obtenido = [(c['score_raw'], c['regla_id'])
+                        for c in CLL.candidatos_para(texto, n=len(REGLAS_TECNICAS))]
+            assert obtenido == esperado, texto
+
+            for unidad in ('m3', 'M2', None):
+                mejor, mejor_score = None, 0
+                for r in REGLAS_TECNICAS:
+                    sc = _score_loop(r, t)
+                    if sc is None:
+                        continue
+                    if unidad and CLL._norm(unidad) in [CLL._norm(u) for u in r.get('unidades_validas', [])]:
+                        sc += 1
+                    if sc > mejor_score:
+                        mejor_score, mejor = sc, r['id']
+                assert CLL._clasificar_keyword_item(texto, unidad)[0] == mejor, (texto, unidad)
+
+
+@pytest.mark.unit
+def test_lotes_en_paralelo_y_uso_de_tokens(app, monkeypatch):
+    """Un pliego de 200 items son 5 lotes: el primero va solo (escribe el cache
+    del prompt) y el resto en paralelo. Cada item recibe la respuesta de SU lote
+    y el uso de tokens de los hilos llega a `g` para el cap diario."""
+    import threading
+    import time
+    from flask import g
+
+    en_vuelo, maximo, orden = [0], [0], []
+    lock = threading.Lock()
+
+    def _fake_api(system, user):
+        lineas = user.split('\n')[1:]
+        with lock:
+            orden.append(lineas[0])
+            en_vuelo[0] += 1
+            maximo[0] = max(maximo[0], en_vuelo[0])
+        time.sleep(0.05)
+        with lock:
+            en_vuelo[0] -= 1
+        CLL._acumular_uso(100, 10, 0, 0)
+        regla = 'losa_hormigon' if 'Losa' in lineas[0] else 'dintel_hormigon'
+        return [{'indice': i, 'regla_id': regla, 'confianza': 0.9} for i in range(len(lineas))]
+
+    monkeypatch.setattr(CLL, '_llamar_api', _fake_api)
+    monkeypatch.setattr(CLL, '_CONCURRENCIA', 4)
+    items = ([{'descripcion': f'Losa {i}', 'unidad': 'm3'} for i in range(40)]
+             + [{'descripcion': f'Dintel {i}', 'unidad': 'ml'} for i in range(160)])
+    with app.test_request_context():
+        res = CLL._clasificar_llm(items, CLL.catalogo_reglas())
+        assert g._llm_input_tokens == 500 and g._llm_output_tokens == 50
+
+    assert [r['regla_id'] for r in res] == ['losa_hormigon'] * 40 + ['dintel_hormigon'] * 160
+    assert orden[0].startswith('0: Losa 0')
+    assert maximo[0] > 1
+
+
+class _RedisFalso:
+    def __init__(self):
+        self.hashes = {}
+
+    def hmget(self, k, claves):
+        return [self.hashes.get(k, {}).get(c) for c in claves]
+
+    def hset(self, k, mapping):
+        self.hashes.setdefault(k, {}).update(mapping)
+
+    def expire(self, k, ttl):
+        pass
+
+    def hdel(self, k, *claves):
+        for c in claves:
+            self.hashes.get(k, {}).pop(c, None)
+
+
+@pytest.mark.unit
+def test_cache_por_org_versionado(app, monkeypatch):
+    """Con CLASIF_CACHE_ORG=1 una linea ya clasificada por el LLM no se vuelve a
+    preguntar en otro presupuesto de la misma org; otra org o un catalogo
+    distinto (otra version) si preguntan, y recalcular la olvida."""
+    redis = _RedisFalso()
+    preguntados = []
+
+    def _fake_api(system, user):
+        preguntados.append(user.count('\n'))
+        return [{'indice': 0, 'regla_id': 'mamposteria_ladrillo_hueco_12', 'confianza': 0.9}]
+
+    monkeypatch.setenv('CLASIF_CACHE_ORG', '1')
+    monkeypatch.setattr(CLL, '_memo_cliente', lambda: redis)
+    monkeypatch.setattr(CLL, 'llm_disponible', lambda: True)
+    monkeypatch.setattr(CLL, '_llamar_api', _fake_api)
+    items = [{'descripcion': 'Mampostería de ladrillo hueco 18cm', 'unidad': 'm2'}]
+
+    with app.app_context():
+        def _clasificar(org, pres):
+            return CLL.clasificar_items(items, memo_scope=f'clasif:pres:{pres}:estandar',
+                                        organizacion_id=org)
+
+        _clasificar(1, 10)
+        res = _clasificar(1, 11)
+        assert res[0]['regla_id'] == 'mamposteria_ladrillo_hueco_12'
+        assert len(preguntados) == 1
+        assert 'clasif:pres:11:estandar' in redis.hashes  # copiado al memo del presupuesto
+
+        _clasificar(2, 12)
+        assert len(preguntados) == 2
+
+        monkeypatch.setattr(CLL, 'MODELO', 'otro-modelo')
+        _clasificar(1, 13)
+        assert len(preguntados) == 3
+
+        CLL.cache_org_olvidar(1, items)
+        _clasificar(1, 14)
+        assert len(preguntados) == 4
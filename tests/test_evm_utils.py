@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Tests del motor EVM vectorizado (evm_utils.py).
+
+Fija cuatro cosas:
+- la curva S de una tarea reproduce el calculo acumulado semana a semana;
+- la curva de la obra sale del rollup obra_evm_semanal, que se actualiza al
+  replanificar / reagregar avances, y arrastra los acumulados de tareas que ya
+  terminaron (la version anterior los perdia al sumar por semana);
+- detectar_alertas_evm usa los ultimos indicadores de cada tarea;
+- el escaneo por paginas da lo mismo que el completo y el snapshot
+  alertas_evm se reescribe sin duplicar.
+"""
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import (Obra, EtapaObra, TareaEtapa, TareaAvance,
+                    ObraEvmSemanal)
+from evm_utils import (generar_plan_lineal, recalcular_avance_semanal, curva_s_tarea,
+                       curva_s_etapa, curva_s_obra, detectar_alertas_evm, lunes_iso)
+
+
+LUNES = lunes_iso(date(2026, 3, 2))
+
+
+def _obra_con_tareas(test_org, test_user):
+    obra = Obra(nombre=f"Obra EVM {uuid.uuid4().hex[:6]}", cliente="Cliente",
+                organizacion_id=test_org.id, estado='en_curso')
+    db.session.add(obra)
+    db.session.flush()
+    etapa = EtapaObra(obra_id=obra.id, nombre="Estructura", orden=1)
+    db.session.add(etapa)
+    db.session.flush()
+    # Tarea A: 4 semanas, 100 m2, $4000 de MO
+    a = TareaEtapa(etapa_id=etapa.id, nombre="Losa", objetivo=100,
+                   fecha_inicio=LUNES, fecha_fin=LUNES + timedelta(days=27),
+                   presupuesto_mo=4000)
+    # Tarea B: 2 semanas, 10 m3, $1000 de MO
+    b = TareaEtapa(etapa_id=etapa.id, nombre="Columnas", objetivo=10,
+                   fecha_inicio=LUNES, fecha_fin=LUNES + timedelta(days=13),
+                   presupuesto_mo=1000)
+    db.session.add_all([a, b])
+    db.session.commit()
+    return obra, etapa, a, b
+
+
+def _avance(tarea, user, cantidad, horas, cuando):
+    db.session.add(TareaAvance(tarea_id=tarea.id, user_id=user.id, cantidad=cantidad,
+                               cantidad_ingresada=cantidad, horas_trabajadas=horas,
+                               status='aprobado', confirmed_at=cuando))
+    db.session.commit()
+
+
+@pytest.mark.unit
+def test_curva_tarea_y_rollup_de_obra(app, test_org, test_user):
+    with app.app_context():
+        obra, etapa, a, b = _obra_con_tareas(test_org, test_user)
+        try:
+            assert generar_plan_lineal(a.id) and generar_plan_lineal(b.id)
+            _avance(a, test_user, 20, 8, datetime(2026, 3, 3, 10))
+            _avance(b, test_user, 5, 4, datetime(2026, 3, 4, 10))
+            _avance(b, test_user, 5, 4, datetime(2026, 3, 10, 10))
+            assert recalcular_avance_semanal(a.id) and recalcular_avance_semanal(b.id)
+
+            curva_a = curva_s_tarea(a.id)
+            assert [c['pv'] for c in curva_a] == [1000, 2000, 3000, 4000]
+            assert curva_a[0]['ev'] == 800  # 20/100 de 4000
+            assert curva_a[0]['ac'] == 200  # 8h * 25
+            assert curva_a[0]['cpi'] == 4.0
+            assert curva_a[-1]['qty_real_acum'] == 20
+
+            rollup = ObraEvmSemanal.query.filter_by(obra_id=obra.id).order_by(ObraEvmSemanal.semana).all()
+            assert len(rollup) == 4
+
+            curva_obra = curva_s_obra(obra.id)
+            # B termina en la semana 2 pero su PV/EV sigue contando despues
+            assert [c['pv'] for c in curva_obra] == [1500, 3000, 4000, 5000]
+            assert curva_obra[-1]['ev'] == 800 + 1000
+            assert curva_obra == curva_s_etapa(etapa.id)
+        finally:
+            db.session.delete(obra)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_alertas_usan_ultimos_indicadores(app, test_org, test_user):
+    with app.app_context():
+        obra, etapa, a, b = _obra_con_tareas(test_org, test_user)
+        try:
+            generar_plan_lineal(a.id)
+            # Mucho costo y poco avance: CPI y SPI bajos
+            _avance(a, test_user, 1, 100, datetime(2026, 3, 3, 10))
+            recalcular_avance_semanal(a.id)
+
+            alertas = detectar_alertas_evm(obra_id=obra.id)
+            tipos = {(x['tarea_id'], x['type']) for x in alertas}
+            assert (a.id, 'cost_performance') in tipos
+            assert (a.id, 'schedule_performance') in tipos
+            # B no tiene plan ni avances: no se evalua
+            assert not any(x['tarea_id'] == b.id for x in alertas)
+        finally:
+            db.session.delete(obra)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_persistir_alertas_evm_por_paginas(app, test_org, test_user):
+    from evm_utils import iterar_alertas_evm, persistir_alertas_evm
+    from models import AlertaEvm
+    from services.alertas_dashboard import obtener_alertas_evm
+
+    with app.app_context():
+        obra, etapa, a, b = _obra_con_tareas(test_org, test_user)
+        try:
+            generar_plan_lineal(a.id)
+            generar_plan_lineal(b.id)
+            _avance(a, test_user, 1, 100, datetime(2026, 3, 3, 10))
+            _avance(b, test_user, 1, 100, datetime(2026, 3, 3, 10))
+            recalcular_avance_semanal(a.id)
+            recalcular_avance_semanal(b.id)
+
+            # Paginas de una tarea: mismo resultado que el escaneo completo
+            paginas = list(iterar_alertas_evm(organizacion_id=test_org.id, page_size=1))
+            assert len(paginas) == 2
+            assert sorted(x['tarea_id'] for p in paginas for x in p) == \
+                sorted(x['tarea_id'] for x in detectar_alertas_evm(organizacion_id=test_org.id))
+
+            total = persistir_alertas_evm(test_org.id)
+            assert total == AlertaEvm.query.filter_by(organizacion_id=test_org.id).count() > 0
+            # Reescribir el snapshot no duplica
+            assert persistir_alertas_evm(test_org.id) == total
+
+            dashboard = obtener_alertas_evm(test_org.id, limite=10)
+            assert {x['tipo'] for x in dashboard} == {'evm_costo', 'evm_cronograma'}
+        finally:
+            AlertaEvm.query.filter_by(organizacion_id=test_org.id).delete()
+            db.session.delete(obra)
+            db.session.commit()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Tests de la geocodificación masiva de obras (services/geocoding_batch.py).
+
+No sale nada a la red: se usa el geocodificador stub (o uno que cuenta
+llamadas). Se fija que obras con la misma dirección se geocodifican una vez,
+que una segunda org sale del GeocodeCache, que solo se tocan las obras de la
+org pedida y que una obra fallida no se reintenta en la corrida siguiente.
+"""
+import threading
+import time
+import uuid
+
+import pytest
+
+from extensions import db
+from models import GeocodeCache, Obra
+from services import geocoding_batch as gb
+
+
+@pytest.fixture
+def sin_redis(monkeypatch):
+    monkeypatch.setattr(gb, '_redis', lambda: None)
+
+
+def _obra(org, direccion):
+    obra = Obra(nombre=f'Obra geo {uuid.uuid4().hex[:6]}', cliente='Cliente',
+                direccion=direccion, organizacion_id=org.id)
+    db.session.add(obra)
+    return obra
+
+
+def _contador():
+    llamadas = []
+    lock = threading.Lock()
+
+    def _geocodificar(direccion):
+        with lock:
+            llamadas.append(direccion)
+        if 'inexistente' in direccion.lower():
+            return None
+        return gb.geocodificar_stub(direccion)
+
+    return _geocodificar, llamadas
+
+
+@pytest.mark.unit
+def test_direcciones_repetidas_se_geocodifican_una_vez(app, test_org, test_org_b, sin_redis):
+    sufijo = uuid.uuid4().hex[:6]
+    direccion = f'Av. Rivadavia {sufijo}, Caseros'
+    with app.app_context():
+        obras = [_obra(test_org, direccion), _obra(test_org, f'  av. rivadavia {sufijo},  caseros '),
+                 _obra(test_org, f'Calle inexistente {sufijo}')]
+        ajena = _obra(test_org_b, direccion)
+        db.session.commit()
+        geocodificar, llamadas = _contador()
+        try:
+            resumen = gb.geocodificar_obras_pendientes(test_org.id, provider='stub',
+                                                       geocodificador=geocodificar, tamano_lote=2)
+            assert (resumen['exitosas'], resumen['fallidas']) == (2, 1)
+            assert len(llamadas) == 2
+            assert obras[0].latitud is not None and obras[0].latitud == obras[1].latitud
+            assert obras[2].geocode_status == 'fail'
+            db.session.refresh(ajena)
+            assert ajena.latitud is None
+
+            # La otra org no va a la red: la dirección ya está en el cache
+            resumen_b = gb.geocodificar_obras_pendientes(test_org_b.id, provider='stub',
+                                                         geocodificador=geocodificar)
+            assert resumen_b['desde_cache'] == 1 and resumen_b['consultas'] == 0
+            assert len(llamadas) == 2
+
+            # La fallida no se reintenta hasta GEOCODE_REINTENTO_HORAS
+            assert gb.consulta_obras_pendientes(test_org.id).count() == 0
+            assert gb.geocodificar_obras_pendientes(test_org.id, provider='stub',
+                                                    geocodificador=geocodificar)['consultas'] == 0
+        finally:
+            for obra in obras + [ajena]:
+                db.session.delete(obra)
+            GeocodeCache.query.filter(GeocodeCache.provider == 'stub',
+                                      GeocodeCache.normalized_text.like(f'%{sufijo}%')).delete(
+                synchronize_session=False)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_progreso_por_lote(app, test_org, sin_redis):
+    sufijo = uuid.uuid4().hex[:6]
+    with app.app_context():
+        obras = [_obra(test_org, f'Calle {sufijo} {n}, Moron') for n in range(5)]
+        db.session.commit()
+        avances = []
+        try:
+            gb.geocodificar_obras_pendientes(test_org.id, provider='stub', tamano_lote=2,
+                                             progreso=avances.append)
+            assert [a['exitosas'] for a in avances] == [2, 4, 5]
+            assert all(o.geocode_provider == 'stub' for o in obras)
+        finally:
+            for obra in obras:
+                db.session.delete(obra)
+            GeocodeCache.query.filter(GeocodeCache.provider == 'stub',
+                                      GeocodeCache.normalized_text.like(f'%{sufijo}%')).delete(
+                synchronize_session=False)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_limitador_respeta_cuota_sin_redis(sin_redis):
+    limitador = gb.LimitadorProveedor({'nominatim': 20.0})
+    inicio = time.monotonic()
+    for _ in range(5):
+        limitador('nominatim')
+    # 5 requests a 20/s: el último sale a los 200ms del primero
+    assert time.monotonic() - inicio >= 0.19
+    inicio = time.monotonic()
+    limitador('google')  # sin cuota configurada: no espera
+    assert time.monotonic() - inicio < 0.05
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Tests del cache y el fan-out de search() (services/geocoding_service.py).
+
+Los proveedores se reemplazan por funciones locales (no sale nada a la red) y
+Redis queda deshabilitado, así que el cache es el LRU del proceso. Se fija que
+la misma búsqueda va una vez al proveedor, que un error de red no se cachea
+como "sin resultados", que por defecto Google va en serie y corta en la
+primera variante con resultados, que con fan-out gana la misma variante que en
+serie y que cada consulta queda en el histograma del proveedor.
+"""
+import threading
+import time
+import uuid
+
+import pytest
+import requests
+
+from config import cache_config as cc
+from services import geocoding_service as gs
+
+
+@pytest.fixture
+def proveedor_local(monkeypatch):
+    monkeypatch.setattr(cc.get_cache(), 'enabled', False)
+    monkeypatch.setattr(gs, '_latencias_locales', {})
+    cc.get_local_cache().clear()
+    yield
+    cc.get_local_cache().clear()
+
+
+def _resultado(texto, provider):
+    return gs.GeocodeResult(display_name=f'{texto}, Caseros, Buenos Aires, Argentina',
+                            lat=-34.6, lng=-58.56, provider=provider, place_id=texto)
+
+
+@pytest.mark.unit
+def test_misma_busqueda_va_una_vez_al_proveedor(app, proveedor_local, monkeypatch):
+    llamadas = []
+
+    def _nominatim(query, *, limit=5):
+        llamadas.append(query)
+        return [_resultado(query, 'nominatim')]
+
+    monkeypatch.setattr(gs, '_fetch_nominatim', _nominatim)
+    query = f'Valparaiso {uuid.uuid4().hex[:6]} 4500, Caseros'
+    with app.app_context():
+        primero = gs.search(query, provider='nominatim')
+        primero[0]['lat'] = 0  # el llamador puede mutar su copia
+        segundo = gs.search(f'  {query} ', provider='nominatim')
+        assert len(llamadas) == 1
+        assert segundo[0]['lat'] == -34.6
+        assert gs.geocode_metricas()['proveedores']['nominatim']['count'] == 1
+
+
+@pytest.mark.unit
+def test_error_de_red_no_se_cachea(app, proveedor_local, monkeypatch):
+    estado = {'caido': True, 'llamadas': 0}
+
+    def _nominatim(query, *, limit=5):
+        estado['llamadas'] += 1
+        if estado['caido']:
+            raise requests.ConnectionError('sin red')
+        return [_resultado(query, 'nominatim')]
+
+    monkeypatch.setattr(gs, '_fetch_nominatim', _nominatim)
+    monkeypatch.setattr(gs, 'GOOGLE_MAPS_API_KEY', '')
+    query = f'Lisandro Medina {uuid.uuid4().hex[:6]}'
+    with app.app_context():
+        assert gs.search(query, provider='nominatim') == []
+        assert gs.geocode_metricas()['proveedores']['nominatim']['errores'] == estado['llamadas']
+        estado['caido'] = False
+        assert gs.search(query, provider='nominatim')
+
+
+@pytest.mark.unit
+def test_fanout_respeta_el_orden_de_las_variantes(app, proveedor_local, monkeypatch):
+    query = f'Av. San Martin {uuid.uuid4().hex[:6]} 1200, Caseros'
+    en_vuelo = {'max': 0, 'ahora': 0}
+    lock = threading.Lock()
+
+    def _google(variant, *, limit=5):
+        with lock:
+            en_vuelo['ahora'] += 1
+            en_vuelo['max'] = max(en_vuelo['max'], en_vuelo['ahora'])
+        try:
+            # La primera variante tarda más que las otras, pero es la que gana
+            time.sleep(0.1 if variant == query else 0.01)
+            return [_resultado(variant, 'google')]
+        finally:
+            with lock:
+                en_vuelo['ahora'] -= 1
+
+    monkeypatch.setattr(gs, '_fetch_google_maps', _google)
+    monkeypatch.setattr(gs, 'GOOGLE_MAPS_API_KEY', 'test-key')
+    monkeypatch.setattr(gs, 'SEARCH_FANOUT', 3)
+    with app.app_context():
+        resultados = gs.search(query, provider='google', limit=1)
+    assert resultados[0]['place_id'] == query
+    assert en_vuelo['max'] > 1
+
+
+@pytest.mark.unit
+def test_google_en_serie_corta_en_la_primera_variante(app, proveedor_local, monkeypatch):
+    consultadas = []
+
+    def _google(variant, *, limit=5):
+        consultadas.append(variant)
+        return [_resultado(variant, 'google')]
+
+    monkeypatch.setattr(gs, '_fetch_google_maps', _google)
+    monkeypatch.setattr(gs, 'GOOGLE_MAPS_API_KEY', 'test-key')
+    query = f'Av. Rivadavia {uuid.uuid4().hex[:6]}, CABA'
+    with app.app_context():
+        gs.search(query, provider='google', limit=1)
+    assert len(consultadas) == 1
+
+    # Con fan-out configurado, nunca más de SEARCH_FANOUT_MAX variantes a la vez
+    monkeypatch.setattr(gs, 'SEARCH_FANOUT', 10)
+    assert gs._ancho_fanout('google') == gs.SEARCH_FANOUT_MAX
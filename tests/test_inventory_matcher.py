@@ -14,11 +14,14 @@ Un vinculo equivocado es peor que ninguno: gestionar-materiales reserva stock
 real contra ese item_inventario_id. Estos tests fijan el comportamiento nuevo:
 conservador, determinista, y que prefiere no vincular antes que arriesgar.
 
-No necesitan DB: la parte pura del matcher trabaja sobre un indice en memoria.
+La parte pura del matcher trabaja sobre un indice en memoria, sin DB. Solo
+los tests del indice invertido (paridad con el dry-run y cache por org) tocan
+la DB.
 """
 import pytest
 
 from services.inventory_matcher import (
+    IndiceInventario,
     _tokens_utiles,
     evaluar_candidatos,
     vincular_item_inventario,
@@ -247,3 +250,157 @@ def test_incluir_rechazados_expone_el_motivo(indice):
     aceptados = evaluar_candidatos(
         "Provisión y montaje de armadura de hierro aletado ADN 420", "kg", indice)
     assert all(c['rechazo'] is None for c in aceptados)
+
+
+# ------------------------------------------------- indice invertido (paridad)
+
+def _evaluar_lineal(descripcion, unidad, indice, incluir_rechazados=False):
+    """Barrido completo, tal cual era evaluar_candidatos() antes del indice
+    invertido. Referencia para fijar que el ranking no cambio."""
+    from services.inventory_matcher import _MIN_TOKENS_COMUNES
+    from services.precio_recurso_service import _unidades_compatibles
+
+    tk_desc = _tokens_utiles(descripcion)
+    if not tk_desc:
+        return []
+    out = []
+    for inv in indice:
+        tk_inv = inv['tokens']
+        if not tk_inv:
+            continue
+        unidad_mala = bool(unidad and inv['unidad']
+                           and not _unidades_compatibles(unidad, inv['unidad']))
+        comunes = tk_desc & tk_inv
+        cobertura = len(comunes) / len(tk_inv)
+        if unidad_mala:
+            rechazo = 'unidad'
+        elif len(comunes) < _MIN_TOKENS_COMUNES:
+            rechazo = 'pocos_tokens'
+        elif cobertura < _MIN_COBERTURA:
+            rechazo = 'cobertura_baja'
+        else:
+            rechazo = None
+        if rechazo is not None and (not incluir_rechazados or not comunes):
+            continue
+        out.append({'id': inv['id'], 'nombre': inv['nombre'], 'unidad': inv['unidad'],
+                    'comunes': sorted(comunes), 'n_comunes': len(comunes),
+                    'cobertura': round(cobertura, 3), 'rechazo': rechazo})
+    out.sort(key=lambda c: (-c['cobertura'], -c['n_comunes'], c['id']))
+    return out
+
+
+def _inventario_sintetico(n=600, seed=7):
+    import random
+    rnd = random.Random(seed)
+    palabras = ['hormigon', 'h21', 'h17', 'hierro', 'aletado', '8mm', '12mm', 'cemento',
+                'portland', 'arena', 'fina', 'gruesa', 'ladrillo', 'hueco', 'comun',
+                'membrana', 'asfaltica', 'pintura', 'latex', 'cano', 'pvc', '110mm',
+                'cal', 'hidratada', 'ayuda', 'gremios', 'provision', 'colocacion']
+    unidades = ['m3', 'kg', 'un', 'UNI', 'm2', 'ml', 'bolsa', 'balde', 'gl', None]
+    # ids desordenados a proposito: el desempate es por id, no por posicion
+    ids = rnd.sample(range(1, 5 * n), n)
+    return [(i, ' '.join(rnd.sample(palabras, rnd.randint(1, 4))), rnd.choice(unidades))
+            for i in ids]
+
+
+def test_indice_invertido_da_el_mismo_ranking_que_el_barrido():
+    items = _inventario_sintetico()
+    indice = IndiceInventario(_indice(items))
+    descripciones = [d for (_i, d, _u) in _inventario_sintetico(n=150, seed=11)]
+    descripciones += [d for (d, _u, _e) in [
+        ("Provisión y colocación de hormigón H21 elaborado para losas", "m3", 3),
+        ("Provisión y montaje de armadura de hierro aletado ADN 420", "kg", None),
+    ]]
+    for desc in descripciones:
+        for unidad in ('m3', 'un', None):
+            for rechazados in (False, True):
+                esperado = _evaluar_lineal(desc, unidad, indice, rechazados)
+                assert evaluar_candidatos(desc, unidad, indice, rechazados) == esperado
+                # una lista comun se indexa al vuelo y da lo mismo
+                assert evaluar_candidatos(desc, unidad, list(indice), rechazados) == esperado
+
+
+def test_indice_invertido_solo_visita_items_con_tokens_comunes(indice):
+    idx = IndiceInventario(indice)
+    tocados = idx.posiciones_con_tokens(_tokens_utiles("Cemento Portland"))
+    assert {idx[p]['id'] for p in tocados} == {2}
+    assert tocados == {1: 2}
+
+
+def test_dry_run_reporta_igual_con_indice_invertido(app, test_org, monkeypatch, capsys):
+    """El dry-run de calibracion (scripts/dry_run_vinculacion_inventario.py)
+    tiene que imprimir exactamente el mismo reporte con el indice invertido que
+    con el barrido completo de antes."""
+    import argparse
+    import importlib.util
+    import os
+    from decimal import Decimal
+    from extensions import db
+    from models import Presupuesto, ItemPresupuesto, ItemInventario
+    import services.inventory_matcher as matcher
+
+    ruta = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                        'scripts', 'dry_run_vinculacion_inventario.py')
+    spec = importlib.util.spec_from_file_location('dry_run_vinculacion', ruta)
+    dry_run = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dry_run)
+
+    with app.app_context():
+        invs = [ItemInventario(codigo=f'PAR-{i}', nombre=n, unidad=u,
+                               organizacion_id=test_org.id)
+                for (i, n, u) in _INVENTARIO]
+        pres = Presupuesto(organizacion_id=test_org.id, numero='TEST-PARIDAD-INV')
+        db.session.add_all(invs + [pres])
+        db.session.flush()
+        for desc, unidad in [
+            ("Provisión y colocación de hormigón H21 elaborado para losas", "m3"),
+            ("Membrana asfáltica con aluminio 4mm en cubierta", "m2"),
+            ("Provisión y montaje de armadura de hierro aletado ADN 420", "kg"),
+            ("Pintura látex acrílico sobre paramentos interiores", "m2"),
+            ("Excavación manual para fundaciones", "m3"),
+        ]:
+            db.session.add(ItemPresupuesto(presupuesto_id=pres.id, tipo='material',
+                                           descripcion=desc, unidad=unidad,
+                                           cantidad=Decimal('1'), precio_unitario=Decimal('0'),
+                                           total=Decimal('0')))
+        db.session.commit()
+        args = argparse.Namespace(presupuesto_id=pres.id, top=5, csv=None)
+        try:
+            dry_run._reportar(args)
+            con_indice = capsys.readouterr().out
+
+            monkeypatch.setattr(matcher, 'evaluar_candidatos', _evaluar_lineal)
+            dry_run._reportar(args)
+            barrido = capsys.readouterr().out
+        finally:
+            ItemPresupuesto.query.filter_by(presupuesto_id=pres.id).delete()
+            db.session.delete(pres)
+            for inv in invs:
+                db.session.delete(inv)
+            db.session.commit()
+
+    assert 'VINCULARIA  (2 de 5)' in con_indice
+    assert con_indice == barrido
+
+
+def test_indice_cacheado_se_invalida_al_cambiar_el_inventario(app, test_org):
+    from extensions import db
+    from models import ItemInventario
+    from services.inventory_matcher import obtener_indice_inventario
+
+    with app.app_context():
+        primero = obtener_indice_inventario(test_org.id)
+        assert obtener_indice_inventario(test_org.id) is primero
+
+        nuevo = ItemInventario(codigo='IDX-1', nombre='Cemento Portland 50kg',
+                               unidad='bolsa', organizacion_id=test_org.id)
+        db.session.add(nuevo)
+        db.session.commit()
+        try:
+            segundo = obtener_indice_inventario(test_org.id)
+            assert segundo is not primero
+            assert nuevo.id in {inv['id'] for inv in segundo}
+        finally:
+            db.session.delete(nuevo)
+            db.session.commit()
+        assert nuevo.id not in {inv['id'] for inv in obtener_indice_inventario(test_org.id)}
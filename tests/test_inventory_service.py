@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Tests de InventoryService (services/inventory_service.py).
+
+Fija que el costo promedio ponderado se mantiene por item y deposito en cada
+movimiento, que get_stock_value lo agrega sin una query por stock, que los
+exports recorren la misma valuacion y que los totales desnormalizados del item
+siguen a movimientos y reservas (y la reconciliacion detecta el drift).
+"""
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from extensions import db
+from models import InventoryCategory, InventoryItem, StockMovement, Warehouse
+from services.inventory_service import InventoryService
+
+
+@pytest.fixture
+def inventario(app, test_org, test_user):
+    with app.app_context():
+        categoria = InventoryCategory(company_id=test_org.id, nombre='Materiales')
+        db.session.add(categoria)
+        db.session.flush()
+        items = [InventoryItem(company_id=test_org.id, sku=f'VAL-{i}-{uuid.uuid4().hex[:6]}',
+                               nombre=f'Item {i}', categoria_id=categoria.id, unidad='u')
+                 for i in range(2)]
+        depositos = [Warehouse(company_id=test_org.id, nombre=f'Deposito {i}') for i in range(2)]
+        db.session.add_all(items + depositos)
+        db.session.commit()
+        yield items, depositos
+        db.session.rollback()
+        for obj in items + depositos + [categoria]:
+            db.session.delete(obj)
+        db.session.commit()
+
+
+@pytest.mark.unit
+def test_costo_promedio_ponderado_por_deposito(app, test_org, test_user, inventario):
+    (item, _), (dep_a, dep_b) = inventario
+    svc = InventoryService()
+    with app.app_context():
+        svc.record_ingreso(item.id, dep_a.id, 10, precio=100, user_id=test_user.id)
+        svc.record_ingreso(item.id, dep_a.id, 30, precio=200, user_id=test_user.id)
+        stock_a = svc._update_stock(item.id, dep_a.id, Decimal('0'))
+        assert stock_a.costo_promedio == Decimal('175')  # (10*100 + 30*200) / 40
+
+        # Egreso y ajuste salen al promedio y no lo cambian
+        egreso = svc.record_egreso(item.id, dep_a.id, 20, user_id=test_user.id)
+        svc.record_ajuste(item.id, dep_a.id, -5, reason='rotura', user_id=test_user.id)
+        assert egreso.costo_unitario == Decimal('175')
+        assert stock_a.costo_promedio == Decimal('175')
+
+        # La transferencia lleva el costo del origen y pondera en el destino
+        svc.record_ingreso(item.id, dep_b.id, 5, precio=75, user_id=test_user.id)
+        svc.record_transferencia(item.id, dep_a.id, dep_b.id, 5, user_id=test_user.id)
+        stock_b = svc._update_stock(item.id, dep_b.id, Decimal('0'))
+        assert stock_b.costo_promedio == Decimal('125')  # (5*75 + 5*175) / 10
+
+        # Ingreso sin precio: entra al promedio vigente
+        svc.record_ingreso(item.id, dep_b.id, 10, user_id=test_user.id)
+        assert stock_b.costo_promedio == Decimal('125')
+
+
+@pytest.mark.unit
+def test_valuacion_agregada_y_exports(app, test_org, test_user, inventario):
+    from sqlalchemy import event
+    (item_1, item_2), (dep_a, dep_b) = inventario
+    svc = InventoryService()
+    with app.app_context():
+        svc.record_ingreso(item_1.id, dep_a.id, 10, precio=100, user_id=test_user.id)
+        svc.record_ingreso(item_1.id, dep_b.id, 4, precio=50, user_id=test_user.id)
+        svc.record_ingreso(item_2.id, dep_a.id, 3, user_id=test_user.id)  # sin costo
+
+        queries = []
+
+        def _contar(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _contar)
+        try:
+            valor = svc.get_stock_value(company_id=test_org.id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _contar)
+
+        assert len(queries) == 2  # totales + top 20, sin importar cuantos stocks haya
+        assert valor['total_items'] == 3
+        assert valor['total_quantity'] == 17
+        assert valor['estimated_value'] == 1200
+        assert valor['items_with_value'] == 2
+        assert [d['valor_total'] for d in valor['items_detail']] == [1000, 200]
+        assert svc.get_stock_value(warehouse_id=dep_b.id)['estimated_value'] == 200
+
+        lineas = list(svc.export_stock_value_csv(company_id=test_org.id))
+        assert lineas[0].startswith('SKU,Item,Unidad')
+        assert len(lineas) == 4
+        assert sum(Decimal(l.strip().split(',')[-1]) for l in lineas[1:]) == 1200
+
+        from openpyxl import load_workbook
+        salida = svc.export_stock_value_xlsx(io.BytesIO(), company_id=test_org.id)
+        salida.seek(0)
+        filas = list(load_workbook(salida).active.iter_rows(values_only=True))
+        assert len(filas) == 4 and sum(f[-1] for f in filas[1:]) == 1200
+
+
+@pytest.mark.unit
+def test_costos_iniciales_desde_ingresos_viejos(app, test_org, test_user, inventario):
+    (item, _), (dep_a, _) = inventario
+    svc = InventoryService()
+    with app.app_context():
+        svc.record_ingreso(item.id, dep_a.id, 10, precio=80, user_id=test_user.id)
+        # Simula datos previos a la columna: el precio solo estaba en el motivo
+        StockMovement.query.filter_by(item_id=item.id).update({'costo_unitario': None})
+        stock = svc._update_stock(item.id, dep_a.id, Decimal('0'))
+        stock.costo_promedio = Decimal('0')
+        db.session.commit()
+
+        assert svc.seed_average_costs(company_id=test_org.id) == 1
+        assert stock.costo_promedio == Decimal('80')
+        assert svc.seed_average_costs(company_id=test_org.id) == 0
+
+
+@pytest.mark.unit
+def test_totales_desnormalizados_y_reconciliacion(app, test_org, test_user, inventario):
+    from models import Obra, Stock, StockReservation
+    items, (dep_a, dep_b) = inventario
+    svc = InventoryService()
+    with app.app_context():
+        item, otro = [db.session.get(InventoryItem, i.id) for i in items]
+        obra = Obra(nombre='Obra reservas', cliente='Cliente', organizacion_id=test_org.id)
+        db.session.add(obra)
+        db.session.commit()
+        try:
+            svc.record_ingreso(item.id, dep_a.id, 10, precio=100, user_id=test_user.id)
+            svc.record_egreso(item.id, dep_a.id, 3, user_id=test_user.id)
+            svc.record_transferencia(item.id, dep_a.id, dep_b.id, 2, user_id=test_user.id)
+            reserva = svc.reserve_stock(item.id, 4, obra.id, test_user.id)
+            otra = svc.reserve_stock(item.id, 1, obra.id, test_user.id)
+            svc.release_reservation(otra.id)
+            assert (item.total_stock, item.reserved_stock, item.available_stock) == (7, 4, 3)
+            svc.confirm_reservation(reserva.id)
+            assert item.reserved_stock == 0
+
+            # Low stock por total: lectura directa, sin sumar Stock
+            otro.min_stock = Decimal('5')
+            db.session.commit()
+            svc.record_ingreso(otro.id, dep_a.id, 2, user_id=test_user.id)
+            bajos = svc.get_low_stock_items(company_id=test_org.id)
+            assert [b['item_id'] for b in bajos] == [otro.id]
+            assert svc.reconcile_stock_totals(company_id=test_org.id) == []
+
+            # Un Stock escrito por fuera del servicio deja drift
+            Stock.query.filter_by(item_id=item.id, warehouse_id=dep_b.id).update({'cantidad': 5})
+            db.session.commit()
+            drift = svc.reconcile_stock_totals(company_id=test_org.id)
+            assert [(d['item_id'], d['stock_total'], d['stock_real']) for d in drift] == [(item.id, 7, 10)]
+            svc.reconcile_stock_totals(company_id=test_org.id, fix=True)
+            db.session.refresh(item)
+            assert item.total_stock == 10
+            assert svc.reconcile_stock_totals(company_id=test_org.id) == []
+        finally:
+            db.session.rollback()
+            StockReservation.query.filter_by(project_id=obra.id).delete()
+            db.session.delete(obra)
+            db.session.commit()
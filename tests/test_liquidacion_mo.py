@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Tests del cálculo por lotes de la liquidación de MO (services/liquidacion_mo.py).
+
+Fija que PeriodoMO da lo mismo que los cálculos por operario (horas de
+avance, fichadas, cantidad y liquidación por modalidad) y que el preview
+hace la misma cantidad de consultas con 2 o con 6 operarios.
+"""
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import AsignacionObra, EtapaObra, Obra, TareaAvance, TareaEtapa, Usuario
+from models.projects import Fichada
+from services import liquidacion_mo
+
+DESDE = date(2026, 3, 2)
+HASTA = date(2026, 3, 8)
+MODALIDADES = ('hora', 'fichada', 'medida')
+
+
+def _obra_con_operarios(org, n):
+    obra = Obra(nombre=f"Obra MO {uuid.uuid4().hex[:6]}", cliente="Cliente",
+                organizacion_id=org.id, estado='en_curso')
+    db.session.add(obra)
+    db.session.flush()
+    etapa = EtapaObra(obra_id=obra.id, nombre="Mampostería", orden=1)
+    db.session.add(etapa)
+    db.session.flush()
+    tareas = [TareaEtapa(etapa_id=etapa.id, nombre=f"Muro {i}", unidad='m2') for i in range(2)]
+    db.session.add_all(tareas)
+    db.session.flush()
+
+    operarios = []
+    for i in range(n):
+        sufijo = uuid.uuid4().hex[:8]
+        op = Usuario(nombre=f"Operario{i}", apellido="MO", email=f"mo_{sufijo}@example.com",
+                     organizacion_id=org.id, rol="operario", role="operario", activo=True,
+                     modalidad_pago=MODALIDADES[i % 3], tarifa_hora=Decimal('1500'),
+                     tarifa_m2=Decimal('900'))
+        db.session.add(op)
+        operarios.append(op)
+    db.session.flush()
+
+    for i, op in enumerate(operarios):
+        if i % 2 == 0:  # la mitad asignados; el resto aparece por avances/fichadas
+            db.session.add(AsignacionObra(obra_id=obra.id, usuario_id=op.id, rol_en_obra='oficial'))
+        for d in range(5):
+            dia = DESDE + timedelta(days=d)
+            db.session.add(TareaAvance(tarea_id=tareas[d % 2].id, user_id=op.id, fecha=dia,
+                                       cantidad=Decimal('3.5'), unidad='m2', horas=Decimal('4'),
+                                       status='aprobado' if d != 3 else 'pendiente'))
+            entrada = datetime.combine(dia, datetime.min.time()) + timedelta(hours=8)
+            db.session.add(Fichada(usuario_id=op.id, obra_id=obra.id, tipo='ingreso', fecha_hora=entrada))
+            if d != 4:  # el último día queda sin egreso
+                db.session.add(Fichada(usuario_id=op.id, obra_id=obra.id, tipo='egreso',
+                                       fecha_hora=entrada + timedelta(hours=8, minutes=15 * i)))
+    # Fuera del período: no cuenta
+    db.session.add(Fichada(usuario_id=operarios[0].id, obra_id=obra.id, tipo='ingreso',
+                           fecha_hora=datetime.combine(HASTA + timedelta(days=1), datetime.min.time())))
+    db.session.commit()
+    return obra, operarios
+
+
+def _limpiar(obra, operarios):
+    ids = [op.id for op in operarios]
+    Fichada.query.filter_by(obra_id=obra.id).delete()
+    TareaAvance.query.filter(TareaAvance.user_id.in_(ids)).delete(synchronize_session=False)
+    AsignacionObra.query.filter_by(obra_id=obra.id).delete()
+    for etapa in EtapaObra.query.filter_by(obra_id=obra.id).all():
+        TareaEtapa.query.filter_by(etapa_id=etapa.id).delete()
+        db.session.delete(etapa)
+    Usuario.query.filter(Usuario.id.in_(ids)).delete(synchronize_session=False)
+    db.session.delete(obra)
+    db.session.commit()
+
+
+def _contar_consultas(fn):
+    conteo = {'n': 0}
+
+    def _contar(*_args, **_kwargs):
+        conteo['n'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _contar)
+    return conteo['n']
+
+
+@pytest.mark.unit
+def test_periodo_igual_a_calculo_por_operario(app, test_org):
+    with app.app_context():
+        obra, operarios = _obra_con_operarios(test_org, 3)
+        try:
+            periodo = liquidacion_mo.PeriodoMO(obra.id, DESDE, HASTA)
+            assert set(periodo.operarios) == set(liquidacion_mo.buscar_operarios_obra(obra.id, DESDE, HASTA))
+            for op in operarios:
+                assert periodo.horas_avance(op.id) == liquidacion_mo.calcular_horas_avance_operario(
+                    obra.id, op.id, DESDE, HASTA)
+                assert periodo.horas_fichadas(op.id) == liquidacion_mo.calcular_horas_fichadas_operario(
+                    obra.id, op.id, DESDE, HASTA)
+                assert periodo.cantidad_avance(op.id) == liquidacion_mo.calcular_cantidad_avance_operario(
+                    obra.id, op.id, DESDE, HASTA)
+                assert liquidacion_mo.calcular_liquidacion_por_operario(
+                    op, obra.id, DESDE, HASTA, tarifa_fallback=100, periodo=periodo
+                ) == liquidacion_mo.calcular_liquidacion_por_operario(
+                    op, obra.id, DESDE, HASTA, tarifa_fallback=100)
+
+            primero = operarios[0]
+            assert periodo.horas_avance(primero.id)['total_horas'] == 16.0
+            assert periodo.horas_fichadas(primero.id)['total_horas'] == 32.0
+            assert len(periodo.horas_fichadas(primero.id)['desglose']) == 5
+            assert periodo.rol(primero.id) == 'oficial'
+            assert periodo.rol(operarios[1].id, 'sin asignar') == 'sin asignar'
+        finally:
+            _limpiar(obra, operarios)
+
+
+@pytest.mark.unit
+def test_preview_con_consultas_constantes(app, test_org):
+    with app.app_context():
+        chica, ops_chica = _obra_con_operarios(test_org, 2)
+        grande, ops_grande = _obra_con_operarios(test_org, 6)
+        try:
+            items = []
+            n_chica = _contar_consultas(
+                lambda: items.extend(liquidacion_mo.generar_preview_liquidacion(chica.id, DESDE, HASTA)))
+            db.session.expire_all()
+            n_grande = _contar_consultas(
+                lambda: liquidacion_mo.generar_preview_liquidacion(grande.id, DESDE, HASTA))
+            assert n_chica == n_grande
+
+            assert [i['operario_id'] for i in items] == [op.id for op in ops_chica]
+            hora, fichada = items
+            assert (hora['modalidad'], hora['base'], hora['monto']) == ('hora', 16.0, 24000.0)
+            assert hora['rol'] == 'oficial' and fichada['rol'] == 'sin asignar'
+            assert fichada['modalidad'] == 'fichada' and fichada['horas_fichadas'] == 33.0
+        finally:
+            _limpiar(chica, ops_chica)
+            _limpiar(grande, ops_grande)
@@ -149,3 +149,201 @@ def test_resolver_mo_v2_usa_costo_empresa(app):
         assert r2['precio'] == pytest.approx(9600.0, abs=1.0)
 
         _limpiar(db)
+
+
+_CONSULTAS_LOTE = [
+    # (descripcion, unidad, item_inventario_id)
+    ('Cemento Portland', 'bolsa', None),          # exacto + unidad exacta
+    ('Cemento Portland', 'bolsas', None),         # exacto + unidad sinonimo
+    ('cemento', 'bolsa', None),                   # fuzzy por cobertura
+    ('Azulejo 15x15', 'u', None),                 # fuzzy con gate lexico
+    ('Arena gruesa', 'm3', None),                 # exacto global antes que fuzzy de la org
+    ('Hierro aletado 8mm', 'kg', 77),             # prioridad 0 por item de inventario
+    ('Membrana liquida', 'l', None),              # sin precio
+    ('cemento', 'bolsa', None),                   # repetida: mismo resultado
+]
+
+
+def _cargar_lista_lote(db, org):
+    _ppl(db, 'Cemento Portland', 'bolsa', 9000, org=org)
+    _ppl(db, 'Cemento Portland', 'bolsa', 8500)
+    _ppl(db, 'Bolsa de Cemento Loma Negra (50 kg)', 'kg', 11850)
+    _ppl(db, 'Azulejo blanco 15x15 (caja)', 'u', 950, org=org)
+    _ppl(db, 'Malla Sima 15x15 cm (4.2 mm de espesor) - Panel 3x2 m', 'un', 20700, org=org)
+    _ppl(db, 'Arena gruesa', 'm3', 30000)
+    _ppl(db, 'Arena gruesa a granel', 'm3', 28000, org=org)
+    _ppl(db, 'Hierro aletado 8 mm barra', 'kg', 1500, org=org)
+    db.session.commit()
+    from models.provider_price_list import ProviderPriceList
+    hierro = ProviderPriceList.query.filter_by(descripcion='Hierro aletado 8 mm barra').one()
+    hierro.item_inventario_id = 77
+    db.session.commit()
+
+
+@pytest.mark.integration
+def test_resolver_en_lote_igual_a_buscar_de_a_uno(app):
+    """El resolutor en lote tiene que devolver exactamente lo mismo que
+    buscar_mejor_precio consulta por consulta (fuente, estado, alternativas)."""
+    from extensions import db
+    from services.precio_recurso_service import resolver_precios_lote
+    with app.app_context():
+        _limpiar(db)
+        _cargar_lista_lote(db, 999)
+
+        lote = resolver_precios_lote(999, [
+            {'descripcion': d, 'unidad': u, 'tipo_recurso': 'material', 'item_inventario_id': inv}
+            for d, u, inv in _CONSULTAS_LOTE])
+        de_a_uno = [buscar_mejor_precio(organizacion_id=999, descripcion=d, unidad=u,
+                                        item_inventario_id=inv)
+                    for d, u, inv in _CONSULTAS_LOTE]
+        assert lote == de_a_uno
+        assert [r['fuente'] for r in lote].count('sin_precio') == 1
+        assert lote[0]['precio'] == 9000.0  # la org pisa a la global
+        assert lote[4]['precio'] == 30000.0
+        _limpiar(db)
+
+
+@pytest.mark.integration
+def test_resolver_en_lote_no_escala_queries_con_las_consultas(app):
+    from sqlalchemy import event
+    from extensions import db
+    from services.precio_recurso_service import resolver_precios_lote
+    with app.app_context():
+        _limpiar(db)
+        _cargar_lista_lote(db, 999)
+        consultas = [{'descripcion': f'{d} {i}', 'unidad': u, 'item_inventario_id': inv}
+                     for i in range(40) for d, u, inv in _CONSULTAS_LOTE]
+
+        queries = []
+
+        def _contar(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _contar)
+        try:
+            resultados = resolver_precios_lote(999, consultas)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _contar)
+
+        assert len(resultados) == len(consultas)
+        # P0 + P1/P2 + indice fuzzy + filas ganadoras + historial + referencias
+        # (+ proveedores); nunca una query por consulta.
+        assert len(queries) <= 10
+        _limpiar(db)
+
+
+@pytest.mark.integration
+def test_indice_fuzzy_se_invalida_al_cargar_precios(app):
+    from extensions import db
+    from services.precio_recurso_service import resolver_precios_lote
+    with app.app_context():
+        _limpiar(db)
+        _ppl(db, 'Arena fina', 'm3', 25000, org=999)
+        db.session.commit()
+        consulta = [{'descripcion': 'cal hidratada', 'unidad': 'bolsa'}]
+        assert resolver_precios_lote(999, consulta)[0]['fuente'] == 'sin_precio'
+
+        _ppl(db, 'Bolsa de cal hidratada 25 kg', 'bolsa', 4000, org=999)
+        db.session.commit()
+        assert resolver_precios_lote(999, consulta)[0]['precio'] == 4000.0
+
+        # Borrado masivo (sin eventos de mapper): tampoco queda un indice viejo
+        _limpiar(db)
+        assert resolver_precios_lote(999, consulta)[0]['fuente'] == 'sin_precio'
+
+
+@pytest.mark.integration
+def test_estimar_precios_presupuesto_usa_el_lote(app, test_org):
+    from extensions import db
+    from models import Presupuesto, ItemPresupuesto
+    from models.budgets import ItemPresupuestoComposicion
+    from services.precio_recurso_service import estimar_precios_presupuesto
+    with app.app_context():
+        _limpiar(db)
+        _cargar_lista_lote(db, test_org.id)
+        pres = Presupuesto(organizacion_id=test_org.id, numero='TEST-LOTE-PRECIOS')
+        db.session.add(pres)
+        db.session.flush()
+        item = ItemPresupuesto(presupuesto_id=pres.id, tipo='material', descripcion='Contrapiso',
+                               unidad='m2', cantidad=Decimal('10'),
+                               precio_unitario=Decimal('0'), total=Decimal('0'))
+        sin_comp = ItemPresupuesto(presupuesto_id=pres.id, tipo='material',
+                                   descripcion='Arena gruesa', unidad='m3', cantidad=Decimal('2'),
+                                   precio_unitario=Decimal('0'), total=Decimal('0'))
+        db.session.add_all([item, sin_comp])
+        db.session.flush()
+        for desc, unidad in [('Cemento Portland', 'bolsa'), ('Azulejo 15x15', 'u'),
+                             ('Membrana liquida', 'l')]:
+            db.session.add(ItemPresupuestoComposicion(
+                item_presupuesto_id=item.id, tipo='material', descripcion=desc,
+                unidad=unidad, cantidad=Decimal('1')))
+        db.session.commit()
+        try:
+            resumen = estimar_precios_presupuesto(pres)
+            assert resumen['composiciones_evaluadas'] == 3
+            assert resumen['actualizados'] == 2 and resumen['sin_precio'] == 1
+            assert resumen['items_volcados_directos'] == 1
+            comps = {c.descripcion: c for c in item.composiciones}
+            assert comps['Cemento Portland'].precio_unitario == Decimal('9000')
+            assert comps['Azulejo 15x15'].precio_unitario == Decimal('950')
+            assert comps['Membrana liquida'].precio_fuente == 'sin_precio'
+        finally:
+            db.session.rollback()
+            ItemPresupuestoComposicion.query.filter_by(item_presupuesto_id=item.id).delete()
+            ItemPresupuesto.query.filter_by(presupuesto_id=pres.id).delete()
+            db.session.delete(pres)
+            db.session.commit()
+            _limpiar(db)
+
+
+@pytest.mark.integration
+def test_tokens_busqueda_se_persisten_al_guardar(app):
+    """Los tokens del fuzzy se calculan una vez al guardar la fila (cualquier
+    via de carga) y se rellenan para las filas viejas."""
+    from extensions import db
+    from models.provider_price_list import ProviderPriceList, normalizar_descripcion_precio
+    from services.precio_recurso_service import rellenar_tokens_busqueda
+    with app.app_context():
+        _limpiar(db)
+        _ppl(db, 'Hierro aletado 8mm', 'kg', 1500, org=999)
+        db.session.commit()
+        fila = ProviderPriceList.query.one()
+        assert fila.tokens_busqueda == '8 8mm aletado hierro mm'
+
+        fila.descripcion = 'Cemento Portland'
+        fila.descripcion_normalizada = normalizar_descripcion_precio(fila.descripcion)
+        db.session.commit()
+        assert fila.tokens_busqueda == 'cemento portland'
+
+        # Fila anterior a la columna
+        db.session.execute(ProviderPriceList.__table__.update().values(tokens_busqueda=None))
+        db.session.commit()
+        assert rellenar_tokens_busqueda() == 1
+        assert rellenar_tokens_busqueda() == 0
+        db.session.refresh(fila)
+        assert fila.tokens_busqueda == 'cemento portland'
+        _limpiar(db)
+
+
+@pytest.mark.integration
+def test_fuzzy_no_retokeniza_candidatos(app, monkeypatch):
+    from extensions import db
+    from services import precio_recurso_service as prs
+    with app.app_context():
+        _limpiar(db)
+        _cargar_lista_lote(db, 999)
+
+        tokenizar = prs._tokens_significativos
+        llamadas = []
+
+        def _contar(texto):
+            llamadas.append(texto)
+            return tokenizar(texto)
+
+        monkeypatch.setattr(prs, '_tokens_significativos', _contar)
+        mejor, alts = _buscar_provider_price_list(999, 'azulejo 15x15', 'u')
+        assert mejor.descripcion == 'Azulejo blanco 15x15 (caja)'
+        # La malla comparte solo la dimension: el pre-filtro ni la trae
+        assert alts == []
+        assert llamadas == ['azulejo 15x15']  # solo la query
+        _limpiar(db)
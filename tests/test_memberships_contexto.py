@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Tests de la identidad por request (services/memberships.py).
+
+Se fija que la membresía sale del cache entre requests (sin consultar
+org_memberships), que un cambio commiteado de la membresía invalida ese cache,
+que sin Redis no se cachea en el proceso, que el contador de consultas por
+request distingue un request cacheado de uno que no, y que el estado del plan
+se calcula una vez por request. El cache corre contra `redis_fake` (conftest).
+"""
+import pytest
+from flask import g
+from flask_login import login_user
+from sqlalchemy import event
+
+from extensions import db
+from models import OrgMembership
+from services import memberships
+from services import plan_service
+
+
+@pytest.fixture
+def membresia(app, test_user, test_org):
+    with app.app_context():
+        registro = OrgMembership(org_id=test_org.id, user_id=test_user.id,
+                                 role='admin', status='active')
+        db.session.add(registro)
+        db.session.commit()
+        registro_id = registro.id
+
+        yield registro
+
+        db.session.rollback()
+        OrgMembership.query.filter_by(id=registro_id).delete()
+        db.session.commit()
+
+
+def _cargar(app, user):
+    """Simula el before_request en un request nuevo; devuelve (identidad, consultas)."""
+    consultas = []
+
+    def _contar(conn, cursor, statement, *args):
+        if 'org_memberships' in statement:
+            consultas.append(statement)
+
+    with app.test_request_context('/'):
+        login_user(user)
+        event.listen(db.engine, 'before_cursor_execute', _contar)
+        try:
+            memberships.load_membership_into_context()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _contar)
+        return g.identidad, len(consultas)
+
+
+@pytest.mark.unit
+def test_membresia_sale_del_cache_entre_requests(app, test_user, test_org, membresia, redis_fake):
+    with app.app_context():
+        user = db.session.get(type(test_user), test_user.id)
+        primera, _ = _cargar(app, user)
+        assert primera is not None and primera.org_id == test_org.id
+        assert primera.membership_id == membresia.id
+
+        segunda, consultas = _cargar(app, user)
+        assert consultas == 0
+        assert (segunda.membership_id, segunda.role) == (primera.membership_id, primera.role)
+
+
+@pytest.mark.unit
+def test_sin_redis_consulta_en_cada_request(app, test_user, membresia, monkeypatch):
+    from config import cache_config
+
+    monkeypatch.setattr(cache_config.get_cache(), 'enabled', False)
+    with app.app_context():
+        user = db.session.get(type(test_user), test_user.id)
+        _cargar(app, user)
+        identidad, consultas = _cargar(app, user)
+        assert consultas >= 1 and identidad.membership_id == membresia.id
+
+
+@pytest.mark.unit
+def test_cambio_de_membresia_invalida_el_cache(app, test_user, membresia, redis_fake):
+    memberships.registrar_hooks_membresias()
+    with app.app_context():
+        user = db.session.get(type(test_user), test_user.id)
+        identidad, _ = _cargar(app, user)
+
+        membresia = db.session.get(OrgMembership, identidad.membership_id)
+        membresia.role = 'pm'
+        db.session.commit()
+
+        identidad, consultas = _cargar(app, user)
+        assert consultas >= 1
+        assert identidad.role == 'pm'
+
+
+@pytest.mark.unit
+def test_estado_del_plan_una_vez_por_request(app, test_user, membresia, monkeypatch):
+    llamadas = []
+    original = plan_service.calcular_estado_suscripcion
+
+    def _contar(org):
+        llamadas.append(org.id)
+        return original(org)
+
+    monkeypatch.setattr(plan_service, 'calcular_estado_suscripcion', _contar)
+    with app.app_context():
+        user = db.session.get(type(test_user), test_user.id)
+        with app.test_request_context('/'):
+            login_user(user)
+            memberships.load_membership_into_context()
+            primero = plan_service.get_subscription_status()
+            assert plan_service.get_subscription_status(plan_service.get_org()) == primero
+            assert g.identidad.estado_plan == primero
+            assert len(llamadas) == 1
+
+
+@pytest.mark.unit
+def test_contexto_rls_previo_se_descarta_al_cargar_la_membresia(app, test_user, test_org, membresia):
+    from middleware import rls_middleware
+
+    with app.app_context():
+        user = db.session.get(type(test_user), test_user.id)
+        with app.test_request_context('/'):
+            login_user(user)
+            # Resuelto antes de la membresía (p. ej. en el user loader) con otra org
+            g._rls_contexto = ('999999', 'false')
+            memberships.load_membership_into_context()
+            assert rls_middleware._contexto_actual() == (str(test_org.id), 'false')
+
+
+@pytest.mark.unit
+def test_contador_de_consultas_por_request(app, test_user, membresia, redis_fake):
+    def _contar_request(user):
+        with app.test_request_context('/'):
+            # Dentro de app_context el `g` es compartido entre requests de test
+            g.pop('_consultas_membresia', None)
+            login_user(user)
+            memberships.load_membership_into_context()
+            return memberships.consultas_membresia_request()
+
+    with app.app_context():
+        user = db.session.get(type(test_user), test_user.id)
+        assert _contar_request(user) >= 1  # sin cache: va a la base
+        assert _contar_request(user) == 0  # cacheado
+
+        # Y sale en el header cuando está habilitado
+        app.config['MEMBERSHIP_QUERY_HEADER'] = True
+        try:
+            with app.test_request_context('/'):
+                g._consultas_membresia = 2
+                respuesta = app.process_response(app.response_class('ok'))
+            assert respuesta.headers['X-Membership-Queries'] == '2'
+        finally:
+            app.config.pop('MEMBERSHIP_QUERY_HEADER', None)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Tests del contador y el long-poll de notificaciones (services/notificaciones_push.py).
+
+Con el broker en memoria: el contador se siembra una vez y después sigue a
+los commits sin COUNT, un rollback no publica nada, el long-poll despierta
+con la notificación nueva y un cliente con versión perdida pide resync. Sin
+broker compartido (sin Redis) se vuelve al COUNT y al polling.
+"""
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models.core import Notificacion
+from services import notificaciones_push
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    # Hace de broker compartido (Redis): el proceso de test es el único worker
+    local = notificaciones_push.BrokerLocal(compartido=True)
+    monkeypatch.setattr(notificaciones_push, 'broker', lambda: local)
+    notificaciones_push.registrar_hooks_notificaciones()
+    return local
+
+
+def _notificar(user, titulo='Aviso'):
+    notif = Notificacion.crear_notificacion(user.organizacion_id, user.id, 'tarea_asignada', titulo)
+    db.session.commit()
+    return notif
+
+
+def _counts():
+    consultas = []
+
+    def _contar(conn, cursor, statement, *args):
+        if 'count(' in statement.lower() and 'notificaciones' in statement:
+            consultas.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    return consultas, lambda: event.remove(db.engine, 'before_cursor_execute', _contar)
+
+
+@pytest.mark.unit
+def test_contador_sigue_a_los_commits_sin_count(app, test_user, broker):
+    with app.app_context():
+        try:
+            assert notificaciones_push.no_leidas(test_user.id) == 0
+            consultas, quitar = _counts()
+            try:
+                primera = _notificar(test_user)
+                segunda = _notificar(test_user)
+                assert notificaciones_push.no_leidas(test_user.id) == 2
+
+                primera.marcar_leida()
+                db.session.commit()
+                db.session.delete(segunda)
+                db.session.commit()
+                assert notificaciones_push.no_leidas(test_user.id) == 0
+
+                Notificacion.crear_notificacion(test_user.organizacion_id, test_user.id, 'x', 'Descartada')
+                db.session.flush()
+                db.session.rollback()
+                assert notificaciones_push.no_leidas(test_user.id) == 0
+            finally:
+                quitar()
+            assert consultas == []
+
+            # Un UPDATE masivo resiembra con un COUNT
+            _notificar(test_user)
+            Notificacion.query.filter_by(usuario_id=test_user.id).update({'leida': True})
+            db.session.commit()
+            notificaciones_push.recontar(test_user.id)
+            assert notificaciones_push.no_leidas(test_user.id) == 0
+        finally:
+            Notificacion.query.filter_by(usuario_id=test_user.id).delete()
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_long_poll_despierta_con_la_notificacion(app, test_user, broker):
+    with app.app_context():
+        try:
+            inicial = notificaciones_push.esperar_eventos(test_user.id, None)
+            assert inicial['resync'] and inicial['v'] == 0
+
+            # Sin novedades, vence la espera con la misma versión
+            vacia = notificaciones_push.esperar_eventos(test_user.id, 0, espera=0.05)
+            assert (vacia['v'], vacia['eventos'], vacia['resync']) == (0, [], False)
+
+            user_id, org_id = test_user.id, test_user.organizacion_id
+            resultado = {}
+
+            def _esperar():
+                with app.app_context():
+                    resultado.update(notificaciones_push.esperar_eventos(user_id, 0, espera=5))
+
+            hilo = threading.Thread(target=_esperar)
+            hilo.start()
+            Notificacion.crear_notificacion(org_id, user_id, 'tarea_asignada', 'Nueva tarea')
+            db.session.commit()
+            hilo.join(timeout=5)
+
+            assert resultado['v'] == 1 and resultado['no_leidas'] == 1
+            assert [n['titulo'] for n in resultado['eventos'][0]['nuevas']] == ['Nueva tarea']
+
+            # Un cliente con una versión que el servidor no conoce recarga todo
+            assert notificaciones_push.esperar_eventos(user_id, 7, espera=0)['resync']
+        finally:
+            Notificacion.query.filter_by(usuario_id=test_user.id).delete()
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_endpoint_eventos(app, authenticated_client, test_user, broker):
+    with app.app_context():
+        respuesta = authenticated_client.get('/notificaciones/api/eventos')
+        datos = respuesta.get_json()
+        assert respuesta.status_code == 200
+        assert datos['ok'] and datos['resync'] and datos['no_leidas'] == 0
+
+
+@pytest.mark.unit
+def test_sin_redis_cuenta_y_pide_polling(app, test_user, monkeypatch):
+    monkeypatch.setattr(notificaciones_push, 'broker', notificaciones_push.BrokerLocal)
+    notificaciones_push.registrar_hooks_notificaciones()
+    with app.app_context():
+        try:
+            _notificar(test_user)
+            consultas, quitar = _counts()
+            try:
+                respuesta = notificaciones_push.esperar_eventos(test_user.id, 0, espera=5)
+            finally:
+                quitar()
+            assert respuesta['polling'] and respuesta['no_leidas'] == 1
+            assert respuesta['reintentar_en'] == notificaciones_push.NOTIF_POLL_SEGUNDOS
+            assert len(consultas) == 1
+        finally:
+            Notificacion.query.filter_by(usuario_id=test_user.id).delete()
+            db.session.commit()
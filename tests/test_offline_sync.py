@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Tests del motor de sync offline (services/offline_sync.py).
+
+Fija que reenviar un lote no duplica avances (offline_id), que una operación
+que falla no arrastra a las demás, que tareas de otra org no se tocan, cómo se
+leen los cursores de los pulls incrementales, que los borrados dejan
+tombstone y que un pull sin cambios corta en 304.
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import (EtapaObra, Obra, SyncOperacionOffline, SyncTombstone, TareaAvance, TareaEtapa,
+                    TareaResponsables)
+from services import offline_sync
+
+
+@pytest.fixture(autouse=True)
+def _sin_tombstones(app):
+    """Cada test arranca y termina sin tombstones: los borrados de obras y
+    tareas del teardown dejan filas, y SQLite reusa los ids de org y tarea."""
+    def _limpiar():
+        with app.app_context():
+            SyncTombstone.query.delete()
+            db.session.commit()
+
+    _limpiar()
+    yield
+    _limpiar()
+
+
+def _tarea(org):
+    obra = Obra(nombre=f"Obra sync {uuid.uuid4().hex[:6]}", cliente="Cliente",
+                organizacion_id=org.id, estado='en_curso')
+    db.session.add(obra)
+    db.session.flush()
+    etapa = EtapaObra(obra_id=obra.id, nombre="Estructura", orden=1)
+    db.session.add(etapa)
+    db.session.flush()
+    tarea = TareaEtapa(etapa_id=etapa.id, nombre="Losa", unidad='m2')
+    db.session.add(tarea)
+    db.session.commit()
+    return obra, tarea
+
+
+def _avance(tarea_id, offline_id, cantidad=5, porcentaje=None):
+    return {'type': 'CREATE_AVANCE', 'data': {'tarea_id': tarea_id, 'offline_id': offline_id,
+                                              'cantidad_ingresada': cantidad, 'porcentaje': porcentaje}}
+
+
+@pytest.mark.unit
+def test_reenviar_lote_no_duplica_avances(app, test_org, test_user):
+    with app.app_context():
+        obra, tarea = _tarea(test_org)
+        try:
+            lote = [_avance(tarea.id, 'off-1'), _avance(tarea.id, 'off-2', porcentaje=40),
+                    _avance(tarea.id, 'off-1')]
+            results, timing = offline_sync.aplicar_lote(lote, test_org.id, test_user.id)
+            assert [r['success'] for r in results] == [True, True, True]
+            assert results[2]['duplicado'] and results[2]['server_id'] == results[0]['server_id']
+            assert set(timing) == {'resolver', 'aplicar', 'commit', 'total'}
+            assert TareaAvance.query.filter_by(tarea_id=tarea.id).count() == 2
+            assert tarea.estado == 'en_curso'
+
+            # El cliente perdió la respuesta y reintenta todo
+            reintento, _ = offline_sync.aplicar_lote(lote, test_org.id, test_user.id)
+            assert all(r['duplicado'] for r in reintento)
+            assert [r['server_id'] for r in reintento] == [r['server_id'] for r in results]
+            assert TareaAvance.query.filter_by(tarea_id=tarea.id).count() == 2
+        finally:
+            SyncOperacionOffline.query.filter_by(usuario_id=test_user.id).delete()
+            db.session.delete(obra)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_operacion_fallida_no_arrastra_el_lote(app, test_org, test_org_b, test_user):
+    with app.app_context():
+        obra, tarea = _tarea(test_org)
+        obra_b, tarea_b = _tarea(test_org_b)
+        try:
+            lote = [
+                _avance(tarea.id, 'ok-1'),
+                _avance(tarea.id, 'mal-1', cantidad='no-es-numero'),
+                _avance(tarea_b.id, 'ajena-1'),  # tarea de otra org
+                {'type': 'UPDATE_TAREA', 'data': {'id': tarea.id, 'estado': 'completada'}},
+                {'type': 'BORRAR_TODO', 'data': {'offline_id': 'raro-1'}},
+            ]
+            results, _ = offline_sync.aplicar_lote(lote, test_org.id, test_user.id)
+            assert [r['success'] for r in results] == [True, False, False, True, False]
+            assert results[2]['error'] == 'Tarea no encontrada'
+            assert TareaAvance.query.filter_by(tarea_id=tarea.id).count() == 1
+            assert TareaAvance.query.filter_by(tarea_id=tarea_b.id).count() == 0
+            assert db.session.get(TareaEtapa, tarea.id).estado == 'completada'
+
+            # Las fallidas no quedan registradas: se pueden reintentar corregidas
+            assert {s.offline_id for s in SyncOperacionOffline.query.filter_by(
+                usuario_id=test_user.id)} == {'ok-1'}
+        finally:
+            SyncOperacionOffline.query.filter_by(usuario_id=test_user.id).delete()
+            db.session.delete(obra)
+            db.session.delete(obra_b)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_cursor_con_solape_y_alcance(monkeypatch):
+    monkeypatch.setattr(offline_sync, 'OFFLINE_SYNC_SOLAPE_SEGUNDOS', 60)
+    assert offline_sync.parse_cursor(None) is None
+    ahora = datetime.utcnow().replace(microsecond=0)
+    assert offline_sync.parse_cursor(ahora.isoformat()) == ahora - timedelta(minutes=1)
+    assert offline_sync.leer_cursor('2026-10-16T12:00:00-03:00') == datetime(2026, 10, 16, 15, 0)
+    with pytest.raises(ValueError):
+        offline_sync.parse_cursor('ayer')
+
+    # El cursor lleva usuario/org: el de otra sesión da pull completo
+    cursor = offline_sync.cursor_respuesta(None, ahora, ahora - timedelta(hours=1), alcance='7.3')
+    assert cursor == f'{ahora.isoformat()}~7.3'
+    assert offline_sync.leer_cursor(cursor, alcance='7.3') == ahora
+    assert offline_sync.leer_cursor(cursor, alcance='8.3') is None
+    # Más viejo que la retención de tombstones: pull completo
+    viejo = ahora - timedelta(days=offline_sync.OFFLINE_TOMBSTONE_DIAS + 1)
+    assert offline_sync.desde_cursor(viejo) is None
+
+
+@pytest.mark.unit
+def test_borrar_tarea_deja_tombstone(app, test_org, test_user):
+    offline_sync.registrar_hooks_tombstones()
+    with app.app_context():
+        obra, tarea = _tarea(test_org)
+        db.session.add(TareaResponsables(tarea_id=tarea.id, user_id=test_user.id))
+        db.session.commit()
+        antes = datetime.utcnow() - timedelta(seconds=1)
+        tarea_id = tarea.id
+        try:
+            db.session.delete(tarea)
+            db.session.commit()
+            # Por (entidad, entidad_id) y fecha, no por id de fila: SQLite reusa
+            # ids y el hook actualiza el tombstone existente en vez de insertar
+            tarea_tombstones = SyncTombstone.query.filter(
+                SyncTombstone.organizacion_id == test_org.id,
+                SyncTombstone.entidad == 'tarea',
+                SyncTombstone.entidad_id == tarea_id,
+            ).all()
+            # La asignación y la tarea se borran juntas: un solo tombstone, de toda la org
+            assert [(t.usuario_id, t.deleted_at >= antes) for t in tarea_tombstones] == [(None, True)]
+            borrados = offline_sync.tombstones(test_org.id, 'tarea', antes, usuario_id=test_user.id)
+            assert [entidad_id for entidad_id, _ in borrados] == [tarea_id]
+        finally:
+            db.session.rollback()
+            db.session.delete(obra)
+            db.session.commit()
+
+
+@pytest.mark.unit
+def test_pull_incremental_con_etag(app, authenticated_client, test_org, test_user):
+    with app.app_context():
+        obra, tarea = _tarea(test_org)
+        try:
+            completo = authenticated_client.get('/api/offline/mis-obras')
+            assert completo.status_code == 200
+            datos = completo.get_json()
+            assert not datos['incremental'] and obra.id in [o['id'] for o in datos['obras']]
+
+            # Misma versión: 304 sin cuerpo
+            etag = completo.headers['ETag']
+            repetido = authenticated_client.get('/api/offline/mis-obras', headers={'If-None-Match': etag})
+            assert repetido.status_code == 304 and repetido.data == b''
+
+            # Sin cambios desde el cursor, el pull incremental es estable (mismo ETag)
+            url = f"/api/offline/mis-obras?since={datos['cursor']}"
+            primero = authenticated_client.get(url)
+            segundo = authenticated_client.get(url, headers={'If-None-Match': primero.headers['ETag']})
+            assert primero.get_json()['incremental']
+            assert segundo.status_code == 304
+
+            # La baja de la obra llega como eliminado
+            obra.deleted_at = datetime.utcnow()
+            db.session.commit()
+            baja = authenticated_client.get(url).get_json()
+            assert obra.id in baja['eliminados']
+            assert obra.id not in [o['id'] for o in baja['obras']]
+        finally:
+            db.session.delete(obra)
+            db.session.commit()
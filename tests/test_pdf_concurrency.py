@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Tests del cache y los jobs de PDF (services/pdf_concurrency.py).
+
+WeasyPrint no se corre: `renderizar_pdf` se reemplaza por un render falso y el
+storage apunta a un directorio temporal, con el backend local y con uno que,
+como S3 (upload_fileobj), solo acepta objetos archivo. Se fija que el mismo HTML
+no se renderiza dos veces, que con PDF_ASYNC la vista recibe un 202 y el job
+deja el PDF en el cache, y que un PDF a medio escribir no se sirve.
+"""
+import io
+
+import pytest
+
+from services import pdf_concurrency as pc
+
+
+def _storage_sin_bytes(base_path):
+    from services.storage_service import LocalStorageBackend
+
+    class _StorageComoS3(LocalStorageBackend):
+        def save(self, file_obj, key, content_type=None):
+            # upload_fileobj necesita .read(): bytes sueltos fallan
+            if not hasattr(file_obj, 'read'):
+                raise TypeError('upload_fileobj requiere un objeto archivo')
+            return super().save(file_obj, key, content_type)
+
+    return _StorageComoS3(base_path)
+
+
+@pytest.fixture(params=['local', 'sin_bytes'])
+def cache_pdf(request, tmp_path, monkeypatch):
+    from services import storage_service
+    backend = (storage_service.LocalStorageBackend(str(tmp_path)) if request.param == 'local'
+               else _storage_sin_bytes(str(tmp_path)))
+    monkeypatch.setattr(storage_service, 'storage', backend)
+    monkeypatch.setattr(pc, '_redis', lambda: None)
+    for campo in pc._metricas_locales:
+        monkeypatch.setitem(pc._metricas_locales, campo, 0)
+    renders = []
+
+    def _render(html, **kwargs):
+        renders.append((html, kwargs))
+        pc._sumar_metricas(renders=1, render_ms=12.0)
+        return b'%PDF-1.7 ' + html.encode() + b'\n%%EOF\n'
+
+    monkeypatch.setattr(pc, 'renderizar_pdf', _render)
+    return renders
+
+
+@pytest.mark.unit
+def test_mismo_html_se_renderiza_una_vez(cache_pdf):
+    primero, segundo = io.BytesIO(), io.BytesIO()
+    assert pc.render_pdf_cacheado(primero, '<p>Presupuesto 1</p>', presentational_hints=True) is None
+    assert pc.render_pdf_cacheado(segundo, '<p>Presupuesto 1</p>', presentational_hints=True) is None
+    assert primero.getvalue() == segundo.getvalue()
+    assert len(cache_pdf) == 1
+
+    # Otras opciones de render u otro HTML (ej. otro logo) son otro PDF
+    pc.render_pdf_cacheado(io.BytesIO(), '<p>Presupuesto 1</p>')
+    pc.render_pdf_cacheado(io.BytesIO(), '<p>Presupuesto 1</p><img src="logo2">')
+    assert len(cache_pdf) == 3
+
+    metricas = pc.pdf_metricas()
+    assert (metricas['hits'], metricas['misses'], metricas['renders']) == (1, 3, 3)
+    assert metricas['avg_render_ms'] == 12.0
+
+
+@pytest.mark.unit
+def test_pdf_truncado_no_se_sirve(cache_pdf):
+    from services.storage_service import storage
+    job_id = pc.pdf_cache_key('<p>x</p>')
+    storage.save(io.BytesIO(b'%PDF-1.7 a medio'), pc._storage_key(job_id, 'pdf'))
+    assert pc.leer_pdf_cacheado(job_id) is None
+    pc.render_pdf_cacheado(io.BytesIO(), '<p>x</p>')
+    assert len(cache_pdf) == 1 and pc.leer_pdf_cacheado(job_id) is not None
+
+
+@pytest.mark.unit
+def test_job_asincronico(app, cache_pdf, monkeypatch):
+    from tasks import pdfs
+    encolados = []
+    monkeypatch.setattr(pc, 'PDF_ASYNC', True)
+    monkeypatch.setattr(pdfs.render_pdf_job, 'apply_async',
+                        lambda args, task_id: encolados.append((args, task_id)))
+    monkeypatch.setattr(pc, 'estado_job', lambda job_id: (
+        'listo' if pc.leer_pdf_cacheado(job_id) is not None else 'pendiente'))
+
+    with app.test_request_context('/presupuestos/1/pdf', headers={'Accept': 'application/json'}):
+        resp = pc.render_pdf_cacheado(io.BytesIO(), '<p>Reporte</p>')
+        assert resp.status_code == 202
+        job_id = resp.get_json()['job_id']
+        assert resp.get_json()['estado_url'].endswith(f'/pdf/jobs/{job_id}')
+        assert encolados == [([job_id, {}], job_id)]
+        assert cache_pdf == []  # el worker web no renderizo
+
+        # El worker corre el job: el PDF queda en cache y el HTML se borra
+        assert pdfs.render_pdf_job(job_id, {}) == {'ok': True, 'job_id': job_id}
+        from services.storage_service import storage
+        assert not storage.exists(pc._storage_key(job_id, 'html'))
+
+        destino = io.BytesIO()
+        assert pc.render_pdf_cacheado(destino, '<p>Reporte</p>') is None
+        assert destino.getvalue().startswith(b'%PDF')
+        assert len(cache_pdf) == 1
+
+        # Sin async (ej. adjunto de email) se renderiza en el momento
+        assert pc.render_pdf_cacheado(io.BytesIO(), '<p>Otro</p>', permitir_async=False) is None
+        assert len(cache_pdf) == 2
+
+
+@pytest.mark.unit
+def test_encolar_fallido_libera_el_job(cache_pdf, monkeypatch):
+    from services import storage_service
+    claves = {}
+
+    class _Redis:
+        def set(self, key, value, nx=False, ex=None):
+            if nx and key in claves:
+                return None
+            claves[key] = value
+            return True
+
+        def delete(self, *keys):
+            for key in keys:
+                claves.pop(key, None)
+
+        def zrem(self, *args):
+            pass
+
+    def _falla(*args, **kwargs):
+        raise OSError('storage caido')
+
+    monkeypatch.setattr(pc, '_redis', lambda: _Redis())
+    monkeypatch.setattr(storage_service.storage, 'save', _falla)
+    with pytest.raises(OSError):
+        pc.encolar_pdf('abc123', '<p>x</p>')
+    # El próximo pedido puede volver a encolar
+    assert claves == {}
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Tests del middleware RLS (middleware/rls_middleware.py).
+
+Corre sobre un engine SQLite propio, con `_aplicar` reemplazado por un registro
+(SQLite no tiene set_config). Fija que el contexto se manda una sola vez por
+conexión mientras no cambie, y que un SET cuya transacción se revirtió se
+vuelve a mandar en el próximo checkout.
+"""
+import logging
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from middleware import rls_middleware as rls
+
+
+@pytest.fixture
+def engine_rls(monkeypatch):
+    aplicados = []
+    contexto = {'actual': ('12', 'false')}
+    monkeypatch.setattr(rls, 'RLS_SET_LOCAL', False)
+    monkeypatch.setattr(rls, '_contexto_actual', lambda: contexto['actual'])
+    monkeypatch.setattr(rls, '_aplicar', lambda _dbapi, ctx, local: aplicados.append((ctx, local)))
+    engine = create_engine('sqlite://')
+    quitar = rls.setup_rls_middleware(SimpleNamespace(logger=logging.getLogger(__name__)),
+                                      SimpleNamespace(engine=engine))
+    yield engine, contexto, aplicados
+    quitar()
+    engine.dispose()
+
+
+def _usar(engine, commit=True):
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+
+
+@pytest.mark.unit
+def test_contexto_se_manda_solo_si_cambia(engine_rls):
+    engine, contexto, aplicados = engine_rls
+    _usar(engine)
+    _usar(engine)
+    _usar(engine)
+    assert aplicados == [(('12', 'false'), False)]
+
+    contexto['actual'] = ('15', 'true')
+    _usar(engine)
+    _usar(engine)
+    assert aplicados[-1] == (('15', 'true'), False) and len(aplicados) == 2
+
+
+@pytest.mark.unit
+def test_set_revertido_se_vuelve_a_mandar(engine_rls):
+    engine, contexto, aplicados = engine_rls
+    _usar(engine, commit=False)
+    _usar(engine)
+    _usar(engine)
+    # El primero se perdió con el rollback; el segundo quedó firme con el commit
+    assert len(aplicados) == 2
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Tests del contador de visitas con escritura diferida (services/visitas_productos.py).
+
+Con el buffer en memoria (sin Redis): ver un producto no escribe su fila,
+el volcado aplica todo lo acumulado en un lote sin tocar updated_at, y si la
+base falla los incrementos vuelven al buffer.
+"""
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import Category, Product, Supplier
+from services import visitas_productos
+from services.marketplace_service import MarketplaceService
+
+
+@pytest.fixture
+def producto(app, monkeypatch):
+    monkeypatch.setattr(visitas_productos, 'MARKETPLACE_VISITAS_FLUSH_SEC', 3600)
+    monkeypatch.setattr(visitas_productos, '_redis', lambda: None)
+    visitas_productos._pendientes_local.clear()
+    with app.app_context():
+        sufijo = uuid.uuid4().hex[:8]
+        supplier = Supplier(razon_social=f'Proveedor {sufijo}', cuit=f'30-{sufijo}',
+                            email=f'prov_{sufijo}@example.com')
+        categoria = Category(nombre=f'Categoria {sufijo}')
+        db.session.add_all([supplier, categoria])
+        db.session.flush()
+        product = Product(supplier_id=supplier.id, category_id=categoria.id, nombre='Cemento',
+                          slug=f'cemento-{sufijo}', estado='publicado', visitas=3)
+        db.session.add(product)
+        db.session.commit()
+        yield product
+        db.session.delete(product)
+        db.session.delete(supplier)
+        db.session.delete(categoria)
+        db.session.commit()
+        visitas_productos._pendientes_local.clear()
+
+
+@pytest.mark.unit
+def test_ver_producto_no_escribe_la_fila(app, producto):
+    updates = []
+
+    def _contar(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('UPDATE'):
+            updates.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    try:
+        for _ in range(5):
+            MarketplaceService().get_product_with_variants(producto.id)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _contar)
+
+    assert updates == []
+    assert visitas_productos.visitas_pendientes(producto.id) == 5
+
+
+@pytest.mark.unit
+def test_volcado_por_lote(app, producto):
+    actualizado = producto.updated_at
+    for _ in range(4):
+        visitas_productos.registrar_visita(producto.id)
+
+    assert visitas_productos.volcar_visitas() == {'productos': 1, 'visitas': 4}
+    db.session.expire_all()
+    product = db.session.get(Product, producto.id)
+    assert product.visitas == 7
+    assert product.updated_at == actualizado
+    assert visitas_productos.visitas_pendientes() == {}
+    assert visitas_productos.volcar_visitas() == {'productos': 0, 'visitas': 0}
+
+
+@pytest.mark.unit
+def test_volcado_fallido_devuelve_al_buffer(app, producto, monkeypatch):
+    visitas_productos.registrar_visita(producto.id)
+
+    def _falla(_incrementos):
+        raise RuntimeError('base caída')
+
+    monkeypatch.setattr(visitas_productos, '_aplicar', _falla)
+    with pytest.raises(RuntimeError):
+        visitas_productos.volcar_visitas()
+    assert visitas_productos.visitas_pendientes(producto.id) == 1